@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
@@ -29,5 +30,28 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()        
+        db.close()
 
+
+
+@contextmanager
+def contar_sentencias_sql(db):
+    """
+    Cuenta las sentencias SQL que ejecuta la sesión `db` dentro del bloque.
+    Sirve para medir round-trips por request (por ejemplo, para detectar patrones N+1).
+    El listener se registra sobre la sesión, así otros requests concurrentes no suman.
+
+        with contar_sentencias_sql(db) as contador:
+            ...
+        print(contador["sentencias"])
+    """
+    contador = {"sentencias": 0}
+
+    def _contar(orm_execute_state):
+        contador["sentencias"] += 1
+
+    event.listen(db, "do_orm_execute", _contar)
+    try:
+        yield contador
+    finally:
+        event.remove(db, "do_orm_execute", _contar)
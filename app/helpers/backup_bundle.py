@@ -0,0 +1,237 @@
+import os
+import json
+import zlib
+import hashlib
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+
+from helpers.backup_manifest import BackupManifest, file_md5, MANIFEST_HASH_WORKERS
+
+
+# Bundle de backup: un .tar con una página de cambios del manifiesto.
+#
+# Los encabezados tar se generan antes de enviar el primer byte (TarInfo.tobuf), así se conoce
+# el tamaño total y el offset de cada miembro: el archivo se arma leyendo las fuentes en streaming,
+# sin archivos temporales, y un rango de bytes (HTTP Range) se sirve posicionándose directamente
+# en el miembro que corresponde. Cada miembro lleva su MD5 en el encabezado PAX `RUA.md5`.
+
+
+BLOCK_SIZE = tarfile.BLOCKSIZE            # 512
+RECORD_SIZE = tarfile.RECORDSIZE          # 10240
+CHUNK_SIZE = 1024 * 1024
+
+BUNDLE_MANIFEST_NAME = "_bundle_manifest.json"
+
+
+
+def _padding(size: int, multiple: int = BLOCK_SIZE) -> int:
+    return (multiple - size % multiple) % multiple
+
+
+def _tar_header(arcname: str, size: int, mtime: float, md5: Optional[str] = None) -> bytes:
+    info = tarfile.TarInfo(arcname)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    info.type = tarfile.REGTYPE
+    if md5:
+        info.pax_headers = {"RUA.md5": md5}
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+
+
+
+class BackupBundle:
+    """
+    Describe un bundle ya resuelto: lista de miembros con su encabezado, offset y tamaño.
+    `miembros` es una lista de dicts con: header, offset, size, path (None = datos en memoria), data.
+    """
+
+    def __init__(self, miembros: List[Dict[str, Any]], total_size: int, etag: str,
+                 resumen: List[Dict[str, Any]], next_cursor: Optional[str]):
+        self.miembros = miembros
+        self.total_size = total_size
+        self.etag = etag
+        self.resumen = resumen
+        self.next_cursor = next_cursor
+
+
+    def iter_bytes(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Genera los bytes del tar entre `start` y `end` (inclusive)."""
+        end = self.total_size - 1 if end is None else end
+        for miembro in self.miembros:
+            bloque_ini = miembro["offset"]
+            header = miembro["header"]
+            datos_ini = bloque_ini + len(header)
+            datos_fin = datos_ini + miembro["size"]                  # exclusivo
+            bloque_fin = datos_fin + _padding(miembro["size"])       # exclusivo
+
+            if bloque_fin <= start:
+                continue
+            if bloque_ini > end:
+                return
+
+            # Encabezado
+            yield from _recortar(header, bloque_ini, start, end)
+
+            # Datos
+            if miembro["size"] and datos_fin > start and datos_ini <= end:
+                desde = max(start, datos_ini) - datos_ini
+                hasta = min(end + 1, datos_fin) - datos_ini
+                yield from _leer_datos(miembro, desde, hasta)
+
+            # Relleno hasta el bloque de 512
+            pad = bloque_fin - datos_fin
+            if pad:
+                yield from _recortar(b"\0" * pad, datos_fin, start, end)
+
+        # Fin del archivo: bloques en cero hasta completar el registro
+        cola_ini = self.miembros[-1]["offset"] + _miembro_len(self.miembros[-1]) if self.miembros else 0
+        if cola_ini <= end:
+            yield from _recortar(b"\0" * (self.total_size - cola_ini), cola_ini, start, end)
+
+
+    def iter_gzip(self) -> Iterator[bytes]:
+        """El mismo tar comprimido con gzip al vuelo (sin soporte de rangos)."""
+        comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in self.iter_bytes():
+            out = comp.compress(chunk)
+            if out:
+                yield out
+        yield comp.flush()
+
+
+
+def _miembro_len(miembro: Dict[str, Any]) -> int:
+    return len(miembro["header"]) + miembro["size"] + _padding(miembro["size"])
+
+
+def _recortar(data: bytes, offset: int, start: int, end: int) -> Iterator[bytes]:
+    ini = max(start - offset, 0)
+    fin = min(end + 1 - offset, len(data))
+    if ini < fin:
+        yield data[ini:fin]
+
+
+def _leer_datos(miembro: Dict[str, Any], desde: int, hasta: int) -> Iterator[bytes]:
+    if miembro["path"] is None:
+        yield miembro["data"][desde:hasta]
+        return
+
+    faltan = hasta - desde
+    try:
+        with open(miembro["path"], "rb") as f:
+            f.seek(desde)
+            while faltan > 0:
+                chunk = f.read(min(CHUNK_SIZE, faltan))
+                if not chunk:
+                    break
+                faltan -= len(chunk)
+                yield chunk
+    except OSError as e:
+        print(f"⚠️ No se pudo leer {miembro['path']} para el bundle: {e}")
+
+    # Si el archivo se achicó desde que se armó el bundle, se completa con ceros para no romper el tar
+    if faltan > 0:
+        yield b"\0" * faltan
+
+
+
+def armar_bundle(
+    manifiesto: BackupManifest,
+    scan_id: int,
+    cursor: Optional[str],
+    page_size: int,
+    tengo: set,
+    es_ruta_permitida,
+) -> BackupBundle:
+    """
+    Arma el bundle de una página de cambios del escaneo `scan_id`.
+    Los archivos cuyo MD5 está en `tengo` se listan en el manifiesto del bundle pero no se incluyen.
+    """
+    pagina = manifiesto.cambios(scan_id, cursor, page_size)
+
+    candidatos = []
+    for cambio in pagina["detalles"]:
+        path = cambio["path"]
+        real = os.path.realpath(path)
+        if real != path or os.path.islink(path) or not es_ruta_permitida(real):
+            continue
+        try:
+            st = os.stat(real)
+        except OSError:
+            continue
+        fila = manifiesto.get_file(real)
+        md5_conocido = (
+            fila["hash"] if fila is not None and fila["hash"]
+            and fila["size"] == st.st_size and fila["mtime"] == st.st_mtime else None
+        )
+        candidatos.append((real, st, md5_conocido))
+
+    # Hash de contenido para los que no lo tienen (en paralelo) y se guarda en el manifiesto
+    sin_hash = [path for path, _, md5 in candidatos if not md5]
+    if sin_hash:
+        with ThreadPoolExecutor(max_workers=MANIFEST_HASH_WORKERS) as pool:
+            calculados = dict(zip(sin_hash, pool.map(file_md5, sin_hash)))
+        for path, md5 in calculados.items():
+            if md5:
+                manifiesto.set_hash(path, md5)
+    else:
+        calculados = {}
+
+    resumen = []
+    archivos = []
+    for path, st, md5 in candidatos:
+        md5 = md5 or calculados.get(path) or None
+        incluido = not (md5 and md5 in tengo)
+        resumen.append({"path": path, "size": st.st_size, "mtime": st.st_mtime, "md5": md5, "incluido": incluido})
+        if incluido:
+            archivos.append((path, st, md5))
+
+    manifest_bytes = json.dumps(
+        {"scan_id": scan_id, "cursor": cursor, "next_cursor": pagina["next_cursor"], "archivos": resumen},
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+    miembros = []
+    offset = 0
+
+    def _agregar(header: bytes, size: int, path: Optional[str], data: Optional[bytes] = None):
+        nonlocal offset
+        miembro = {"header": header, "offset": offset, "size": size, "path": path, "data": data}
+        miembros.append(miembro)
+        offset += _miembro_len(miembro)
+
+    _agregar(_tar_header(BUNDLE_MANIFEST_NAME, len(manifest_bytes), 0), len(manifest_bytes), None, manifest_bytes)
+    for path, st, md5 in archivos:
+        _agregar(_tar_header(path.lstrip("/"), st.st_size, st.st_mtime, md5), st.st_size, path)
+
+    total = offset + 2 * BLOCK_SIZE
+    total += _padding(total, RECORD_SIZE)
+
+    etag = hashlib.sha1(manifest_bytes).hexdigest()
+    return BackupBundle(miembros, total, f'"{etag}"', resumen, pagina["next_cursor"])
+
+
+
+def parse_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta un encabezado `Range: bytes=...` de un único rango.
+    Devuelve (start, end) inclusivo, None si no hay rango válido, o lanza ValueError si no es satisfacible.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    ini, _, fin = header[len("bytes="):].strip().partition("-")
+    try:
+        if ini == "":
+            largo = int(fin)
+            if largo <= 0:
+                raise ValueError("rango vacío")
+            return max(total - largo, 0), total - 1
+        start = int(ini)
+        end = int(fin) if fin else total - 1
+    except ValueError:
+        return None
+    if start >= total or end < start:
+        raise ValueError("rango fuera del archivo")
+    return start, min(end, total - 1)
@@ -0,0 +1,371 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Iterator, Tuple, Callable
+
+
+# Manifiesto persistente del backup incremental.
+#
+# Guarda, por ruta, inode / tamaño / mtime / hash de contenido en una base SQLite y registra cada
+# escaneo en `scans`. El recorrido usa os.scandir en orden determinístico (nombres ordenados), así
+# un escaneo cortado por `limit` se retoma desde el cursor guardado. Los archivos se procesan en
+# lotes: la memoria no depende de la cantidad total de documentos.
+
+
+# Tamaño de lote para consultas/escrituras en el manifiesto
+MANIFEST_BATCH_SIZE = 1000
+
+# Hilos para calcular hashes de archivos cambiados
+MANIFEST_HASH_WORKERS = int(os.getenv("BACKUP_HASH_WORKERS", "4"))
+
+
+
+def file_md5(path: str) -> str:
+    """Calcula un hash MD5 del archivo (vacío si no se puede leer)."""
+    try:
+        with open(path, "rb") as f:
+            h = hashlib.md5()
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    except Exception:
+        return ""
+
+
+
+class BackupManifest:
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path             TEXT PRIMARY KEY,
+                inode            INTEGER,
+                size             INTEGER NOT NULL,
+                mtime            REAL NOT NULL,
+                hash             TEXT,
+                seen_scan_id     INTEGER NOT NULL,
+                changed_scan_id  INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS ix_files_changed ON files (changed_scan_id, path);
+            CREATE INDEX IF NOT EXISTS ix_files_seen ON files (seen_scan_id);
+
+            CREATE TABLE IF NOT EXISTS scans (
+                scan_id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+                status                   TEXT NOT NULL,
+                started_at               REAL NOT NULL,
+                finished_at              REAL,
+                cursor                   TEXT,
+                modo_rapido              INTEGER NOT NULL,
+                total_escaneados         INTEGER NOT NULL DEFAULT 0,
+                archivos_cambiados       INTEGER NOT NULL DEFAULT 0,
+                archivos_eliminados      INTEGER NOT NULL DEFAULT 0,
+                omitidos_por_tamano      INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+    # ---------------------------
+    # Estado
+    # ---------------------------
+    def import_legacy_state(self, legacy_path: str) -> int:
+        """
+        Importa una única vez el antiguo last_backup_state.json ({path: {mtime, size}}) para que
+        el primer escaneo no marque todo como cambiado. Devuelve la cantidad de rutas importadas.
+        """
+        if not os.path.exists(legacy_path):
+            return 0
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f) or {}
+        except Exception:
+            data = {}
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO files (path, inode, size, mtime, hash, seen_scan_id, changed_scan_id) "
+                "VALUES (?, NULL, ?, ?, NULL, 0, NULL)",
+                [
+                    (path, int(info.get("size") or 0), float(info.get("mtime") or 0))
+                    for path, info in data.items() if isinstance(info, dict)
+                ],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        os.replace(legacy_path, legacy_path + ".migrado")
+        return len(data)
+
+
+    def scan_actual(self) -> Optional[sqlite3.Row]:
+        """Escaneo incompleto (cortado por limit) que debe retomarse, si existe."""
+        return self.conn.execute(
+            "SELECT * FROM scans WHERE status = 'parcial' ORDER BY scan_id DESC LIMIT 1"
+        ).fetchone()
+
+
+    def ultimo_scan(self) -> Optional[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM scans ORDER BY scan_id DESC LIMIT 1").fetchone()
+
+
+    def get_scan(self, scan_id: int) -> Optional[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM scans WHERE scan_id = ?", (scan_id,)).fetchone()
+
+
+    def total_indexados(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+    def reset(self) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.execute("DELETE FROM files")
+        self.conn.execute("DELETE FROM scans")
+        self.conn.execute("COMMIT")
+
+
+    # ---------------------------
+    # Escaneo
+    # ---------------------------
+    def scan(
+        self,
+        roots: List[str],
+        excluir: Callable[[str], bool],
+        max_file_size: int,
+        limit: int = 0,
+        modo_rapido: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Escanea (o retoma) el backup incremental. Procesa como máximo `limit` archivos por llamada
+        (0 = sin límite) y devuelve el resumen del escaneo.
+        """
+        scan = self.scan_actual()
+        if scan is None:
+            cur = self.conn.execute(
+                "INSERT INTO scans (status, started_at, modo_rapido) VALUES ('parcial', ?, ?)",
+                (time.time(), int(modo_rapido)),
+            )
+            scan_id = cur.lastrowid
+            cursor = None
+            modo_rapido_scan = modo_rapido
+        else:
+            scan_id = scan["scan_id"]
+            cursor = tuple(json.loads(scan["cursor"])) if scan["cursor"] else None
+            # Un escaneo retomado mantiene el modo con el que empezó
+            modo_rapido_scan = bool(scan["modo_rapido"])
+
+        procesados = 0
+        omitidos = 0
+        ultimo_visto = cursor
+        limit_reached = False
+        lote: List[Tuple[str, os.stat_result]] = []
+
+        with ThreadPoolExecutor(max_workers=MANIFEST_HASH_WORKERS) as pool:
+            for clave, path, st in _walk(roots, excluir, cursor):
+                ultimo_visto = clave
+                if st.st_size > max_file_size:
+                    omitidos += 1
+                    continue
+                lote.append((path, st))
+
+                if len(lote) >= MANIFEST_BATCH_SIZE or (limit and procesados + len(lote) >= limit):
+                    self._procesar_lote(lote, scan_id, modo_rapido_scan, pool, ultimo_visto, omitidos)
+                    procesados += len(lote)
+                    lote, omitidos = [], 0
+                    if limit and procesados >= limit:
+                        limit_reached = True
+                        break
+
+            if lote or omitidos:
+                self._procesar_lote(lote, scan_id, modo_rapido_scan, pool, ultimo_visto, omitidos)
+
+        if not limit_reached:
+            self._finalizar(scan_id)
+
+        resumen = dict(self.get_scan(scan_id))
+        resumen["limit_reached"] = limit_reached
+        return resumen
+
+
+    def _procesar_lote(self, lote, scan_id: int, modo_rapido: bool, pool: ThreadPoolExecutor,
+                       cursor: Optional[tuple], omitidos: int) -> None:
+        """Compara el lote contra el manifiesto, hashea los cambiados y guarda todo en una transacción."""
+        paths = [path for path, _ in lote]
+        placeholders = ",".join("?" for _ in paths)
+        previos = {
+            r["path"]: r for r in self.conn.execute(
+                f"SELECT path, inode, size, mtime, hash FROM files WHERE path IN ({placeholders})", paths
+            )
+        } if paths else {}
+
+        sin_cambios, cambiados = [], []
+        for path, st in lote:
+            prev = previos.get(path)
+            if (prev is not None
+                and prev["size"] == st.st_size
+                and prev["mtime"] == st.st_mtime
+                and (prev["inode"] is None or prev["inode"] == st.st_ino)):
+                sin_cambios.append((st.st_ino, scan_id, path))
+            else:
+                cambiados.append((path, st, prev))
+
+        hashes = {}
+        if cambiados and not modo_rapido:
+            hashes = dict(zip(
+                (path for path, _, _ in cambiados),
+                pool.map(file_md5, (path for path, _, _ in cambiados)),
+            ))
+
+        filas = []
+        reales = 0
+        for path, st, prev in cambiados:
+            nuevo_hash = hashes.get(path)
+            # Si solo cambió el mtime pero el contenido es idéntico, no se reporta como cambio
+            if nuevo_hash and prev is not None and prev["hash"] == nuevo_hash and prev["size"] == st.st_size:
+                filas.append((path, st.st_ino, st.st_size, st.st_mtime, nuevo_hash, scan_id, None))
+                continue
+            filas.append((path, st.st_ino, st.st_size, st.st_mtime, nuevo_hash, scan_id, scan_id))
+            reales += 1
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if sin_cambios:
+                self.conn.executemany(
+                    "UPDATE files SET inode = ?, seen_scan_id = ? WHERE path = ?", sin_cambios
+                )
+            if filas:
+                self.conn.executemany(
+                    "INSERT INTO files (path, inode, size, mtime, hash, seen_scan_id, changed_scan_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET inode = excluded.inode, size = excluded.size, "
+                    "mtime = excluded.mtime, hash = excluded.hash, seen_scan_id = excluded.seen_scan_id, "
+                    "changed_scan_id = COALESCE(excluded.changed_scan_id, files.changed_scan_id)",
+                    filas,
+                )
+            self.conn.execute(
+                "UPDATE scans SET cursor = ?, total_escaneados = total_escaneados + ?, "
+                "archivos_cambiados = archivos_cambiados + ?, omitidos_por_tamano = omitidos_por_tamano + ? "
+                "WHERE scan_id = ?",
+                (json.dumps(list(cursor)) if cursor else None, len(lote), reales, omitidos, scan_id),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+
+    def _finalizar(self, scan_id: int) -> None:
+        """Cierra el escaneo y quita del manifiesto los archivos que ya no existen."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            eliminados = self.conn.execute(
+                "DELETE FROM files WHERE seen_scan_id < ?", (scan_id,)
+            ).rowcount
+            self.conn.execute(
+                "UPDATE scans SET status = 'completo', finished_at = ?, cursor = NULL, "
+                "archivos_eliminados = ? WHERE scan_id = ?",
+                (time.time(), eliminados, scan_id),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+
+    # ---------------------------
+    # Cambios paginados
+    # ---------------------------
+    def cambios(self, scan_id: int, after: Optional[str] = None, page_size: int = 1000) -> Dict[str, Any]:
+        """Página de archivos cambiados en `scan_id`, ordenados por ruta (cursor = última ruta)."""
+        rows = self.conn.execute(
+            "SELECT path, size, mtime, hash FROM files WHERE changed_scan_id = ? AND path > ? "
+            "ORDER BY path LIMIT ?",
+            (scan_id, after or "", page_size + 1),
+        ).fetchall()
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        return {
+            "scan_id": scan_id,
+            "detalles": [_fila_cambio(r) for r in rows],
+            "next_cursor": rows[-1]["path"] if has_next else None,
+        }
+
+
+    def iter_cambios(self, scan_id: int, after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Recorre todos los cambios de `scan_id` por páginas (para respuestas en streaming)."""
+        while True:
+            pagina = self.cambios(scan_id, after, MANIFEST_BATCH_SIZE)
+            yield from pagina["detalles"]
+            after = pagina["next_cursor"]
+            if not after:
+                return
+
+
+    def get_file(self, path: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+
+
+    def set_hash(self, path: str, file_hash: str) -> None:
+        self.conn.execute("UPDATE files SET hash = ? WHERE path = ?", (file_hash, path))
+
+
+
+def _fila_cambio(r: sqlite3.Row) -> Dict[str, Any]:
+    cambio = {"path": r["path"], "size": r["size"], "mtime": r["mtime"]}
+    if r["hash"]:
+        cambio["md5"] = r["hash"]
+    return cambio
+
+
+
+def _walk(roots: List[str], excluir: Callable[[str], bool], cursor: Optional[tuple]) -> Iterator[Tuple[tuple, str, os.stat_result]]:
+    """
+    Recorre los directorios con os.scandir en orden determinístico y devuelve
+    (clave, ruta_real, stat) para cada archivo. La clave es (índice_raíz, *componentes), de modo
+    que el orden de recorrido coincide con el orden de las claves y se puede retomar desde `cursor`.
+    Los archivos y directorios para los que `excluir(ruta)` es verdadero no se recorren.
+    """
+    for idx, root in enumerate(roots):
+        if not root or not os.path.isdir(root):
+            continue
+        yield from _walk_dir(root, (idx,), excluir, cursor)
+
+
+def _walk_dir(path: str, clave: tuple, excluir: Callable[[str], bool], cursor: Optional[tuple]):
+    if cursor is not None and cursor[:len(clave)] > clave:
+        # Todo el subárbol quedó antes del cursor
+        return
+    try:
+        with os.scandir(path) as it:
+            entradas = sorted(it, key=lambda e: e.name)
+    except OSError:
+        return
+
+    for entrada in entradas:
+        clave_entrada = clave + (entrada.name,)
+        try:
+            if entrada.is_symlink() or excluir(entrada.path):
+                continue
+            if entrada.is_dir(follow_symlinks=False):
+                yield from _walk_dir(entrada.path, clave_entrada, excluir, cursor)
+                continue
+            if not entrada.is_file(follow_symlinks=False):
+                continue
+            if cursor is not None and clave_entrada <= cursor:
+                continue
+            yield clave_entrada, entrada.path, entrada.stat(follow_symlinks=False)
+        except OSError:
+            continue
@@ -0,0 +1,500 @@
+import os
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session, aliased
+
+from database.config import SessionLocal
+from helpers.jobstore import JOBSTORE_EXPORT_DIR
+from models.users import User
+from models.proyecto import Proyecto
+from models.nna import Nna
+from models.ddjj import DDJJ
+from models.convocatorias import Postulacion
+from models.carpeta import Carpeta, DetalleNNAEnCarpeta, DetalleProyectosEnCarpeta
+
+
+# Índice de búsqueda de los listados (parámetro `search` / `busqueda_rapida`).
+#
+# Los listados buscaban cada palabra con ILIKE '%palabra%' sobre varios campos de varias tablas
+# unidas, o sea un recorrido completo por búsqueda. Acá cada fila buscable (usuario, proyecto, NNA,
+# DDJJ, carpeta, postulación) tiene un "documento": sus campos de búsqueda en minúsculas y sin
+# acentos, en una tabla FTS5 de SQLite con tokenizador trigram dentro de EXPORT_DIR (compartida por
+# los workers, como la cola de mails). El trigram resuelve por índice tanto prefijos como
+# substrings: buscar("usuarios", "gonz pere") devuelve los logins cuyo documento contiene "gonz"
+# y "pere", igual que el AND de ILIKEs original.
+#
+# El índice se mantiene solo: cada commit que toca un campo indexado encola las claves afectadas
+# (incluidas las dependientes: el documento de un proyecto tiene los nombres de sus adoptantes, el
+# de una carpeta los de sus NNA y proyectos) y un hilo las vuelve a leer de MySQL. Cada
+# BUSQUEDA_RESYNC_SEGS un worker recorre todo y corrige lo que cambió por fuera del ORM.
+#
+# buscar() devuelve None si el índice todavía no está armado o si hay demasiadas coincidencias
+# para un IN: el listado usa entonces su filtro ILIKE de siempre.
+
+
+BUSQUEDA_DB_PATH = os.path.join(JOBSTORE_EXPORT_DIR, "_busqueda.sqlite3")
+
+# Cada cuánto se recorre todo para corregir cambios hechos por fuera del ORM
+BUSQUEDA_RESYNC_SEGS = int(os.getenv("BUSQUEDA_RESYNC_SEGS", "900"))
+
+# Con más coincidencias que esto se filtra en MySQL (un IN tan grande no conviene)
+BUSQUEDA_MAX_CLAVES = int(os.getenv("BUSQUEDA_MAX_CLAVES", "5000"))
+
+# Claves por lote al reconstruir
+BUSQUEDA_LOTE = 1000
+
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+# False hasta que el esquema existe (y SQLite tiene el tokenizador trigram)
+_disponible = False
+
+_cola: "queue.Queue[Dict[type, Set]]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+
+
+
+# ── Fuentes: qué campos forman el documento de cada tipo ───────────────────────
+# Cada fuente es una consulta cuya primera columna es la clave; una clave puede tener varias
+# filas (la carpeta, una por NNA x proyecto) y el documento junta todos sus valores. La clave no
+# entra al documento: si el ILIKE que se reemplaza también la busca (el login/DNI de los usuarios)
+# se repite como columna de valor. tests/test_busqueda_fuentes.py compara los campos con cada ILIKE.
+
+def _fuente_usuarios(db: Session):
+    return db.query(User.login, User.login.label("dni"), User.nombre, User.apellido, User.mail, User.calle_y_nro, User.barrio, User.localidad)
+
+
+def _fuente_proyectos(db: Session):
+    User1, User2 = aliased(User), aliased(User)
+    return (
+        db.query(
+            Proyecto.proyecto_id, Proyecto.nro_orden_rua, Proyecto.login_1, Proyecto.login_2,
+            Proyecto.proyecto_calle_y_nro, Proyecto.proyecto_barrio, Proyecto.proyecto_localidad,
+            Proyecto.proyecto_provincia, User1.nombre, User1.apellido, User2.nombre, User2.apellido,
+        )
+        .outerjoin(User1, User1.login == Proyecto.login_1)
+        .outerjoin(User2, User2.login == Proyecto.login_2)
+    )
+
+
+def _fuente_nna(db: Session):
+    return db.query(Nna.nna_id, Nna.nna_nombre, Nna.nna_apellido, Nna.nna_dni, Nna.nna_localidad)
+
+
+def _fuente_ddjj(db: Session):
+    return db.query(
+        DDJJ.ddjj_id, DDJJ.ddjj_nombre, DDJJ.ddjj_apellido, DDJJ.login, DDJJ.ddjj_localidad,
+        DDJJ.ddjj_provincia, DDJJ.ddjj_correo_electronico, DDJJ.ddjj_telefono,
+    )
+
+
+def _fuente_carpetas(db: Session):
+    User1, User2 = aliased(User), aliased(User)
+    return (
+        db.query(
+            Carpeta.carpeta_id, Nna.nna_nombre, Nna.nna_apellido, Nna.nna_dni,
+            Proyecto.nro_orden_rua, Proyecto.login_1, Proyecto.login_2,
+            User1.nombre, User1.apellido, User1.login, User2.nombre, User2.apellido, User2.login,
+        )
+        .outerjoin(DetalleNNAEnCarpeta, DetalleNNAEnCarpeta.carpeta_id == Carpeta.carpeta_id)
+        .outerjoin(Nna, Nna.nna_id == DetalleNNAEnCarpeta.nna_id)
+        .outerjoin(DetalleProyectosEnCarpeta, DetalleProyectosEnCarpeta.carpeta_id == Carpeta.carpeta_id)
+        .outerjoin(Proyecto, Proyecto.proyecto_id == DetalleProyectosEnCarpeta.proyecto_id)
+        .outerjoin(User1, User1.login == Proyecto.login_1)
+        .outerjoin(User2, User2.login == Proyecto.login_2)
+    )
+
+
+def _fuente_postulaciones(db: Session):
+    return db.query(
+        Postulacion.postulacion_id, Postulacion.nombre, Postulacion.apellido, Postulacion.dni,
+        Postulacion.calle_y_nro, Postulacion.barrio, Postulacion.localidad, Postulacion.provincia,
+        Postulacion.mail, Postulacion.ocupacion, Postulacion.conyuge_nombre, Postulacion.conyuge_apellido,
+        Postulacion.conyuge_dni, Postulacion.conyuge_otros_datos,
+    )
+
+
+# tipo -> (columna clave, tipo de la clave, consulta)
+FUENTES: Dict[str, Tuple[object, type, Callable]] = {
+    "usuarios": (User.login, str, _fuente_usuarios),
+    "proyectos": (Proyecto.proyecto_id, int, _fuente_proyectos),
+    "nna": (Nna.nna_id, int, _fuente_nna),
+    "ddjj": (DDJJ.ddjj_id, int, _fuente_ddjj),
+    "carpetas": (Carpeta.carpeta_id, int, _fuente_carpetas),
+    "postulaciones": (Postulacion.postulacion_id, int, _fuente_postulaciones),
+}
+
+# Modelo -> (atributo clave, campos que forman parte de algún documento). Los modelos de detalle
+# (sin campos) cuentan solo al agregarse o borrarse.
+CAMPOS_INDEXADOS = {
+    User: ("login", ("nombre", "apellido", "mail", "calle_y_nro", "barrio", "localidad")),
+    Proyecto: ("proyecto_id", ("nro_orden_rua", "login_1", "login_2", "proyecto_calle_y_nro", "proyecto_barrio",
+                               "proyecto_localidad", "proyecto_provincia")),
+    Nna: ("nna_id", ("nna_nombre", "nna_apellido", "nna_dni", "nna_localidad")),
+    DDJJ: ("ddjj_id", ("ddjj_nombre", "ddjj_apellido", "login", "ddjj_localidad", "ddjj_provincia",
+                       "ddjj_correo_electronico", "ddjj_telefono")),
+    Postulacion: ("postulacion_id", ("nombre", "apellido", "dni", "calle_y_nro", "barrio", "localidad", "provincia",
+                                     "mail", "ocupacion", "conyuge_nombre", "conyuge_apellido", "conyuge_dni",
+                                     "conyuge_otros_datos")),
+    DetalleNNAEnCarpeta: ("carpeta_id", ()),
+    DetalleProyectosEnCarpeta: ("carpeta_id", ()),
+}
+
+
+
+def plegar(texto: Optional[str]) -> str:
+    """Minúsculas y sin acentos ("Peña Gómez" -> "pena gomez")."""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def palabras_busqueda(texto: Optional[str]) -> List[str]:
+    return [p for p in plegar(texto).split() if p]
+
+
+
+# ── SQLite ──────────────────────────────────────────────────────────────────────
+
+def _get_conn() -> sqlite3.Connection:
+    """Una conexión por hilo (y por proceso, por si hubo fork)."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(BUSQUEDA_DB_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS docs (
+                        id      INTEGER PRIMARY KEY AUTOINCREMENT,
+                        tipo    TEXT NOT NULL,
+                        clave   TEXT NOT NULL,
+                        firma   TEXT NOT NULL,
+                        UNIQUE (tipo, clave)
+                    );
+                    CREATE TABLE IF NOT EXISTS meta (
+                        tipo            TEXT PRIMARY KEY,
+                        completo_en     REAL,
+                        iniciado_en     REAL
+                    );
+                    """
+                )
+                for tipo in FUENTES:
+                    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS fts_{tipo} USING fts5(texto, tokenize='trigram')")
+                _initialized = True
+    return conn
+
+
+def _firma(texto: str) -> str:
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def _escribir(tipo: str, documentos: Dict[str, Optional[str]]) -> int:
+    """Guarda los documentos {clave: texto} (None o vacío = borrar). Devuelve cuántos cambiaron."""
+    if not documentos:
+        return 0
+    conn = _get_conn()
+    cambiados = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for clave, texto in documentos.items():
+            fila = conn.execute("SELECT id, firma FROM docs WHERE tipo = ? AND clave = ?", (tipo, clave)).fetchone()
+            if not texto:
+                if fila:
+                    conn.execute(f"DELETE FROM fts_{tipo} WHERE rowid = ?", (fila[0],))
+                    conn.execute("DELETE FROM docs WHERE id = ?", (fila[0],))
+                    cambiados += 1
+                continue
+            firma = _firma(texto)
+            if fila and fila[1] == firma:
+                continue
+            if fila:
+                doc_id = fila[0]
+                conn.execute("UPDATE docs SET firma = ? WHERE id = ?", (firma, doc_id))
+                conn.execute(f"DELETE FROM fts_{tipo} WHERE rowid = ?", (doc_id,))
+            else:
+                doc_id = conn.execute(
+                    "INSERT INTO docs (tipo, clave, firma) VALUES (?, ?, ?)", (tipo, clave, firma)
+                ).lastrowid
+            conn.execute(f"INSERT INTO fts_{tipo} (rowid, texto) VALUES (?, ?)", (doc_id, texto))
+            cambiados += 1
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    return cambiados
+
+
+def _completo(tipo: str) -> bool:
+    fila = _get_conn().execute("SELECT completo_en FROM meta WHERE tipo = ?", (tipo,)).fetchone()
+    return bool(fila and fila[0])
+
+
+
+# ── Búsqueda ────────────────────────────────────────────────────────────────────
+
+def buscar(tipo: str, texto: Optional[str]) -> Optional[List]:
+    """
+    Claves de `tipo` cuyo documento contiene todas las palabras de `texto` (en cualquier campo,
+    como prefijo o en el medio). None si el índice no está disponible o si hay más de
+    BUSQUEDA_MAX_CLAVES coincidencias: en ese caso el llamador filtra con su ILIKE.
+    """
+    palabras = palabras_busqueda(texto)
+    if not _disponible or not palabras:
+        return None
+    try:
+        if not _completo(tipo):
+            return None
+
+        # Las de 3+ letras van por MATCH (trigramas); las más cortas, con LIKE sobre los candidatos
+        largas = [p for p in palabras if len(p) >= 3]
+        cortas = [p for p in palabras if len(p) < 3]
+        condiciones, parametros = [], []
+        if largas:
+            condiciones.append(f"fts_{tipo} MATCH ?")
+            parametros.append(" AND ".join('"' + p.replace('"', '""') + '"' for p in largas))
+        for p in cortas:
+            condiciones.append("f.texto LIKE ? ESCAPE '\\'")
+            parametros.append("%" + p.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+
+        filas = _get_conn().execute(
+            f"SELECT d.clave FROM fts_{tipo} f JOIN docs d ON d.id = f.rowid "
+            f"WHERE {' AND '.join(condiciones)} LIMIT ?",
+            (*parametros, BUSQUEDA_MAX_CLAVES + 1),
+        ).fetchall()
+    except Exception as e:
+        print(f"⚠️ Error en el índice de búsqueda ({tipo}), se busca en MySQL: {e}")
+        return None
+
+    if len(filas) > BUSQUEDA_MAX_CLAVES:
+        return None
+    convertir = FUENTES[tipo][1]
+    return [convertir(f[0]) for f in filas]
+
+
+
+# ── Armado de documentos ────────────────────────────────────────────────────────
+
+def _documentos(db: Session, tipo: str, claves: Iterable) -> Dict[str, Optional[str]]:
+    """{clave: texto del documento} leído de MySQL; None para las claves que ya no existen."""
+    columna, _, fuente = FUENTES[tipo]
+    claves = list(claves)
+    if not claves:
+        return {}
+    valores: Dict[str, List[str]] = {str(c): [] for c in claves}
+    for fila in fuente(db).filter(columna.in_(claves)).all():
+        partes = valores.setdefault(str(fila[0]), [])
+        for v in fila[1:]:
+            v = plegar(v).strip()
+            if v and v not in partes:
+                partes.append(v)
+    # Una clave sin filas ya no existe; una con filas pero sin valores queda con documento vacío
+    existentes = {str(f[0]) for f in db.query(columna).filter(columna.in_(claves)).all()}
+    return {c: (" ".join(p) if c in existentes else None) for c, p in valores.items()}
+
+
+def reindexar(tipo: str, claves: Iterable) -> int:
+    """Vuelve a leer de MySQL los documentos de esas claves. Devuelve cuántos cambiaron."""
+    claves = [c for c in set(claves) if c is not None]
+    if not _disponible or not claves:
+        return 0
+    total = 0
+    db = SessionLocal()
+    try:
+        for i in range(0, len(claves), BUSQUEDA_LOTE):
+            total += _escribir(tipo, _documentos(db, tipo, claves[i:i + BUSQUEDA_LOTE]))
+    finally:
+        db.close()
+    return total
+
+
+def reconstruir(tipo: str) -> int:
+    """Recorre todas las filas de `tipo`, corrige los documentos distintos y borra los que sobran."""
+    columna, convertir, _ = FUENTES[tipo]
+    vistas: Set[str] = set()
+    total = 0
+    db = SessionLocal()
+    try:
+        ultima = None
+        while True:
+            q = db.query(columna).order_by(columna)
+            if ultima is not None:
+                q = q.filter(columna > ultima)
+            claves = [c for (c,) in q.limit(BUSQUEDA_LOTE).all()]
+            if not claves:
+                break
+            ultima = claves[-1]
+            vistas.update(str(c) for c in claves)
+            total += _escribir(tipo, _documentos(db, tipo, claves))
+            db.rollback()   # no retener la transacción (ni el snapshot) entre lotes
+    finally:
+        db.close()
+
+    conn = _get_conn()
+    sobrantes = [c for (c,) in conn.execute("SELECT clave FROM docs WHERE tipo = ?", (tipo,)) if c not in vistas]
+    total += _escribir(tipo, {c: None for c in sobrantes})
+    conn.execute(
+        "INSERT INTO meta (tipo, completo_en) VALUES (?, ?) "
+        "ON CONFLICT(tipo) DO UPDATE SET completo_en = excluded.completo_en",
+        (tipo, time.time()),
+    )
+    return total
+
+
+def _tomar_resync(tipo: str) -> bool:
+    """True si a este proceso le toca recorrer `tipo` (nadie lo hizo ni lo empezó hace poco)."""
+    conn = _get_conn()
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        fila = conn.execute("SELECT completo_en, iniciado_en FROM meta WHERE tipo = ?", (tipo,)).fetchone()
+        completo_en, iniciado_en = fila if fila else (None, None)
+        if (completo_en and completo_en > ahora - BUSQUEDA_RESYNC_SEGS) or \
+                (iniciado_en and iniciado_en > ahora - BUSQUEDA_RESYNC_SEGS):
+            conn.execute("COMMIT")
+            return False
+        conn.execute(
+            "INSERT INTO meta (tipo, iniciado_en) VALUES (?, ?) "
+            "ON CONFLICT(tipo) DO UPDATE SET iniciado_en = excluded.iniciado_en",
+            (tipo, ahora),
+        )
+        conn.execute("COMMIT")
+        return True
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+
+# ── Cambios del ORM ─────────────────────────────────────────────────────────────
+
+def _expandir(db: Session, cambios: Dict[type, Set]) -> Dict[str, Set]:
+    """Claves a reindexar por tipo, incluidos los documentos que dependen de lo que cambió."""
+    por_tipo: Dict[str, Set] = {tipo: set() for tipo in FUENTES}
+    logins = cambios.get(User, set())
+    proyectos = set(cambios.get(Proyecto, set()))
+    nnas = cambios.get(Nna, set())
+
+    por_tipo["usuarios"] |= logins
+    por_tipo["nna"] |= nnas
+    por_tipo["ddjj"] |= cambios.get(DDJJ, set())
+    por_tipo["postulaciones"] |= cambios.get(Postulacion, set())
+    por_tipo["carpetas"] |= cambios.get(DetalleNNAEnCarpeta, set()) | cambios.get(DetalleProyectosEnCarpeta, set())
+
+    if logins:
+        proyectos |= {
+            p for (p,) in db.query(Proyecto.proyecto_id)
+            .filter(or_(Proyecto.login_1.in_(logins), Proyecto.login_2.in_(logins))).all()
+        }
+    por_tipo["proyectos"] |= proyectos
+
+    if proyectos:
+        por_tipo["carpetas"] |= {
+            c for (c,) in db.query(DetalleProyectosEnCarpeta.carpeta_id)
+            .filter(DetalleProyectosEnCarpeta.proyecto_id.in_(proyectos)).all()
+        }
+    if nnas:
+        por_tipo["carpetas"] |= {
+            c for (c,) in db.query(DetalleNNAEnCarpeta.carpeta_id)
+            .filter(DetalleNNAEnCarpeta.nna_id.in_(nnas)).all()
+        }
+    return por_tipo
+
+
+def _procesar_cambios(cambios: Dict[type, Set]) -> None:
+    db = SessionLocal()
+    try:
+        por_tipo = _expandir(db, cambios)
+    finally:
+        db.close()
+    for tipo, claves in por_tipo.items():
+        if claves:
+            reindexar(tipo, claves)
+
+
+def _loop() -> None:
+    while True:
+        try:
+            for tipo in FUENTES:
+                if _tomar_resync(tipo):
+                    cambiados = reconstruir(tipo)
+                    if cambiados:
+                        print(f"🔎 Índice de búsqueda ({tipo}): {cambiados} documentos actualizados")
+
+            try:
+                cambios = _cola.get(timeout=30)
+            except queue.Empty:
+                continue
+            # Juntar lo que se acumuló mientras tanto en una sola pasada
+            while True:
+                try:
+                    otros = _cola.get_nowait()
+                except queue.Empty:
+                    break
+                for modelo, claves in otros.items():
+                    cambios.setdefault(modelo, set()).update(claves)
+            _procesar_cambios(cambios)
+        except Exception as e:
+            print(f"⚠️ Error en el worker del índice de búsqueda: {e}")
+            time.sleep(5)
+
+
+def iniciar_indice_busqueda() -> None:
+    """Al arrancar: crea el índice si hace falta y arranca el hilo que lo mantiene."""
+    global _disponible, _worker
+    try:
+        _get_conn()
+        _disponible = True
+    except Exception as e:
+        print(f"⚠️ Índice de búsqueda no disponible, se busca con ILIKE: {e}")
+        return
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_loop, name="indice-busqueda", daemon=True)
+        _worker.start()
+
+
+# Las claves tocadas en el flush se juntan en session.info y se encolan recién en el commit. Si la
+# transacción se revierte quedan para el próximo commit: reindexar de más solo cuesta una consulta.
+
+@event.listens_for(Session, "after_flush")
+def _marcar_busqueda(session: Session, flush_context) -> None:
+    if not _disponible:
+        return
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        indexado = CAMPOS_INDEXADOS.get(type(obj))
+        if indexado is None:
+            continue
+        atributo, campos = indexado
+        if obj in session.dirty and obj not in session.deleted:
+            estado = inspect(obj)
+            if not any(estado.attrs[c].history.has_changes() for c in campos):
+                continue
+        clave = getattr(obj, atributo, None)
+        if clave is not None:
+            session.info.setdefault("busqueda_cambios", {}).setdefault(type(obj), set()).add(clave)
+
+
+@event.listens_for(Session, "after_commit")
+def _encolar_busqueda(session: Session) -> None:
+    cambios = session.info.pop("busqueda_cambios", None)
+    if cambios:
+        _cola.put(cambios)
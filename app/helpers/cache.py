@@ -0,0 +1,42 @@
+import os
+
+try:
+    import redis
+    REDIS_ENABLED = True
+except Exception:
+    REDIS_ENABLED = False
+
+
+# Backend compartido opcional para cachés entre workers de uvicorn.
+# Si REDIS_URL no está definida (o redis no está instalado) cada worker usa solo su memoria.
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Prefijo de todas las claves que escribe la API
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "rua:")
+
+
+_redis_client = None
+
+
+
+def get_redis():
+    """
+    Devuelve un cliente redis compartido o None si no hay backend configurado.
+    Los errores de conexión se detectan al usarlo; quien llama debe tolerarlos y
+    seguir con la caché en memoria.
+    """
+    global _redis_client
+    if not (REDIS_ENABLED and REDIS_URL):
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            REDIS_URL,
+            socket_timeout = 0.5,
+            socket_connect_timeout = 0.5,
+            decode_responses = True,
+        )
+    return _redis_client
+
+
+def redis_key(*partes) -> str:
+    return REDIS_PREFIX + ":".join(str(p) for p in partes)
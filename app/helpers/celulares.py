@@ -0,0 +1,218 @@
+import os
+import re
+import time
+import threading
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from database.config import SessionLocal, engine
+from helpers.utils import normalize_phone
+from helpers.tablas_derivadas import asegurar_registro, sincronizar_si_vencida, ultima_sincronizacion
+from models.users import User, UserCelular
+
+
+# Índice teléfono -> login.
+#
+# sec_users.celular guarda lo que haya cargado cada usuario ("351 15...", "+54 9 351...", "0351...").
+# sec_users_celular tiene, por login, el mismo número en forma canónica E.164 con índice, así que
+# resolver el login de un remitente de WhatsApp es una búsqueda puntual por índice.
+#
+# La tabla se mantiene sola: cada flush que crea un User o le cambia el celular actualiza su fila, y
+# un hilo corre sincronizar_celulares() al arrancar y cada CELULARES_RESYNC_SEGS, que completa o
+# corrige las filas que no coinciden con sec_users.celular (usuarios previos o cambios hechos por
+# fuera del ORM). La sincronización corre en un solo worker a la vez y la tabla se usa para buscar
+# recién cuando hubo una completa (helpers/tablas_derivadas.py).
+
+
+# Filas que corrige sincronizar_celulares() por transacción
+CELULARES_LOTE = 500
+
+# Cada cuánto se vuelve a recorrer todo (uno de los workers), y cada cuánto se revisa si toca
+CELULARES_RESYNC_SEGS = int(os.getenv("CELULARES_RESYNC_SEGS", "900"))
+CELULARES_REVISION_SEGS = 60
+
+# Nombre en tablas_derivadas_sync
+CELULARES_SYNC = "sec_users_celular"
+
+
+# True cuando la tabla existe: desde ahí cada flush mantiene sus filas
+_tabla_creada = False
+
+# True cuando hubo una sincronización completa; mientras tanto la búsqueda cae a sec_users.celular
+_tabla_lista = False
+
+_worker = None
+
+
+
+def celular_e164(celular: Optional[str]) -> Optional[str]:
+    """
+    Forma canónica E.164 de un celular. Los argentinos quedan como +549 + código de área + número
+    (la forma en que los envía Meta); None si no tiene una cantidad de dígitos razonable.
+    """
+    if not celular:
+        return None
+    digitos = re.sub(r"\D", "", celular)
+    if digitos.startswith("00"):
+        digitos = digitos[2:]
+    elif digitos.startswith("0"):
+        digitos = digitos[1:]
+
+    if len(digitos) == 12 and not digitos.startswith("54"):
+        # Nacional con el 15 después del código de área (351 15 2613442)
+        for n in (2, 3, 4):
+            if digitos[n:n + 2] == "15":
+                digitos = digitos[:n] + digitos[n + 2:]
+                break
+
+    if len(digitos) == 10:
+        digitos = "549" + digitos              # número nacional sin 0 ni 15
+    elif digitos.startswith("54") and len(digitos) == 12:
+        digitos = "549" + digitos[2:]          # +54 sin el 9 de celular
+    elif not digitos.startswith("54") and len(digitos) < 11:
+        return None
+
+    if len(digitos) < 11 or len(digitos) > 15:
+        return None
+    return "+" + digitos
+
+
+
+def asegurar_tabla_celulares() -> bool:
+    """Crea sec_users_celular si no existe. Devuelve si quedó disponible."""
+    global _tabla_creada
+    try:
+        UserCelular.__table__.create(bind=engine, checkfirst=True)
+        asegurar_registro()
+        _tabla_creada = True
+    except Exception as e:
+        print(f"⚠️ No se pudo crear sec_users_celular, se busca por sec_users.celular: {e}")
+    return _tabla_creada
+
+
+def sincronizar_celulares() -> int:
+    """Crea o corrige las filas de sec_users_celular que no coinciden con sec_users. Devuelve cuántas."""
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            filas = (
+                db.query(User.login, User.celular, UserCelular)
+                .outerjoin(UserCelular, UserCelular.login == User.login)
+                .filter(func.coalesce(User.celular, "") != func.coalesce(UserCelular.celular_original, ""))
+                .limit(CELULARES_LOTE)
+                .all()
+            )
+            if not filas:
+                break
+            for login, celular, fila in filas:
+                if fila is None:
+                    db.add(UserCelular(login=login, celular_e164=celular_e164(celular), celular_original=celular))
+                else:
+                    fila.celular_e164 = celular_e164(celular)
+                    fila.celular_original = celular
+            db.commit()
+            total += len(filas)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return total
+
+
+def _loop() -> None:
+    global _tabla_lista
+    while True:
+        try:
+            if _tabla_creada or asegurar_tabla_celulares():
+                total = sincronizar_si_vencida(CELULARES_SYNC, sincronizar_celulares, CELULARES_RESYNC_SEGS)
+                if total:
+                    print(f"📱 sec_users_celular: {total} celulares indexados")
+                if not _tabla_lista and ultima_sincronizacion(CELULARES_SYNC) is not None:
+                    _tabla_lista = True
+                    print("📱 sec_users_celular: se busca por el índice E.164")
+        except Exception as e:
+            print(f"⚠️ Error sincronizando sec_users_celular: {e}")
+        time.sleep(CELULARES_REVISION_SEGS)
+
+
+def iniciar_sincronizacion_celulares() -> None:
+    """Al arrancar: crea la tabla si hace falta y arranca el hilo que la sincroniza."""
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_loop, name="celulares-sync", daemon=True)
+        _worker.start()
+
+
+
+def usuarios_por_celular(db: Session, celulares: Iterable[str]) -> Dict[str, User]:
+    """
+    Resuelve varios celulares (en cualquier formato) a su usuario, en una sola consulta por el
+    índice E.164. Devuelve {celular tal como vino: User}; los que no se encuentran no aparecen.
+    """
+    celulares = [c for c in set(celulares) if c]
+    if not celulares:
+        return {}
+
+    if not _tabla_lista:
+        # Sin índice: comparación directa contra sec_users.celular
+        formas = set(celulares) | {normalize_phone(c) for c in celulares}
+        por_celular = {u.celular: u for u in db.query(User).filter(User.celular.in_(formas)).all()}
+        return {
+            c: por_celular.get(normalize_phone(c)) or por_celular[c]
+            for c in celulares
+            if normalize_phone(c) in por_celular or c in por_celular
+        }
+
+    por_e164 = {}
+    for c in celulares:
+        e164 = celular_e164(c)
+        if e164:
+            por_e164.setdefault(e164, []).append(c)
+    if not por_e164:
+        return {}
+
+    resultado = {}
+    filas = (
+        db.query(UserCelular.celular_e164, User)
+        .join(User, User.login == UserCelular.login)
+        .filter(UserCelular.celular_e164.in_(list(por_e164)))
+        .order_by(UserCelular.login)
+        .all()
+    )
+    for e164, user in filas:
+        for c in por_e164[e164]:
+            resultado.setdefault(c, user)
+    return resultado
+
+
+def usuario_por_celular(db: Session, *celulares: str) -> Optional[User]:
+    """El usuario del primer celular (de los dados, en orden) que esté registrado."""
+    encontrados = usuarios_por_celular(db, celulares)
+    for c in celulares:
+        if c in encontrados:
+            return encontrados[c]
+    return None
+
+
+
+# ── Mantenimiento en cada escritura por el ORM ─────────────────────────────────
+
+@event.listens_for(Session, "before_flush")
+def _actualizar_celulares(session: Session, flush_context, instances) -> None:
+    if not _tabla_creada:
+        return
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, User) or not obj.login:
+            continue
+        if obj not in session.new and not inspect(obj).attrs.celular.history.has_changes():
+            continue
+        fila = session.get(UserCelular, obj.login) if obj not in session.new else None
+        if fila is None:
+            session.add(UserCelular(login=obj.login, celular_e164=celular_e164(obj.celular), celular_original=obj.celular))
+        else:
+            fila.celular_e164 = celular_e164(obj.celular)
+            fila.celular_original = obj.celular
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from helpers.cache import get_redis, redis_key
+from models.users import User
+from models.proyecto import Proyecto
+
+
+# Contadores de trabajo pendiente del backoffice (las "badges" de supervisión).
+#
+# Cada contador es la cantidad de filas de un modelo con la columna de estado en ciertos valores.
+# Se calculan todos juntos con un GROUP BY por tabla y se guardan CONTADORES_TTL_SEGS segundos
+# (en redis si hay, si no en memoria por worker).
+#
+# Se invalidan solos al confirmar (commit) un cambio hecho por el ORM en alguna de esas columnas
+# (alta, baja o cambio de estado). Los cambios por query(...).update() o SQL directo no pasan por
+# el flush: ahí se ven al vencer el TTL, o llamando a invalidar_contadores().
+
+
+CONTADORES_TTL_SEGS = int(os.getenv("CONTADORES_TTL_SEGS", "30"))
+
+# nombre -> (modelo, columna de estado, estados que cuenta)
+CONTADORES: Dict[str, Tuple[type, str, Tuple[str, ...]]] = {
+    "doc_adoptante": (User, "doc_adoptante_estado", ("pedido_revision",)),
+    "doc_proyecto": (Proyecto, "estado_general", ("en_revision",)),
+    "proyectos_en_entrevistas": (Proyecto, "estado_general", ("calendarizando", "entrevistando")),
+    "proyectos_en_valoracion": (Proyecto, "estado_general", ("en_valoracion",)),
+}
+
+
+_contadores: Optional[Tuple[float, Dict[str, int]]] = None
+_contadores_lock = threading.Lock()
+
+
+
+def registrar_contador(nombre: str, modelo: type, columna: str, estados: Tuple[str, ...]) -> None:
+    """Agrega un contador (cantidad de `modelo` con `columna` en `estados`)."""
+    CONTADORES[nombre] = (modelo, columna, tuple(estados))
+    invalidar_contadores()
+
+
+def _calcular(db: Session) -> Dict[str, int]:
+    # Un GROUP BY por (modelo, columna) con todos los estados que piden sus contadores
+    por_columna: Dict[Tuple[type, str], set] = {}
+    for modelo, columna, estados in CONTADORES.values():
+        por_columna.setdefault((modelo, columna), set()).update(estados)
+
+    cantidades: Dict[Tuple[type, str, str], int] = {}
+    for (modelo, columna), estados in por_columna.items():
+        col = getattr(modelo, columna)
+        for estado, cantidad in db.query(col, func.count()).filter(col.in_(estados)).group_by(col):
+            cantidades[(modelo, columna, estado)] = cantidad
+
+    return {
+        nombre: sum(cantidades.get((modelo, columna, e), 0) for e in estados)
+        for nombre, (modelo, columna, estados) in CONTADORES.items()
+    }
+
+
+def obtener_contadores(db: Session) -> Dict[str, int]:
+    """Todos los contadores, desde la caché si no vencieron."""
+    global _contadores
+    ahora = time.time()
+    with _contadores_lock:
+        guardado = _contadores
+    if guardado and guardado[0] > ahora:
+        return dict(guardado[1])
+
+    r = get_redis()
+    if r is not None:
+        try:
+            crudo = r.get(redis_key("contadores"))
+            if crudo:
+                valores = json.loads(crudo)
+                if set(valores) == set(CONTADORES):
+                    with _contadores_lock:
+                        _contadores = (ahora + CONTADORES_TTL_SEGS, valores)
+                    return dict(valores)
+        except Exception as e:
+            print(f"⚠️ No se pudieron leer los contadores en redis: {e}")
+
+    valores = _calcular(db)
+
+    with _contadores_lock:
+        _contadores = (ahora + CONTADORES_TTL_SEGS, valores)
+    if r is not None:
+        try:
+            r.set(redis_key("contadores"), json.dumps(valores), ex=CONTADORES_TTL_SEGS)
+        except Exception as e:
+            print(f"⚠️ No se pudieron guardar los contadores en redis: {e}")
+
+    return dict(valores)
+
+
+def invalidar_contadores() -> None:
+    global _contadores
+    with _contadores_lock:
+        _contadores = None
+
+    r = get_redis()
+    if r is not None:
+        try:
+            r.delete(redis_key("contadores"))
+        except Exception as e:
+            print(f"⚠️ No se pudieron invalidar los contadores en redis: {e}")
+
+
+
+# ── Invalidación automática por cambios del ORM ─────────────────────────────────
+# Igual que la identidad (security/identidad.py): se marca en el flush y se invalida en el commit.
+
+def _afecta_contadores(session: Session, obj) -> bool:
+    columnas = [columna for modelo, columna, _ in CONTADORES.values() if isinstance(obj, modelo)]
+    if not columnas:
+        return False
+    if obj in session.new or obj in session.deleted:
+        return True
+    estado = inspect(obj)
+    return any(estado.attrs[columna].history.has_changes() for columna in columnas)
+
+
+@event.listens_for(Session, "after_flush")
+def _marcar_contadores(session: Session, flush_context) -> None:
+    if session.info.get("contadores_a_invalidar"):
+        return
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if _afecta_contadores(session, obj):
+            session.info["contadores_a_invalidar"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_contadores(session: Session) -> None:
+    if session.info.pop("contadores_a_invalidar", None):
+        invalidar_contadores()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import subprocess
+from typing import Dict, List
+
+from PIL import Image
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    HEIF_ENABLED = True
+except Exception:
+    HEIF_ENABLED = False
+
+
+# Conversión de documentos sueltos a PDF y derivados de imágenes (la usan services/dossiers.py y
+# services/uploads.py).
+#
+# Este módulo no importa nada de la app: las imágenes se procesan en un pool de procesos (spawn)
+# que solo necesita cargar Pillow. Los documentos de Office se convierten de a lotes en
+# una sola invocación de LibreOffice, con un perfil de usuario persistente por proceso para no
+# recrearlo en cada arranque.
+
+
+# Tamaño A4 en puntos (1 punto = 1/72 pulgadas)
+A4_ANCHO, A4_ALTO = 595, 842
+
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png")
+EXTENSIONES_OFFICE = (".doc", ".docx")
+
+# Tiempo máximo de una invocación de LibreOffice (un lote)
+LIBREOFFICE_TIMEOUT_SEGS = int(os.getenv("LIBREOFFICE_TIMEOUT_SEGS", "300"))
+
+
+
+def imagen_a_pdf(origen: str, destino: str, en_a4: bool) -> str:
+    """
+    Convierte una imagen a PDF. `en_a4` la centra en una hoja A4 blanca (achicándola si hace
+    falta); si no, el PDF queda del tamaño de la imagen. Escribe de forma atómica.
+    """
+    img = Image.open(origen).convert("RGB")
+    if en_a4:
+        hoja = Image.new("RGB", (A4_ANCHO, A4_ALTO), (255, 255, 255))
+        # Redimensionar manteniendo proporción para que quepa en A4 y centrarla
+        img.thumbnail((A4_ANCHO, A4_ALTO))
+        hoja.paste(img, ((A4_ANCHO - img.width) // 2, (A4_ALTO - img.height) // 2))
+        img = hoja
+
+    temporal = destino + f".{os.getpid()}.tmp"
+    if en_a4:
+        img.save(temporal, "PDF", resolution=100.0)
+    else:
+        img.save(temporal, "PDF")
+    os.replace(temporal, destino)
+    return destino
+
+
+def office_a_pdf(conversiones: Dict[str, str], perfil_dir: str) -> List[str]:
+    """
+    Convierte documentos de Office a PDF con una sola invocación de LibreOffice.
+    `conversiones` es {origen: destino}. Devuelve los destinos que se generaron.
+    """
+    if not conversiones:
+        return []
+
+    generados = []
+    with tempfile.TemporaryDirectory(prefix="office_pdf_") as trabajo:
+        entrada = os.path.join(trabajo, "in")
+        salida = os.path.join(trabajo, "out")
+        os.makedirs(entrada)
+        os.makedirs(salida)
+
+        # Nombres únicos: LibreOffice nombra la salida como la entrada
+        nombres = {}
+        for i, (origen, destino) in enumerate(conversiones.items()):
+            nombre = f"doc_{i}{os.path.splitext(origen)[1].lower()}"
+            shutil.copy(origen, os.path.join(entrada, nombre))
+            nombres[os.path.splitext(nombre)[0] + ".pdf"] = destino
+
+        subprocess.run(
+            [
+                "libreoffice", "--headless",
+                f"-env:UserInstallation=file://{perfil_dir}",
+                "--convert-to", "pdf", "--outdir", salida,
+                *[os.path.join(entrada, n) for n in sorted(os.listdir(entrada))],
+            ],
+            check=True,
+            timeout=LIBREOFFICE_TIMEOUT_SEGS,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        for nombre_pdf, destino in nombres.items():
+            generado = os.path.join(salida, nombre_pdf)
+            if os.path.exists(generado):
+                temporal = destino + f".{os.getpid()}.tmp"
+                shutil.move(generado, temporal)
+                os.replace(temporal, destino)
+                generados.append(destino)
+    return generados
+
+
+def heic_a_jpeg(origen: str, destino: str, calidad: int) -> str:
+    """Convierte una foto HEIC/HEIF a JPEG. Escribe de forma atómica."""
+    if not HEIF_ENABLED:
+        raise RuntimeError("pillow_heif no está instalado")
+    img = Image.open(origen).convert("RGB")
+    temporal = destino + f".{os.getpid()}.tmp"
+    img.save(temporal, "JPEG", quality=calidad, optimize=True)
+    os.replace(temporal, destino)
+    return destino
+
+
+def miniatura(origen: str, destino: str, lado: int) -> str:
+    """JPEG de la imagen reducida a `lado` píxeles como máximo. Escribe de forma atómica."""
+    img = Image.open(origen)
+    img.draft("RGB", (lado, lado))
+    img = img.convert("RGB")
+    img.thumbnail((lado, lado))
+    temporal = destino + f".{os.getpid()}.tmp"
+    img.save(temporal, "JPEG", quality=80)
+    os.replace(temporal, destino)
+    return destino
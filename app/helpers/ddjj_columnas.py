@@ -0,0 +1,106 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, load_only
+
+from models.ddjj import DDJJ
+
+
+# Grupos de columnas de la DDJJ (la tabla tiene ~280).
+#
+# La mayoría de los endpoints usa una parte chica de la DDJJ (la fecha de nacimiento, el domicilio,
+# los subregistros), así que en lugar de traer la fila completa se carga solo el grupo que hace
+# falta: cargar_ddjj(db, login, "domicilio"). El resto de las columnas queda diferido (si se accede
+# a una se trae en una consulta aparte), así que el código que lee otra columna sigue funcionando,
+# solo que más lento: conviene pedir el grupo correcto. Para escribir la DDJJ completa o devolverla
+# entera sigue estando db.query(DDJJ).
+
+
+def _con_prefijo(*prefijos: str) -> Tuple[str, ...]:
+    return tuple(c.key for c in DDJJ.__table__.columns if c.key.startswith(prefijos))
+
+
+# Siempre se cargan
+DDJJ_COLUMNAS_BASE = ("ddjj_id", "login", "ddjj_fecha_ultimo_cambio")
+
+DDJJ_GRUPOS: Dict[str, Tuple[str, ...]] = {
+    "identidad": (
+        "ddjj_nombre", "ddjj_apellido", "ddjj_estado_civil", "ddjj_fecha_nac", "ddjj_nacionalidad",
+        "ddjj_sexo", "ddjj_correo_electronico", "ddjj_telefono", "ddjj_inscripto_programa_familias",
+    ),
+    "domicilio": (
+        "ddjj_calle", "ddjj_depto", "ddjj_barrio", "ddjj_localidad", "ddjj_cp", "ddjj_provincia",
+        "ddjj_calle_legal", "ddjj_depto_legal", "ddjj_barrio_legal", "ddjj_localidad_legal",
+        "ddjj_cp_legal", "ddjj_provincia_legal",
+    ),
+    "familia": _con_prefijo("ddjj_hijo", "ddjj_otro"),
+    "red_apoyo": _con_prefijo("ddjj_apoyo"),
+    "laboral": (
+        "ddjj_educativo_maximo", "ddjj_ocupacion", "ddjj_horas_semanales", "ddjj_ingreso_mensual",
+        "ddjj_existe_otro_ingreso", "ddjj_ingreso_grupo_familiar", "ddjj_analizaron", "ddjj_horas_ocio",
+        "ddjj_extra_laborales",
+    ),
+    "judicial": (
+        "ddjj_denunciado_violencia_familiar", "ddjj_descripcion_violencia_familiar", "ddjj_causa_penal",
+        "ddjj_descripcion_causa_penal", "ddjj_juicios_filiacion", "ddjj_descripcion_juicios_filiacion",
+    ),
+    # Subregistros declarados (ddjj_subregistro_*), sus flexibilidades y los definitivos (subreg_*)
+    "subregistros": _con_prefijo(
+        "ddjj_subregistro_", "ddjj_flex_", "ddjj_discapacidad_", "ddjj_edad_", "ddjj_enfermedad_",
+        "ddjj_hermanos_", "subreg_",
+    ),
+    "aceptaciones": _con_prefijo("ddjj_acepto_", "ddjj_guardo_"),
+}
+
+
+
+def campos_ddjj(*grupos: str, campos: Iterable[str] = ()) -> List[str]:
+    """Nombres de columna de los grupos pedidos más `campos`, sin repetir (incluye las de base)."""
+    nombres = list(DDJJ_COLUMNAS_BASE)
+    for grupo in grupos:
+        if grupo not in DDJJ_GRUPOS:
+            raise ValueError(f"Grupo de DDJJ desconocido: {grupo}")
+        nombres.extend(DDJJ_GRUPOS[grupo])
+    nombres.extend(campos)
+    return list(dict.fromkeys(nombres))
+
+
+def columnas_ddjj(*grupos: str, campos: Iterable[str] = ()) -> list:
+    """Columnas para proyectar en db.query(...) (filas livianas, sin objetos DDJJ)."""
+    return [getattr(DDJJ, c) for c in campos_ddjj(*grupos, campos=campos)]
+
+
+def opciones_ddjj(*grupos: str, campos: Iterable[str] = ()):
+    """Opción de carga para query(DDJJ): trae los grupos pedidos y difiere el resto."""
+    return load_only(*columnas_ddjj(*grupos, campos=campos))
+
+
+def cargar_ddjj(db: Session, login: str, *grupos: str, campos: Iterable[str] = ()) -> Optional[DDJJ]:
+    """La DDJJ de `login` con solo los grupos (y campos sueltos) pedidos cargados."""
+    return (
+        db.query(DDJJ)
+        .options(opciones_ddjj(*grupos, campos=campos))
+        .filter(DDJJ.login == login)
+        .first()
+    )
+
+
+def cargar_ddjjs(db: Session, logins: Iterable[str], *grupos: str, campos: Iterable[str] = ()) -> Dict[str, DDJJ]:
+    """Las DDJJ de varios logins en una consulta: {login: DDJJ}."""
+    logins = [l for l in set(logins) if l]
+    if not logins:
+        return {}
+    filas = (
+        db.query(DDJJ)
+        .options(opciones_ddjj(*grupos, campos=campos))
+        .filter(DDJJ.login.in_(logins))
+        .order_by(DDJJ.ddjj_id)
+        .all()
+    )
+    resultado = {}
+    for d in filas:
+        resultado.setdefault(d.login, d)
+    return resultado
+
+
+def existe_ddjj(db: Session, login: str) -> bool:
+    return db.query(DDJJ.ddjj_id).filter(DDJJ.login == login).first() is not None
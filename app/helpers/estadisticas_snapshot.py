@@ -0,0 +1,313 @@
+import json
+import time
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database.config import SessionLocal
+from helpers.cache import get_redis, redis_key
+from helpers.utils import (
+    _estadisticas_usuarios,
+    _estadisticas_proyectos,
+    _estadisticas_nna,
+    _estadisticas_ddjj,
+    _tiempos_proyectos,
+    _tiempos_pretensos,
+    _tiempos_ratificacion,
+)
+from models.proyecto import ProyectoHistorialEstado
+from models.nna import NnaHistorialEstado
+
+
+# Snapshot materializado de /estadisticas/generales.
+#
+# Cada sección se calcula por separado y guarda su propio computed_at. Los requests sirven
+# siempre el último snapshot (memoria del worker o redis, si REDIS_URL está definida) y un hilo
+# en segundo plano recalcula las secciones vencidas por TTL o marcadas como desactualizadas
+# cuando se confirma un cambio de estado de proyectos o NNA. Con redis las marcas viven solo ahí
+# (las ve y las limpia cualquier worker); sin redis, en la memoria del worker.
+
+
+def _tiempos(db: Session) -> dict:
+    return {
+        "proyectos": _tiempos_proyectos(db),
+        "pretensos": _tiempos_pretensos(db),
+        "ratificacion": _tiempos_ratificacion(db),
+    }
+
+
+SECCIONES = {
+    "usuarios": _estadisticas_usuarios,
+    "proyectos": _estadisticas_proyectos,
+    "nna": _estadisticas_nna,
+    "ddjj": _estadisticas_ddjj,
+    "tiempos": _tiempos,
+}
+
+# Antigüedad máxima (segundos) de cada sección aunque no haya cambios de estado
+TTL_SECCIONES = {
+    "usuarios": 300,
+    "proyectos": 300,
+    "nna": 300,
+    "ddjj": 900,
+    "tiempos": 1800,
+}
+
+# Secciones afectadas por cada tabla de historial
+SECCIONES_POR_MODELO = {
+    ProyectoHistorialEstado: {"usuarios", "proyectos", "tiempos"},
+    NnaHistorialEstado: {"nna"},
+}
+
+# Cada cuánto revisa el hilo de refresco si hay secciones vencidas
+REFRESCO_INTERVALO_SEGS = 30
+
+# Espera tras una invalidación, para agrupar ráfagas de cambios en un solo recálculo
+REFRESCO_DEBOUNCE_SEGS = 5
+
+# Lock en redis para que un solo worker recalcule a la vez
+REDIS_LOCK_SEGS = 300
+
+
+_snapshot: Dict[str, dict] = {}      # seccion -> {"data", "computed_at", "ts"}
+_desactualizadas = set()             # marcas si no hay redis (o si falla)
+_lock = threading.Lock()
+_evento_refresco = threading.Event()
+_refrescador: Optional[threading.Thread] = None
+
+
+
+# ---------------------------
+# Backend compartido (redis)
+# ---------------------------
+def _redis_leer(secciones: Iterable[str]) -> Dict[str, dict]:
+    r = get_redis()
+    if r is None:
+        return {}
+    secciones = list(secciones)
+    try:
+        valores = r.mget([redis_key("estadisticas", s) for s in secciones])
+    except Exception as e:
+        print(f"⚠️ Redis no disponible para estadísticas: {e}")
+        return {}
+    return {s: json.loads(v) for s, v in zip(secciones, valores) if v}
+
+
+def _redis_guardar(seccion: str, entrada: dict) -> None:
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.set(redis_key("estadisticas", seccion), json.dumps(entrada))
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar la sección {seccion} en redis: {e}")
+
+
+def _redis_marcar(secciones: set) -> bool:
+    r = get_redis()
+    if r is None:
+        return False
+    try:
+        r.sadd(redis_key("estadisticas", "desactualizadas"), *secciones)
+        return True
+    except Exception as e:
+        print(f"⚠️ No se pudieron marcar estadísticas desactualizadas en redis: {e}")
+        return False
+
+
+def _secciones_marcadas() -> set:
+    """Secciones marcadas como desactualizadas (en redis, compartidas, o en este worker)."""
+    with _lock:
+        locales = set(_desactualizadas)
+    r = get_redis()
+    if r is None:
+        return locales
+    try:
+        return locales | set(r.smembers(redis_key("estadisticas", "desactualizadas")))
+    except Exception:
+        return locales
+
+
+def _desmarcar(seccion: str) -> None:
+    with _lock:
+        _desactualizadas.discard(seccion)
+    r = get_redis()
+    if r is not None:
+        try:
+            r.srem(redis_key("estadisticas", "desactualizadas"), seccion)
+        except Exception:
+            pass
+
+
+
+# ---------------------------
+# Invalidación
+# ---------------------------
+def marcar_secciones_desactualizadas(secciones: Iterable[str]) -> None:
+    """
+    Marca secciones para recálculo en segundo plano. La usan los listeners de sesión y
+    los caminos que escriben historial con INSERT masivos (que no pasan por el flush del ORM).
+    """
+    secciones = set(secciones) & set(SECCIONES)
+    if not secciones:
+        return
+    if not _redis_marcar(secciones):
+        # Sin backend compartido la marca queda en este worker
+        with _lock:
+            _desactualizadas.update(secciones)
+    _evento_refresco.set()
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_cambios_de_estado(session, flush_context):
+    for obj in session.new:
+        secciones = SECCIONES_POR_MODELO.get(type(obj))
+        if secciones:
+            session.info.setdefault("estadisticas_desactualizadas", set()).update(secciones)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_tras_commit(session):
+    secciones = session.info.pop("estadisticas_desactualizadas", None)
+    if secciones:
+        marcar_secciones_desactualizadas(secciones)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_tras_rollback(session):
+    session.info.pop("estadisticas_desactualizadas", None)
+
+
+
+# ---------------------------
+# Cálculo
+# ---------------------------
+def _recalcular(secciones: Iterable[str]) -> None:
+    db = SessionLocal()
+    try:
+        for seccion in secciones:
+            # Se descarta la marca antes de calcular: un cambio confirmado durante el cálculo
+            # vuelve a marcarla y dispara otro recálculo
+            _desmarcar(seccion)
+            t0 = time.perf_counter()
+            data = jsonable_encoder(SECCIONES[seccion](db))
+            entrada = {
+                "data": data,
+                "computed_at": datetime.now().isoformat(timespec="seconds"),
+                "ts": time.time(),
+            }
+            with _lock:
+                _snapshot[seccion] = entrada
+            _redis_guardar(seccion, entrada)
+            print(f"📊 Estadísticas '{seccion}' recalculadas en {time.perf_counter() - t0:.2f} segundos")
+    finally:
+        db.close()
+
+
+def _secciones_a_recalcular() -> list:
+    ahora = time.time()
+    marcadas = _secciones_marcadas()
+    return [
+        s for s in SECCIONES
+        if s in marcadas
+        or s not in _snapshot
+        or ahora - _snapshot[s]["ts"] > TTL_SECCIONES[s]
+    ]
+
+
+def _tomar_lock_redis() -> bool:
+    r = get_redis()
+    if r is None:
+        return True
+    try:
+        return bool(r.set(redis_key("estadisticas", "lock"), "1", nx=True, ex=REDIS_LOCK_SEGS))
+    except Exception:
+        return True
+
+
+def _liberar_lock_redis() -> None:
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.delete(redis_key("estadisticas", "lock"))
+    except Exception:
+        pass
+
+
+def refrescar_snapshot() -> None:
+    """Un ciclo de refresco: trae lo compartido y recalcula solo lo vencido o invalidado."""
+    compartido = _redis_leer(SECCIONES)
+    with _lock:
+        for seccion, entrada in compartido.items():
+            if seccion not in _snapshot or entrada["ts"] > _snapshot[seccion]["ts"]:
+                _snapshot[seccion] = entrada
+
+    pendientes = _secciones_a_recalcular()
+    if not pendientes or not _tomar_lock_redis():
+        return
+    try:
+        _recalcular(pendientes)
+    finally:
+        _liberar_lock_redis()
+
+
+def _loop_refresco() -> None:
+    while True:
+        if _evento_refresco.wait(timeout=REFRESCO_INTERVALO_SEGS):
+            time.sleep(REFRESCO_DEBOUNCE_SEGS)
+            _evento_refresco.clear()
+        try:
+            refrescar_snapshot()
+        except Exception as e:
+            print(f"❌ Error al refrescar estadísticas: {e}")
+
+
+def _asegurar_refrescador() -> None:
+    global _refrescador
+    if _refrescador is not None and _refrescador.is_alive():
+        return
+    with _lock:
+        if _refrescador is None or not _refrescador.is_alive():
+            _refrescador = threading.Thread(target=_loop_refresco, name="estadisticas-snapshot", daemon=True)
+            _refrescador.start()
+
+
+
+def obtener_estadisticas_generales() -> dict:
+    """
+    Devuelve el snapshot de estadísticas generales (misma forma que calcular_estadisticas_generales)
+    más `computed_at` (la sección más antigua) y `secciones` con la frescura de cada una.
+    Solo calcula en el request si el worker todavía no tiene ninguna versión de una sección.
+    """
+    _asegurar_refrescador()
+
+    faltantes = [s for s in SECCIONES if s not in _snapshot]
+    if faltantes:
+        compartido = _redis_leer(faltantes)
+        with _lock:
+            _snapshot.update(compartido)
+        faltantes = [s for s in faltantes if s not in _snapshot]
+        if faltantes:
+            _recalcular(faltantes)
+
+    ahora = time.time()
+    marcadas = _secciones_marcadas()
+    with _lock:
+        snapshot = dict(_snapshot)
+
+    secciones = {}
+    for seccion, entrada in snapshot.items():
+        desactualizada = seccion in marcadas or ahora - entrada["ts"] > TTL_SECCIONES[seccion]
+        secciones[seccion] = {"computed_at": entrada["computed_at"], "desactualizada": desactualizada}
+        if desactualizada:
+            _evento_refresco.set()
+
+    resultado = {seccion: snapshot[seccion]["data"] for seccion in SECCIONES}
+    resultado["computed_at"] = min(entrada["computed_at"] for entrada in snapshot.values())
+    resultado["secciones"] = secciones
+    return resultado
@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, List
+
+
+# Registro de jobs en segundo plano (exportaciones Excel, envíos masivos, etc.)
+#
+# Se guarda en una base SQLite dentro de EXPORT_DIR (volumen compartido por todos los workers
+# de uvicorn). SQLite resuelve el bloqueo entre procesos y cada lectura por id es un acceso por
+# clave primaria, en lugar de parsear y reescribir un JSON completo en cada operación.
+
+
+# Para almacenar el excel de estadísticas
+JOBSTORE_EXPORT_DIR = os.getenv("EXPORT_DIR")
+if not JOBSTORE_EXPORT_DIR:
+    raise RuntimeError("La variable de entorno EXPORT_DIR no está definida. Verificá tu archivo .env")
+os.makedirs(JOBSTORE_EXPORT_DIR, exist_ok=True)
+
+
+# Base de datos de jobs (queda dentro del EXPORT_DIR montado)
+JOBSTORE_DB_PATH = os.path.join(JOBSTORE_EXPORT_DIR, "_jobs.sqlite3")
+
+# Archivo del jobstore anterior; si existe se importa una única vez
+JOBSTORE_LEGACY_PATH = os.path.join(JOBSTORE_EXPORT_DIR, "_jobs.json")
+
+# Tiempo que se conservan los jobs terminados (y sus archivos) antes de purgarlos
+JOBSTORE_TTL_SEGS = int(os.getenv("JOBSTORE_TTL_HORAS", "24")) * 3600
+
+# Cada cuánto, como mínimo, un worker intenta purgar jobs vencidos
+JOBSTORE_PURGE_INTERVAL_SEGS = 600
+
+JOBSTORE_FINISHED_STATUSES = ("done", "error")
+
+# Campos con columna propia; cualquier otro campo se guarda en `extra`
+_JOB_COLUMNS = ("kind", "status", "created_at", "updated_at", "file_path", "error", "meta")
+
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(JOBSTORE_DB_PATH, timeout=10, isolation_level=None, check_same_thread=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    return conn
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Una conexión por hilo (y por proceso, por si hubo fork); se reutiliza entre llamadas."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                _init_schema(conn)
+                _initialized = True
+    return conn
+
+
+def _init_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id          TEXT PRIMARY KEY,
+            kind        TEXT NOT NULL,
+            status      TEXT NOT NULL,
+            created_at  INTEGER NOT NULL,
+            updated_at  INTEGER NOT NULL,
+            file_path   TEXT,
+            error       TEXT,
+            meta        TEXT,
+            extra       TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_jobs_kind_created ON jobs (kind, created_at);
+        CREATE INDEX IF NOT EXISTS ix_jobs_status_updated ON jobs (status, updated_at);
+        """
+    )
+    _import_legacy_json(conn)
+
+
+def _import_legacy_json(conn: sqlite3.Connection) -> None:
+    """Migra los jobs del antiguo _jobs.json (si existe) y lo renombra para no reimportarlo."""
+    if not os.path.exists(JOBSTORE_LEGACY_PATH):
+        return
+    try:
+        with open(JOBSTORE_LEGACY_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        data = {}
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for job in (data or {}).values():
+            if not isinstance(job, dict) or not job.get("id"):
+                continue
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, status, created_at, updated_at, file_path, error, meta, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _job_to_row(job),
+            )
+        conn.execute("COMMIT")
+        os.replace(JOBSTORE_LEGACY_PATH, JOBSTORE_LEGACY_PATH + ".migrado")
+    except FileNotFoundError:
+        # Otro worker ya lo migró
+        pass
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        print(f"⚠️ No se pudo migrar {JOBSTORE_LEGACY_PATH}: {e}")
+
+
+
+def _job_to_row(job: Dict[str, Any]) -> tuple:
+    extra = {k: v for k, v in job.items() if k != "id" and k not in _JOB_COLUMNS}
+    return (
+        job["id"],
+        job.get("kind") or "",
+        job.get("status") or "pending",
+        int(job.get("created_at") or time.time()),
+        int(job.get("updated_at") or time.time()),
+        job.get("file_path"),
+        job.get("error"),
+        json.dumps(job.get("meta") or {}, ensure_ascii=False),
+        json.dumps(extra, ensure_ascii=False) if extra else None,
+    )
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = {
+        "id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "file_path": row["file_path"],
+        "error": row["error"],
+        "meta": json.loads(row["meta"]) if row["meta"] else {},
+    }
+    if row["extra"]:
+        job.update(json.loads(row["extra"]))
+    return job
+
+
+
+def jobstore_create_job(kind: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    conn = _get_conn()
+    now = int(time.time())
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "pending",     # pending | running | done | error
+        "created_at": now,
+        "updated_at": now,
+        "file_path": None,
+        "error": None,
+        "meta": meta or {},
+    }
+    conn.execute(
+        "INSERT INTO jobs (id, kind, status, created_at, updated_at, file_path, error, meta, extra) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        _job_to_row(job),
+    )
+    _maybe_purge_expired()
+    return job
+
+
+def jobstore_update_job(job_id: str, **fields) -> Optional[Dict[str, Any]]:
+    """
+    Actualiza los campos indicados del job de forma atómica (BEGIN IMMEDIATE toma el lock de
+    escritura de SQLite, compartido entre procesos). Devuelve el job actualizado o None.
+    """
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return None
+        job = _row_to_job(row)
+        job.update(fields)
+        job["id"] = job_id
+        job["updated_at"] = int(time.time())
+        values = _job_to_row(job)
+        conn.execute(
+            "UPDATE jobs SET kind = ?, status = ?, created_at = ?, updated_at = ?, file_path = ?, "
+            "error = ?, meta = ?, extra = ? WHERE id = ?",
+            values[1:] + (job_id,),
+        )
+        conn.execute("COMMIT")
+        return job
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def jobstore_take_job(job_id: str, owner: str, lease_segs: int) -> bool:
+    """
+    Toma (o renueva) el job para `owner` durante `lease_segs` segundos si nadie más lo tiene
+    tomado. Sirve para que un job reanudable lo ejecute un solo proceso a la vez.
+    """
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return False
+        job = _row_to_job(row)
+        now = time.time()
+        if job.get("lease_owner") not in (None, owner) and (job.get("lease_until") or 0) > now:
+            conn.execute("ROLLBACK")
+            return False
+        job["lease_owner"] = owner
+        job["lease_until"] = now + lease_segs
+        job["updated_at"] = int(now)
+        values = _job_to_row(job)
+        conn.execute("UPDATE jobs SET updated_at = ?, extra = ? WHERE id = ?", (values[4], values[8], job_id))
+        conn.execute("COMMIT")
+        return True
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def jobstore_read_job(job_id: str) -> Optional[Dict[str, Any]]:
+    row = _get_conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def jobstore_job_exists(job_id: str) -> bool:
+    return _get_conn().execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+
+def jobstore_list_jobs(
+    kind: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Lista jobs (más recientes primero), opcionalmente filtrando por `kind` y/o `status`."""
+    condiciones, params = [], []
+    if kind:
+        condiciones.append("kind = ?")
+        params.append(kind)
+    if status:
+        condiciones.append("status = ?")
+        params.append(status)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    rows = _get_conn().execute(
+        f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?",
+        (*params, int(limit)),
+    ).fetchall()
+    return [_row_to_job(r) for r in rows]
+
+
+
+def jobstore_purge_expired(ttl_segs: int = JOBSTORE_TTL_SEGS) -> int:
+    """
+    Elimina los jobs terminados (done/error) cuya última actualización supera el TTL,
+    junto con sus archivos exportados (solo si están dentro de EXPORT_DIR).
+    Devuelve la cantidad de jobs eliminados.
+    """
+    conn = _get_conn()
+    limite = int(time.time()) - ttl_segs
+    placeholders = ",".join("?" for _ in JOBSTORE_FINISHED_STATUSES)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            f"SELECT id, file_path FROM jobs WHERE status IN ({placeholders}) AND updated_at < ?",
+            (*JOBSTORE_FINISHED_STATUSES, limite),
+        ).fetchall()
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(r["id"],) for r in rows])
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+    export_dir = os.path.realpath(JOBSTORE_EXPORT_DIR)
+    for r in rows:
+        file_path = r["file_path"]
+        if not file_path:
+            continue
+        real = os.path.realpath(file_path)
+        if os.path.commonpath([export_dir, real]) != export_dir:
+            continue
+        try:
+            os.remove(real)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ No se pudo borrar el archivo del job {r['id']}: {e}")
+
+    return len(rows)
+
+
+def _maybe_purge_expired() -> None:
+    global _last_purge
+    # Un solo hilo del proceso purga por intervalo (los demás siguen sin esperar). Entre workers
+    # la purga puede coincidir: es inocuo, un archivo ya borrado se ignora.
+    if not _purge_lock.acquire(blocking=False):
+        return
+    try:
+        now = time.monotonic()
+        if now - _last_purge < JOBSTORE_PURGE_INTERVAL_SEGS:
+            return
+        _last_purge = now
+    finally:
+        _purge_lock.release()
+    try:
+        jobstore_purge_expired()
+    except Exception as e:
+        print(f"⚠️ Error al purgar jobs vencidos: {e}")
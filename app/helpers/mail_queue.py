@@ -0,0 +1,411 @@
+import os
+import json
+import time
+import sqlite3
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.utils import formataddr
+from typing import Optional, List, Dict, Any, Callable
+
+from helpers.jobstore import JOBSTORE_EXPORT_DIR
+from helpers.rate_limit import esperar_turno
+
+
+# Cola de mails salientes.
+#
+# Los handlers encolan (enviar_mail / enviar_mail_multiples en helpers/utils.py) y vuelven enseguida.
+# La cola es una base SQLite dentro de EXPORT_DIR, compartida por todos los workers de uvicorn;
+# cada proceso corre un hilo que toma lotes de mails pendientes (con lease, para que un mail no
+# lo envíen dos procesos), los manda por conexiones SMTP persistentes (STARTTLS y login una sola
+# vez por conexión, reconexión si se cae) y reprograma los que fallan con backoff exponencial.
+# Cada envío respeta el límite global del canal "smtp" (helpers/rate_limit.py) y los mails
+# transaccionales salen antes que los de campañas masivas (menor `prioridad` primero).
+
+
+MAIL_QUEUE_DB_PATH = os.path.join(JOBSTORE_EXPORT_DIR, "_mail_queue.sqlite3")
+
+# Mails que toma el worker por vuelta
+MAIL_QUEUE_LOTE = int(os.getenv("MAIL_QUEUE_LOTE", "20"))
+
+# Intentos antes de dar un mail por fallido
+MAIL_QUEUE_MAX_INTENTOS = int(os.getenv("MAIL_QUEUE_MAX_INTENTOS", "6"))
+
+# Backoff: 30s, 60s, 120s ... hasta 1 hora
+MAIL_QUEUE_BACKOFF_BASE_SEGS = 30
+MAIL_QUEUE_BACKOFF_MAX_SEGS = 3600
+
+# Si un proceso toma un mail y muere, otro lo retoma pasado este tiempo. Mientras el lote espera
+# turnos del límite global, cada envío extiende el lease de lo que queda del lote (más la espera)
+MAIL_QUEUE_LEASE_SEGS = 300
+
+# Cada cuánto revisa la cola el worker si nadie lo despierta
+MAIL_QUEUE_INTERVALO_SEGS = 5
+
+# Tiempo que se conservan los mails enviados o fallidos
+MAIL_QUEUE_RETENCION_SEGS = int(os.getenv("MAIL_QUEUE_RETENCION_DIAS", "7")) * 86400
+
+# La conexión SMTP se cierra tras este tiempo sin uso o esta cantidad de mensajes
+MAIL_SMTP_IDLE_SEGS = int(os.getenv("MAIL_SMTP_IDLE_SEGS", "60"))
+MAIL_SMTP_MAX_MENSAJES = int(os.getenv("MAIL_SMTP_MAX_MENSAJES", "100"))
+
+# Conexiones SMTP en paralelo por proceso
+MAIL_SMTP_CONEXIONES = int(os.getenv("MAIL_SMTP_CONEXIONES", "2"))
+
+# STARTTLS al abrir la conexión (N solo para relays internos o el sink SMTP de los tests)
+MAIL_SMTP_STARTTLS = os.getenv("MAIL_STARTTLS", "Y").upper() == "Y"
+
+ESTADOS_MAIL = ("pendiente", "enviando", "enviado", "error")
+
+PRIORIDAD_TRANSACCIONAL = 0
+PRIORIDAD_MASIVA = 10
+
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_evento_worker = threading.Event()
+
+
+
+# ---------------------------
+# Conexión SMTP persistente
+# ---------------------------
+class ConexionSMTP:
+    """
+    Conexión SMTP reutilizable: se abre (STARTTLS + login) al primer envío y se mantiene
+    mientras se use. Si el servidor la cerró, reconecta y reintenta el mensaje una vez.
+    """
+
+    def __init__(self):
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._usada = 0.0
+        self._mensajes = 0
+        self._lock = threading.Lock()
+
+    def _abrir(self) -> smtplib.SMTP:
+        smtp_server = os.getenv("MAIL_SERVER", "smtp.office365.com")
+        smtp_port = int(os.getenv("MAIL_PORT", 587))
+        remitente = os.getenv("MAIL_REMITENTE")
+        password = os.getenv("MAIL_PASSWORD")
+
+        smtp = smtplib.SMTP(smtp_server, smtp_port, timeout=30)
+        if MAIL_SMTP_STARTTLS:
+            smtp.starttls()
+        if password:
+            smtp.login(remitente, password)
+        self._mensajes = 0
+        return smtp
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._cerrar()
+
+    def _cerrar(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+        self._smtp = None
+
+    def cerrar_si_inactiva(self) -> None:
+        with self._lock:
+            if self._smtp is not None and time.monotonic() - self._usada > MAIL_SMTP_IDLE_SEGS:
+                self._cerrar()
+
+    def enviar(self, msg, from_addr: str, to_addrs: List[str]) -> None:
+        with self._lock:
+            if self._smtp is not None and (
+                self._mensajes >= MAIL_SMTP_MAX_MENSAJES
+                or time.monotonic() - self._usada > MAIL_SMTP_IDLE_SEGS
+            ):
+                self._cerrar()
+
+            for intento in (1, 2):
+                if self._smtp is None:
+                    self._smtp = self._abrir()
+                try:
+                    self._smtp.send_message(msg, from_addr=from_addr, to_addrs=to_addrs)
+                    self._mensajes += 1
+                    self._usada = time.monotonic()
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    self._smtp = None
+                    if intento == 2:
+                        raise
+                except smtplib.SMTPException:
+                    # Rechazo del servidor (destinatario, contenido...): la conexión sigue sirviendo
+                    raise
+                except OSError:
+                    # Socket caído o timeout
+                    self._cerrar()
+                    if intento == 2:
+                        raise
+
+
+
+_conexiones = threading.local()
+_todas_las_conexiones: List[ConexionSMTP] = []
+
+
+def _conexion_del_hilo() -> ConexionSMTP:
+    conexion = getattr(_conexiones, "smtp", None)
+    if conexion is None:
+        conexion = ConexionSMTP()
+        _conexiones.smtp = conexion
+        _todas_las_conexiones.append(conexion)
+    return conexion
+
+
+
+def armar_mensaje(destinatarios: List[str], asunto: str, cuerpo: str, cc: Optional[List[str]] = None) -> MIMEMultipart:
+    remitente = os.getenv("MAIL_REMITENTE")  # ejemplo: sistemarua@justiciacordoba.gob.ar
+    nombre_remitente = os.getenv("MAIL_NOMBRE_REMITENTE", "RUA")
+    reply_to = os.getenv("MAIL_REPLY_TO", "registroadopcion@justiciacordoba.gob.ar")  # Dirección para responder
+
+    msg = MIMEMultipart()
+    msg["From"] = formataddr((nombre_remitente, remitente))  # Ej: "RUA <sistemarua@...>"
+    msg["Reply-To"] = reply_to
+    msg["To"] = ", ".join(destinatarios)
+    if cc:
+        msg["Cc"] = ", ".join(cc)
+    msg["Subject"] = asunto
+    msg.attach(MIMEText(cuerpo, "html"))
+    return msg
+
+
+def enviar_ahora(destinatarios: List[str], asunto: str, cuerpo: str,
+                 cc: Optional[List[str]] = None, bcc: Optional[List[str]] = None,
+                 antes_de_esperar: Optional[Callable[[float], None]] = None) -> None:
+    """Envía en el momento por la conexión persistente del hilo (sin pasar por la cola)."""
+    cc = cc or []
+    bcc = bcc or []
+    msg = armar_mensaje(destinatarios, asunto, cuerpo, cc)
+    esperar_turno("smtp", antes_de_esperar)
+    _conexion_del_hilo().enviar(msg, os.getenv("MAIL_REMITENTE"), destinatarios + cc + bcc)
+
+
+
+# ---------------------------
+# Cola durable (SQLite)
+# ---------------------------
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(MAIL_QUEUE_DB_PATH, timeout=10, isolation_level=None, check_same_thread=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    return conn
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Una conexión por hilo (y por proceso, por si hubo fork)."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS mails (
+                        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+                        destinatarios   TEXT NOT NULL,
+                        cc              TEXT,
+                        bcc             TEXT,
+                        asunto          TEXT NOT NULL,
+                        cuerpo          TEXT NOT NULL,
+                        origen          TEXT,
+                        prioridad       INTEGER NOT NULL DEFAULT 0,
+                        estado          TEXT NOT NULL,
+                        intentos        INTEGER NOT NULL DEFAULT 0,
+                        proximo_intento REAL NOT NULL,
+                        lease_hasta     REAL,
+                        error           TEXT,
+                        creado          REAL NOT NULL,
+                        actualizado     REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS ix_mails_estado_prioridad ON mails (estado, prioridad, proximo_intento);
+                    CREATE INDEX IF NOT EXISTS ix_mails_origen ON mails (origen, estado);
+                    """
+                )
+                _initialized = True
+    return conn
+
+
+def encolar_mail(
+    destinatarios: List[str],
+    asunto: str,
+    cuerpo: str,
+    cc: Optional[List[str]] = None,
+    bcc: Optional[List[str]] = None,
+    origen: Optional[str] = None,
+    prioridad: int = PRIORIDAD_TRANSACCIONAL,
+) -> int:
+    """
+    Encola un mail y devuelve su id. `origen` es una etiqueta libre (por ejemplo el id de un envío
+    masivo) para poder consultar el avance con `estado_cola_mail(origen)`.
+    """
+    ahora = time.time()
+    cursor = _get_conn().execute(
+        "INSERT INTO mails (destinatarios, cc, bcc, asunto, cuerpo, origen, prioridad, estado, intentos, proximo_intento, creado, actualizado) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, 'pendiente', 0, ?, ?, ?)",
+        (json.dumps(destinatarios), json.dumps(cc or []), json.dumps(bcc or []), asunto, cuerpo, origen, prioridad, ahora, ahora, ahora),
+    )
+    iniciar_worker_mail()
+    _evento_worker.set()
+    return cursor.lastrowid
+
+
+def _tomar_lote(limite: int) -> List[sqlite3.Row]:
+    """Toma (con lease) hasta `limite` mails listos para enviar."""
+    conn = _get_conn()
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        filas = conn.execute(
+            "SELECT * FROM mails WHERE (estado = 'pendiente' AND proximo_intento <= ?) "
+            "OR (estado = 'enviando' AND lease_hasta < ?) ORDER BY prioridad, proximo_intento LIMIT ?",
+            (ahora, ahora, limite),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE mails SET estado = 'enviando', lease_hasta = ?, actualizado = ? WHERE id = ?",
+            [(ahora + MAIL_QUEUE_LEASE_SEGS, ahora, f["id"]) for f in filas],
+        )
+        conn.execute("COMMIT")
+        return filas
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def _renovar_lease(ids: List[int], espera: float) -> None:
+    """Extiende el lease de los mails del lote que todavía no se enviaron (o reprogramaron)."""
+    _get_conn().execute(
+        f"UPDATE mails SET lease_hasta = ? WHERE estado = 'enviando' AND id IN ({', '.join('?' * len(ids))})",
+        (time.time() + espera + MAIL_QUEUE_LEASE_SEGS, *ids),
+    )
+
+
+def _marcar_enviado(mail_id: int) -> None:
+    _get_conn().execute(
+        "UPDATE mails SET estado = 'enviado', lease_hasta = NULL, error = NULL, actualizado = ? WHERE id = ?",
+        (time.time(), mail_id),
+    )
+
+
+def _marcar_fallido(fila: sqlite3.Row, error: str) -> None:
+    intentos = fila["intentos"] + 1
+    ahora = time.time()
+    if intentos >= MAIL_QUEUE_MAX_INTENTOS:
+        estado, proximo = "error", ahora
+        print(f"❌ Mail {fila['id']} descartado tras {intentos} intentos: {error}")
+    else:
+        estado = "pendiente"
+        proximo = ahora + min(MAIL_QUEUE_BACKOFF_BASE_SEGS * 2 ** (intentos - 1), MAIL_QUEUE_BACKOFF_MAX_SEGS)
+    _get_conn().execute(
+        "UPDATE mails SET estado = ?, intentos = ?, proximo_intento = ?, lease_hasta = NULL, error = ?, actualizado = ? "
+        "WHERE id = ?",
+        (estado, intentos, proximo, error[:1000], ahora, fila["id"]),
+    )
+
+
+def _purgar_viejos() -> None:
+    _get_conn().execute(
+        "DELETE FROM mails WHERE estado IN ('enviado', 'error') AND actualizado < ?",
+        (time.time() - MAIL_QUEUE_RETENCION_SEGS,),
+    )
+
+
+def _enviar_fila(fila: sqlite3.Row, lote: List[int]) -> None:
+    try:
+        enviar_ahora(
+            json.loads(fila["destinatarios"]),
+            fila["asunto"],
+            fila["cuerpo"],
+            cc = json.loads(fila["cc"] or "[]"),
+            bcc = json.loads(fila["bcc"] or "[]"),
+            antes_de_esperar = lambda espera: _renovar_lease(lote, espera),
+        )
+        _marcar_enviado(fila["id"])
+    except Exception as e:
+        print(f"⚠️ Error al enviar el mail {fila['id']} (intento {fila['intentos'] + 1}): {e}")
+        _marcar_fallido(fila, str(e))
+
+
+_pool_envio: Optional[ThreadPoolExecutor] = None
+
+
+def procesar_cola_mail(limite: int = MAIL_QUEUE_LOTE) -> int:
+    """
+    Envía un lote de la cola (en paralelo por MAIL_SMTP_CONEXIONES conexiones, siempre dentro
+    del límite global del canal). Devuelve la cantidad de mails procesados (enviados o reprogramados).
+    """
+    global _pool_envio
+    filas = _tomar_lote(limite)
+    lote = [f["id"] for f in filas]
+    if len(filas) <= 1 or MAIL_SMTP_CONEXIONES <= 1:
+        for fila in filas:
+            _enviar_fila(fila, lote)
+        return len(filas)
+
+    if _pool_envio is None:
+        _pool_envio = ThreadPoolExecutor(max_workers=MAIL_SMTP_CONEXIONES, thread_name_prefix="mail-smtp")
+    list(_pool_envio.map(lambda fila: _enviar_fila(fila, lote), filas))
+    return len(filas)
+
+
+def estado_cola_mail(origen: Optional[str] = None) -> Dict[str, int]:
+    """Cantidad de mails por estado, de toda la cola o de un `origen`."""
+    if origen is None:
+        filas = _get_conn().execute("SELECT estado, COUNT(*) AS n FROM mails GROUP BY estado").fetchall()
+    else:
+        filas = _get_conn().execute(
+            "SELECT estado, COUNT(*) AS n FROM mails WHERE origen = ? GROUP BY estado", (origen,)
+        ).fetchall()
+    conteo = {estado: 0 for estado in ESTADOS_MAIL}
+    conteo.update({f["estado"]: f["n"] for f in filas})
+    return conteo
+
+
+
+# ---------------------------
+# Worker
+# ---------------------------
+def _loop_worker() -> None:
+    ultima_purga = 0.0
+    while True:
+        try:
+            while procesar_cola_mail():
+                pass
+            if time.monotonic() - ultima_purga > 3600:
+                _purgar_viejos()
+                ultima_purga = time.monotonic()
+        except Exception as e:
+            print(f"❌ Error en el worker de mails: {e}")
+
+        for conexion in list(_todas_las_conexiones):
+            conexion.cerrar_si_inactiva()
+        _evento_worker.wait(timeout=MAIL_QUEUE_INTERVALO_SEGS)
+        _evento_worker.clear()
+
+
+def iniciar_worker_mail() -> None:
+    """Arranca (una vez por proceso) el hilo que vacía la cola."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_loop_worker, name="mail-queue", daemon=True)
+            _worker.start()
@@ -1,225 +1,468 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Optional, Dict, Any, Tuple
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from fastapi import Depends, HTTPException
-from database.config import get_db
+from starlette.concurrency import run_in_threadpool
+from database.config import get_db, SessionLocal
 
+from models.eventos_y_configs import SecSettings
 from helpers.utils import get_setting_value
 
 
+# Cliente de la API REST de Moodle.
+#
+# Un único MoodleClient por proceso mantiene un pool de conexiones keep-alive (requests para el
+# código sincrónico, httpx para el asincrónico), lee la configuración de sec_settings una sola vez
+# (se vuelve a leer al vencer el TTL o cuando se confirma un cambio de esas claves) y cachea el id
+# del curso y los ids de usuario por mail. Así una verificación de curso aprobado cuesta un solo
+# request a Moodle en lugar de tres y varias lecturas de sec_settings.
 
 
-def get_idcurso(db: Session) -> int:
-    """
-    Obtiene el ID de un curso en Moodle por su shortname.
-    Devuelve el ID del curso si existe, o -1 si no se encuentra.
-    """
+MOODLE_SETTINGS = ("wstoken", "endpoint_api_moodle", "timeout_api_moodle_segs", "shortname_curso")
 
-    shortname = get_setting_value(db, "shortname_curso")
+# Cada cuánto se vuelve a leer la configuración aunque no haya cambios confirmados en este worker
+MOODLE_SETTINGS_TTL_SEGS = 60
 
-    # Obtener valores de configuración desde la base de datos
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = get_setting_value(db, "timeout_api_moodle_segs")
+# Vigencia del id del curso y de los ids de usuario por mail
+MOODLE_CURSO_TTL_SEGS = 3600
+MOODLE_USUARIO_TTL_SEGS = 900
 
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
+# Un mail que no existe en Moodle se recuerda poco tiempo (el usuario puede crearse desde Moodle)
+MOODLE_USUARIO_NO_ENCONTRADO_TTL_SEGS = 60
 
-    timeout = int(timeout) if timeout else 10  # Default a 10 segundos si no está definido
+# Máximo de mails cacheados
+MOODLE_USUARIOS_MAX = 20000
 
-    # Parámetros de la solicitud a Moodle
-    parametros_post = {
-        "wstoken": wstoken,
-        "moodlewsrestformat": "json",
-        "wsfunction": "core_course_get_courses_by_field",
-        "field": "shortname",
-        "value": shortname
-    }
+# Conexiones simultáneas por proceso hacia Moodle
+MOODLE_POOL_MAXSIZE = int(os.getenv("MOODLE_POOL_MAXSIZE", "20"))
 
-    try:
-        # Hacer la solicitud HTTP a Moodle
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
+MOODLE_TIMEOUT_DEFAULT_SEGS = 10
 
-        # Decodificar la respuesta JSON
-        data = response.json()
-        courses = data.get("courses", [])
 
-        for course in courses:
-            if course.get("shortname") == shortname:
-                return course.get("id", -1)
 
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al conectar con Moodle: {str(e)}")
+class MoodleConfig:
+    def __init__(self, wstoken: Optional[str], endpoint: Optional[str], timeout: int, shortname_curso: Optional[str]):
+        self.wstoken = wstoken
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.shortname_curso = shortname_curso
 
-    return -1  # Retorna -1 si no se encuentra el curso
+    def firma(self) -> Tuple:
+        return (self.wstoken, self.endpoint, self.shortname_curso)
 
 
-def get_idusuario_by_mail(mail: str, db: Session) -> int:
-    """
-    Obtiene el ID de un usuario en Moodle por su correo electrónico.
-    Devuelve el ID del usuario si existe, o -1 si no se encuentra.
-    """
 
-    # Obtener valores de configuración desde la base de datos
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = get_setting_value(db, "timeout_api_moodle_segs")
+class _CacheTTL:
+    """Diccionario con vencimiento por entrada, seguro entre hilos."""
 
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
+    def __init__(self, max_entradas: int):
+        self.max_entradas = max_entradas
+        self._datos: Dict[Any, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
 
-    timeout = int(timeout) if timeout else 10  # Default a 10 segundos si no está definido
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            vence, valor = entrada
+            if vence < time.monotonic():
+                del self._datos[clave]
+                return None
+            return valor
 
-    # Parámetros de la solicitud a Moodle
-    parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "core_user_get_users",
-        "moodlewsrestformat": "json",
-        "criteria[0][key]": "email",
-        "criteria[0][value]": mail
-    }
+    def set(self, clave, valor, ttl_segs: int) -> None:
+        with self._lock:
+            if len(self._datos) >= self.max_entradas and clave not in self._datos:
+                # Se descartan primero las entradas vencidas y, si no alcanza, las más viejas
+                ahora = time.monotonic()
+                for k in [k for k, (vence, _) in self._datos.items() if vence < ahora]:
+                    del self._datos[k]
+                while len(self._datos) >= self.max_entradas:
+                    del self._datos[next(iter(self._datos))]
+            self._datos[clave] = (time.monotonic() + ttl_segs, valor)
+
+    def delete(self, clave) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def delete_valor(self, valor) -> None:
+        with self._lock:
+            for k in [k for k, (_, v) in self._datos.items() if v == valor]:
+                del self._datos[k]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+
+
+class MoodleClient:
+
+    def __init__(self):
+        self._config: Optional[MoodleConfig] = None
+        self._config_ts = 0.0
+        self._config_lock = threading.Lock()
+
+        self._session: Optional[requests.Session] = None
+        self._session_pid: Optional[int] = None
+        self._session_lock = threading.Lock()
+
+        self._aclientes: Dict[int, httpx.AsyncClient] = {}     # id(event loop) -> cliente
+
+        self._cursos = _CacheTTL(16)                              # shortname -> id
+        self._usuarios = _CacheTTL(MOODLE_USUARIOS_MAX)           # mail -> id (-1 si no existe)
+
+
+    # ---------------------------
+    # Configuración
+    # ---------------------------
+    def _config_vigente(self) -> bool:
+        return self._config is not None and time.monotonic() - self._config_ts < MOODLE_SETTINGS_TTL_SEGS
+
+
+    def configuracion(self, db: Optional[Session] = None) -> MoodleConfig:
+        """
+        Devuelve la configuración de Moodle, leyéndola de sec_settings (una sola consulta) solo si
+        venció o fue invalidada. Si cambió el token, el endpoint o el curso se vacían las cachés.
+        """
+        if self._config_vigente():
+            return self._config
+
+        with self._config_lock:
+            if self._config_vigente():
+                return self._config
+
+            propia = db is None
+            if propia:
+                db = SessionLocal()
+            try:
+                filas = db.query(SecSettings.set_name, SecSettings.set_value) \
+                    .filter(SecSettings.set_name.in_(MOODLE_SETTINGS)).all()
+            finally:
+                if propia:
+                    db.close()
+
+            valores = {nombre: valor for nombre, valor in filas}
+            timeout = valores.get("timeout_api_moodle_segs")
+            config = MoodleConfig(
+                wstoken = valores.get("wstoken"),
+                endpoint = valores.get("endpoint_api_moodle"),
+                timeout = int(timeout) if timeout else MOODLE_TIMEOUT_DEFAULT_SEGS,
+                shortname_curso = valores.get("shortname_curso"),
+            )
+
+            if self._config is not None and self._config.firma() != config.firma():
+                print("🔄 Cambió la configuración de Moodle: se vacían las cachés de curso y usuarios")
+                self._cursos.clear()
+                self._usuarios.clear()
+
+            self._config = config
+            self._config_ts = time.monotonic()
+            return config
+
+
+    def invalidar_configuracion(self) -> None:
+        """Fuerza a releer sec_settings en el próximo uso."""
+        self._config_ts = 0.0
+
+
+    def _config_valida(self, db: Optional[Session]) -> MoodleConfig:
+        config = self.configuracion(db)
+        if not config.wstoken or not config.endpoint:
+            raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
+        return config
+
+
+    async def _aconfig_valida(self) -> MoodleConfig:
+        if not self._config_vigente():
+            await run_in_threadpool(self.configuracion)
+        return self._config_valida(None)
+
+
+    # ---------------------------
+    # Transporte
+    # ---------------------------
+    def _get_session(self) -> requests.Session:
+        """Sesión con pool keep-alive; se recrea si el proceso fue forkeado."""
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._session_lock:
+                if self._session is None or self._session_pid != pid:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MOODLE_POOL_MAXSIZE)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.verify = False
+                    self._session = session
+                    self._session_pid = pid
+        return self._session
+
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        """Un AsyncClient por event loop (httpx no permite compartirlo entre loops)."""
+        loop = asyncio.get_running_loop()
+        cliente = self._aclientes.get(id(loop))
+        if cliente is None or cliente.is_closed:
+            cliente = httpx.AsyncClient(
+                verify = False,
+                limits = httpx.Limits(max_connections=MOODLE_POOL_MAXSIZE, max_keepalive_connections=MOODLE_POOL_MAXSIZE),
+            )
+            self._aclientes[id(loop)] = cliente
+        return cliente
+
+
+    def llamar(self, wsfunction: str, params: Dict[str, Any], db: Optional[Session] = None,
+               error: str = "Error al conectar con Moodle") -> Any:
+        """Invoca una función del web service de Moodle y devuelve el JSON de la respuesta."""
+        config = self._config_valida(db)
+        parametros_post = {"wstoken": config.wstoken, "wsfunction": wsfunction, "moodlewsrestformat": "json", **params}
+        try:
+            response = self._get_session().post(config.endpoint, data=parametros_post, timeout=config.timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            raise HTTPException(status_code=500, detail=f"{error}: {str(e)}")
+
+
+    async def allamar(self, wsfunction: str, params: Dict[str, Any],
+                      error: str = "Error al conectar con Moodle") -> Any:
+        """Versión asincrónica de `llamar`."""
+        config = await self._aconfig_valida()
+        parametros_post = {"wstoken": config.wstoken, "wsfunction": wsfunction, "moodlewsrestformat": "json", **params}
+        try:
+            response = await self._get_aclient().post(config.endpoint, data=parametros_post, timeout=config.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise HTTPException(status_code=500, detail=f"{error}: {str(e)}")
+
+
+    async def aclose(self) -> None:
+        """Cierra el AsyncClient del event loop actual (por ejemplo al terminar un ciclo del scheduler)."""
+        cliente = self._aclientes.pop(id(asyncio.get_running_loop()), None)
+        if cliente is not None:
+            await cliente.aclose()
+
+
+    # ---------------------------
+    # Curso y usuarios
+    # ---------------------------
+    @staticmethod
+    def _id_curso_de(data: dict, shortname: Optional[str]) -> int:
+        for course in data.get("courses", []):
+            if course.get("shortname") == shortname:
+                return course.get("id", -1)
+        return -1
 
-    try:
-        # Hacer la solicitud HTTP a Moodle
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
 
-        # Decodificar la respuesta JSON
-        data = response.json()
+    @staticmethod
+    def _id_usuario_de(data: dict) -> int:
         users = data.get("users", [])
+        return users[0].get("id", -1) if users else -1
+
+
+    @staticmethod
+    def _params_curso(shortname: Optional[str]) -> Dict[str, Any]:
+        return {"field": "shortname", "value": shortname}
+
+
+    @staticmethod
+    def _params_usuario(mail: str) -> Dict[str, Any]:
+        return {"criteria[0][key]": "email", "criteria[0][value]": mail}
+
+
+    def _recordar_usuario(self, mail: str, id_usuario: int) -> None:
+        ttl = MOODLE_USUARIO_TTL_SEGS if id_usuario != -1 else MOODLE_USUARIO_NO_ENCONTRADO_TTL_SEGS
+        self._usuarios.set(mail.strip().lower(), id_usuario, ttl)
+
+
+    def olvidar_usuario(self, mail: Optional[str] = None, id_usuario: Optional[int] = None) -> None:
+        """Descarta de la caché un mail y/o todas las entradas que apuntan a un id de Moodle."""
+        if mail:
+            self._usuarios.delete(mail.strip().lower())
+        if id_usuario is not None:
+            self._usuarios.delete_valor(int(id_usuario))
+
+
+    def id_curso(self, db: Optional[Session] = None) -> int:
+        shortname = self.configuracion(db).shortname_curso
+        id_curso = self._cursos.get(shortname)
+        if id_curso is None:
+            data = self.llamar("core_course_get_courses_by_field", self._params_curso(shortname), db)
+            id_curso = self._id_curso_de(data, shortname)
+            if id_curso != -1:
+                self._cursos.set(shortname, id_curso, MOODLE_CURSO_TTL_SEGS)
+        return id_curso
 
-        if users:
-            return users[0].get("id", -1)
 
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al conectar con Moodle: {str(e)}")
+    async def aid_curso(self) -> int:
+        shortname = (await self._aconfig_valida()).shortname_curso
+        id_curso = self._cursos.get(shortname)
+        if id_curso is None:
+            data = await self.allamar("core_course_get_courses_by_field", self._params_curso(shortname))
+            id_curso = self._id_curso_de(data, shortname)
+            if id_curso != -1:
+                self._cursos.set(shortname, id_curso, MOODLE_CURSO_TTL_SEGS)
+        return id_curso
 
-    return -1  # Retorna -1 si no se encuentra el usuario
 
+    def id_usuario_por_mail(self, mail: str, db: Optional[Session] = None, usar_cache: bool = True) -> int:
+        if usar_cache:
+            id_usuario = self._usuarios.get(mail.strip().lower())
+            if id_usuario is not None:
+                return id_usuario
+        data = self.llamar("core_user_get_users", self._params_usuario(mail), db)
+        id_usuario = self._id_usuario_de(data)
+        self._recordar_usuario(mail, id_usuario)
+        return id_usuario
 
-def is_curso_aprobado(mail: str, db: Session) -> bool:
-    """
-    Verifica si un usuario con el correo proporcionado ha completado un curso en Moodle.
-    """
 
-    # Obtener ID de curso y usuario en Moodle
-    shortname = get_setting_value(db, "shortname_curso")
+    async def aid_usuario_por_mail(self, mail: str, usar_cache: bool = True) -> int:
+        if usar_cache:
+            id_usuario = self._usuarios.get(mail.strip().lower())
+            if id_usuario is not None:
+                return id_usuario
+        data = await self.allamar("core_user_get_users", self._params_usuario(mail))
+        id_usuario = self._id_usuario_de(data)
+        self._recordar_usuario(mail, id_usuario)
+        return id_usuario
 
-    id_curso = get_idcurso(db)
-    id_user = get_idusuario_by_mail(mail, db)
 
-    if not id_curso or not id_user:
-        raise HTTPException(status_code=404, detail="Curso o usuario no encontrado en Moodle.")
+    def curso_aprobado(self, mail: str, db: Optional[Session] = None) -> bool:
+        id_curso = self.id_curso(db)
+        id_user = self.id_usuario_por_mail(mail, db)
+        if not id_curso or not id_user:
+            raise HTTPException(status_code=404, detail="Curso o usuario no encontrado en Moodle.")
+        data = self.llamar(
+            "core_completion_get_course_completion_status", {"courseid": id_curso, "userid": id_user}, db
+        )
+        return data.get("completionstatus", {}).get("completed", False)
 
-    # Obtener valores de configuración desde la base de datos
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = get_setting_value(db, "timeout_api_moodle_segs")
 
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
+    async def aids_usuarios_por_mails(self, mails) -> Dict[str, int]:
+        """
+        Resuelve varios mails en un solo request (core_user_get_users_by_field).
+        Devuelve {mail: id} con -1 para los que no existen en Moodle y actualiza la caché.
+        """
+        mails = list(dict.fromkeys(m for m in mails if m))
+        if not mails:
+            return {}
+        params = {"field": "email"}
+        for i, mail in enumerate(mails):
+            params[f"values[{i}]"] = mail
+        data = await self.allamar("core_user_get_users_by_field", params)
 
-    timeout = int(timeout) if timeout else 10  # Default a 10 segundos si no está definido
+        ids = {}
+        for user in data if isinstance(data, list) else []:
+            if user.get("email") and user.get("id"):
+                ids[user["email"].strip().lower()] = user["id"]
 
-    # Parámetros de la solicitud a Moodle
-    parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "core_completion_get_course_completion_status",
-        "moodlewsrestformat": "json",
-        "courseid": id_curso,
-        "userid": id_user
-    }
+        resultado = {}
+        for mail in mails:
+            id_usuario = ids.get(mail.strip().lower(), -1)
+            self._recordar_usuario(mail, id_usuario)
+            resultado[mail] = id_usuario
+        return resultado
 
-    try:
-        # Hacer la solicitud HTTP a Moodle
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
 
-        # Decodificar la respuesta JSON
-        data = response.json()
-        completed = data.get("completionstatus", {}).get("completed", False)
+    def id_usuario_cacheado(self, mail: str) -> Optional[int]:
+        return self._usuarios.get(mail.strip().lower())
 
-        return completed
 
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al conectar con Moodle: {str(e)}")
+    async def aestado_completitud(self, id_curso: int, id_usuario: int) -> bool:
+        """Un único request: estado de finalización del curso para ids ya resueltos."""
+        data = await self.allamar(
+            "core_completion_get_course_completion_status", {"courseid": id_curso, "userid": id_usuario}
+        )
+        return data.get("completionstatus", {}).get("completed", False)
 
 
+    async def acurso_aprobado(self, mail: str) -> bool:
+        id_curso = await self.aid_curso()
+        id_user = await self.aid_usuario_por_mail(mail)
+        if not id_curso or not id_user:
+            raise HTTPException(status_code=404, detail="Curso o usuario no encontrado en Moodle.")
+        return await self.aestado_completitud(id_curso, id_user)
 
-def existe_mail_en_moodle(email: str, db: Session = Depends(get_db)) -> bool:
-    """
-    Verifica si un usuario con el correo proporcionado existe en Moodle.
-    """
 
-    # Obtener valores de configuración desde la base de datos
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = get_setting_value(db, "timeout_api_moodle_segs")
 
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
+moodle_client = MoodleClient()
 
-    timeout = int(timeout) if timeout else 10  # Default a 10 segundos si no está definido
 
-    # Parámetros de la solicitud a Moodle
-    parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "core_user_get_users",
-        "moodlewsrestformat": "json",
-        "criteria[0][key]": "email",
-        "criteria[0][value]": email
-    }
 
-    try:
-        # Hacer la solicitud HTTP a Moodle
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
-        
-        # Decodificar la respuesta JSON
-        data = response.json()
-        users = data.get("users", [])
+@event.listens_for(Session, "after_flush")
+def _registrar_cambios_de_configuracion(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SecSettings) and obj.set_name in MOODLE_SETTINGS:
+            session.info["moodle_config_modificada"] = True
+            return
 
-        return len(users) > 0
 
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al conectar con Moodle: {str(e)}")
+@event.listens_for(Session, "after_commit")
+def _invalidar_configuracion_tras_commit(session):
+    if session.info.pop("moodle_config_modificada", None):
+        moodle_client.invalidar_configuracion()
 
 
-def existe_dni_en_moodle(dni: str, db: Session = Depends(get_db)) -> bool:
+@event.listens_for(Session, "after_rollback")
+def _descartar_configuracion_tras_rollback(session):
+    session.info.pop("moodle_config_modificada", None)
+
+
+
+
+def get_idcurso(db: Session) -> int:
     """
-    Verifica si un usuario con el DNI proporcionado (username en Moodle) existe en Moodle.
+    Obtiene el ID de un curso en Moodle por su shortname.
+    Devuelve el ID del curso si existe, o -1 si no se encuentra.
     """
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = get_setting_value(db, "timeout_api_moodle_segs")
+    return moodle_client.id_curso(db)
 
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
 
-    timeout = int(timeout) if timeout else 10  # Default a 10 segundos si no está definido
+def get_idusuario_by_mail(mail: str, db: Session) -> int:
+    """
+    Obtiene el ID de un usuario en Moodle por su correo electrónico.
+    Devuelve el ID del usuario si existe, o -1 si no se encuentra.
+    """
+    return moodle_client.id_usuario_por_mail(mail, db)
 
-    # Parámetros de la solicitud a Moodle
-    parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "core_user_get_users",
-        "moodlewsrestformat": "json",
-        "criteria[0][key]": "username",
-        "criteria[0][value]": dni
-    }
 
-    try:
-        # Hacer la solicitud HTTP a Moodle
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
-        
-        # Decodificar la respuesta JSON
-        data = response.json()
-        users = data.get("users", [])
+def is_curso_aprobado(mail: str, db: Session) -> bool:
+    """
+    Verifica si un usuario con el correo proporcionado ha completado un curso en Moodle.
+    Con el curso y el usuario ya cacheados cuesta un único request a Moodle.
+    """
+    return moodle_client.curso_aprobado(mail, db)
+
+
+
+def existe_mail_en_moodle(email: str, db: Session = Depends(get_db)) -> bool:
+    """
+    Verifica si un usuario con el correo proporcionado existe en Moodle.
+    Siempre consulta a Moodle (se usa para validar altas y bajas) y actualiza la caché.
+    """
+    return moodle_client.id_usuario_por_mail(email, db, usar_cache=False) != -1
 
-        return len(users) > 0
 
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al conectar con Moodle: {str(e)}")
+def existe_dni_en_moodle(dni: str, db: Session = Depends(get_db)) -> bool:
+    """
+    Verifica si un usuario con el DNI proporcionado (username en Moodle) existe en Moodle.
+    """
+    data = moodle_client.llamar(
+        "core_user_get_users",
+        {"criteria[0][key]": "username", "criteria[0][value]": dni},
+        db,
+    )
+    return len(data.get("users", [])) > 0
 
 
 def crear_usuario_en_moodle(login: str, pswd: str, name: str, apellido: str, email: str, db: Session = Depends(get_db)) -> dict:
@@ -228,21 +471,8 @@ def crear_usuario_en_moodle(login: str, pswd: str, name: str, apellido: str, ema
     Retorna la respuesta completa del servidor Moodle.
     """
 
-    # Obtener valores de configuración desde la base de datos
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = get_setting_value(db, "timeout_api_moodle_segs")
-
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
-
-    timeout = int(timeout) if timeout else 10  # Default a 10 segundos si no está definido
-
     # Parámetros para la creación del usuario
     parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "core_user_create_users",
-        "moodlewsrestformat": "json",
         "users[0][username]": login,
         "users[0][password]": pswd,
         "users[0][firstname]": name,
@@ -252,16 +482,9 @@ def crear_usuario_en_moodle(login: str, pswd: str, name: str, apellido: str, ema
         "users[0][maildisplay]": "1",      # Mostrar email a todos
     }
 
-    try:
-        # Hacer la solicitud HTTP a Moodle
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
-
-        # Retornar la respuesta como dict
-        return response.json()
-
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al crear usuario en Moodle: {str(e)}")
+    # El mail pudo haber quedado cacheado como inexistente
+    moodle_client.olvidar_usuario(mail = email)
+    return moodle_client.llamar("core_user_create_users", parametros_post, db, error="Error al crear usuario en Moodle")
 
 
 
@@ -270,36 +493,14 @@ def enrolar_usuario(idcurso: int, idusuario: int, db: Session = Depends(get_db))
     Inscribe un usuario en un curso de Moodle con el rol de estudiante (roleid = 5).
     """
 
-    # Obtener valores de configuración desde la base de datos
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = get_setting_value(db, "timeout_api_moodle_segs")
-
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
-
-    timeout = int(timeout) if timeout else 10  # Valor por defecto: 10 segundos
-
     # Construir parámetros de inscripción
     parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "enrol_manual_enrol_users",
-        "moodlewsrestformat": "json",
         "enrolments[0][roleid]": "5",        # 5 es el ID del rol "student" en Moodle
         "enrolments[0][userid]": str(idusuario),
         "enrolments[0][courseid]": str(idcurso)
     }
 
-    try:
-        # Hacer la solicitud HTTP a Moodle
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
-
-        # Retornar respuesta completa de Moodle
-        return response.json()
-
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al inscribir usuario en Moodle: {str(e)}")
+    return moodle_client.llamar("enrol_manual_enrol_users", parametros_post, db, error="Error al inscribir usuario en Moodle")
 
 
 def eliminar_usuario_en_moodle(user_id: int, db: Session = Depends(get_db)) -> dict:
@@ -308,38 +509,14 @@ def eliminar_usuario_en_moodle(user_id: int, db: Session = Depends(get_db)) -> d
     Utiliza la función core_user_delete_users.
     """
 
-    # Obtener valores de configuración desde la base de datos
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = get_setting_value(db, "timeout_api_moodle_segs")
+    data = moodle_client.llamar("core_user_delete_users", {"userids[0]": str(user_id)}, db)
+    moodle_client.olvidar_usuario(id_usuario = user_id)
 
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
-
-    timeout = int(timeout) if timeout else 10
-
-    # Parámetros para eliminar el usuario
-    parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "core_user_delete_users",
-        "moodlewsrestformat": "json",
-        "userids[0]": str(user_id)
-    }
-
-    try:
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
-
-        data = response.json()
-
-        # Moodle devuelve [] si fue exitoso
-        if data == []:
-            return { "success": True, "message": f"Usuario {user_id} eliminado correctamente" }
-        else:
-            return { "success": False, "detalle": data }
-
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al conectar con Moodle: {str(e)}")
+    # Moodle devuelve [] si fue exitoso
+    if data == []:
+        return { "success": True, "message": f"Usuario {user_id} eliminado correctamente" }
+    else:
+        return { "success": False, "detalle": data }
 
 
 def actualizar_usuario_en_moodle(mail_old: str, dni: str, mail: str, nombre: str, apellido: str, db: Session) -> dict:
@@ -353,19 +530,8 @@ def actualizar_usuario_en_moodle(mail_old: str, dni: str, mail: str, nombre: str
     if iduser == -1:
         raise HTTPException(status_code=404, detail="Usuario no encontrado en Moodle")
 
-    # Obtener configuración desde la base de datos
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = int(get_setting_value(db, "timeout_api_moodle_segs") or 10)
-
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
-
     # Parámetros para actualizar el usuario
     parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "core_user_update_users",
-        "moodlewsrestformat": "json",
         "users[0][id]": str(iduser),
         "users[0][username]": dni,
         "users[0][email]": mail,
@@ -373,12 +539,10 @@ def actualizar_usuario_en_moodle(mail_old: str, dni: str, mail: str, nombre: str
         "users[0][lastname]": apellido
     }
 
-    try:
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al actualizar usuario en Moodle: {str(e)}")
+    resultado = moodle_client.llamar("core_user_update_users", parametros_post, db, error="Error al actualizar usuario en Moodle")
+    moodle_client.olvidar_usuario(mail = mail_old, id_usuario = iduser)
+    moodle_client.olvidar_usuario(mail = mail)
+    return resultado
 
 
 
@@ -399,27 +563,10 @@ def actualizar_clave_en_moodle(mail: str, nueva_password: str, db: Session) -> d
     if iduser == -1:
         raise HTTPException(status_code=404, detail="Usuario no encontrado en Moodle para cambiar la clave.")
 
-    # Obtener configuración
-    wstoken = get_setting_value(db, "wstoken")
-    url_endpoint = get_setting_value(db, "endpoint_api_moodle")
-    timeout = int(get_setting_value(db, "timeout_api_moodle_segs") or 10)
-
-    if not wstoken or not url_endpoint:
-        raise HTTPException(status_code=500, detail="Error en configuración de Moodle API")
-
     # Parámetros de la solicitud
     parametros_post = {
-        "wstoken": wstoken,
-        "wsfunction": "core_user_update_users",
-        "moodlewsrestformat": "json",
         "users[0][id]": str(iduser),
         "users[0][password]": nueva_password
     }
 
-    try:
-        response = requests.post(url_endpoint, data=parametros_post, timeout=timeout, verify=False)
-        response.raise_for_status()
-        return response.json()
-
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error al actualizar contraseña en Moodle: {str(e)}")
+    return moodle_client.llamar("core_user_update_users", parametros_post, db, error="Error al actualizar contraseña en Moodle")
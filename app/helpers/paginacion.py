@@ -0,0 +1,172 @@
+import json
+import time
+import base64
+import hashlib
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+from helpers.cache import get_redis, redis_key
+
+
+# Paginación por cursor (keyset) y conteos cacheados para los listados grandes.
+#
+# En modo cursor el listado se ordena por una clave estable (el orden propio del endpoint más
+# el id como desempate) y cada página pide las filas que siguen a la última de la página
+# anterior, en lugar de usar OFFSET: una página profunda cuesta lo mismo que la primera. El
+# cursor es opaco (JSON en base64 urlsafe) con los valores de la clave de esa última fila.
+#
+# Las expresiones de la clave no pueden ser NULL (la comparación con NULL no avanza): las
+# columnas nulables se envuelven en coalesce con un valor que conserve el orden de MySQL.
+
+
+# Segundos que se reutiliza un total ya contado para los mismos filtros
+CONTEO_TTL_SEGS = 60
+
+# Totales guardados en memoria por worker (se descartan los vencidos al superarlo)
+CONTEO_MAX_ENTRADAS = 1000
+
+DESCRIPCION_CURSOR = (
+    "Paginación por cursor: enviar vacío para la primera página y luego el next_cursor recibido. "
+    "Si se omite, se usa la paginación por número de página."
+)
+DESCRIPCION_CON_TOTAL = "En modo cursor, incluir total_records (cacheado unos segundos)"
+
+
+_conteos: Dict[str, Tuple[float, int]] = {}
+_conteos_lock = threading.Lock()
+
+
+
+def _a_json(valor: Any) -> Any:
+    if isinstance(valor, datetime):
+        return {"dt": valor.isoformat()}
+    if isinstance(valor, date):
+        return {"d": valor.isoformat()}
+    if isinstance(valor, Decimal):
+        return {"n": str(valor)}
+    return valor
+
+
+def _desde_json(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        if "dt" in valor:
+            return datetime.fromisoformat(valor["dt"])
+        if "d" in valor:
+            return date.fromisoformat(valor["d"])
+        if "n" in valor:
+            return Decimal(valor["n"])
+    return valor
+
+
+def codificar_cursor(valores) -> str:
+    crudo = json.dumps([_a_json(v) for v in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, cantidad: int) -> List[Any]:
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = [_desde_json(v) for v in json.loads(crudo)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido.")
+    if len(valores) != cantidad:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido.")
+    return valores
+
+
+
+def paginar_por_cursor(query: Query, orden: List[Tuple[Any, bool]], cursor: Optional[str], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Devuelve una página de `query` (hasta `limit` filas) y el cursor de la siguiente, o None si
+    no hay más. `orden` es la clave estable del listado: [(expresión, descendente), ...], y el
+    último elemento tiene que ser único (normalmente el id). Reemplaza el order_by de `query`.
+    """
+    n = len(orden)
+    query = query.order_by(None).order_by(*[e.desc() if desc else e.asc() for e, desc in orden])
+
+    if cursor:
+        valores = decodificar_cursor(cursor, n)
+        # (k1, k2, ...) posterior a (v1, v2, ...) respetando la dirección de cada clave
+        condiciones = []
+        for i, (expr, desc) in enumerate(orden):
+            iguales = [orden[j][0] == valores[j] for j in range(i)]
+            condiciones.append(and_(*iguales, expr < valores[i] if desc else expr > valores[i]))
+        query = query.filter(or_(*condiciones))
+
+    filas = query.add_columns(*[e.label(f"_cursor_{i}") for i, (e, _) in enumerate(orden)]).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        next_cursor = codificar_cursor(tuple(filas[-1])[-n:])
+
+    items = [fila[0] if len(fila) == n + 1 else tuple(fila)[:-n] for fila in filas]
+    return items, next_cursor
+
+
+
+def _clave_conteo(query: Query, listado: str) -> str:
+    """Clave del total: el SQL del listado con sus parámetros (es decir, sus filtros)."""
+    sentencia = query.order_by(None).statement.compile(dialect=query.session.get_bind().dialect)
+    firma = str(sentencia) + json.dumps(sentencia.params, sort_keys=True, default=str)
+    return f"{listado}:{hashlib.sha1(firma.encode()).hexdigest()}"
+
+
+def contar_cacheado(query: Query, listado: str, ttl: int = CONTEO_TTL_SEGS) -> int:
+    """
+    query.count() reutilizado durante `ttl` segundos para los mismos filtros del `listado`.
+    Se comparte entre workers si hay redis; si no, cada worker cachea en memoria.
+    Solo para el total opcional del modo cursor: la paginación por número de página cuenta en
+    cada request, porque un total vencido le cambia total_pages a quien acaba de dar un alta.
+    """
+    clave = _clave_conteo(query, listado)
+    ahora = time.time()
+    with _conteos_lock:
+        guardado = _conteos.get(clave)
+    if guardado and guardado[0] > ahora:
+        return guardado[1]
+
+    r = get_redis()
+    if r is not None:
+        try:
+            valor = r.get(redis_key("conteo", clave))
+            if valor is not None:
+                total = int(valor)
+                with _conteos_lock:
+                    _conteos[clave] = (ahora + ttl, total)
+                return total
+        except Exception as e:
+            print(f"⚠️ No se pudo leer el conteo cacheado en redis: {e}")
+
+    total = query.order_by(None).count()
+
+    with _conteos_lock:
+        if len(_conteos) >= CONTEO_MAX_ENTRADAS:
+            for k in [k for k, (vence, _) in _conteos.items() if vence <= ahora]:
+                del _conteos[k]
+            if len(_conteos) >= CONTEO_MAX_ENTRADAS:
+                _conteos.clear()
+        _conteos[clave] = (ahora + ttl, total)
+
+    if r is not None:
+        try:
+            r.set(redis_key("conteo", clave), total, ex=ttl)
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar el conteo en redis: {e}")
+
+    return total
+
+
+
+def respuesta_cursor(clave_items: str, items: list, limit: int, next_cursor: Optional[str], total_records: Optional[int] = None) -> dict:
+    """Cuerpo de respuesta de un listado en modo cursor (total_records solo si se pidió)."""
+    respuesta = {"limit": limit, "next_cursor": next_cursor, clave_items: items}
+    if total_records is not None:
+        respuesta["total_records"] = total_records
+    return respuesta
@@ -0,0 +1,82 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+from helpers.jobstore import JOBSTORE_EXPORT_DIR
+
+
+# Límite global de envíos por canal (SMTP, WhatsApp), compartido por todos los procesos.
+#
+# Cada envío reserva un turno en una tabla SQLite dentro de EXPORT_DIR: el turno es el primer
+# instante libre y el siguiente queda `60 / envios_por_minuto` segundos después. La transacción
+# dura lo que un UPDATE; la espera hasta el turno se hace fuera de ella.
+
+
+RATE_LIMIT_DB_PATH = os.path.join(JOBSTORE_EXPORT_DIR, "_rate_limit.sqlite3")
+
+# Envíos por minuto de cada canal (0 = sin límite). Office 365 admite 30 mails por minuto por buzón.
+ENVIOS_POR_MINUTO = {
+    "smtp": int(os.getenv("MAIL_ENVIOS_POR_MINUTO", "30")),
+    "whatsapp": int(os.getenv("WHATSAPP_ENVIOS_POR_MINUTO", "60")),
+}
+
+
+_local = threading.local()
+
+
+
+def _get_conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(RATE_LIMIT_DB_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        conn.execute("CREATE TABLE IF NOT EXISTS turnos (canal TEXT PRIMARY KEY, proximo REAL NOT NULL)")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def reservar_turno(canal: str) -> float:
+    """Reserva el próximo turno libre del canal y devuelve cuántos segundos faltan para usarlo."""
+    por_minuto = ENVIOS_POR_MINUTO.get(canal, 0)
+    if por_minuto <= 0:
+        return 0.0
+    intervalo = 60.0 / por_minuto
+
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ahora = time.time()
+        fila = conn.execute("SELECT proximo FROM turnos WHERE canal = ?", (canal,)).fetchone()
+        turno = max(ahora, fila[0]) if fila else ahora
+        conn.execute(
+            "INSERT INTO turnos (canal, proximo) VALUES (?, ?) "
+            "ON CONFLICT(canal) DO UPDATE SET proximo = excluded.proximo",
+            (canal, turno + intervalo),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    return max(turno - ahora, 0.0)
+
+
+def esperar_turno(canal: str, antes_de_esperar: Optional[Callable[[float], None]] = None) -> None:
+    """
+    Bloquea hasta que el canal admita un envío más. `antes_de_esperar` recibe los segundos que
+    falta esperar, ya reservado el turno (la cola de mails lo usa para extender sus leases).
+    """
+    try:
+        espera = reservar_turno(canal)
+    except sqlite3.Error as e:
+        # Si el registro no está disponible no se frena el envío
+        print(f"⚠️ No se pudo reservar turno de envío para {canal}: {e}")
+        return
+    if antes_de_esperar:
+        antes_de_esperar(espera)
+    if espera > 0:
+        time.sleep(espera)
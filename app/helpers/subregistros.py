@@ -0,0 +1,330 @@
+import os
+import time
+import threading
+from functools import reduce
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import and_, case, event, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from database.config import SessionLocal, engine
+from models.proyecto import Proyecto, ProyectoSubregistros
+from models.ddjj import DDJJ, DDJJSubregistros
+from helpers.tablas_derivadas import asegurar_registro, sincronizar_si_vencida, ultima_sincronizacion
+
+
+# Subregistros como máscara de bits.
+#
+# Proyecto y DDJJ guardan cada subregistro en su propia columna String(1) ("Y"/"N"): 59 definitivos
+# (subreg_*) y 16 del formulario anterior (subregistro_* / ddjj_subregistro_*). Filtrar por
+# subregistro eran árboles de OR/AND sobre esas columnas, y el texto "1 ; FE2 ; 5A1ET" se armaba
+# en Python para cada fila.
+#
+# proyecto_subregistros y ddjj_subregistros tienen, por proyecto / DDJJ, las dos máscaras (bit i =
+# i-ésimo código de SUBREG_CODIGOS / SUBREGISTRO_LEGACY) con índice, y el texto ya armado. Un
+# filtro de subregistros queda en pruebas de bits sobre una sola columna.
+#
+# Las tablas se mantienen como sec_users_celular (helpers/celulares.py): cada flush que crea un
+# proyecto / DDJJ o le cambia algún subregistro actualiza su fila, y un hilo corre
+# sincronizar_subregistros() al arrancar y cada SUBREGISTROS_RESYNC_SEGS, que completa las que
+# falten y corrige las que no coinciden (filas previas o cambios hechos por fuera del ORM). Hasta
+# que una sincronización completa quede registrada (helpers/tablas_derivadas.py), los filtros usan
+# las columnas.
+
+
+# Orden = posición del bit. Solo se agregan códigos al final (los bits guardados no cambian).
+SUBREG_CODIGOS: Tuple[str, ...] = (
+    "1", "2", "3", "4",
+    "FE1", "FE2", "FE3", "FE4", "FET",
+    "5A1E1", "5A1E2", "5A1E3", "5A1E4", "5A1ET",
+    "5A2E1", "5A2E2", "5A2E3", "5A2E4", "5A2ET",
+    "5B1E1", "5B1E2", "5B1E3", "5B1E4", "5B1ET",
+    "5B2E1", "5B2E2", "5B2E3", "5B2E4", "5B2ET",
+    "5B3E1", "5B3E2", "5B3E3", "5B3E4", "5B3ET",
+    "F5S", "F5E1", "F5E2", "F5E3", "F5E4", "F5ET",
+    "61E1", "61E2", "61E3", "61ET",
+    "62E1", "62E2", "62E3", "62ET",
+    "63E1", "63E2", "63E3", "63ET",
+    "FQ1", "FQ2", "FQ3",
+    "F6E1", "F6E2", "F6E3", "F6ET",
+)
+
+SUBREG_BITS: Dict[str, int] = {codigo: 1 << i for i, codigo in enumerate(SUBREG_CODIGOS)}
+
+# Tags "padre" del filtro de la portada: matchean si el proyecto tiene cualquiera de sus hijos
+SUBREG_PADRES: Dict[str, Tuple[str, ...]] = {
+    "FE": ("FE1", "FE2", "FE3", "FE4", "FET"),
+    "5A": ("5A1E1", "5A1E2", "5A1E3", "5A1E4", "5A1ET", "5A2E1", "5A2E2", "5A2E3", "5A2E4", "5A2ET"),
+    "5B": ("5B1E1", "5B1E2", "5B1E3", "5B1E4", "5B1ET", "5B2E1", "5B2E2", "5B2E3", "5B2E4", "5B2ET",
+           "5B3E1", "5B3E2", "5B3E3", "5B3E4", "5B3ET"),
+    "F5": ("F5S", "F5E1", "F5E2", "F5E3", "F5E4", "F5ET"),
+    "6": ("61E1", "61E2", "61E3", "61ET", "62E1", "62E2", "62E3", "62ET", "63E1", "63E2", "63E3", "63ET"),
+    "F6": ("F6E1", "F6E2", "F6E3", "F6ET"),
+}
+
+# (sufijo de la columna, código) del formulario anterior, en orden de bit
+SUBREGISTRO_LEGACY: Tuple[Tuple[str, str], ...] = (
+    ("1", "1"), ("2", "2"), ("3", "3"), ("4", "4"),
+    ("5_a", "5a"), ("5_b", "5b"), ("5_c", "5c"),
+    ("6_a", "6a"), ("6_b", "6b"), ("6_c", "6c"), ("6_d", "6d"),
+    ("6_2", "62"), ("6_3", "63"), ("6_mas_de_3", "63+"),
+    ("flexible", "f"), ("otra_provincia", "o"),
+)
+
+# modelo -> (tabla de máscaras, clave primaria, prefijo de las columnas del formulario anterior)
+MODELOS = {
+    Proyecto: (ProyectoSubregistros, "proyecto_id", "subregistro_"),
+    DDJJ: (DDJJSubregistros, "ddjj_id", "ddjj_subregistro_"),
+}
+
+# Filas que corrige sincronizar_subregistros() por transacción
+SUBREGISTROS_LOTE = 500
+
+# Cada cuánto se vuelve a recorrer todo (uno de los workers), y cada cuánto se revisa si toca
+SUBREGISTROS_RESYNC_SEGS = int(os.getenv("SUBREGISTROS_RESYNC_SEGS", "900"))
+SUBREGISTROS_REVISION_SEGS = 60
+
+# Nombre en tablas_derivadas_sync (uno para las dos tablas)
+SUBREGISTROS_SYNC = "subregistros"
+
+
+# True cuando las tablas existen: desde ahí cada flush mantiene sus filas
+_tablas_creadas = False
+
+# True cuando hubo una sincronización completa; mientras tanto se filtra por las columnas
+_tablas_listas = False
+
+_worker = None
+
+
+
+def _columnas(modelo) -> List[Tuple[str, int]]:
+    """(columna, bit) de los subregistros definitivos de `modelo`."""
+    return [(f"subreg_{codigo}", bit) for codigo, bit in SUBREG_BITS.items()]
+
+
+def _columnas_legacy(modelo) -> List[Tuple[str, int]]:
+    """(columna, bit) de los subregistros del formulario anterior que tiene `modelo`."""
+    prefijo = MODELOS[modelo][2]
+    return [
+        (prefijo + sufijo, 1 << i)
+        for i, (sufijo, _) in enumerate(SUBREGISTRO_LEGACY)
+        if hasattr(modelo, prefijo + sufijo)
+    ]
+
+
+def mascaras_de(obj) -> Tuple[int, int]:
+    """(máscara de definitivos, máscara del formulario anterior) de un Proyecto o DDJJ cargado."""
+    modelo = type(obj)
+
+    def mascara(columnas):
+        return sum(bit for columna, bit in columnas if str(getattr(obj, columna, None)).upper() == "Y")
+
+    return mascara(_columnas(modelo)), mascara(_columnas_legacy(modelo))
+
+
+def texto_subregistros(mascara: int) -> str:
+    """Texto de los subregistros definitivos ("1 ; FE2 ; 5A1ET"), igual a construir_subregistro_string."""
+    return " ; ".join(codigo for codigo, bit in SUBREG_BITS.items() if mascara & bit)
+
+
+def _expr_mascara(columnas_modelo):
+    # Suma de CASE por columna: la máscara calculada en la base, para sincronizar por lotes
+    return reduce(lambda a, b: a + b, [case((col == "Y", bit), else_=0) for col, bit in columnas_modelo])
+
+
+
+# ── Filtros ─────────────────────────────────────────────────────────────────────
+
+def _normalizar_tags(tags: Iterable[str]) -> List[str]:
+    # Igual que el filtro original: un padre se ignora si también vino alguno de sus hijos
+    tags = list(dict.fromkeys(tags))
+    return [
+        t for t in tags
+        if not (t in SUBREG_PADRES and any(h in tags for h in SUBREG_PADRES[t]))
+    ]
+
+
+def condicion_subregistros(modelo, tags: Iterable[str]):
+    """
+    Condición SQL "tiene todos estos subregistros" para query(modelo). Un tag padre (FE, 5A, ...)
+    pide cualquiera de sus hijos. Con la tabla de máscaras es una prueba de bits sobre
+    tabla.mascara; si no está disponible, el árbol de OR/AND sobre las columnas subreg_*.
+    None si ningún tag es válido.
+    """
+    todos = 0                  # bits que tienen que estar todos
+    alguno: List[int] = []     # por cada padre, bits de los que alcanza con uno
+    for tag in _normalizar_tags(tags):
+        if tag in SUBREG_PADRES:
+            alguno.append(sum(SUBREG_BITS[h] for h in SUBREG_PADRES[tag]))
+        elif tag in SUBREG_BITS:
+            todos |= SUBREG_BITS[tag]
+    if not todos and not alguno:
+        return None
+
+    tabla, pk, _ = MODELOS[modelo]
+
+    if not _tablas_listas:
+        columnas = dict(_columnas(modelo))
+        condiciones = [getattr(modelo, c) == "Y" for c, bit in columnas.items() if todos & bit]
+        for bits in alguno:
+            condiciones.append(or_(*[getattr(modelo, c) == "Y" for c, bit in columnas.items() if bits & bit]))
+        return and_(*condiciones)
+
+    condiciones = []
+    if todos:
+        condiciones.append(tabla.mascara.op("&")(todos) == todos)
+    for bits in alguno:
+        condiciones.append(tabla.mascara.op("&")(bits) != 0)
+    return getattr(modelo, pk).in_(select(getattr(tabla, pk)).where(and_(*condiciones)))
+
+
+def subregistro_strings(db: Session, objetos: Iterable) -> Dict[int, str]:
+    """
+    {id: texto de subregistros} de varios proyectos / DDJJ (del mismo modelo), leído de la tabla
+    de máscaras en una consulta. Los que no tienen fila todavía se calculan de sus columnas.
+    """
+    objetos = list(objetos)
+    if not objetos:
+        return {}
+    tabla, pk, _ = MODELOS[type(objetos[0])]
+    ids = [getattr(o, pk) for o in objetos]
+
+    resultado = {}
+    if _tablas_listas:
+        try:
+            resultado = dict(
+                db.query(getattr(tabla, pk), tabla.subregistro_string)
+                .filter(getattr(tabla, pk).in_(ids), tabla.subregistro_string != None)
+                .all()
+            )
+        except Exception as e:
+            print(f"⚠️ No se pudieron leer los subregistros de {tabla.__tablename__}: {e}")
+    for o in objetos:
+        if getattr(o, pk) not in resultado:
+            resultado[getattr(o, pk)] = texto_subregistros(mascaras_de(o)[0])
+    return resultado
+
+
+
+# ── Creación y sincronización ───────────────────────────────────────────────────
+
+def asegurar_tablas_subregistros() -> bool:
+    """Crea proyecto_subregistros y ddjj_subregistros si no existen. Devuelve si quedaron disponibles."""
+    global _tablas_creadas
+    try:
+        for tabla, _, _ in MODELOS.values():
+            tabla.__table__.create(bind=engine, checkfirst=True)
+        asegurar_registro()
+        _tablas_creadas = True
+    except Exception as e:
+        print(f"⚠️ No se pudieron crear las tablas de subregistros, se filtra por columnas: {e}")
+    return _tablas_creadas
+
+
+def _sincronizar_modelo(db: Session, modelo) -> int:
+    tabla, pk, _ = MODELOS[modelo]
+    id_modelo, id_tabla = getattr(modelo, pk), getattr(tabla, pk)
+    expr = _expr_mascara([(getattr(modelo, c), bit) for c, bit in _columnas(modelo)])
+    expr_legacy = _expr_mascara([(getattr(modelo, c), bit) for c, bit in _columnas_legacy(modelo)])
+
+    total = 0
+    while True:
+        filas = (
+            db.query(id_modelo, expr, expr_legacy, tabla)
+            .outerjoin(tabla, id_tabla == id_modelo)
+            .filter(or_(id_tabla == None, tabla.mascara != expr, tabla.mascara_legacy != expr_legacy))
+            .limit(SUBREGISTROS_LOTE)
+            .all()
+        )
+        if not filas:
+            return total
+        for id_, mascara, mascara_legacy, fila in filas:
+            _guardar(db, tabla, pk, id_, int(mascara), int(mascara_legacy), fila)
+        db.commit()
+        total += len(filas)
+
+
+def sincronizar_subregistros() -> int:
+    """Crea o corrige las filas de las tablas de máscaras que no coinciden. Devuelve cuántas."""
+    total = 0
+    db = SessionLocal()
+    try:
+        for modelo in MODELOS:
+            total += _sincronizar_modelo(db, modelo)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return total
+
+
+def _loop() -> None:
+    global _tablas_listas
+    while True:
+        try:
+            if _tablas_creadas or asegurar_tablas_subregistros():
+                total = sincronizar_si_vencida(SUBREGISTROS_SYNC, sincronizar_subregistros, SUBREGISTROS_RESYNC_SEGS)
+                if total:
+                    print(f"🧮 Subregistros: {total} máscaras actualizadas")
+                if not _tablas_listas and ultima_sincronizacion(SUBREGISTROS_SYNC) is not None:
+                    _tablas_listas = True
+                    print("🧮 Subregistros: se filtra por las tablas de máscaras")
+        except Exception as e:
+            print(f"⚠️ Error sincronizando las tablas de subregistros: {e}")
+        time.sleep(SUBREGISTROS_REVISION_SEGS)
+
+
+def iniciar_sincronizacion_subregistros() -> None:
+    """Al arrancar: crea las tablas si hace falta y arranca el hilo que las sincroniza."""
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_loop, name="subregistros-sync", daemon=True)
+        _worker.start()
+
+
+def _guardar(session: Session, tabla, pk: str, id_: int, mascara: int, mascara_legacy: int, fila=None) -> None:
+    if fila is None:
+        fila = session.get(tabla, id_)
+    if fila is None:
+        session.add(tabla(**{pk: id_}, mascara=mascara, mascara_legacy=mascara_legacy,
+                          subregistro_string=texto_subregistros(mascara)))
+    else:
+        fila.mascara = mascara
+        fila.mascara_legacy = mascara_legacy
+        fila.subregistro_string = texto_subregistros(mascara)
+
+
+
+# ── Mantenimiento en cada escritura por el ORM ─────────────────────────────────
+# Los ids de los proyectos / DDJJ nuevos recién existen después del INSERT: en el flush se anotan
+# los cambiados y las filas se escriben en after_flush_postexec (que vuelve a hacer flush).
+
+def _cambio_subregistros(session: Session, obj) -> bool:
+    if obj in session.new:
+        return True
+    attrs = inspect(obj).attrs
+    modelo = type(obj)
+    return any(attrs[c].history.has_changes() for c, _ in _columnas(modelo) + _columnas_legacy(modelo))
+
+
+@event.listens_for(Session, "after_flush")
+def _marcar_subregistros(session: Session, flush_context) -> None:
+    if not _tablas_creadas:
+        return
+    for obj in list(session.new) + list(session.dirty):
+        if type(obj) in MODELOS and _cambio_subregistros(session, obj):
+            session.info.setdefault("subregistros_a_guardar", set()).add(obj)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _guardar_subregistros(session: Session, flush_context) -> None:
+    pendientes = session.info.pop("subregistros_a_guardar", None)
+    if not pendientes:
+        return
+    for obj in pendientes:
+        tabla, pk, _ = MODELOS[type(obj)]
+        if getattr(obj, pk) is None:
+            continue
+        _guardar(session, tabla, pk, getattr(obj, pk), *mascaras_de(obj))
@@ -0,0 +1,85 @@
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import text
+
+from database.config import SessionLocal, engine
+from models.eventos_y_configs import SincronizacionTabla
+
+
+# Sincronización de tablas derivadas (sec_users_celular, proyecto_subregistros, ddjj_subregistros).
+#
+# Son tablas que se recalculan de otras columnas. Una tabla recién creada (o a medio llenar) no se
+# puede usar para buscar o filtrar: faltarían filas. Por eso cada tabla tiene su registro en
+# tablas_derivadas_sync, con la fecha de la última sincronización completa, y los workers la usan
+# recién cuando ven esa fecha. Como el registro está en la base, un reinicio no lo pierde.
+#
+# La sincronización corre en un solo worker a la vez: toma un GET_LOCK de MySQL con el nombre de
+# la tabla y los demás la saltean (ven la fecha cuando termina).
+
+
+# Prefijo de los locks de MySQL (GET_LOCK es global al servidor)
+TABLAS_DERIVADAS_LOCK_PREFIJO = os.getenv("TABLAS_DERIVADAS_LOCK_PREFIJO", "rua_sync_")
+
+
+
+def asegurar_registro() -> None:
+    SincronizacionTabla.__table__.create(bind=engine, checkfirst=True)
+
+
+def ultima_sincronizacion(tabla: str) -> Optional[datetime]:
+    """Fecha de la última sincronización completa de `tabla` (None si nunca terminó una)."""
+    db = SessionLocal()
+    try:
+        return db.query(SincronizacionTabla.completo_en).filter(SincronizacionTabla.tabla == tabla).scalar()
+    finally:
+        db.close()
+
+
+def _vencida(tabla: str, cada_segs: int) -> bool:
+    completo_en = ultima_sincronizacion(tabla)
+    return completo_en is None or completo_en < datetime.now() - timedelta(seconds=cada_segs)
+
+
+def _marcar_sincronizada(tabla: str) -> None:
+    db = SessionLocal()
+    try:
+        db.merge(SincronizacionTabla(tabla=tabla, completo_en=datetime.now()))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+@contextmanager
+def bloqueo(tabla: str) -> Iterator[bool]:
+    """GET_LOCK sin espera sobre `tabla`. Devuelve si este proceso lo obtuvo."""
+    nombre = TABLAS_DERIVADAS_LOCK_PREFIJO + tabla
+    with engine.connect() as conn:
+        obtenido = conn.execute(text("SELECT GET_LOCK(:nombre, 0)"), {"nombre": nombre}).scalar() == 1
+        try:
+            yield obtenido
+        finally:
+            if obtenido:
+                conn.execute(text("SELECT RELEASE_LOCK(:nombre)"), {"nombre": nombre})
+
+
+def sincronizar_si_vencida(tabla: str, sincronizar: Callable[[], int], cada_segs: int) -> Optional[int]:
+    """
+    Corre `sincronizar` si la última sincronización completa de `tabla` tiene más de `cada_segs`
+    (o nunca hubo una) y ningún otro worker la está corriendo. Solo si termina sin error se
+    registra como completa. Devuelve las filas corregidas, o None si no le tocó a este proceso.
+    """
+    if not _vencida(tabla, cada_segs):
+        return None
+    with bloqueo(tabla) as obtenido:
+        # Otro worker pudo haberla terminado entre la primera consulta y el lock
+        if not obtenido or not _vencida(tabla, cada_segs):
+            return None
+        total = sincronizar()
+        _marcar_sincronizada(tabla)
+        return total
@@ -27,10 +27,7 @@ from models.users import User, Group, UserGroup
 from models.nna import Nna
 from models.ddjj import DDJJ
 
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.utils import formataddr
+from helpers.mail_queue import encolar_mail, PRIORIDAD_TRANSACCIONAL
 
 from models.eventos_y_configs import SecSettings
 
@@ -40,15 +37,14 @@ import uuid, json, time
 
 
 
-# Para almacenar el excel de estadísticas
-JOBSTORE_EXPORT_DIR = os.getenv("EXPORT_DIR")
-if not JOBSTORE_EXPORT_DIR:
-    raise RuntimeError("La variable de entorno EXPORT_DIR no está definida. Verificá tu archivo .env")
-os.makedirs(JOBSTORE_EXPORT_DIR, exist_ok=True)
-
-
-# Archivo donde se guardan los jobs (queda dentro del EXPORT_DIR montado)
-JOBSTORE_PATH = os.path.join(JOBSTORE_EXPORT_DIR, "_jobs.json")
+# El registro de jobs vive en helpers/jobstore.py; se reexporta por compatibilidad
+from helpers.jobstore import (
+    JOBSTORE_EXPORT_DIR,
+    jobstore_create_job,
+    jobstore_update_job,
+    jobstore_read_job,
+    jobstore_job_exists,
+)
 
 
 RECAPTCHA_SECRET_KEY = os.getenv("RECAPTCHA_SECRET_KEY")
@@ -76,66 +72,6 @@ async def verificar_recaptcha(token: str, remote_ip: str = "", threshold: float
 
 
 
-def _jobstore_load() -> Dict[str, Any]:
-    if not os.path.exists(JOBSTORE_PATH):
-        return {}
-    try:
-        with open(JOBSTORE_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        # si se corrompe, empezamos limpio
-        return {}
-
-
-def _jobstore_save(data: Dict[str, Any]) -> None:
-    tmp = JOBSTORE_PATH + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, JOBSTORE_PATH)  # write atomic
-
-
-def jobstore_create_job(kind: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    data = _jobstore_load()
-    job_id = uuid.uuid4().hex
-    now = int(time.time())
-    job = {
-        "id": job_id,
-        "kind": kind,
-        "status": "pending",     # pending | running | done | error
-        "created_at": now,
-        "updated_at": now,
-        "file_path": None,
-        "error": None,
-        "meta": meta or {},
-    }
-    data[job_id] = job
-    _jobstore_save(data)
-    return job
-
-
-def jobstore_update_job(job_id: str, **fields) -> Optional[Dict[str, Any]]:
-    data = _jobstore_load()
-    job = data.get(job_id)
-    if not job:
-        return None
-    job.update(fields)
-    job["updated_at"] = int(time.time())
-    data[job_id] = job
-    _jobstore_save(data)
-    return job
-
-
-def jobstore_read_job(job_id: str) -> Optional[Dict[str, Any]]:
-    data = _jobstore_load()
-    return data.get(job_id)
-
-
-def jobstore_job_exists(job_id: str) -> bool:
-    return jobstore_read_job(job_id) is not None
-
-    
-
-
 # ---------------------------
 # Listas "fuente de verdad"
 # ---------------------------
@@ -878,14 +814,14 @@ def get_setting_value(db: Session, setting_name: str) -> str:
 
 
 
-def enviar_mail(destinatario: str, asunto: str, cuerpo: str):
-    # Datos del remitente y servidor SMTP desde variables de entorno
-    remitente = os.getenv("MAIL_REMITENTE")  # ejemplo: sistemarua@justiciacordoba.gob.ar
-    nombre_remitente = os.getenv("MAIL_NOMBRE_REMITENTE", "RUA")
-    password = os.getenv("MAIL_PASSWORD")
-    smtp_server = os.getenv("MAIL_SERVER", "smtp.office365.com")
-    smtp_port = int(os.getenv("MAIL_PORT", 587))
-    reply_to = os.getenv("MAIL_REPLY_TO", "registroadopcion@justiciacordoba.gob.ar")  # Dirección para responder
+def enviar_mail(destinatario: str, asunto: str, cuerpo: str, origen: Optional[str] = None,
+                prioridad: int = PRIORIDAD_TRANSACCIONAL) -> int:
+    """
+    Encola un mail HTML para `destinatario` y vuelve enseguida; lo envía el worker de
+    helpers/mail_queue.py (conexión SMTP persistente, reintentos con backoff).
+    Los envíos masivos usan `prioridad = PRIORIDAD_MASIVA` para no demorar a los transaccionales.
+    Devuelve el id del mail en la cola.
+    """
 
     # ─────────── Lógica de destino ───────────
     # Si la variable no existe, tomamos "Y" como valor por defecto
@@ -894,22 +830,10 @@ def enviar_mail(destinatario: str, asunto: str, cuerpo: str):
     enviar_a_cesar = mail_solo_a_cesar != "N"      # True → mandar solo a César
     destino_final  = "cesarosimani@gmail.com" if enviar_a_cesar else destinatario
 
-    # ─────────── Construcción del mensaje ───────────
-    msg = MIMEMultipart()
-    msg["From"]    = formataddr((nombre_remitente, remitente))  # Ej: "RUA <sistemarua@...>"
-    msg["Reply-To"] = reply_to
-    msg["To"]      = destino_final
-    msg["Subject"] = asunto
-    msg.attach(MIMEText(cuerpo, "html"))
-
-    # Enviar el correo
     try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(remitente, password)
-            server.send_message(msg)
+        return encolar_mail([destino_final], asunto, cuerpo, origen = origen, prioridad = prioridad)
     except Exception as e:
-        print(f"❌ Error al enviar el correo: {e}")
+        print(f"❌ Error al encolar el correo: {e}")
         raise
 
 
@@ -920,14 +844,11 @@ def enviar_mail_multiples(
     cuerpo: str,
     cc: Optional[List[str]] = None,
     bcc: Optional[List[str]] = None,
-    ):
-    
-    remitente = os.getenv("MAIL_REMITENTE")
-    nombre_remitente = os.getenv("MAIL_NOMBRE_REMITENTE", "RUA")
-    password = os.getenv("MAIL_PASSWORD")
-    smtp_server = os.getenv("MAIL_SERVER", "smtp.office365.com")
-    smtp_port = int(os.getenv("MAIL_PORT", 587))
-    reply_to = os.getenv("MAIL_REPLY_TO", "registroadopcion@justiciacordoba.gob.ar")  # Dirección para responder
+    origen: Optional[str] = None,
+    ) -> int:
+    """
+    Encola un único mail con varios destinatarios (To, Cc y Bcc). Bcc no va en los encabezados.
+    """
 
     # Respeta el “modo solo a César” (por defecto Y)
     mail_solo_a_cesar = os.getenv("MAIL_SOLO_A_CESAR", "Y").strip().upper() != "N"
@@ -936,27 +857,7 @@ def enviar_mail_multiples(
         cc = []
         bcc = []
 
-    cc = cc or []
-    bcc = bcc or []
-
-    # Encabezados visibles (To y Cc). Bcc NO se pone en headers.
-    msg = MIMEMultipart()
-    msg["From"] = formataddr((nombre_remitente, remitente))
-    msg["Reply-To"] = reply_to
-    msg["To"] = ", ".join(destinatarios)
-    if cc:
-        msg["Cc"] = ", ".join(cc)
-    msg["Subject"] = asunto
-    msg.attach(MIMEText(cuerpo, "html"))
-
-    # Lista total de entrega
-    to_addrs = destinatarios + cc + bcc
-
-    with smtplib.SMTP(smtp_server, smtp_port) as server:
-        server.starttls()
-        server.login(remitente, password)
-        # Aseguramos lista completa de destinatarios
-        server.send_message(msg, from_addr=remitente, to_addrs=to_addrs)
+    return encolar_mail(destinatarios, asunto, cuerpo, cc = cc or [], bcc = bcc or [], origen = origen)
 
 
 
@@ -1031,6 +932,18 @@ def get_user_name_by_login(db: Session, login: str):
     return ""
 
 
+def get_user_names_by_logins(db: Session, logins) -> Dict[str, str]:
+    """
+    Versión por lotes de get_user_name_by_login: resuelve todos los logins con una sola
+    consulta IN y devuelve { login: "nombre apellido" }. Los logins inexistentes no aparecen.
+    """
+    logins = {l for l in logins if l}
+    if not logins:
+        return {}
+    rows = db.query(User.login, User.nombre, User.apellido).filter(User.login.in_(logins)).all()
+    return { r.login: f"{r.nombre} {r.apellido}" for r in rows }
+
+
 
 def build_subregistro_string(user):
     subregistros = {
@@ -0,0 +1,132 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import List
+
+from helpers.jobstore import JOBSTORE_EXPORT_DIR
+
+
+# Bandeja de entrada durable de webhooks (WhatsApp Cloud API).
+#
+# El endpoint del webhook solo guarda el cuerpo crudo acá y responde; un worker
+# (services/webhook_whatsapp.py) toma los pendientes de a lotes con lease y los procesa en una
+# sola transacción de MySQL. Es una base SQLite dentro de EXPORT_DIR, compartida por los workers
+# de uvicorn, igual que la cola de mails.
+
+
+WEBHOOK_INBOX_DB_PATH = os.path.join(JOBSTORE_EXPORT_DIR, "_webhook_inbox.sqlite3")
+
+# Si un proceso toma un lote y muere, otro lo retoma pasado este tiempo
+WEBHOOK_INBOX_LEASE_SEGS = 120
+
+# Intentos antes de dar un webhook por fallido (queda guardado con estado 'error')
+WEBHOOK_INBOX_MAX_INTENTOS = 5
+
+# Tiempo que se conservan los webhooks ya procesados
+WEBHOOK_INBOX_RETENCION_SEGS = int(os.getenv("WEBHOOK_INBOX_RETENCION_DIAS", "3")) * 86400
+
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Una conexión por hilo (y por proceso, por si hubo fork)."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(WEBHOOK_INBOX_DB_PATH, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS webhooks (
+                        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+                        canal           TEXT NOT NULL,
+                        cuerpo          TEXT NOT NULL,
+                        estado          TEXT NOT NULL,
+                        intentos        INTEGER NOT NULL DEFAULT 0,
+                        proximo_intento REAL NOT NULL,
+                        lease_hasta     REAL,
+                        error           TEXT,
+                        creado          REAL NOT NULL,
+                        actualizado     REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS ix_webhooks_estado ON webhooks (canal, estado, proximo_intento);
+                    """
+                )
+                _initialized = True
+    return conn
+
+
+def guardar_webhook(canal: str, cuerpo: str) -> int:
+    """Guarda el cuerpo crudo de un webhook como pendiente y devuelve su id."""
+    ahora = time.time()
+    cursor = _get_conn().execute(
+        "INSERT INTO webhooks (canal, cuerpo, estado, intentos, proximo_intento, creado, actualizado) "
+        "VALUES (?, ?, 'pendiente', 0, ?, ?, ?)",
+        (canal, cuerpo, ahora, ahora, ahora),
+    )
+    return cursor.lastrowid
+
+
+def tomar_webhooks(canal: str, limite: int) -> List[sqlite3.Row]:
+    """Toma (con lease) hasta `limite` webhooks pendientes del canal, en orden de llegada."""
+    conn = _get_conn()
+    ahora = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        filas = conn.execute(
+            "SELECT * FROM webhooks WHERE canal = ? AND ((estado = 'pendiente' AND proximo_intento <= ?) "
+            "OR (estado = 'procesando' AND lease_hasta < ?)) ORDER BY id LIMIT ?",
+            (canal, ahora, ahora, limite),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE webhooks SET estado = 'procesando', lease_hasta = ?, actualizado = ? WHERE id = ?",
+            [(ahora + WEBHOOK_INBOX_LEASE_SEGS, ahora, f["id"]) for f in filas],
+        )
+        conn.execute("COMMIT")
+        return filas
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def marcar_webhooks_procesados(ids: List[int]) -> None:
+    _get_conn().executemany(
+        "UPDATE webhooks SET estado = 'procesado', lease_hasta = NULL, error = NULL, actualizado = ? WHERE id = ?",
+        [(time.time(), i) for i in ids],
+    )
+
+
+def marcar_webhooks_fallidos(filas: List[sqlite3.Row], error: str) -> None:
+    """Reprograma los webhooks con backoff (5s, 10s, 20s...) o los da por fallidos."""
+    ahora = time.time()
+    valores = []
+    for fila in filas:
+        intentos = fila["intentos"] + 1
+        estado = "error" if intentos >= WEBHOOK_INBOX_MAX_INTENTOS else "pendiente"
+        valores.append((estado, intentos, ahora + 5 * 2 ** (intentos - 1), error[:1000], ahora, fila["id"]))
+    _get_conn().executemany(
+        "UPDATE webhooks SET estado = ?, intentos = ?, proximo_intento = ?, lease_hasta = NULL, error = ?, "
+        "actualizado = ? WHERE id = ?",
+        valores,
+    )
+
+
+def purgar_webhooks_viejos() -> None:
+    _get_conn().execute(
+        "DELETE FROM webhooks WHERE estado = 'procesado' AND actualizado < ?",
+        (time.time() - WEBHOOK_INBOX_RETENCION_SEGS,),
+    )
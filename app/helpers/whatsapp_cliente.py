@@ -0,0 +1,227 @@
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy.orm import Session
+
+from helpers.config_whatsapp import WhatsAppSettings, get_whatsapp_settings
+from helpers.rate_limit import reservar_turno
+
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except Exception:
+    HTTP2_ENABLED = False
+
+
+# Cliente HTTP de la API de WhatsApp Cloud (Meta).
+#
+# Un único httpx.AsyncClient por proceso, con conexiones persistentes (HTTP/2 si está instalado
+# h2), vive en un event loop propio en un hilo de fondo. Los endpoints sincrónicos lo usan con
+# enviar_whatsapp_payload / enviar_whatsapp_muchos, que esperan el resultado sin crear conexiones
+# nuevas; send_many corre los envíos en paralelo hasta WHATSAPP_CONCURRENCIA a la vez.
+#
+# Cada envío respeta el límite del canal (helpers/rate_limit.py) y, si Meta responde 429, reintenta
+# después del Retry-After. La respuesta lleva en "_envio" el status HTTP, los intentos y la latencia,
+# que quedan en Mensajeria.data_json al registrar el mensaje.
+
+
+WHATSAPP_API_URL = "https://graph.facebook.com/v22.0"
+
+# Envíos simultáneos de un lote
+WHATSAPP_CONCURRENCIA = int(os.getenv("WHATSAPP_CONCURRENCIA", "8"))
+
+# Reintentos ante 429 / errores de red
+WHATSAPP_REINTENTOS = int(os.getenv("WHATSAPP_REINTENTOS", "3"))
+
+WHATSAPP_TIMEOUT_SEGS = float(os.getenv("WHATSAPP_TIMEOUT_SEGS", "15"))
+
+# Segundos que se reutiliza la configuración leída de sec_settings (en los otros workers, un cambio
+# de credenciales tarda a lo sumo esto en verse)
+WHATSAPP_SETTINGS_TTL_SEGS = int(os.getenv("WHATSAPP_SETTINGS_TTL_SEGS", "60"))
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_cliente: Optional[httpx.AsyncClient] = None
+_loop_lock = threading.Lock()
+
+_settings: Optional[Tuple[float, WhatsAppSettings]] = None
+_settings_lock = threading.Lock()
+
+
+
+# ── Configuración cacheada ──────────────────────────────────────────────────────
+
+def obtener_whatsapp_settings(db: Session) -> WhatsAppSettings:
+    """get_whatsapp_settings reutilizado durante WHATSAPP_SETTINGS_TTL_SEGS segundos."""
+    global _settings
+    with _settings_lock:
+        if _settings and _settings[0] > time.time():
+            return _settings[1]
+    settings = get_whatsapp_settings(db)
+    with _settings_lock:
+        _settings = (time.time() + WHATSAPP_SETTINGS_TTL_SEGS, settings)
+    return settings
+
+
+def invalidar_whatsapp_settings() -> None:
+    """Descarta la configuración cacheada (al guardar credenciales nuevas)."""
+    global _settings
+    with _settings_lock:
+        _settings = None
+
+
+
+# ── Event loop y cliente compartidos ───────────────────────────────────────────
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None or not _loop.is_running():
+            _loop = asyncio.new_event_loop()
+            listo = threading.Event()
+
+            def _correr(loop):
+                asyncio.set_event_loop(loop)
+                loop.call_soon(listo.set)
+                loop.run_forever()
+
+            threading.Thread(target=_correr, args=(_loop,), name="whatsapp-http", daemon=True).start()
+            listo.wait()
+        return _loop
+
+
+def _get_cliente() -> httpx.AsyncClient:
+    # Solo se llama desde el loop de fondo
+    global _cliente
+    if _cliente is None:
+        _cliente = httpx.AsyncClient(
+            http2 = HTTP2_ENABLED,
+            timeout = WHATSAPP_TIMEOUT_SEGS,
+            limits = httpx.Limits(max_connections = WHATSAPP_CONCURRENCIA, max_keepalive_connections = WHATSAPP_CONCURRENCIA),
+        )
+    return _cliente
+
+
+def _ejecutar(coro):
+    """Corre la corrutina en el loop de WhatsApp y espera su resultado."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+
+# ── Envíos ─────────────────────────────────────────────────────────────────────
+
+def _headers(settings: WhatsAppSettings) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {settings.whatsapp_token}",
+        "Content-Type": "application/json",
+    }
+
+
+def _segundos_reintento(response: Optional[httpx.Response], intento: int) -> float:
+    if response is not None:
+        try:
+            return max(float(response.headers.get("Retry-After")), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return min(2 ** intento, 30)
+
+
+async def _esperar_turno_async() -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        espera = await loop.run_in_executor(None, reservar_turno, "whatsapp")
+    except sqlite3.Error as e:
+        print(f"⚠️ No se pudo reservar turno de envío para whatsapp: {e}")
+        return
+    if espera > 0:
+        await asyncio.sleep(espera)
+
+
+async def enviar_payload(settings: WhatsAppSettings, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """POST /messages con reintentos ante 429. Devuelve el JSON de Meta más "_envio"."""
+    url = f"{WHATSAPP_API_URL}/{settings.phone_number_id}/messages"
+    inicio = time.perf_counter()
+    response = None
+
+    for intento in range(WHATSAPP_REINTENTOS + 1):
+        await _esperar_turno_async()
+        try:
+            response = await _get_cliente().post(url, headers = _headers(settings), json = payload)
+        except httpx.HTTPError as e:
+            response = None
+            if intento >= WHATSAPP_REINTENTOS:
+                return {"error": str(e), "_envio": _datos_envio(None, intento + 1, inicio)}
+            await asyncio.sleep(_segundos_reintento(None, intento))
+            continue
+
+        if response.status_code == 429 and intento < WHATSAPP_REINTENTOS:
+            espera = _segundos_reintento(response, intento)
+            print(f"⏳ WhatsApp 429: reintento en {espera:.0f} s")
+            await asyncio.sleep(espera)
+            continue
+        break
+
+    try:
+        resultado = response.json()
+    except ValueError:
+        resultado = {"error": {"message": response.text}}
+    if not isinstance(resultado, dict):
+        resultado = {"respuesta": resultado}
+    resultado["_envio"] = _datos_envio(response, intento + 1, inicio)
+    return resultado
+
+
+def _datos_envio(response: Optional[httpx.Response], intentos: int, inicio: float) -> Dict[str, Any]:
+    return {
+        "http_status": response.status_code if response is not None else None,
+        "intentos": intentos,
+        "latencia_ms": round((time.perf_counter() - inicio) * 1000),
+    }
+
+
+async def send_many(settings: WhatsAppSettings, payloads: List[Dict[str, Any]],
+                    concurrencia: int = WHATSAPP_CONCURRENCIA) -> List[Dict[str, Any]]:
+    """Envía los payloads con hasta `concurrencia` envíos en vuelo. Respeta el orden de entrada."""
+    semaforo = asyncio.Semaphore(max(concurrencia, 1))
+
+    async def _uno(payload):
+        async with semaforo:
+            try:
+                return await enviar_payload(settings, payload)
+            except Exception as e:
+                return {"error": str(e)}
+
+    return await asyncio.gather(*[_uno(p) for p in payloads])
+
+
+async def consultar(settings: WhatsAppSettings, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """GET a la Graph API (por ejemplo, el contenido de una plantilla)."""
+    response = await _get_cliente().get(
+        f"{WHATSAPP_API_URL}/{path}",
+        headers = {"Authorization": f"Bearer {settings.whatsapp_token}"},
+        params = params,
+    )
+    return response.json()
+
+
+
+# ── Versiones sincrónicas (para endpoints def y helpers) ──────────────────────
+
+def enviar_whatsapp_payload(settings: WhatsAppSettings, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return _ejecutar(enviar_payload(settings, payload))
+
+
+def enviar_whatsapp_muchos(settings: WhatsAppSettings, payloads: List[Dict[str, Any]],
+                           concurrencia: int = WHATSAPP_CONCURRENCIA) -> List[Dict[str, Any]]:
+    if not payloads:
+        return []
+    return _ejecutar(send_many(settings, payloads, concurrencia))
+
+
+def consultar_whatsapp(settings: WhatsAppSettings, path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return _ejecutar(consultar(settings, path, params))
@@ -1,12 +1,12 @@
 import os
 
-import requests
 from dotenv import load_dotenv
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from sqlalchemy.orm import Session
 
-from helpers.config_whatsapp import WhatsAppSettings, get_whatsapp_settings
+from helpers.config_whatsapp import WhatsAppSettings
+from helpers.whatsapp_cliente import obtener_whatsapp_settings, enviar_whatsapp_payload, enviar_whatsapp_muchos
 
 
 load_dotenv()
@@ -18,14 +18,14 @@ def _resolve_whatsapp_settings(
     db: Optional[Session],
     whatsapp_settings: Optional[WhatsAppSettings]
 ) -> WhatsAppSettings:
-    """Devuelve una configuración válida de WhatsApp usando sec_settings."""
+    """Devuelve una configuración válida de WhatsApp usando sec_settings (cacheada)."""
     if whatsapp_settings:
         return whatsapp_settings
 
     if db is None:
         raise ValueError("Se requiere una sesión de base de datos para obtener la configuración de WhatsApp.")
 
-    return get_whatsapp_settings(db)
+    return obtener_whatsapp_settings(db)
 
 
 
@@ -97,24 +97,13 @@ def _resolve_whatsapp_settings(
 
 
 
-def _enviar_template_whatsapp(
-    *,
-    db: Session,
+def _armar_payload_template(
     destinatario: str,
     template_name: str,
     parametros: list,
-    language_code: str = "es",
-    whatsapp_settings: Optional[WhatsAppSettings] = None
+    language_code: str = "es"
 ) -> Dict:
-
-    settings = _resolve_whatsapp_settings(db, whatsapp_settings)
-
-    url = f"{WHATSAPP_API_URL}/{settings.phone_number_id}/messages"
-
-    headers = {
-        "Authorization": f"Bearer {settings.whatsapp_token}",
-        "Content-Type": "application/json"
-    }
+    """Payload de una plantilla, con "_meta" indicando a quién se envía realmente."""
 
     # ---------------------------------------------------
     # 🔒 WHATSAPP SOLO A CÉSAR (default = Y)
@@ -150,18 +139,37 @@ def _enviar_template_whatsapp(
     if components:
         payload["template"]["components"] = components
 
+    meta = {
+        "enviado_a": destino_final,
+        "redirigido_a_cesar": enviar_a_cesar
+    }
+    return payload, meta
+
+
+
+def _enviar_template_whatsapp(
+    *,
+    db: Session,
+    destinatario: str,
+    template_name: str,
+    parametros: list,
+    language_code: str = "es",
+    whatsapp_settings: Optional[WhatsAppSettings] = None
+) -> Dict:
+
+    settings = _resolve_whatsapp_settings(db, whatsapp_settings)
+
+    payload, meta = _armar_payload_template(destinatario, template_name, parametros, language_code)
+
     print("\n📤 PAYLOAD WHATSAPP:")
     print(payload)
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        print("📥 RESPUESTA META:", response.text)
+        # Cliente compartido: límite del canal, reintentos ante 429 y conexión reutilizada
+        resultado = enviar_whatsapp_payload(settings, payload)
+        print("📥 RESPUESTA META:", resultado)
 
-        resultado = response.json()
-        resultado["_meta"] = {
-            "enviado_a": destino_final,
-            "redirigido_a_cesar": enviar_a_cesar
-        }
+        resultado["_meta"] = meta
         return resultado
 
     except Exception as e:
@@ -169,6 +177,36 @@ def _enviar_template_whatsapp(
 
 
 
+def enviar_templates_whatsapp(
+    *,
+    db: Session,
+    envios: List[Dict],
+    whatsapp_settings: Optional[WhatsAppSettings] = None
+) -> List[Dict]:
+    """
+    Envía varias plantillas en paralelo (concurrencia acotada) y devuelve las respuestas en el
+    mismo orden. Cada envío: {"destinatario", "template_name", "parametros"[, "language_code"]}.
+    """
+    if not envios:
+        return []
+
+    settings = _resolve_whatsapp_settings(db, whatsapp_settings)
+
+    armados = [
+        _armar_payload_template(e["destinatario"], e["template_name"], e.get("parametros") or [], e.get("language_code", "es"))
+        for e in envios
+    ]
+    try:
+        resultados = enviar_whatsapp_muchos(settings, [payload for payload, _ in armados])
+    except Exception as e:
+        return [{"error": str(e)} for _ in envios]
+
+    for resultado, (_, meta) in zip(resultados, armados):
+        resultado["_meta"] = meta
+    return resultados
+
+
+
 
 # ==========================================================
 # 📢 PLANTILLA RUA - NOTIFICACIÓN GENERAL
@@ -199,6 +237,16 @@ def enviar_whatsapp_rua_notificacion(
 
 
 
+def envio_rua_notificacion(destinatario: str, nombre: str, mensaje: str) -> Dict:
+    """Envío de rua_notificacion_v1 para enviar_templates_whatsapp."""
+    return {
+        "destinatario": destinatario,
+        "template_name": "rua_notificacion_v1",
+        "parametros": [nombre, mensaje],
+    }
+
+
+
 # ==========================================================
 # ✅ EJEMPLO: RECORDATORIO CITA
 # Template: rua_recordatorio_cita_v1
@@ -244,13 +292,6 @@ def enviar_whatsapp_texto(
 
     settings = _resolve_whatsapp_settings(db, whatsapp_settings)
 
-    url = f"{WHATSAPP_API_URL}/{settings.phone_number_id}/messages"
-
-    headers = {
-        "Authorization": f"Bearer {settings.whatsapp_token}",
-        "Content-Type": "application/json"
-    }
-
     payload = {
         "messaging_product": "whatsapp",
         "to": destinatario,
@@ -273,9 +314,9 @@ def enviar_whatsapp_texto(
     print(payload)
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        print("📥 Respuesta Meta:", response.text)
-        return response.json()
+        resultado = enviar_whatsapp_payload(settings, payload)
+        print("📥 Respuesta Meta:", resultado)
+        return resultado
     except Exception as e:
         return {"error": str(e)}
 
@@ -316,11 +357,11 @@ def enviar_whatsapp(
     print("📨 Payload:", payload)
 
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        print("✅ Status Code:", response.status_code)
-        print("📥 Respuesta:", response.text)
+        resultado = enviar_whatsapp_payload(settings, payload)
+        print("✅ Status Code:", resultado.get("_envio", {}).get("http_status"))
+        print("📥 Respuesta:", resultado)
 
-        return response.json()
+        return resultado
     except Exception as e:
         print("❌ Error en envío:", str(e))
         return {"success": False, "error": str(e)}
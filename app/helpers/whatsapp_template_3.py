@@ -1,4 +1,4 @@
-import requests
+from helpers.whatsapp_cliente import consultar_whatsapp, enviar_whatsapp_payload
 from helpers.config_whatsapp import WhatsAppSettings
 
 class WhatsAppTemplate3Service:
@@ -11,16 +11,13 @@ class WhatsAppTemplate3Service:
         if not whatsapp_settings.waba_id:
             return None
 
-        url = f"{WhatsAppTemplate3Service.BASE_URL}/{whatsapp_settings.waba_id}/message_templates"
         params = {
             "name": template_name,
             "limit": 1
         }
-        headers = {"Authorization": f"Bearer {whatsapp_settings.whatsapp_token}"}
 
         try:
-            response = requests.get(url, headers=headers, params=params)
-            data = response.json()
+            data = consultar_whatsapp(whatsapp_settings, f"{whatsapp_settings.waba_id}/message_templates", params)
             
             if "error" in data:
                 return None
@@ -40,13 +37,6 @@ class WhatsAppTemplate3Service:
         if whatsapp_settings is None:
             raise ValueError("Se requieren las credenciales de WhatsApp para enviar mensajes.")
 
-        url = f"{WhatsAppTemplate3Service.BASE_URL}/{whatsapp_settings.phone_number_id}/messages" 
-
-        headers = {
-            "Authorization": f"Bearer {whatsapp_settings.whatsapp_token}",
-            "Content-Type": "application/json"
-        }
-
         data = {
             "messaging_product": "whatsapp",
             "to": to,
@@ -69,5 +59,5 @@ class WhatsAppTemplate3Service:
             }
         }
 
-        response = requests.post(url, headers=headers, json=data)
-        return response.json()
+        # Cliente compartido: conexión reutilizada, límite del canal y reintentos ante 429
+        return enviar_whatsapp_payload(whatsapp_settings, data)
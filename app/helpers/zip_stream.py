@@ -0,0 +1,96 @@
+import os
+import zipfile
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi.responses import StreamingResponse
+
+
+# ZIP generado al vuelo para las descargas de varios documentos.
+#
+# zipfile escribe sobre una salida no posicionable (usa descriptores de datos después de cada
+# miembro), así que los bytes se entregan a medida que se leen las fuentes: no hay archivo temporal
+# y el primer byte sale enseguida sin importar el tamaño total. Los formatos que ya vienen
+# comprimidos (PDF, imágenes, docx) se guardan sin volver a comprimir. ZIP64 se activa solo cuando
+# un miembro o el archivo completo lo necesitan.
+
+
+ZIP_CHUNK_SIZE = 256 * 1024
+
+# Extensiones que no ganan nada con deflate
+EXTENSIONES_COMPRIMIDAS = {
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".heif",
+    ".zip", ".gz", ".rar", ".7z", ".docx", ".xlsx", ".pptx", ".mp4", ".mp3",
+}
+
+
+
+class _SalidaZip:
+    """Destino de ZipFile que acumula lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self) -> None:
+        pass
+
+    def vaciar(self) -> Iterator[bytes]:
+        if self._partes:
+            datos = b"".join(self._partes)
+            self._partes.clear()
+            yield datos
+
+
+def _nombres_unicos(entradas: Iterable[Tuple[str, Optional[str]]]) -> List[Tuple[str, str]]:
+    """(ruta, nombre en el zip) de los archivos existentes, sin nombres repetidos."""
+    usados = set()
+    resultado = []
+    for ruta, nombre in entradas:
+        if not ruta or not os.path.isfile(ruta):
+            print(f"⚠️ Ruta inexistente o vacía: {ruta}")
+            continue
+        nombre = nombre or os.path.basename(ruta)
+        base, ext = os.path.splitext(nombre)
+        n = 2
+        while nombre in usados:
+            nombre = f"{base} ({n}){ext}"
+            n += 1
+        usados.add(nombre)
+        resultado.append((ruta, nombre))
+    return resultado
+
+
+def iter_zip(entradas: Iterable[Tuple[str, Optional[str]]], chunk_size: int = ZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Genera el ZIP de `entradas` ([(ruta, nombre en el zip o None)]) en bloques.
+    Las rutas inexistentes se omiten.
+    """
+    salida = _SalidaZip()
+    with zipfile.ZipFile(salida, "w", allowZip64=True) as zf:
+        for ruta, nombre in _nombres_unicos(entradas):
+            zinfo = zipfile.ZipInfo.from_file(ruta, arcname=nombre)
+            ext = os.path.splitext(nombre)[1].lower()
+            zinfo.compress_type = zipfile.ZIP_STORED if ext in EXTENSIONES_COMPRIMIDAS else zipfile.ZIP_DEFLATED
+
+            with open(ruta, "rb") as origen, zf.open(zinfo, "w") as destino:
+                while True:
+                    bloque = origen.read(chunk_size)
+                    if not bloque:
+                        break
+                    destino.write(bloque)
+                    yield from salida.vaciar()
+            yield from salida.vaciar()
+    yield from salida.vaciar()
+
+
+def respuesta_zip(entradas: Iterable[Tuple[str, Optional[str]]], filename: str) -> StreamingResponse:
+    """StreamingResponse con el ZIP de `entradas` armado al vuelo."""
+    return StreamingResponse(
+        iter_zip(list(entradas)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
+    )
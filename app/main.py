@@ -127,6 +127,30 @@ app.include_router(notificaciones_router, prefix="/notificaciones", tags=["Notif
 app.include_router(postulaciones_router, prefix="/postulaciones", tags=["Postulaciones"])
 
 
+
+from helpers.mail_queue import iniciar_worker_mail
+from services.campanias import reanudar_campanias
+from services.webhook_whatsapp import iniciar_worker_webhooks
+from helpers.celulares import iniciar_sincronizacion_celulares
+from helpers.subregistros import iniciar_sincronizacion_subregistros
+from helpers.busqueda import iniciar_indice_busqueda
+
+@app.on_event("startup")
+def arrancar_workers():
+    # Mails que quedaron en la cola de una ejecución anterior
+    iniciar_worker_mail()
+    # Campañas de notificación masiva que quedaron a medio procesar
+    reanudar_campanias()
+    # Webhooks de WhatsApp que quedaron en la bandeja
+    iniciar_worker_webhooks()
+    # Índice de celulares (sec_users_celular): crea la tabla y completa las filas que falten
+    iniciar_sincronizacion_celulares()
+    # Máscaras de subregistros (proyecto_subregistros, ddjj_subregistros): crea y completa las tablas
+    iniciar_sincronizacion_subregistros()
+    # Índice de búsqueda de los listados (SQLite FTS5): lo arma y lo mantiene en segundo plano
+    iniciar_indice_busqueda()
+
+
 if __name__ == "__main__":
     import uvicorn
 
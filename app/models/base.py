@@ -1,3 +1,8 @@
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
+
+# Charset y collation de las tablas que crea la propia app (las tablas derivadas y su registro de
+# sincronización): los mismos que sec_users, proyecto y ddjj, para que los joins por login no
+# mezclen collations.
+MYSQL_TABLA_OPCIONES = {"mysql_charset": "utf8mb4", "mysql_collate": "utf8mb4_0900_ai_ci"}
@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Date, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Date, Text, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 
-from models.base import Base
+from models.base import Base, MYSQL_TABLA_OPCIONES
 
 
 class DDJJ(Base):
@@ -317,3 +317,15 @@ class DDJJ(Base):
 
 
 
+class DDJJSubregistros(Base):
+    """Subregistros de cada DDJJ como máscara de bits (ver helpers/subregistros.py)."""
+    __tablename__ = "ddjj_subregistros"
+    ddjj_id = Column(Integer, ForeignKey("ddjj.ddjj_id", ondelete="CASCADE"), primary_key=True)
+    mascara = Column(BigInteger, nullable=False, default=0)          # subreg_* (definitivos)
+    mascara_legacy = Column(Integer, nullable=False, default=0)      # ddjj_subregistro_*
+    subregistro_string = Column(String(512), nullable=True)
+
+    __table_args__ = (
+        Index('ix_ddjj_subregistros_mascara', 'mascara'),
+        dict(MYSQL_TABLA_OPCIONES),
+    )
@@ -2,7 +2,7 @@ from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey
 from datetime import datetime
 from sqlalchemy.orm import relationship
 
-from models.base import Base
+from models.base import Base, MYSQL_TABLA_OPCIONES
 
 
 class RuaEvento(Base):
@@ -83,3 +83,14 @@ class UsuarioNotificadoRatificacion(Base):
 
 
 
+
+
+
+class SincronizacionTabla(Base):
+    """Última sincronización completa de cada tabla derivada (ver helpers/tablas_derivadas.py)."""
+    __tablename__ = "tablas_derivadas_sync"
+
+    tabla = Column(String(64), primary_key=True)
+    completo_en = Column(DateTime, nullable=True)
+
+    __table_args__ = dict(MYSQL_TABLA_OPCIONES)
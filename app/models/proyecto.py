@@ -1,5 +1,5 @@
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Date, DateTime, Text
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Enum, Date, DateTime, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from models.users import User
@@ -8,7 +8,7 @@ from datetime import datetime
 from models.notif_y_observaciones import ObservacionesProyectos
 
 
-from models.base import Base
+from models.base import Base, MYSQL_TABLA_OPCIONES
 
 
 
@@ -222,6 +222,24 @@ class Proyecto(Base):
 
 
 
+class ProyectoSubregistros(Base):
+    """Subregistros de cada proyecto como máscara de bits (ver helpers/subregistros.py)."""
+    __tablename__ = "proyecto_subregistros"
+    proyecto_id = Column(Integer, ForeignKey("proyecto.proyecto_id", ondelete="CASCADE"), primary_key=True)
+    mascara = Column(BigInteger, nullable=False, default=0)          # subreg_* (definitivos)
+    mascara_legacy = Column(Integer, nullable=False, default=0)      # subregistro_*
+    subregistro_string = Column(String(512), nullable=True)          # el de construir_subregistro_string
+
+    __table_args__ = (
+        Index('ix_proyecto_subregistros_mascara', 'mascara'),
+        dict(MYSQL_TABLA_OPCIONES),
+    )
+
+
+
+
+
+
 class ProyectoHistorialEstado(Base):
     __tablename__ = "proyecto_historial_estado"
 
@@ -2,7 +2,7 @@ from sqlalchemy import Column, Integer, String, Date, LargeBinary, ForeignKey, I
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
-from models.base import Base
+from models.base import Base, MYSQL_TABLA_OPCIONES
 
 
 
@@ -86,3 +86,17 @@ class UserGroup(Base):
     group_id = Column(Integer, ForeignKey("sec_groups.group_id"), primary_key=True)
 
 
+
+
+class UserCelular(Base):
+    """Celular de cada usuario en forma canónica E.164 (ver helpers/celulares.py)."""
+    __tablename__ = "sec_users_celular"
+    login = Column(String(190), ForeignKey("sec_users.login", ondelete="CASCADE"), primary_key=True)
+    celular_e164 = Column(String(20), nullable=True)  # NULL si el celular cargado no es válido
+    # Valor de User.celular a partir del cual se calculó (para detectar cambios hechos por fuera del ORM)
+    celular_original = Column(String(20), nullable=True)
+
+    __table_args__ = (
+        Index('ix_users_celular_e164', 'celular_e164'),
+        dict(MYSQL_TABLA_OPCIONES),
+    )
@@ -9,6 +9,8 @@ from typing import List, Optional, Literal
 from datetime import datetime, date
 
 from database.config import get_db
+from helpers.paginacion import paginar_por_cursor, contar_cacheado, respuesta_cursor, DESCRIPCION_CURSOR, DESCRIPCION_CON_TOTAL
+from helpers.busqueda import buscar
 from security.security import verify_api_key, require_roles, get_current_user
 
 from helpers.utils import construir_subregistro_string
@@ -20,7 +22,9 @@ from models.users import User
 from models.nna import Nna, NnaHistorialEstado
 from models.eventos_y_configs import RuaEvento
 from services.proyecto_unificacion import unify_on_enter_vinculacion
+from services.dossiers import spec_pdf, spec_zip, responder_dossier, estado_dossier, descargar_job_dossier, VARIANTE_A4
 from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 import tempfile, shutil
 
 from zipfile import ZipFile
@@ -69,6 +73,8 @@ def listar_carpetas(
     busqueda_rapida: Optional[str] = Query(None),
     estado_filtro: Optional[str] = Query(None),
     estado_proyecto_filtro: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description=DESCRIPCION_CURSOR),
+    con_total: bool = Query(False, description=DESCRIPCION_CON_TOTAL),
     ):
 
     try:
@@ -116,47 +122,60 @@ def listar_carpetas(
 
         # 🔍 Búsqueda rápida
         if busqueda_rapida and len(busqueda_rapida.strip()) >= 3:
-            palabras = busqueda_rapida.strip().split()
-            condiciones_por_palabra = []
+            encontrados = buscar("carpetas", busqueda_rapida)
+            if encontrados is not None:
+                query = query.filter(Carpeta.carpeta_id.in_(encontrados))
+            else:
+                palabras = busqueda_rapida.strip().split()
+                condiciones_por_palabra = []
+
+                # ✅ Joins necesarios para búsqueda
+                query = query \
+                    .outerjoin(DetalleNNAEnCarpeta, DetalleNNAEnCarpeta.carpeta_id == Carpeta.carpeta_id) \
+                    .outerjoin(Nna, DetalleNNAEnCarpeta.nna_id == Nna.nna_id)
 
-            # ✅ Joins necesarios para búsqueda
-            query = query \
-                .outerjoin(DetalleNNAEnCarpeta, DetalleNNAEnCarpeta.carpeta_id == Carpeta.carpeta_id) \
-                .outerjoin(Nna, DetalleNNAEnCarpeta.nna_id == Nna.nna_id)
+                if not joined_proyectos:
+                    query = query \
+                        .outerjoin(DetalleProyectosEnCarpeta, DetalleProyectosEnCarpeta.carpeta_id == Carpeta.carpeta_id) \
+                        .outerjoin(Proyecto, DetalleProyectosEnCarpeta.proyecto_id == Proyecto.proyecto_id)
+                    joined_proyectos = True
 
-            if not joined_proyectos:
                 query = query \
-                    .outerjoin(DetalleProyectosEnCarpeta, DetalleProyectosEnCarpeta.carpeta_id == Carpeta.carpeta_id) \
-                    .outerjoin(Proyecto, DetalleProyectosEnCarpeta.proyecto_id == Proyecto.proyecto_id)
-                joined_proyectos = True
-
-            query = query \
-                .outerjoin(User1, User1.login == Proyecto.login_1) \
-                .outerjoin(User2, User2.login == Proyecto.login_2)
-
-            for palabra in palabras:
-                patron = f"%{palabra}%"
-                condiciones_por_palabra.append(
-                    or_(
-                        Nna.nna_nombre.ilike(patron),
-                        Nna.nna_apellido.ilike(patron),
-                        Nna.nna_dni.ilike(patron),
-                        Proyecto.nro_orden_rua.ilike(patron),
-                        Proyecto.login_1.ilike(patron),
-                        Proyecto.login_2.ilike(patron),
-                        User1.nombre.ilike(patron),
-                        User1.apellido.ilike(patron),
-                        User1.login.ilike(patron),
-                        User2.nombre.ilike(patron),
-                        User2.apellido.ilike(patron),
-                        User2.login.ilike(patron),
+                    .outerjoin(User1, User1.login == Proyecto.login_1) \
+                    .outerjoin(User2, User2.login == Proyecto.login_2)
+
+                for palabra in palabras:
+                    patron = f"%{palabra}%"
+                    condiciones_por_palabra.append(
+                        or_(
+                            Nna.nna_nombre.ilike(patron),
+                            Nna.nna_apellido.ilike(patron),
+                            Nna.nna_dni.ilike(patron),
+                            Proyecto.nro_orden_rua.ilike(patron),
+                            Proyecto.login_1.ilike(patron),
+                            Proyecto.login_2.ilike(patron),
+                            User1.nombre.ilike(patron),
+                            User1.apellido.ilike(patron),
+                            User1.login.ilike(patron),
+                            User2.nombre.ilike(patron),
+                            User2.apellido.ilike(patron),
+                            User2.login.ilike(patron),
+                        )
                     )
-                )
 
-            query = query.filter(and_(*condiciones_por_palabra)).distinct(Carpeta.carpeta_id)
+                query = query.filter(and_(*condiciones_por_palabra)).distinct(Carpeta.carpeta_id)
+
+        if cursor is not None:
+            # Paginación por cursor: mismo orden (estado, carpeta_id desc)
+            carpetas, next_cursor = paginar_por_cursor(query, [
+                (orden_estado, False),
+                (Carpeta.carpeta_id, True),
+            ], cursor, limit)
+            total = contar_cacheado(query, "carpetas") if con_total else None
 
-        total = query.count()
-        carpetas = query.offset((page - 1) * limit).limit(limit).all()
+        else:
+            total = query.count()
+            carpetas = query.offset((page - 1) * limit).limit(limit).all()
 
 
         resultado = []
@@ -233,6 +252,9 @@ def listar_carpetas(
                 "nnas_resumen": nnas_resumen
             })
 
+        if cursor is not None:
+            return respuesta_cursor("carpetas", resultado, limit, next_cursor, total)
+
         return {
             "page": page,
             "limit": limit,
@@ -1200,40 +1222,48 @@ def seleccionar_proyecto(
 
 
 
-@carpetas_router.get("/{carpeta_id}/descargar-pdf", response_class=FileResponse)
-def descargar_pdf_carpeta_completa(carpeta_id: int, db: Session = Depends(get_db)):
-    print(f"🔍 Buscando carpeta con ID {carpeta_id}...")
-    carpeta = db.query(Carpeta).filter(Carpeta.carpeta_id == carpeta_id).first()
+DOCUMENTOS_PERSONALES_CARPETA = [
+    "doc_adoptante_domicilio", "doc_adoptante_dni_frente", "doc_adoptante_dni_dorso",
+    "doc_adoptante_deudores_alimentarios", "doc_adoptante_antecedentes",
+    "doc_adoptante_migraciones", "doc_adoptante_salud"
+]
+
+
+def _nombre_legajo_carpeta(carpeta_id: int) -> str:
+    return f"carpeta_{carpeta_id}_documentos"
 
+
+def _spec_zip_carpeta(db: Session, carpeta_id: int):
+    """Spec del ZIP de la carpeta: un legajo PDF por proyecto (ver services/dossiers.py)."""
+    carpeta = (
+        db.query(Carpeta)
+        .options(
+            joinedload(Carpeta.detalle_proyectos).joinedload(DetalleProyectosEnCarpeta.proyecto),
+            joinedload(Carpeta.detalle_nna).joinedload(DetalleNNAEnCarpeta.nna),
+        )
+        .filter(Carpeta.carpeta_id == carpeta_id)
+        .first()
+    )
     if not carpeta:
         print("❌ Carpeta no encontrada")
         raise HTTPException(status_code=404, detail="Carpeta no encontrada")
 
-    output_folder = os.path.join(DIR_PDF_GENERADOS, f"carpeta_{carpeta_id}")
-    os.makedirs(output_folder, exist_ok=True)
-    print(f"📁 Carpeta de salida creada: {output_folder}")
-
-    pdf_paths = []
+    fichas_nna = [
+        (f"ficha_nna_{dnna.nna.nna_id}", dnna.nna.nna_ficha, VARIANTE_A4)
+        for dnna in carpeta.detalle_nna
+        if dnna.nna and dnna.nna.nna_ficha
+    ]
 
+    partes = []
     for dp in carpeta.detalle_proyectos:
         proyecto = dp.proyecto
         if not proyecto:
             print("⚠️ Proyecto no encontrado en detalle_proyectos")
             continue
 
-        print(f"📄 Procesando proyecto ID {proyecto.proyecto_id}")
-        merged = fitz.open()
-
-
-        ###############
         pretenso_1 = proyecto.usuario_1
         pretenso_2 = proyecto.usuario_2 if proyecto.login_2 else None
 
-        portada = merged.new_page(width=595, height=842)
-        portada.insert_textbox(fitz.Rect(0, 50, 595, 100), "SERVICIO DE GUARDA Y ADOPCIÓN", fontname="helv", fontsize=16, align=1, color=(0.1, 0.1, 0.3))
-        portada.insert_textbox(fitz.Rect(0, 75, 595, 120), "REGISTRO ÚNICO DE ADOPCIONES Y EQUIPO TÉCNICO", fontname="helv", fontsize=13, align=1, color=(0.2, 0.2, 0.4))
-        portada.insert_textbox(fitz.Rect(0, 105, 595, 135), "DOCUMENTACIÓN DEL PROYECTO ADOPTIVO", fontname="helv", fontsize=11, align=1, color=(0.4, 0.4, 0.4))
-
         domicilio = proyecto.proyecto_calle_y_nro or ""
         if proyecto.proyecto_depto_etc:
             domicilio += f", {proyecto.proyecto_depto_etc}"
@@ -1256,140 +1286,60 @@ def descargar_pdf_carpeta_completa(carpeta_id: int, db: Session = Depends(get_db
         if proyecto.proyecto_provincia:
             datos.append(f"Provincia: {proyecto.proyecto_provincia}")
 
-        fondo = fitz.Rect(50, 160, 545, 380)
-        portada.draw_rect(fondo, fill=(0.88, 0.93, 0.98))
-        y = 170
-        for linea in datos:
-            portada.insert_textbox(fitz.Rect(60, y, 530, y + 25), linea, fontsize=13, fontname="helv", align=0, color=(0.1, 0.1, 0.1))
-            y += 28
-
-        portada.draw_line(p1=(60, y + 10), p2=(portada.rect.width - 60, y + 10), color=(0.5, 0.5, 0.5), width=0.6)
-
-        #################
+        documentos = [("informe_profesionales", proyecto.informe_profesionales, VARIANTE_A4)]
+        if proyecto.proyecto_tipo != "Monoparental":
+            documentos.append(("convivencia", proyecto.doc_proyecto_convivencia_o_estado_civil, VARIANTE_A4))
 
-        # # Portada
-        # portada = merged.new_page(width=595, height=842)
-        # portada.insert_textbox(fitz.Rect(0, 50, 595, 100), "📄 Proyecto adoptivo", fontsize=22, align=1)
+        for user in (pretenso_1, pretenso_2):
+            if user:
+                for campo in DOCUMENTOS_PERSONALES_CARPETA:
+                    documentos.append((campo, getattr(user, campo, None), VARIANTE_A4))
 
-        # datos = [
-        #     f"N° RUA: {proyecto.nro_orden_rua or '-'}",
-        #     f"Tipo: {proyecto.proyecto_tipo or '-'}",
-        #     f"Provincia: {proyecto.proyecto_provincia or '-'}",
-        # ]
+        documentos.extend(fichas_nna)
 
-        # if proyecto.usuario_1:
-        #     datos.append(f"Pretenso 1: {proyecto.usuario_1.nombre} {proyecto.usuario_1.apellido} - DNI: {proyecto.login_1}")
-        # if proyecto.usuario_2:
-        #     datos.append(f"Pretenso 2: {proyecto.usuario_2.nombre} {proyecto.usuario_2.apellido} - DNI: {proyecto.login_2}")
+        partes.append(spec_pdf(f"proyecto_{proyecto.proyecto_id}", datos, documentos, separadores = False))
 
-        # y = 130
-        # for linea in datos:
-        #     portada.insert_textbox(fitz.Rect(60, y, 530, y+25), linea, fontsize=14)
-        #     y += 30
+    if not partes:
+        print("❌ No se generó ningún PDF. Abortando ZIP.")
+        raise HTTPException(status_code=404, detail="No se pudieron generar documentos para esta carpeta.")
 
+    return spec_zip(_nombre_legajo_carpeta(carpeta_id), partes)
 
 
 
+@carpetas_router.get("/{carpeta_id}/descargar-pdf", response_class=FileResponse)
+async def descargar_pdf_carpeta_completa(carpeta_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    📦 Descarga un ZIP con el legajo PDF de cada proyecto de la carpeta.
 
+    Se sirve desde la caché (con ETag) si no cambió ningún documento. Si hay que armarlo y no
+    termina en unos segundos, responde 202 con el `job_id` para consultar el avance en
+    `/{carpeta_id}/descargar-pdf/jobs/{job_id}` y descargar en `.../{job_id}/download`.
+    """
+    spec = await run_in_threadpool(_spec_zip_carpeta, db, carpeta_id)
+    return await responder_dossier(spec, request, f"carpeta_{carpeta_id}_documentos.zip")
 
-        def agregar_doc(ruta, nombre):
-            if not ruta:
-                print(f"⚠️ Documento '{nombre}' no definido.")
-                return
-            if not os.path.exists(ruta):
-                print(f"❌ Ruta inexistente: {ruta}")
-                return
 
-            ext = os.path.splitext(ruta)[1].lower()
-            nombre_base = f"{nombre}_{os.path.basename(ruta)}"
-            out_pdf = os.path.join(output_folder, nombre_base + ".pdf")
-            print(f"📎 Agregando documento '{nombre}' ({ext}) desde {ruta}")
 
-            try:
-                if ext == ".pdf":
-                    shutil.copy(ruta, out_pdf)
-                
-                # elif ext in [".jpg", ".jpeg", ".png"]:
-                #     Image.open(ruta).convert("RGB").save(out_pdf)
-                elif ext in [".jpg", ".jpeg", ".png"]:
-                    img = Image.open(ruta).convert("RGB")
-                    
-                    # Tamaño A4 en puntos (1 punto = 1/72 pulgadas)
-                    a4_width, a4_height = 595, 842
-
-                    # Crear nuevo lienzo blanco A4
-                    new_img = Image.new("RGB", (a4_width, a4_height), (255, 255, 255))
-
-                    # Redimensionar imagen manteniendo proporción para que quepa en A4
-                    img.thumbnail((a4_width, a4_height))
-
-                    # Calcular posición para centrarla
-                    x = (a4_width - img.width) // 2
-                    y = (a4_height - img.height) // 2
-
-                    new_img.paste(img, (x, y))
-
-                    # Guardar como PDF en tamaño A4
-                    new_img.save(out_pdf, "PDF", resolution=100.0)
-                    
-                elif ext in [".doc", ".docx"]:
-                    subprocess.run([
-                        "libreoffice", "--headless", "--convert-to", "pdf", "--outdir", output_folder, ruta
-                    ], check=True)
-                    out_pdf = os.path.join(output_folder, os.path.splitext(os.path.basename(ruta))[0] + ".pdf")
-
-                if os.path.exists(out_pdf):
-                    with fitz.open(out_pdf) as doc:
-                        merged.insert_pdf(doc)
-                    print(f"✅ Documento agregado: {out_pdf}")
-                else:
-                    print(f"⚠️ No se generó el PDF para: {ruta}")
-            except Exception as e:
-                print(f"❌ Error procesando documento '{ruta}': {e}")
-
-        agregar_doc(proyecto.informe_profesionales, "informe_profesionales")
-
-        if proyecto.proyecto_tipo != "Monoparental":
-            agregar_doc(proyecto.doc_proyecto_convivencia_o_estado_civil, "convivencia")
-
-        for login in [proyecto.login_1, proyecto.login_2]:
-            if login:
-                user = db.query(User).filter(User.login == login).first()
-                if user:
-                    print(f"👤 Documentos para usuario {login}")
-                    for campo in [
-                        "doc_adoptante_domicilio", "doc_adoptante_dni_frente", "doc_adoptante_dni_dorso",
-                        "doc_adoptante_deudores_alimentarios", "doc_adoptante_antecedentes",
-                        "doc_adoptante_migraciones", "doc_adoptante_salud"
-                    ]:
-                        agregar_doc(getattr(user, campo, None), campo)
+@carpetas_router.get("/{carpeta_id}/descargar-pdf/jobs/{job_id}", response_model=dict)
+def estado_pdf_carpeta_completa(carpeta_id: int, job_id: str):
+    """
+    ⏳ Avance del armado del ZIP de la carpeta.
+    """
+    estado = estado_dossier(job_id, _nombre_legajo_carpeta(carpeta_id))
+    if estado is None:
+        raise HTTPException(status_code=404, detail="job no encontrado")
+    return estado
 
-        for dnna in carpeta.detalle_nna:
-            if dnna.nna and dnna.nna.nna_ficha:
-                agregar_doc(dnna.nna.nna_ficha, f"ficha_nna_{dnna.nna.nna_id}")
 
-        pdf_name = f"proyecto_{proyecto.proyecto_id}.pdf"
-        final_pdf_path = os.path.join(output_folder, pdf_name)
-        merged.save(final_pdf_path)
-        pdf_paths.append(final_pdf_path)
-        print(f"📄 PDF generado: {final_pdf_path}")
 
-    if not pdf_paths:
-        print("❌ No se generó ningún PDF. Abortando ZIP.")
-        raise HTTPException(status_code=404, detail="No se pudieron generar documentos para esta carpeta.")
+@carpetas_router.get("/{carpeta_id}/descargar-pdf/jobs/{job_id}/download")
+def descargar_job_pdf_carpeta_completa(carpeta_id: int, job_id: str, request: Request):
+    """
+    📦 Descarga el ZIP armado por un job.
+    """
+    return descargar_job_dossier(job_id, _nombre_legajo_carpeta(carpeta_id), request, f"carpeta_{carpeta_id}_documentos.zip")
 
-    zip_path = os.path.join(DIR_PDF_GENERADOS, f"carpeta_{carpeta_id}_documentos.zip")
-    with ZipFile(zip_path, 'w') as zipf:
-        for pdf in pdf_paths:
-            zipf.write(pdf, os.path.basename(pdf))
-            print(f"📦 Agregado al ZIP: {os.path.basename(pdf)}")
-
-    print(f"✅ ZIP final generado: {zip_path}")
-    return FileResponse(
-        path=zip_path,
-        filename=os.path.basename(zip_path),
-        media_type="application/zip"
-    )
 
 
 
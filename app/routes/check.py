@@ -1,6 +1,6 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Body
 from sqlalchemy.orm import Session
-from sqlalchemy import text, and_
+from sqlalchemy import text, and_, or_, func, insert
 from database.config import get_db, SessionLocal
 from helpers.moodle import existe_mail_en_moodle, existe_dni_en_moodle, is_curso_aprobado, get_setting_value
 from models.users import User
@@ -10,15 +10,22 @@ from helpers.moodle import eliminar_usuario_en_moodle, get_idusuario_by_mail
 from datetime import datetime, timedelta
 from models.proyecto import Proyecto, ProyectoHistorialEstado, FechaRevision
 from models.eventos_y_configs import RuaEvento
+from helpers.estadisticas_snapshot import marcar_secciones_desactualizadas, SECCIONES_POR_MODELO
 
-import os, json, hashlib, time
+import os, json, hashlib, time, fnmatch
 
 
 from pathlib import Path
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Optional
+
+from helpers.backup_manifest import BackupManifest
+from helpers.backup_bundle import armar_bundle, parse_range
+from services.dossiers import DOSSIER_CACHE_DIR
+from starlette.responses import Response
 
 
 load_dotenv()
@@ -30,9 +37,37 @@ check_router = APIRouter()
 # --- Directorio donde se guarda el estado del último backup ---
 EXPORT_DIR = os.getenv("EXPORT_DIR") or "/docs-rua/exports"
 os.makedirs(EXPORT_DIR, exist_ok=True)
-BACKUP_STATE_FILE = os.path.join(EXPORT_DIR, "last_backup_state.json")
+BACKUP_STATE_FILE = os.path.join(EXPORT_DIR, "last_backup_state.json")  # formato anterior, se migra al manifiesto
+BACKUP_MANIFEST_FILE = os.path.join(EXPORT_DIR, "_backup_manifest.sqlite3")
 BACKUP_LOCK_FILE = os.path.join(EXPORT_DIR, "backup.lock")
 
+# Archivos propios del backup que no se incluyen en el backup
+BACKUP_EXCLUDED_FILES = {
+    os.path.realpath(p) for p in (
+        BACKUP_STATE_FILE,
+        BACKUP_LOCK_FILE,
+        BACKUP_MANIFEST_FILE,
+        BACKUP_MANIFEST_FILE + "-wal",
+        BACKUP_MANIFEST_FILE + "-shm",
+    )
+}
+
+# Estado de trabajo de la app en EXPORT_DIR, que cambia todo el tiempo y no es un documento:
+# bases SQLite (jobs, cola de mails, límites de envío, webhooks, índice de búsqueda) con sus
+# -wal/-shm y los archivos de entrada de las campañas (se borran con su job)
+BACKUP_EXCLUDED_PATTERNS = (
+    "_*.sqlite3",
+    "_*.sqlite3-wal",
+    "_*.sqlite3-shm",
+    "_*.sqlite3-journal",
+    "campania_*",
+)
+
+# Directorios que no se recorren: la caché de legajos armados (se regenera sola)
+BACKUP_EXCLUDED_DIRS = {os.path.realpath(DOSSIER_CACHE_DIR)}
+
+_EXPORT_DIR_REAL = os.path.realpath(EXPORT_DIR)
+
 
 # --- Directorios que se recorren ---
 DIRS_TO_BACKUP = [
@@ -54,112 +89,176 @@ MAX_FILE_SIZE_BYTES = 500 * 1024 * 1024
 
 
 
-def _load_state() -> dict:
-    if os.path.exists(BACKUP_STATE_FILE):
-        try:
-            with open(BACKUP_STATE_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            print("⚠️ Archivo de estado de backup corrupto; se reinicia el estado.")
-            return {}
-    return {}
-
+def _abrir_manifiesto() -> BackupManifest:
+    """Abre el manifiesto del backup; la primera vez importa el antiguo last_backup_state.json."""
+    manifiesto = BackupManifest(BACKUP_MANIFEST_FILE)
+    try:
+        importados = manifiesto.import_legacy_state(BACKUP_STATE_FILE)
+        if importados:
+            print(f"📦 Manifiesto de backup: importadas {importados} rutas desde {BACKUP_STATE_FILE}")
+    except Exception as e:
+        print(f"⚠️ No se pudo importar el estado previo de backup: {e}")
+    return manifiesto
 
-def _save_state(state: dict) -> None:
-    """Guarda el estado del último backup incremental."""
-    with open(BACKUP_STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, indent=2)
 
+def _tomar_lock_backup() -> None:
+    """Lock atómico entre workers (O_EXCL) para evitar escaneos concurrentes."""
+    try:
+        fd = os.open(BACKUP_LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+    except FileExistsError:
+        raise HTTPException(status_code=423, detail="Ya hay un proceso de backup en ejecución.")
 
 
-def _file_md5(path: str) -> str:
-    """Calcula un hash MD5 del archivo (opcional, para verificar cambios reales)."""
+def _liberar_lock_backup() -> None:
     try:
-        with open(path, "rb") as f:
-            h = hashlib.md5()
-            for chunk in iter(lambda: f.read(8192), b""):
-                h.update(chunk)
-        return h.hexdigest()
+        if os.path.exists(BACKUP_LOCK_FILE):
+            os.remove(BACKUP_LOCK_FILE)
     except Exception:
-        return ""
+        # Si no se puede borrar, lo registrás en logs del servidor
+        pass
 
 
 @check_router.post("/verificaciones_de_cron", response_model=dict, dependencies=[Depends( verify_api_key ), 
                                 Depends(require_roles(["administrador", "supervision", "supervisora"]))])
-def verificaciones_de_cron(db: Session = Depends(get_db)):
+def verificaciones_de_cron(
+    db: Session = Depends(get_db),
+    dry_run: bool = Query(False, description="Si es true, solo devuelve los proyectos candidatos sin modificarlos"),
+    batch_size: int = Query(500, ge=1, le=5000, description="Cantidad de proyectos por transacción"),
+    ):
     """
     Revisa proyectos con estado 'no_viable' y si tienen más de 2 años en ese estado,
     los pasa a estado 'baja_caducidad' y registra el cambio.
+    Los candidatos se obtienen con una única consulta agrupada y los cambios se aplican
+    por lotes (UPDATE + INSERT masivos), con un commit por lote.
     """
 
-    dos_anios_atras = datetime.now() - timedelta(days=730)
-    proyectos_afectados = []
-
-    proyectos_no_viables = db.query(Proyecto).filter(Proyecto.estado_general == 'no_viable').all()
-
-    for proyecto in proyectos_no_viables:
-        fecha_no_viable = None
+    ahora = datetime.now()
+    dos_anios_atras = ahora - timedelta(days=730)
 
-        # Buscar la última fecha donde el estado fue cambiado a no_viable en el historial
-        historial_no_viable = (
-            db.query(ProyectoHistorialEstado)
-            .filter(
-                ProyectoHistorialEstado.proyecto_id == proyecto.proyecto_id,
-                ProyectoHistorialEstado.estado_nuevo == 'no_viable'
+    # Última vez que cada proyecto pasó a no_viable, según el historial
+    ultimo_no_viable_sq = (
+        db.query(
+            ProyectoHistorialEstado.proyecto_id.label("proyecto_id"),
+            func.max(ProyectoHistorialEstado.fecha_hora).label("fecha_no_viable")
+        )
+        .join(Proyecto, Proyecto.proyecto_id == ProyectoHistorialEstado.proyecto_id)
+        .filter(
+            Proyecto.estado_general == 'no_viable',
+            ProyectoHistorialEstado.estado_nuevo == 'no_viable'
+        )
+        .group_by(ProyectoHistorialEstado.proyecto_id)
+        .subquery()
+    )
+
+    candidatos = (
+        db.query(
+            Proyecto.proyecto_id,
+            Proyecto.login_1,
+            Proyecto.login_2,
+            ultimo_no_viable_sq.c.fecha_no_viable,
+            Proyecto.ultimo_cambio_de_estado,
+        )
+        .outerjoin(ultimo_no_viable_sq, ultimo_no_viable_sq.c.proyecto_id == Proyecto.proyecto_id)
+        .filter(
+            Proyecto.estado_general == 'no_viable',
+            or_(
+                ultimo_no_viable_sq.c.fecha_no_viable < dos_anios_atras,
+                and_(
+                    ultimo_no_viable_sq.c.fecha_no_viable.is_(None),
+                    Proyecto.ultimo_cambio_de_estado < dos_anios_atras.date()
+                )
             )
-            .order_by(ProyectoHistorialEstado.fecha_hora.desc())
-            .first()
         )
+        .order_by(Proyecto.proyecto_id)
+        .all()
+    )
+
+    proyectos_candidatos = []
+    for c in candidatos:
+        fecha_no_viable = c.fecha_no_viable or datetime.combine(c.ultimo_cambio_de_estado, datetime.min.time())
+        proyectos_candidatos.append({
+            "proyecto_id": c.proyecto_id,
+            "login_1": c.login_1,
+            "login_2": c.login_2,
+            "fecha_no_viable": fecha_no_viable.strftime("%Y-%m-%d")
+        })
+
+    print(f"[CADUCIDAD de NO VIABLE] {len(proyectos_candidatos)} proyectos con más de 2 años en 'no_viable'"
+          f"{' (dry run)' if dry_run else ''}")
+
+    if dry_run:
+        return {
+            "dry_run": True,
+            "cantidad_proyectos_candidatos": len(proyectos_candidatos),
+            "proyectos_candidatos": proyectos_candidatos
+        }
 
-        print(f"[CADUCIDAD de NO VIABLE - Que no cumplieron 2 años] Proyecto {proyecto.proyecto_id}")
-
-        if historial_no_viable:
-            fecha_no_viable = historial_no_viable.fecha_hora
-        elif proyecto.ultimo_cambio_de_estado:
-            fecha_no_viable = datetime.combine(proyecto.ultimo_cambio_de_estado, datetime.min.time())
+    proyectos_afectados = []
 
-        # Si la fecha es mayor a 2 años, se debe actualizar el estado
-        if fecha_no_viable and fecha_no_viable < dos_anios_atras:
-            estado_anterior = proyecto.estado_general
-            proyecto.estado_general = 'baja_caducidad'
-            proyecto.ultimo_cambio_de_estado = datetime.now().date()
+    for i in range(0, len(proyectos_candidatos), batch_size):
+        lote = {p["proyecto_id"]: p for p in proyectos_candidatos[i:i + batch_size]}
 
-            db.add(ProyectoHistorialEstado(
-                proyecto_id=proyecto.proyecto_id,
-                estado_anterior=estado_anterior,
-                estado_nuevo='baja_caducidad',
-                comentarios='Cambio automático por cron: más de 2 años en estado no_viable.',
-                fecha_hora=datetime.now()
-            ))
+        try:
+            # Se bloquean solo las filas del lote y se descartan las que cambiaron de estado mientras tanto
+            ids_vigentes = [
+                pid for (pid,) in (
+                    db.query(Proyecto.proyecto_id)
+                    .filter(Proyecto.proyecto_id.in_(lote.keys()), Proyecto.estado_general == 'no_viable')
+                    .with_for_update()
+                    .all()
+                )
+            ]
+            if not ids_vigentes:
+                db.rollback()
+                continue
 
-            ahora = datetime.now()  # fuera del bucle si querés usar el mismo timestamp
+            db.query(Proyecto).filter(Proyecto.proyecto_id.in_(ids_vigentes)).update(
+                {
+                    Proyecto.estado_general: 'baja_caducidad',
+                    Proyecto.ultimo_cambio_de_estado: ahora.date(),
+                },
+                synchronize_session=False
+            )
 
-            if proyecto.login_1:
-                db.add(RuaEvento(
-                    evento_detalle = f"Cambio automático de estado del proyecto {proyecto.proyecto_id}: de 'no_viable' a 'baja_caducidad' por antigüedad mayor a 2 años.",
-                    evento_fecha = ahora,
-                    login = proyecto.login_1
-                ))
+            db.execute(insert(ProyectoHistorialEstado), [
+                {
+                    "proyecto_id": pid,
+                    "estado_anterior": 'no_viable',
+                    "estado_nuevo": 'baja_caducidad',
+                    "comentarios": 'Cambio automático por cron: más de 2 años en estado no_viable.',
+                    "fecha_hora": ahora,
+                }
+                for pid in ids_vigentes
+            ])
+
+            eventos = [
+                {
+                    "evento_detalle": f"Cambio automático de estado del proyecto {pid}: de 'no_viable' a 'baja_caducidad' por antigüedad mayor a 2 años.",
+                    "evento_fecha": ahora,
+                    "login": login,
+                }
+                for pid in ids_vigentes
+                for login in (lote[pid]["login_1"], lote[pid]["login_2"])
+                if login
+            ]
+            if eventos:
+                db.execute(insert(RuaEvento), eventos)
 
-            if proyecto.login_2:
-                db.add(RuaEvento(
-                    evento_detalle = f"Cambio automático de estado del proyecto {proyecto.proyecto_id}: de 'no_viable' a 'baja_caducidad' por antigüedad mayor a 2 años.",
-                    evento_fecha = ahora,
-                    login = proyecto.login_2
-                ))
+            db.commit()
 
+        except Exception as e:
+            db.rollback()
+            print(f"❌ [CADUCIDAD de NO VIABLE] Error en el lote que empieza en {i}: {e}")
+            raise HTTPException(status_code=500, detail=f"Error al aplicar la caducidad de proyectos no viables: {str(e)}")
 
-            proyectos_afectados.append({
-                "proyecto_id": proyecto.proyecto_id,
-                "login_1": proyecto.login_1,
-                "login_2": proyecto.login_2,
-                "fecha_no_viable": fecha_no_viable.strftime("%Y-%m-%d")
-            })
+        proyectos_afectados.extend(lote[pid] for pid in ids_vigentes)
 
-            print(f"[CADUCIDAD de NO VIABLE] Proyecto {proyecto.proyecto_id} pasó de 'no_viable' a 'baja_caducidad' "
-                  f"(login_1: {proyecto.login_1}, login_2: {proyecto.login_2}, desde: {fecha_no_viable.date()})")
+    if proyectos_afectados:
+        # Los INSERT masivos no pasan por el flush del ORM: se invalida el snapshot de estadísticas a mano
+        marcar_secciones_desactualizadas(SECCIONES_POR_MODELO[ProyectoHistorialEstado])
 
-    db.commit()
+    print(f"[CADUCIDAD de NO VIABLE] {len(proyectos_afectados)} proyectos pasaron de 'no_viable' a 'baja_caducidad'")
 
     return {
         "cantidad_proyectos_actualizados": len(proyectos_afectados),
@@ -299,135 +398,185 @@ def api_moodle_eliminar_usuario(
     dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))])
 def verificar_archivos_para_backup(
     db: Session = Depends(get_db),
-    limit: int = Query(0, description="Máximo número de archivos a escanear (0 = sin límite)"),
-    modo_rapido: bool = Query(True, description="Si True, ignora hashes MD5 y solo compara tamaño/fecha")
+    limit: int = Query(0, description="Máximo número de archivos a escanear en esta llamada (0 = sin límite)"),
+    modo_rapido: bool = Query(True, description="Si True, ignora hashes MD5 y solo compara tamaño/fecha/inode"),
+    page_size: int = Query(1000, ge=1, le=10000, description="Cantidad de cambios incluidos en `detalles`")
     ):
 
     """
-    Analiza los directorios definidos en .env y devuelve los archivos nuevos o modificados
-    desde el último backup. Soporta limitación de cantidad y modo rápido sin hashes.
+    Analiza los directorios definidos en .env contra el manifiesto persistente y devuelve los
+    archivos nuevos o modificados desde el último backup.
+    - Si un escaneo anterior se cortó por `limit`, esta llamada lo retoma desde donde quedó.
+    - `detalles` trae la primera página de cambios; el resto se pide a /backup/cambios con
+      `scan_id` y `next_cursor`.
     Incluye:
     - Lock para evitar ejecuciones concurrentes
     - Límite de tamaño de archivo
     - Registro de evento en RuaEvento
     """
 
-    # 🔒 Lock simple para evitar ejecuciones concurrentes
-    if os.path.exists(BACKUP_LOCK_FILE):
-        raise HTTPException(status_code=423, detail="Ya hay un proceso de backup en ejecución.")
-
-    open(BACKUP_LOCK_FILE, "w").close()
+    _tomar_lock_backup()
 
     try:
-        prev_state = _load_state()
-        new_state = {}
-        changed_files = []
-        total_archivos = 0
-        procesados = 0
-        archivos_omitidos_por_tamano = 0
-
-        for base_dir in DIRS_TO_BACKUP:
-            if not base_dir:
-                continue
-            base_dir_real = os.path.realpath(base_dir)
-            if not os.path.exists(base_dir_real):
-                continue
+        manifiesto = _abrir_manifiesto()
+        try:
+            t0 = time.perf_counter()
+            resumen = manifiesto.scan(
+                roots = list(dict.fromkeys(ALLOWED_BACKUP_ROOTS)),
+                excluir = _excluido_del_backup,
+                max_file_size = MAX_FILE_SIZE_BYTES,
+                limit = limit,
+                modo_rapido = modo_rapido,
+            )
+            pagina = manifiesto.cambios(resumen["scan_id"], page_size = page_size)
+        finally:
+            manifiesto.close()
 
-            for root, _, files in os.walk(base_dir_real):
-                for f in files:
-                    full_path = os.path.join(root, f)
-                    full_path_real = os.path.realpath(full_path)
-
-                    # Evitar incluir el archivo de estado del backup y el lock en el propio backup
-                    if full_path_real == os.path.realpath(BACKUP_STATE_FILE):
-                        continue
-                    if full_path_real == os.path.realpath(BACKUP_LOCK_FILE):
-                        continue
-
-                    try:
-                        stat = os.stat(full_path_real)
-
-                        # Límite de tamaño
-                        if stat.st_size > MAX_FILE_SIZE_BYTES:
-                            archivos_omitidos_por_tamano += 1
-                            continue
-
-                        new_state[full_path_real] = {
-                            "mtime": stat.st_mtime,
-                            "size": stat.st_size
-                        }
-                        total_archivos += 1
-
-                        prev = prev_state.get(full_path_real)
-                        if (not prev or
-                            prev.get("size") != stat.st_size or
-                            prev.get("mtime") != stat.st_mtime):
-                            changed = {
-                                "path": full_path_real,
-                                "size": stat.st_size,
-                                "mtime": stat.st_mtime,
-                            }
-                            if not modo_rapido:
-                                changed["md5"] = _file_md5(full_path_real)
-                            changed_files.append(changed)
-
-                        procesados += 1
-                        if limit and procesados >= limit:
-                            _save_state(new_state)
-
-                            # Registrar evento en RuaEvento
-                            db.add(RuaEvento(
-                                evento_detalle=(
-                                    f"Backup incremental verificado parcialmente (limit={limit}). "
-                                    f"Archivos escaneados: {total_archivos}, "
-                                    f"archivos cambiados: {len(changed_files)}, "
-                                    f"omitidos por tamaño: {archivos_omitidos_por_tamano}."
-                                ),
-                                evento_fecha=datetime.now()
-                            ))
-                            db.commit()
-
-                            return {
-                                "total_archivos_escaneados": total_archivos,
-                                "archivos_cambiados": len(changed_files),
-                                "limit_reached": True,
-                                "archivos_omitidos_por_tamano": archivos_omitidos_por_tamano,
-                                "detalles": changed_files
-                            }
-                    except Exception:
-                        # Podés loguear algo si querés
-                        continue
-
-        _save_state(new_state)
+        limit_reached = resumen["limit_reached"]
+        print(f"📦 Escaneo de backup {resumen['scan_id']}: {resumen['total_escaneados']} archivos "
+              f"en {time.perf_counter() - t0:.2f} segundos")
 
         # Registrar evento en RuaEvento
         db.add(RuaEvento(
             evento_detalle=(
-                "Backup incremental verificado completamente. "
-                f"Archivos escaneados: {total_archivos}, "
-                f"archivos cambiados: {len(changed_files)}, "
-                f"omitidos por tamaño: {archivos_omitidos_por_tamano}."
+                (f"Backup incremental verificado parcialmente (limit={limit}). " if limit_reached
+                 else "Backup incremental verificado completamente. ") +
+                f"Archivos escaneados: {resumen['total_escaneados']}, "
+                f"archivos cambiados: {resumen['archivos_cambiados']}, "
+                f"omitidos por tamaño: {resumen['omitidos_por_tamano']}."
             ),
             evento_fecha=datetime.now()
         ))
         db.commit()
 
         return {
-            "total_archivos_escaneados": total_archivos,
-            "archivos_cambiados": len(changed_files),
-            "limit_reached": False,
-            "archivos_omitidos_por_tamano": archivos_omitidos_por_tamano,
-            "detalles": changed_files
+            "scan_id": resumen["scan_id"],
+            "total_archivos_escaneados": resumen["total_escaneados"],
+            "archivos_cambiados": resumen["archivos_cambiados"],
+            "archivos_eliminados": resumen["archivos_eliminados"],
+            "limit_reached": limit_reached,
+            "archivos_omitidos_por_tamano": resumen["omitidos_por_tamano"],
+            "detalles": pagina["detalles"],
+            "next_cursor": pagina["next_cursor"],
         }
 
     finally:
         # Quitar lock siempre, aunque falle algo
+        _liberar_lock_backup()
+
+
+@check_router.get("/backup/cambios",
+    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))])
+def listar_cambios_backup(
+    scan_id: int = Query(..., description="Escaneo devuelto por /backup/verificar"),
+    cursor: Optional[str] = Query(None, description="`next_cursor` de la página anterior"),
+    page_size: int = Query(1000, ge=1, le=10000),
+    stream: bool = Query(False, description="Si True, devuelve todos los cambios restantes como NDJSON en streaming")
+    ):
+    """
+    Devuelve los archivos cambiados de un escaneo, paginados por ruta.
+    Con `stream=true` envía una línea JSON por archivo, leyendo el manifiesto por lotes.
+    """
+    manifiesto = _abrir_manifiesto()
+    if manifiesto.get_scan(scan_id) is None:
+        manifiesto.close()
+        raise HTTPException(status_code=404, detail="Escaneo de backup no encontrado.")
+
+    if not stream:
         try:
-            if os.path.exists(BACKUP_LOCK_FILE):
-                os.remove(BACKUP_LOCK_FILE)
-        except Exception:
-            # Si no se puede borrar, lo registrás en logs del servidor
-            pass
+            return manifiesto.cambios(scan_id, cursor, page_size)
+        finally:
+            manifiesto.close()
+
+    def _ndjson():
+        # La conexión SQLite se usa en el hilo que consume el generador
+        m = BackupManifest(BACKUP_MANIFEST_FILE)
+        try:
+            for cambio in m.iter_cambios(scan_id, cursor):
+                yield json.dumps(cambio) + "\n"
+        finally:
+            m.close()
+
+    manifiesto.close()
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+
+@check_router.post("/backup/bundle",
+    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))])
+def descargar_bundle_backup(
+    request: Request,
+    datos: dict = Body(...),
+    ):
+    """
+    Descarga en un único .tar los archivos de una página de cambios del backup.
+    Body: { "scan_id": int, "cursor": str | null, "page_size": int, "tengo": [md5, ...], "comprimir": bool }
+    - El primer miembro (_bundle_manifest.json) lista todos los archivos de la página con su MD5,
+      incluidos o no; los que el cliente ya tiene (`tengo`) no se envían.
+    - Cada miembro lleva su MD5 en el encabezado PAX `RUA.md5`.
+    - Sin compresión soporta Range / If-Range para retomar una descarga cortada.
+    - `X-Next-Cursor` indica la página siguiente.
+    """
+    try:
+        scan_id = int(datos.get("scan_id"))
+        page_size = min(max(int(datos.get("page_size") or 1000), 1), 10000)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="scan_id y page_size deben ser numéricos.")
+    cursor = datos.get("cursor") or None
+    tengo = set(datos.get("tengo") or [])
+    comprimir = bool(datos.get("comprimir", False))
+
+    manifiesto = _abrir_manifiesto()
+    try:
+        if manifiesto.get_scan(scan_id) is None:
+            raise HTTPException(status_code=404, detail="Escaneo de backup no encontrado.")
+        bundle = armar_bundle(manifiesto, scan_id, cursor, page_size, tengo, _es_ruta_de_backup)
+    finally:
+        manifiesto.close()
+
+    headers = {
+        "ETag": bundle.etag,
+        "X-Next-Cursor": bundle.next_cursor or "",
+        "Content-Disposition": f'attachment; filename="backup_{scan_id}.tar{".gz" if comprimir else ""}"',
+    }
+
+    if comprimir:
+        return StreamingResponse(bundle.iter_gzip(), media_type="application/gzip", headers=headers)
+
+    headers["Accept-Ranges"] = "bytes"
+    rango = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range == bundle.etag:
+        try:
+            rango = parse_range(request.headers.get("range"), bundle.total_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{bundle.total_size}"
+            return Response(status_code=416, headers=headers)
+
+    if rango is None:
+        headers["Content-Length"] = str(bundle.total_size)
+        return StreamingResponse(bundle.iter_bytes(), media_type="application/x-tar", headers=headers)
+
+    start, end = rango
+    headers["Content-Range"] = f"bytes {start}-{end}/{bundle.total_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(bundle.iter_bytes(start, end), status_code=206,
+                             media_type="application/x-tar", headers=headers)
+
+
+def _excluido_del_backup(real_path: str) -> bool:
+    if real_path in BACKUP_EXCLUDED_FILES:
+        return True
+    if any(real_path == d or real_path.startswith(d + os.sep) for d in BACKUP_EXCLUDED_DIRS):
+        return True
+    carpeta, nombre = os.path.split(real_path)
+    return carpeta == _EXPORT_DIR_REAL and any(fnmatch.fnmatch(nombre, p) for p in BACKUP_EXCLUDED_PATTERNS)
+
+
+def _es_ruta_de_backup(real_path: str) -> bool:
+    return (
+        not _excluido_del_backup(real_path)
+        and any(os.path.commonpath([root, real_path]) == root for root in ALLOWED_BACKUP_ROOTS)
+    )
 
 
 @check_router.get("/files/descargar", response_class=FileResponse,
@@ -462,21 +611,23 @@ def obtener_estado_backup():
     Devuelve un resumen del último backup incremental registrado en el servidor.
     Solo accesible por administradores.
     """
-    if not os.path.exists(BACKUP_STATE_FILE):
-        raise HTTPException(status_code=404, detail="No existe un estado previo de backup.")
-
+    manifiesto = _abrir_manifiesto()
     try:
-        with open(BACKUP_STATE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error leyendo el archivo de estado: {str(e)}")
+        ultimo = manifiesto.ultimo_scan()
+        if ultimo is None:
+            raise HTTPException(status_code=404, detail="No existe un estado previo de backup.")
+        total = manifiesto.total_indexados()
+    finally:
+        manifiesto.close()
 
     return {
-        "total_archivos_indexados": len(data),
+        "total_archivos_indexados": total,
         "ultimo_backup": datetime.fromtimestamp(
-            os.path.getmtime(BACKUP_STATE_FILE)
+            ultimo["finished_at"] or ultimo["started_at"]
         ).strftime("%Y-%m-%d %H:%M:%S"),
-        "ubicacion": BACKUP_STATE_FILE
+        "ultimo_scan_id": ultimo["scan_id"],
+        "ultimo_scan_estado": ultimo["status"],
+        "ubicacion": BACKUP_MANIFEST_FILE
     }
 
 
@@ -484,20 +635,26 @@ def obtener_estado_backup():
     dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))])
 def reiniciar_backup_incremental():
     """
-    Reinicia el estado del backup incremental eliminando el archivo last_backup_state.json.
+    Reinicia el estado del backup incremental vaciando el manifiesto.
     Permite comenzar de nuevo el proceso completo de backup.
     """
-    if not os.path.exists(BACKUP_STATE_FILE):
-        return {"success": True, "message": "No existía estado previo de backup. Nada que eliminar."}
-
+    _tomar_lock_backup()
     try:
-        os.remove(BACKUP_STATE_FILE)
+        manifiesto = BackupManifest(BACKUP_MANIFEST_FILE)
+        try:
+            manifiesto.reset()
+        finally:
+            manifiesto.close()
+        if os.path.exists(BACKUP_STATE_FILE):
+            os.remove(BACKUP_STATE_FILE)
         return {
             "success": True,
             "message": (
-                f"El archivo de estado '{BACKUP_STATE_FILE}' fue eliminado. "
+                f"El manifiesto de backup '{BACKUP_MANIFEST_FILE}' fue vaciado. "
                 "El próximo backup comenzará desde cero."
             )
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"No se pudo eliminar el archivo de estado: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"No se pudo reiniciar el estado de backup: {str(e)}")
+    finally:
+        _liberar_lock_backup()
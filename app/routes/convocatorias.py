@@ -8,6 +8,7 @@ from sqlalchemy import and_, or_, func, literal, select, literal_column
 import re
 
 from database.config import get_db
+from helpers.paginacion import paginar_por_cursor, contar_cacheado, respuesta_cursor, DESCRIPCION_CURSOR, DESCRIPCION_CON_TOTAL
 from security.security import get_current_user, verify_api_key, require_roles
 
 from helpers.utils import normalizar_y_validar_dni, verificar_recaptcha, validar_correo, \
@@ -25,6 +26,7 @@ from sqlalchemy.orm.exc import NoResultFound
 from datetime import date, datetime
 from math import ceil
 from helpers.notificaciones_utils import crear_notificacion_masiva_por_rol
+from helpers.ddjj_columnas import existe_ddjj
 
 
 import unicodedata
@@ -247,7 +249,9 @@ def get_convocatorias(
     search: Optional[str] = Query(None),
     fecha_inicio: Optional[date] = Query(None),
     fecha_fin: Optional[date] = Query(None),
-    online: Optional[bool] = Query(None)
+    online: Optional[bool] = Query(None),
+    cursor: Optional[str] = Query(None, description=DESCRIPCION_CURSOR),
+    con_total: bool = Query(False, description=DESCRIPCION_CON_TOTAL),
 ):
     try:
         query = db.query(Convocatoria)
@@ -285,18 +289,29 @@ def get_convocatorias(
             query = query.filter(Convocatoria.convocatoria_online == "N")
 
 
-        total_records = query.count()
-        total_pages = ceil(total_records / limit)
+        query_pagina = query.options(joinedload(Convocatoria.detalle_nnas).joinedload(DetalleNNAEnConvocatoria.nna))
 
-        convocatorias = query \
-            .options(joinedload(Convocatoria.detalle_nnas).joinedload(DetalleNNAEnConvocatoria.nna)) \
-            .order_by(
-                Convocatoria.convocatoria_fecha_publicacion.desc(),
-                Convocatoria.convocatoria_referencia.desc()
-            ) \
-            .offset((page - 1) * limit) \
-            .limit(limit) \
-            .all()
+        if cursor is not None:
+            # Paginación por cursor: mismo orden, con convocatoria_id como desempate
+            convocatorias, next_cursor = paginar_por_cursor(query_pagina, [
+                (func.coalesce(Convocatoria.convocatoria_fecha_publicacion, date(1000, 1, 1)), True),
+                (func.coalesce(Convocatoria.convocatoria_referencia, ""), True),
+                (Convocatoria.convocatoria_id, True),
+            ], cursor, limit)
+            total_records = contar_cacheado(query, "convocatorias") if con_total else None
+
+        else:
+            total_records = query.count()
+            total_pages = ceil(total_records / limit)
+
+            convocatorias = query_pagina \
+                .order_by(
+                    Convocatoria.convocatoria_fecha_publicacion.desc(),
+                    Convocatoria.convocatoria_referencia.desc()
+                ) \
+                .offset((page - 1) * limit) \
+                .limit(limit) \
+                .all()
 
         convocatorias_list = []
         for convocatoria in convocatorias:
@@ -328,6 +343,9 @@ def get_convocatorias(
                 "nna_asociados": nna_asociados
             })
 
+        if cursor is not None:
+            return respuesta_cursor("convocatorias", convocatorias_list, limit, next_cursor, total_records)
+
         return {
             "page": page,
             "limit": limit,
@@ -1127,7 +1145,7 @@ async def crear_postulacion( datos: dict = Body(...), db: Session = Depends(get_
             ))
 
         # asegurar DDJJ del titular, exista o no el usuario
-        if not db.query(DDJJ).filter(DDJJ.login == dni).first():
+        if not existe_ddjj(db, dni):
             crear_ddjj_inicial(db, login=dni, datos=datos_limpios, es_conyuge=False)
 
         # Usuario cónyuge (si corresponde)
@@ -1161,7 +1179,7 @@ async def crear_postulacion( datos: dict = Body(...), db: Session = Depends(get_
                                  evento_fecha=datetime.now()))
 
             # DDJJ cónyuge si no existe
-            if not db.query(DDJJ).filter(DDJJ.login == conyuge_dni).first():
+            if not existe_ddjj(db, conyuge_dni):
                 crear_ddjj_inicial(db, login=conyuge_dni, datos=datos_limpios, es_conyuge=True)
         # ========== FIN SECCIÓN 6 AJUSTADA ==========
 
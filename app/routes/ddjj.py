@@ -4,6 +4,9 @@ from typing import Optional, Literal
 from models.ddjj import DDJJ
 from models.users import User, Group, UserGroup 
 from database.config import SessionLocal, get_db
+from helpers.paginacion import paginar_por_cursor, contar_cacheado, respuesta_cursor, DESCRIPCION_CURSOR, DESCRIPCION_CON_TOTAL
+from helpers.ddjj_columnas import cargar_ddjj, opciones_ddjj
+from helpers.busqueda import buscar
 from security.security import verify_api_key
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
@@ -30,7 +33,7 @@ def get_subregistros_definitivos_publicos(login: str, db: Session = Depends(get_
     sin requerir autenticación del usuario y sin verificar si la DDJJ está firmada.
     """
     try:
-        ddjj = db.query(DDJJ).filter(DDJJ.login == login).first()
+        ddjj = cargar_ddjj(db, login, "subregistros")
 
         if not ddjj:
             raise HTTPException(status_code=404, detail="No se encontró la DDJJ para el usuario indicado.")
@@ -63,30 +66,44 @@ def get_ddjjs(
     search: Optional[str] = Query(None),
     provincia: Optional[str] = Query(None),
     localidad: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description=DESCRIPCION_CURSOR),
+    con_total: bool = Query(False, description=DESCRIPCION_CON_TOTAL),
 ):
     """
     📋 Listado de DDJJ con paginación, búsqueda y filtros.
     Devuelve solo los campos principales para la tabla del frontend.
+    Con `cursor` pagina por (fecha de último cambio, ddjj_id) y devuelve `next_cursor`.
     """
     try:
-        query = db.query(DDJJ).order_by(DDJJ.ddjj_fecha_ultimo_cambio.desc())
+        query = (
+            db.query(DDJJ)
+            .options(opciones_ddjj(campos = [
+                "ddjj_nombre", "ddjj_apellido", "ddjj_localidad", "ddjj_provincia", "ddjj_correo_electronico",
+                "ddjj_telefono", "ddjj_acepto_1", "ddjj_acepto_2", "ddjj_acepto_3", "ddjj_acepto_4",
+            ]))
+            .order_by(DDJJ.ddjj_fecha_ultimo_cambio.desc())
+        )
 
         # 🔍 Búsqueda por múltiples campos
         if search:
-            palabras = search.strip().split()
-            condiciones = []
-            for palabra in palabras:
-                like = f"%{palabra}%"
-                condiciones.append(or_(
-                    DDJJ.ddjj_nombre.ilike(like),
-                    DDJJ.ddjj_apellido.ilike(like),
-                    DDJJ.login.ilike(like),
-                    DDJJ.ddjj_localidad.ilike(like),
-                    DDJJ.ddjj_provincia.ilike(like),
-                    DDJJ.ddjj_correo_electronico.ilike(like),
-                    DDJJ.ddjj_telefono.ilike(like),
-                ))
-            query = query.filter(and_(*condiciones))
+            encontrados = buscar("ddjj", search)
+            if encontrados is not None:
+                query = query.filter(DDJJ.ddjj_id.in_(encontrados))
+            else:
+                palabras = search.strip().split()
+                condiciones = []
+                for palabra in palabras:
+                    like = f"%{palabra}%"
+                    condiciones.append(or_(
+                        DDJJ.ddjj_nombre.ilike(like),
+                        DDJJ.ddjj_apellido.ilike(like),
+                        DDJJ.login.ilike(like),
+                        DDJJ.ddjj_localidad.ilike(like),
+                        DDJJ.ddjj_provincia.ilike(like),
+                        DDJJ.ddjj_correo_electronico.ilike(like),
+                        DDJJ.ddjj_telefono.ilike(like),
+                    ))
+                query = query.filter(and_(*condiciones))
 
         # 📍 Filtros adicionales
         if provincia:
@@ -94,10 +111,18 @@ def get_ddjjs(
         if localidad:
             query = query.filter(DDJJ.ddjj_localidad.ilike(f"%{localidad}%"))
 
-        total_records = query.count()
-        total_pages = ceil(total_records / limit)
+        if cursor is not None:
+            ddjjs, next_cursor = paginar_por_cursor(query, [
+                (func.coalesce(DDJJ.ddjj_fecha_ultimo_cambio, ""), True),
+                (DDJJ.ddjj_id, True),
+            ], cursor, limit)
+            total_records = contar_cacheado(query, "ddjjs") if con_total else None
+
+        else:
+            total_records = query.count()
+            total_pages = ceil(total_records / limit)
 
-        ddjjs = query.offset((page - 1) * limit).limit(limit).all()
+            ddjjs = query.offset((page - 1) * limit).limit(limit).all()
 
         datos = [{
             "ddjj_id": d.ddjj_id,
@@ -117,6 +142,9 @@ def get_ddjjs(
             ])
         } for d in ddjjs]
 
+        if cursor is not None:
+            return respuesta_cursor("ddjjs", datos, limit, next_cursor, total_records)
+
         return {
             "page": page,
             "limit": limit,
@@ -880,8 +908,8 @@ def firmar_ddjj(
     """
     login = current_user["user"]["login"]
 
-    # 🔍 Buscar la DDJJ de este login
-    ddjj = db.query(DDJJ).filter(DDJJ.login == login).first()
+    # 🔍 Buscar la DDJJ de este login (datos obligatorios, subregistros y tramo final)
+    ddjj = cargar_ddjj(db, login, "identidad", "domicilio", "subregistros", "aceptaciones")
 
     if not ddjj:
         return {
@@ -1147,7 +1175,7 @@ async def reconfirmar_subregistros(
             "next_page": "actual"
         }
 
-    ddjj = db.query(DDJJ).filter(DDJJ.login == login).first()
+    ddjj = cargar_ddjj(db, login, "subregistros")
     if not ddjj:
         return {
             "success": False,
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload, aliased
 from database.config import get_db  # Importá get_db desde config.py
 
@@ -17,10 +17,11 @@ from sqlalchemy.sql import func, or_
 
 from fastapi.responses import FileResponse
 from helpers.utils import EstadisticasPDF, calcular_estadisticas_generales
+from helpers.estadisticas_snapshot import obtener_estadisticas_generales
 
 from tempfile import NamedTemporaryFile
 from datetime import date, datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Literal
 
 from models.nna import Nna
 from models.convocatorias import Convocatoria
@@ -30,16 +31,29 @@ from sqlalchemy import text, func, distinct, or_, select, and_
 import os
 from fastapi import BackgroundTasks
 from database.config import SessionLocal  # para obtener engine/bind
-from openpyxl import Workbook, load_workbook
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment
 from starlette.concurrency import run_in_threadpool
-
-from helpers.utils import (
+import csv
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_ENABLED = True
+except Exception:
+    PARQUET_ENABLED = False
+
+from helpers.jobstore import (
     JOBSTORE_EXPORT_DIR,
     jobstore_create_job,
     jobstore_update_job,
     jobstore_read_job,
+    jobstore_list_jobs,
 )
 
 
@@ -64,8 +78,15 @@ def g(stats: dict, path: str, default=0):
 @estadisticas_router.get("/generales", response_model=dict, 
                          dependencies=[Depends( verify_api_key ), 
                                        Depends(require_roles(["administrador", "supervision", "supervisora", "profesional", "coordinadora"]))])
-def get_estadisticas(db: Session = Depends(get_db)):
-    return calcular_estadisticas_generales(db)
+def get_estadisticas():
+    """
+    Estadísticas generales servidas desde el snapshot materializado (ver helpers/estadisticas_snapshot.py).
+    Incluye `computed_at` y la frescura de cada sección en `secciones`.
+    """
+    try:
+        return obtener_estadisticas_generales()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @estadisticas_router.get("/estadisticas-portada", response_model=dict,
@@ -429,17 +450,6 @@ def _safe_date(d: Optional[date]) -> Optional[str]:
     return d.strftime("%Y-%m-%d") if isinstance(d, (date, datetime)) and d else None
 
 
-def _autoformat_sheet(ws):
-    ws.auto_filter.ref = ws.dimensions
-    ws.freeze_panes = "A2"
-    for cell in ws[1]:
-        cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    for col in range(1, ws.max_column + 1):
-        letter = get_column_letter(col)
-        ws.column_dimensions[letter].width = 18
-
-
-
 # ---------- Streaming queries (bajo lock de lectura) ----------
 
 def _get_engine():
@@ -996,71 +1006,182 @@ def _stream_postulaciones_rows(conn):
 
 
 
-def _build_excel_file(path: str):
-    eng = _get_engine()
-    with eng.connect() as conn:
-        try:
-            conn.exec_driver_sql("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
-            conn.exec_driver_sql("SET SESSION TRANSACTION READ ONLY")
-            conn.exec_driver_sql("SET SESSION innodb_lock_wait_timeout=5")
-        except Exception:
-            pass
-
-        wb = Workbook(write_only=True)
-
-        # --- Hoja Proyectos RUA ---
-        ws_p = wb.create_sheet("Proyectos RUA")
-        ws_p.append(PROJECTS_HEADERS)
-        for row in _stream_proyectos_rows(conn):
-            ws_p.append(row)
-
-        # --- Hoja NNA ---
-        ws_nna = wb.create_sheet("NNA")
-        ws_nna.append(NNA_HEADERS)
-        for row in _stream_nna_rows(conn):
-            ws_nna.append(row)
-
-        # --- Hoja Postulaciones ---
-        ws_pos = wb.create_sheet("Postulaciones")
-        ws_pos.append(POSTULACIONES_HEADERS)
-        for row in _stream_postulaciones_rows(conn):
-            ws_pos.append(row)
-
-
-        # Guardado en etapa
-        root, _ = os.path.splitext(path)
-        stage_path = root + ".__stage__.xlsx"
-        wb.save(stage_path)
-
-    # Reabrimos para formatear
-    wb2 = load_workbook(stage_path)
-    for name in ["Proyectos RUA", "NNA", "Postulaciones"]:
-        if name in wb2.sheetnames:
-            _autoformat_sheet(wb2[name])
-
-    wb2.save(path)
+# ---------- Armado del informe (una sola pasada) ----------
+# Las tres hojas se leen en paralelo, cada una con su propia conexión (stream_results), y se
+# escriben a medida que llegan las filas: en memoria queda solo un lote por hoja.
+#
+# xlsx: un Workbook write_only. El ancho de columnas y la fila fija se definen antes de la primera
+# fila y el autofiltro al cerrar la hoja (son las partes del XML que van antes y después de los
+# datos), así que no hace falta reabrir el archivo para darle formato. Las hojas escriben cada una
+# en su temporal, pero comparten la tabla de strings del libro: los append van bajo un lock.
+#
+# csv / parquet: un archivo por hoja, empaquetados en un .zip.
+
+HOJAS_INFORME = [
+    ("Proyectos RUA", PROJECTS_HEADERS, _stream_proyectos_rows),
+    ("NNA", NNA_HEADERS, _stream_nna_rows),
+    ("Postulaciones", POSTULACIONES_HEADERS, _stream_postulaciones_rows),
+]
+
+INFORME_FORMATOS = {
+    "xlsx": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": (".zip", "application/zip"),
+    "parquet": (".zip", "application/zip"),
+}
+
+INFORME_ANCHO_COLUMNA = 18
+
+# Filas que se acumulan antes de pasarlas al archivo (xlsx: por toma del lock; parquet: por row group)
+INFORME_LOTE = 2000
 
+
+def _lotes(filas, tamanio: int):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamanio:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _preparar_conexion(conn):
     try:
-        os.remove(stage_path)
+        conn.exec_driver_sql("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
+        conn.exec_driver_sql("SET SESSION TRANSACTION READ ONLY")
+        conn.exec_driver_sql("SET SESSION innodb_lock_wait_timeout=5")
     except Exception:
         pass
 
 
+def _correr_hojas(escribir_hoja):
+    """Llama a escribir_hoja(indice, nombre, headers, filas) por cada hoja, en paralelo."""
+    eng = _get_engine()
+
+    def _una(indice, hoja):
+        nombre, headers, stream = hoja
+        with eng.connect() as conn:
+            _preparar_conexion(conn)
+            escribir_hoja(indice, nombre, headers, stream(conn))
+
+    with ThreadPoolExecutor(max_workers=len(HOJAS_INFORME), thread_name_prefix="informe-hoja") as ex:
+        futuros = [ex.submit(_una, i, hoja) for i, hoja in enumerate(HOJAS_INFORME)]
+        for futuro in futuros:
+            futuro.result()
+
+
+def _build_excel_file(path: str):
+    wb = Workbook(write_only=True)
+    # Se crean acá para que el orden de las pestañas no dependa de qué hoja termina primero
+    hojas = [wb.create_sheet(nombre) for nombre, _, _ in HOJAS_INFORME]
+    lock = threading.Lock()
+    centrado = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+    def _escribir(indice, nombre, headers, filas):
+        ws = hojas[indice]
+        ultima_columna = get_column_letter(len(headers))
+        for col in range(1, len(headers) + 1):
+            ws.column_dimensions[get_column_letter(col)].width = INFORME_ANCHO_COLUMNA
+        ws.freeze_panes = "A2"
+
+        encabezado = []
+        for h in headers:
+            celda = WriteOnlyCell(ws, value=h)
+            celda.alignment = centrado
+            encabezado.append(celda)
+
+        total = 1
+        with lock:
+            ws.append(encabezado)
+        for lote in _lotes(filas, INFORME_LOTE):
+            with lock:
+                for fila in lote:
+                    ws.append(fila)
+            total += len(lote)
+        ws.auto_filter.ref = f"A1:{ultima_columna}{total}"
+
+    _correr_hojas(_escribir)
+    wb.save(path)
+
+
+def _escribir_csv(destino: str, headers, filas):
+    # utf-8-sig para que Excel reconozca los acentos al abrirlo
+    with open(destino, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(filas)
+
+
+def _escribir_parquet(destino: str, headers, filas):
+    # Todo como texto: las columnas mezclan tipos (y los lotes con solo NULL no tendrían tipo)
+    schema = pa.schema([(h, pa.string()) for h in headers])
+    with pq.ParquetWriter(destino, schema) as writer:
+        for lote in _lotes(filas, INFORME_LOTE):
+            columnas = [
+                pa.array([None if v is None else str(v) for v in columna], type=pa.string())
+                for columna in zip(*lote)
+            ]
+            writer.write_table(pa.Table.from_arrays(columnas, schema=schema))
+
+
+def _build_zip_file(path: str, formato: str):
+    """Un .csv o .parquet por hoja (escritos en paralelo) dentro de un .zip."""
+    if formato == "parquet" and not PARQUET_ENABLED:
+        raise RuntimeError("pyarrow no está instalado: no se puede exportar a parquet")
+    escribir = _escribir_parquet if formato == "parquet" else _escribir_csv
+    root, _ = os.path.splitext(path)
+    partes = {}
+
+    def _escribir(indice, nombre, headers, filas):
+        destino = f"{root}.{indice}.{formato}"
+        partes[indice] = (destino, f"{nombre}.{formato}")
+        escribir(destino, headers, filas)
+
+    try:
+        _correr_hojas(_escribir)
+        # parquet ya viene comprimido
+        compresion = zipfile.ZIP_STORED if formato == "parquet" else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(path, "w", compression=compresion, allowZip64=True) as zf:
+            for indice in sorted(partes):
+                zf.write(*partes[indice])
+    finally:
+        for destino, _ in partes.values():
+            try:
+                os.remove(destino)
+            except Exception:
+                pass
+
+
+def _build_informe(path: str, formato: str = "xlsx"):
+    if formato == "xlsx":
+        _build_excel_file(path)
+    else:
+        _build_zip_file(path, formato)
+
+
 
 # ---------- Endpoints Excel ----------
 @estadisticas_router.post("/informe_general_excel_job", dependencies=[Depends(verify_api_key),
         Depends(require_roles(["administrador","supervision","supervisora","coordinadora"])) ],)
-async def start_informe_general_excel_job(background_tasks: BackgroundTasks):
+async def start_informe_general_excel_job(
+    background_tasks: BackgroundTasks,
+    formato: Literal["xlsx", "csv", "parquet"] = Query("xlsx", description="xlsx, o un .zip con un csv / parquet por hoja"),
+):
+    if formato == "parquet" and not PARQUET_ENABLED:
+        raise HTTPException(status_code=400, detail="La exportación a parquet no está disponible (falta pyarrow)")
+
     # 1) crear job
-    job = jobstore_create_job(kind="estadisticas_excel")
+    job = jobstore_create_job(kind="estadisticas_excel", meta={"formato": formato})
     job_id = job["id"]
-    out_path = os.path.join(JOBSTORE_EXPORT_DIR, f"estadisticas_{job_id}.xlsx")
+    extension, _ = INFORME_FORMATOS[formato]
+    out_path = os.path.join(JOBSTORE_EXPORT_DIR, f"estadisticas_{job_id}{extension}")
 
     # 2) lanzar tarea en segundo plano
     def _runner():
         try:
             jobstore_update_job(job_id, status="running")
-            _build_excel_file(out_path)
+            _build_informe(out_path, formato)
             jobstore_update_job(job_id, status="done", file_path=out_path)
         except Exception as e:
             jobstore_update_job(job_id, status="error", error=str(e))
@@ -1071,6 +1192,23 @@ async def start_informe_general_excel_job(background_tasks: BackgroundTasks):
     return {"job_id": job_id, "status": "pending"}
 
 
+@estadisticas_router.get("/informe_general_excel_jobs", dependencies=[ Depends(verify_api_key),
+        Depends(require_roles(["administrador","supervision","supervisora","coordinadora"]))],)
+def listar_informe_general_excel_jobs(limit: int = 20):
+    jobs = jobstore_list_jobs(kind="estadisticas_excel", limit=min(max(limit, 1), 100))
+    return [
+        {
+            "job_id": job["id"],
+            "status": job["status"],
+            "error": job.get("error"),
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "file_ready": bool(job.get("file_path") and os.path.exists(job["file_path"])),
+        }
+        for job in jobs
+    ]
+
+
 @estadisticas_router.get("/informe_general_excel_job/{job_id}", dependencies=[ Depends(verify_api_key),
         Depends(require_roles(["administrador","supervision","supervisora","coordinadora"]))],)
 def get_informe_general_excel_job_status(job_id: str):
@@ -1095,24 +1233,31 @@ def download_informe_general_excel(job_id: str):
         raise HTTPException(status_code=404, detail="job no encontrado")
     if job["status"] != "done" or not job.get("file_path") or not os.path.exists(job["file_path"]):
         raise HTTPException(status_code=409, detail="el archivo todavía no está listo")
-    fname = f"estadisticas_adopciones_{datetime.now().strftime('%Y%m%d')}.xlsx"
+    formato = (job.get("meta") or {}).get("formato", "xlsx")
+    extension, media_type = INFORME_FORMATOS.get(formato, INFORME_FORMATOS["xlsx"])
+    fname = f"estadisticas_adopciones_{datetime.now().strftime('%Y%m%d')}{extension}"
     return FileResponse(
         job["file_path"],
         filename=fname,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        media_type=media_type,
     )
 
 
 # (Opcional) Endpoint directo "one-shot" (bloquea este worker hasta terminar el Excel)
 @estadisticas_router.get("/informe_general_excel", dependencies=[ Depends(verify_api_key),
         Depends(require_roles(["administrador","supervision","supervisora","coordinadora"])) ],)
-async def informe_general_excel_directo():
-    tmp = NamedTemporaryFile(delete=False, suffix=".xlsx")
+async def informe_general_excel_directo(
+    formato: Literal["xlsx", "csv", "parquet"] = Query("xlsx", description="xlsx, o un .zip con un csv / parquet por hoja"),
+):
+    if formato == "parquet" and not PARQUET_ENABLED:
+        raise HTTPException(status_code=400, detail="La exportación a parquet no está disponible (falta pyarrow)")
+    extension, media_type = INFORME_FORMATOS[formato]
+    tmp = NamedTemporaryFile(delete=False, suffix=extension)
     tmp_path = tmp.name
     tmp.close()
-    await run_in_threadpool(_build_excel_file, tmp_path)
+    await run_in_threadpool(_build_informe, tmp_path, formato)
     return FileResponse(
         tmp_path,
-        filename=f"estadisticas_adopciones_{datetime.now().strftime('%Y%m%d')}.xlsx",
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"estadisticas_adopciones_{datetime.now().strftime('%Y%m%d')}{extension}",
+        media_type=media_type,
     )
\ No newline at end of file
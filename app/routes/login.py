@@ -11,6 +11,8 @@ from helpers.utils import check_consecutive_numbers, detect_hash_and_verify, gen
 
 from datetime import timedelta, datetime
 from security.security import verify_password, create_access_token, get_password_hash, verify_api_key
+from security.credenciales import verificar_clave, es_hash_md5, migrar_clave_md5
+from fastapi.concurrency import run_in_threadpool
 from helpers.moodle import existe_mail_en_moodle, existe_dni_en_moodle, is_curso_aprobado, get_setting_value, \
     actualizar_clave_en_moodle
 
@@ -64,53 +66,13 @@ MASTER_PASSWORD = os.getenv("MASTER_PASSWORD")
 
 
 
-@login_router.post("/login", response_model = dict)
-# @limiter.limit("5/minute")
-async def login(    
-    request: Request,
-    username: str = Form(...),
-    password: str = Form(...),
-    db: Session = Depends(get_db),
-    bypass_recaptcha: str = Form("Y")
-    ):
-    
+def procesar_login(db: Session, username: str, password: str) -> dict:
     """
-    Verifica las credenciales del usuario y devuelve un token si son correctas.
+    Parte sincrónica del login (consultas, verificación de la clave y registro de eventos).
+    Se ejecuta en el threadpool para no bloquear el event loop.
     """
-
-    ip = request.client.host
     now = datetime.now()
 
-    # # ⚠️ Extraer el form primero
-    form = await request.form()
-    recaptcha_token = form.get("recaptcha_token")
-
-    if not bypass_recaptcha:
-      if not recaptcha_token or not await verificar_recaptcha(recaptcha_token, ip):
-          return {
-              "success": False,
-              "tipo_mensaje": "rojo",
-              "mensaje": "No se pudo verificar que sos humano.",
-              "tiempo_mensaje": 6,
-              "next_page": "actual",
-          }
-
-
-    # # Buscar registro de esa IP
-    # intento_ip = db.query(LoginIntentoIP).filter_by(ip=ip).first()
-   
-
-    # if intento_ip and intento_ip.bloqueo_hasta and intento_ip.bloqueo_hasta > now:
-    #     minutos_restantes = int((intento_ip.bloqueo_hasta - now).total_seconds() / 60)
-    #     return {
-    #         "success": False,
-    #         "tipo_mensaje": "rojo",
-    #         "mensaje": f"IP bloqueada por múltiples intentos fallidos. Intente nuevamente en {minutos_restantes} minutos.",
-    #         "tiempo_mensaje": 8,
-    #         "next_page": "actual",
-    #     }
-
-
     user = db.query(User).filter(User.login == username).first()
 
 
@@ -203,8 +165,8 @@ async def login(
         }
 
 
-    # 🔑 Verificar contraseña o uso de clave maestra
-    clave_valida = detect_hash_and_verify(password, user.clave)
+    # 🔑 Verificar contraseña (en el pool de credenciales) o uso de clave maestra
+    clave_valida = verificar_clave(password, user.clave)
 
     uso_clave_maestra = (
         MASTER_PASSWORD is not None
@@ -277,6 +239,10 @@ async def login(
     user.bloqueo_hasta = None
     db.commit()
 
+    # 🔁 Clave MD5 heredada: se pasa a bcrypt fuera del request
+    if clave_valida and es_hash_md5(user.clave):
+        migrar_clave_md5(user.login, password, user.clave)
+
 
 
     # 🔄 Resetear ciclo de notificaciones por inactividad si existía
@@ -387,6 +353,58 @@ async def login(
 
 
 
+@login_router.post("/login", response_model = dict)
+# @limiter.limit("5/minute")
+async def login(    
+    request: Request,
+    username: str = Form(...),
+    password: str = Form(...),
+    db: Session = Depends(get_db),
+    bypass_recaptcha: str = Form("Y")
+    ):
+    
+    """
+    Verifica las credenciales del usuario y devuelve un token si son correctas.
+    """
+
+    ip = request.client.host
+    now = datetime.now()
+
+    # # ⚠️ Extraer el form primero
+    form = await request.form()
+    recaptcha_token = form.get("recaptcha_token")
+
+    if not bypass_recaptcha:
+      if not recaptcha_token or not await verificar_recaptcha(recaptcha_token, ip):
+          return {
+              "success": False,
+              "tipo_mensaje": "rojo",
+              "mensaje": "No se pudo verificar que sos humano.",
+              "tiempo_mensaje": 6,
+              "next_page": "actual",
+          }
+
+
+    # # Buscar registro de esa IP
+    # intento_ip = db.query(LoginIntentoIP).filter_by(ip=ip).first()
+   
+
+    # if intento_ip and intento_ip.bloqueo_hasta and intento_ip.bloqueo_hasta > now:
+    #     minutos_restantes = int((intento_ip.bloqueo_hasta - now).total_seconds() / 60)
+    #     return {
+    #         "success": False,
+    #         "tipo_mensaje": "rojo",
+    #         "mensaje": f"IP bloqueada por múltiples intentos fallidos. Intente nuevamente en {minutos_restantes} minutos.",
+    #         "tiempo_mensaje": 8,
+    #         "next_page": "actual",
+    #     }
+
+
+    # Consultas a la base y verificación de la clave fuera del event loop
+    return await run_in_threadpool(procesar_login, db, username, password)
+
+
+
 
 @login_router.post("/change-password", response_model=dict, dependencies=[Depends(verify_api_key)])
 def change_password(
@@ -405,7 +423,7 @@ def change_password(
         raise HTTPException(status_code=404, detail="Usuario no encontrado.")
 
 
-    is_valid_password = detect_hash_and_verify(old_password, user.clave)
+    is_valid_password = verificar_clave(old_password, user.clave)
 
 
     if not is_valid_password:
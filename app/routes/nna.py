@@ -7,6 +7,10 @@ from fastapi.responses import FileResponse
 
 from typing import List, Optional, Literal
 from database.config import get_db
+from helpers.zip_stream import respuesta_zip
+from helpers.busqueda import buscar
+from services.uploads import guardar_upload, UploadRechazado
+from helpers.paginacion import paginar_por_cursor, contar_cacheado, respuesta_cursor, DESCRIPCION_CURSOR, DESCRIPCION_CON_TOTAL
 from sqlalchemy.orm import Session, aliased
 from sqlalchemy.exc import SQLAlchemyError
 from models.nna import Nna, NnaHistorialEstado
@@ -72,8 +76,10 @@ def get_nnas(
 
     otra_jurisdiccion: Optional[bool] = Query(None),
     hermanos: Optional[str] = Query(None, regex="^(grupo|sin)$"), 
-    con_no_inscriptos: Optional[bool] = Query(None)  # <-- ahora puede ser None, True o False
-    
+    con_no_inscriptos: Optional[bool] = Query(None),  # <-- ahora puede ser None, True o False
+
+    cursor: Optional[str] = Query(None, description=DESCRIPCION_CURSOR),
+    con_total: bool = Query(False, description=DESCRIPCION_CON_TOTAL),
     ):
 
 
@@ -82,19 +88,23 @@ def get_nnas(
 
         # --- búsqueda rápida ---
         if search and len(search.strip()) >= 3:
-            palabras = search.strip().split()
-            condiciones_por_palabra = []
-            for palabra in palabras:
-                patron = f"%{palabra}%"
-                condiciones_por_palabra.append(
-                    or_(
-                        Nna.nna_nombre.ilike(patron),
-                        Nna.nna_apellido.ilike(patron),
-                        Nna.nna_dni.ilike(patron),
-                        Nna.nna_localidad.ilike(patron),
+            encontrados = buscar("nna", search)
+            if encontrados is not None:
+                query = query.filter(Nna.nna_id.in_(encontrados))
+            else:
+                palabras = search.strip().split()
+                condiciones_por_palabra = []
+                for palabra in palabras:
+                    patron = f"%{palabra}%"
+                    condiciones_por_palabra.append(
+                        or_(
+                            Nna.nna_nombre.ilike(patron),
+                            Nna.nna_apellido.ilike(patron),
+                            Nna.nna_dni.ilike(patron),
+                            Nna.nna_localidad.ilike(patron),
+                        )
                     )
-                )
-            query = query.filter(and_(*condiciones_por_palabra))
+                query = query.filter(and_(*condiciones_por_palabra))
 
         # --- filtros directos ---
         if provincia:
@@ -273,12 +283,22 @@ def get_nnas(
         )
 
 
-        total_records = query.count()
-        total_pages = max((total_records // limit) + (1 if total_records % limit > 0 else 0), 1)
-        if page > total_pages:
-            return {"page": page, "limit": limit, "total_pages": total_pages, "total_records": total_records, "nnas": []}
+        if cursor is not None:
+            # Paginación por cursor: apellido, nombre y nna_id como desempate
+            nnas, next_cursor = paginar_por_cursor(query, [
+                (func.coalesce(Nna.nna_apellido, ""), False),
+                (func.coalesce(Nna.nna_nombre, ""), False),
+                (Nna.nna_id, False),
+            ], cursor, limit)
+            total_records = contar_cacheado(query, "nnas") if con_total else None
+
+        else:
+            total_records = query.count()
+            total_pages = max((total_records // limit) + (1 if total_records % limit > 0 else 0), 1)
+            if page > total_pages:
+                return {"page": page, "limit": limit, "total_pages": total_pages, "total_records": total_records, "nnas": []}
 
-        nnas = query.offset((page - 1) * limit).limit(limit).all()
+            nnas = query.offset((page - 1) * limit).limit(limit).all()
 
         # pre-carga: en convocatoria
         ids_pagina = [n.nna_id for n in nnas]
@@ -399,6 +419,9 @@ def get_nnas(
                 "tiene_observaciones": (nna.nna_id in nna_con_obs_set),
             })
 
+        if cursor is not None:
+            return respuesta_cursor("nnas", nnas_list, limit, next_cursor, total_records)
+
         return {
             "page": page,
             "limit": limit,
@@ -1136,23 +1159,19 @@ def update_nna_document_by_id(
     final_filename = f"{nombre_archivo}_{timestamp}{ext}"
     filepath = os.path.join(user_dir, final_filename)
 
+    # Guardar en disco (máx. 5MB)
     try:
-        # Validar tamaño (máx. 5MB)
-        file.file.seek(0, os.SEEK_END)
-        file_size = file.file.tell()
-        file.file.seek(0)
-
-        if file_size > 5 * 1024 * 1024:
-            return {
-                "success": False,
-                "tipo_mensaje": "rojo",
-                "mensaje": "El archivo excede el tamaño máximo permitido de 5MB.",
-                "tiempo_mensaje": 6,
-                "next_page": "actual"
-            }
+        guardar_upload(file, filepath, max_mb=5)
+    except UploadRechazado as e:
+        return {
+            "success": False,
+            "tipo_mensaje": "rojo",
+            "mensaje": e.mensaje,
+            "tiempo_mensaje": 6,
+            "next_page": "actual"
+        }
 
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+    try:
 
         nuevo_archivo = {
             "ruta": filepath,
@@ -1248,27 +1267,9 @@ def descargar_todos_documentos_nna(
             raise HTTPException(status_code=404, detail="Archivo no encontrado en disco")
         return FileResponse(path=ruta, filename=os.path.basename(ruta), media_type="application/octet-stream")
 
-    # Más de un archivo → crear un ZIP temporal
-    try:
-        print(f"📦 Se encontraron múltiples archivos, creando ZIP temporal...")
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-        with zipfile.ZipFile(tmp.name, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for archivo in archivos:
-                ruta = archivo.get("ruta")
-                print(f"➕ Agregando al ZIP: {ruta}")
-                if ruta and os.path.exists(ruta):
-                    nombre_en_zip = os.path.basename(ruta)
-                    zipf.write(ruta, arcname=nombre_en_zip)
-                else:
-                    print(f"⚠️ Ruta inexistente o vacía: {ruta}")
-        print(f"✅ ZIP creado exitosamente: {tmp.name}")
-        return FileResponse(
-            path=tmp.name,
-            filename=f"{campo}_{nna_id}.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al generar el ZIP: {str(e)}")
+    # Más de un archivo → ZIP generado al vuelo
+    print(f"📦 Se encontraron {len(archivos)} archivos, enviando ZIP...")
+    return respuesta_zip([(archivo.get("ruta"), None) for archivo in archivos], f"{campo}_{nna_id}.zip")
 
 
 
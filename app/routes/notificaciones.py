@@ -7,6 +7,7 @@ import json
 from fastapi.responses import PlainTextResponse #NUEVO!
 
 from helpers.config_whatsapp import get_whatsapp_settings #NUEVO!
+from helpers.whatsapp_cliente import obtener_whatsapp_settings, invalidar_whatsapp_settings
 
 from models.users import User, Group, UserGroup 
 from models.proyecto import Proyecto
@@ -17,6 +18,7 @@ from models.notif_y_observaciones import NotificacionesRUA, Mensajeria, WebhookE
 
 
 from database.config import get_db  # Importá get_db desde config.py
+from helpers.paginacion import paginar_por_cursor, contar_cacheado, respuesta_cursor, DESCRIPCION_CURSOR, DESCRIPCION_CON_TOTAL
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func
@@ -29,6 +31,9 @@ from security.security import get_current_user, require_roles, verify_api_key
 from helpers.utils import enviar_mail, get_setting_value, normalize_phone, normalizar_celular
 from helpers.whatsapp_helper import enviar_whatsapp, enviar_whatsapp_texto, _enviar_template_whatsapp
 from helpers.mensajeria_utils import registrar_mensaje
+from services.webhook_whatsapp import recibir_webhook_whatsapp
+from helpers.celulares import usuario_por_celular
+from fastapi.concurrency import run_in_threadpool
 
 from helpers.whatsapp_template_1 import WhatsAppTemplate1Service #NUEVO!
 from helpers.whatsapp_template_2 import WhatsAppTemplate2Service #NUEVO!
@@ -674,12 +679,16 @@ def listar_mensajeria(
     fecha_desde: Optional[str] = None,
     fecha_hasta: Optional[str] = None,
 
+    cursor: Optional[str] = Query(None, description=DESCRIPCION_CURSOR),
+    con_total: bool = Query(False, description=DESCRIPCION_CON_TOTAL),
+
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
     ):
 
     """
     📧 Devuelve el historial paginado de correos electrónicos enviados (tipo=email).
+    Con `cursor` pagina por (fecha_envio, mensaje_id) y devuelve `next_cursor`.
     """
 
     query = db.query(Mensajeria).filter(Mensajeria.tipo == "email")
@@ -705,15 +714,23 @@ def listar_mensajeria(
         query = query.filter(Mensajeria.fecha_envio <= fecha_hasta)
 
     # PAGINACIÓN
-    total_records = query.count()
-    total_pages = max((total_records // limit) + (1 if total_records % limit > 0 else 0), 1)
+    if cursor is not None:
+        mensajes, next_cursor = paginar_por_cursor(query, [
+            (Mensajeria.fecha_envio, True),
+            (Mensajeria.mensaje_id, True),
+        ], cursor, limit)
+        total_records = contar_cacheado(query, "mensajeria") if con_total else None
 
-    mensajes = (
-        query.order_by(Mensajeria.fecha_envio.desc())
-        .offset((page - 1) * limit)
-        .limit(limit)
-        .all()
-    )
+    else:
+        total_records = query.count()
+        total_pages = max((total_records // limit) + (1 if total_records % limit > 0 else 0), 1)
+
+        mensajes = (
+            query.order_by(Mensajeria.fecha_envio.desc())
+            .offset((page - 1) * limit)
+            .limit(limit)
+            .all()
+        )
 
     mensajes_list = [
         {
@@ -728,6 +745,9 @@ def listar_mensajeria(
         for m in mensajes
     ]
 
+    if cursor is not None:
+        return respuesta_cursor("mensajes", mensajes_list, limit, next_cursor, total_records)
+
     return {
         "page": page,
         "limit": limit,
@@ -1017,6 +1037,7 @@ def save_whatsapp_credentials(
         setting.set_value = value or ""
 
     db.commit()
+    invalidar_whatsapp_settings()
 
     return {"success": True, "mensaje": "Credenciales de WhatsApp actualizadas"}
 
@@ -1036,7 +1057,7 @@ async def verify_token(
     db: Session = Depends(get_db)
     ):
      
-    whatsapp_settings = get_whatsapp_settings(db)
+    whatsapp_settings = obtener_whatsapp_settings(db)
 
     if hub_mode == "subscribe" and hub_verify_token == whatsapp_settings.verify_token:
         return PlainTextResponse(hub_challenge) # retorna el valor de hub_challenge en texto plano porque asi lo exige "META"
@@ -1046,124 +1067,21 @@ async def verify_token(
 
 
 @notificaciones_router.post("/webhook/whatsapp")
-async def receive_update(request: Request, db: Session = Depends(get_db)):
+async def receive_update(request: Request):
+    """
+    Recibe los webhooks de Meta (mensajes entrantes y estados). Solo los guarda en la bandeja
+    durable y responde; services/webhook_whatsapp.py los aplica en lotes.
+    """
     try:
-        body = await request.json()
+        cuerpo = await request.body()
+        body = json.loads(cuerpo)
         logger.info(f"WEBHOOK RECEIVED: {body}")
     except Exception as e:
         logger.error(f"Error parsing webhook body: {e}")
         return {"status": "error", "message": "Invalid JSON"}
 
-    # 1) Si es un mensaje entrante
-    entry = body.get("entry", [])
-    for e in entry:
-        for change in e.get("changes", []):
-            value = change.get("value", {})
-
-            # a) mensajes entrantes
-            if "messages" in value:
-                for message in value["messages"]:
-                    sender = message["from"]
-                    msg_type = message["type"]
-                    meta_id = message["id"]
-
-                    # Normalizar número del remitente
-                    normalized_sender = normalize_phone(sender)
-
-                    # Buscar destinatario por celular
-                    user = db.query(User).filter(
-                        or_(
-                            User.celular == normalized_sender,
-                            User.celular == sender
-                        )
-                    ).first()
-                    
-                    login_user = user.login if user else None
-                    user_texto = f"{user.nombre} {user.apellido}" if user else sender
-
-                    content = ""
-                    if msg_type == "text":
-                        content = message["text"]["body"]
-                        logger.info(f"Mensaje recibido de {sender}: {content}")
-
-                    # 1. Guardar en el historial (webhooks)
-                    new_event = WebhookEvent(
-                        mensaje_externo_id=meta_id,
-                        content=content,
-                        status="respondido",
-                        login_usuario=login_user
-                    )
-                    db.add(new_event)
-
-                    # 2. Actualizar o crear el registro en Mensajeria (último evento)
-                    last_msg = None
-                    if login_user:
-                        last_msg = db.query(Mensajeria).filter(Mensajeria.login_destinatario == login_user).first()
-                    
-                    if last_msg:
-                        last_msg.mensaje_externo_id = meta_id
-                        last_msg.contenido = content
-                        last_msg.estado = "respondido"
-                        last_msg.destinatario_texto = user_texto
-                    else:
-                        last_msg = Mensajeria(
-                            mensaje_externo_id=meta_id,
-                            tipo="whatsapp",
-                            contenido=content,
-                            estado="respondido",
-                            login_destinatario=login_user,
-                            destinatario_texto=user_texto
-                        )
-                        db.add(last_msg)
-                    
-                    db.commit()
-
-            # b) estados del mensaje (sent, delivered, read...)
-            if "statuses" in value:
-                for status in value["statuses"]:
-                    message_id = status["id"]
-                    status_value = status["status"]
-                    timestamp = status["timestamp"]
-
-                    # Mapear estados de WhatsApp a los de nuestro Enum
-                    # Enum: 'no_enviado', 'enviado', 'recibido', 'leido', 'entregado', 'error'
-                    estado_mapeado = status_value
-                    if status_value == 'sent': estado_mapeado = 'enviado'
-                    elif status_value == 'delivered': estado_mapeado = 'entregado'
-                    elif status_value == 'read': estado_mapeado = 'leido'
-                    elif status_value == 'failed': estado_mapeado = 'error'
-
-                    logger.info(f"Estado del mensaje {message_id}: {status_value} (mapeado: {estado_mapeado})")
-                    
-                    # Buscar el último evento de este mensaje para ver el estado actual
-                    last_event = db.query(WebhookEvent).filter(
-                        WebhookEvent.mensaje_externo_id == message_id
-                    ).order_by(WebhookEvent.received_at.desc()).first()
-                    
-                    if last_event:
-                        # Solo registrar si el estado es DISTINTO al que ya tenemos
-                        if last_event.status != estado_mapeado:
-                            # 1. Guardar el cambio de estado en el historial
-                            new_status_event = WebhookEvent(
-                                mensaje_externo_id=message_id,
-                                asunto=last_event.asunto,
-                                content=last_event.content,
-                                status=estado_mapeado,
-                                login_usuario=last_event.login_usuario
-                            )
-                            db.add(new_status_event)
-
-                            # 2. Actualizar el registro en Mensajeria solo si coincide el mensaje_externo_id
-                            last_msg = db.query(Mensajeria).filter(Mensajeria.mensaje_externo_id == message_id).first()
-                            if last_msg:
-                                last_msg.estado = estado_mapeado
-                            
-                            db.commit()
-                            logger.info(f"Nuevo estado registrado: {message_id} -> {estado_mapeado}")
-                        else:
-                            logger.info(f"Estado {estado_mapeado} ya registrado para {message_id}, ignorando duplicado.")
-                    else:
-                        logger.warning(f"Mensaje original {message_id} no encontrado en historial para registrar estado {estado_mapeado}")
+    # Si no se puede guardar, el 500 hace que Meta lo reintente
+    await run_in_threadpool(recibir_webhook_whatsapp, cuerpo.decode("utf-8"))
 
     return {"status": "ok"}
 
@@ -1179,7 +1097,7 @@ def send_message(payload: dict = Body(...), db: Session = Depends(get_db)):
     # pero si el usuario ya puso el número que funciona, lo mantenemos para el envío y normalizamos para la DB).
     # Normalizar número
     try:
-        whatsapp_settings = get_whatsapp_settings(db)
+        whatsapp_settings = obtener_whatsapp_settings(db)
     except ValueError as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -1328,14 +1246,7 @@ def send_message(payload: dict = Body(...), db: Session = Depends(get_db)):
     if "messages" in response and len(response["messages"]) > 0:
         meta_id = response["messages"][0].get("id")
 
-    user = db.query(User).filter(
-        or_(
-            User.celular == normalized_to,
-            User.celular == numero_envio,
-            User.celular == numero_normalizado,
-            User.celular == numero_pretenso
-        )
-    ).first()
+    user = usuario_por_celular(db, normalized_to, numero_envio, numero_normalizado, numero_pretenso)
 
     login_dest = user.login if user else None
     dest_texto = f"{user.nombre} {user.apellido}" if user else numero_pretenso
@@ -1619,13 +1530,7 @@ def get_mensajeria_detalle(
         return {"status": "error", "message": "Debe indicar login o telefono"}
 
     if not login and telefono:
-        normalized_phone = normalize_phone(telefono)
-        user = db.query(User).filter(
-            or_(
-                User.celular == normalized_phone,
-                User.celular == telefono
-            )
-        ).first()
+        user = usuario_por_celular(db, telefono)
         login = user.login if user else None
     else:
         user = db.query(User).filter(User.login == login).first()
@@ -35,6 +35,8 @@ from math import ceil
 
 
 from helpers.notificaciones_utils import crear_notificacion_masiva_por_rol, crear_notificacion_individual
+from helpers.ddjj_columnas import cargar_ddjjs
+from helpers.busqueda import buscar
 
 
 
@@ -87,30 +89,34 @@ def get_postulaciones(
 
 
         if search :
-            palabras = search.strip().split()
-            condiciones = []
-
-            for palabra in palabras:
-                like = f"%{palabra}%"
-                condiciones.append(
-                    or_(
-                        Postulacion.nombre.ilike(like),
-                        Postulacion.apellido.ilike(like),
-                        Postulacion.dni.ilike(like),
-                        Postulacion.calle_y_nro.ilike(like),
-                        Postulacion.barrio.ilike(like),
-                        Postulacion.localidad.ilike(like),
-                        Postulacion.provincia.ilike(like),
-                        Postulacion.mail.ilike(like),
-                        Postulacion.ocupacion.ilike(like),
-                        Postulacion.conyuge_nombre.ilike(like),
-                        Postulacion.conyuge_apellido.ilike(like),
-                        Postulacion.conyuge_dni.ilike(like),
-                        Postulacion.conyuge_otros_datos.ilike(like),
+            encontrados = buscar("postulaciones", search)
+            if encontrados is not None:
+                query = query.filter(Postulacion.postulacion_id.in_(encontrados))
+            else:
+                palabras = search.strip().split()
+                condiciones = []
+
+                for palabra in palabras:
+                    like = f"%{palabra}%"
+                    condiciones.append(
+                        or_(
+                            Postulacion.nombre.ilike(like),
+                            Postulacion.apellido.ilike(like),
+                            Postulacion.dni.ilike(like),
+                            Postulacion.calle_y_nro.ilike(like),
+                            Postulacion.barrio.ilike(like),
+                            Postulacion.localidad.ilike(like),
+                            Postulacion.provincia.ilike(like),
+                            Postulacion.mail.ilike(like),
+                            Postulacion.ocupacion.ilike(like),
+                            Postulacion.conyuge_nombre.ilike(like),
+                            Postulacion.conyuge_apellido.ilike(like),
+                            Postulacion.conyuge_dni.ilike(like),
+                            Postulacion.conyuge_otros_datos.ilike(like),
+                        )
                     )
-                )
 
-            query = query.filter(and_(*condiciones))  # todas las palabras deben coincidir en al menos un campo
+                query = query.filter(and_(*condiciones))  # todas las palabras deben coincidir en al menos un campo
 
         if convocatoria_id:
             query = query.filter(Postulacion.convocatoria_id == convocatoria_id)
@@ -516,10 +522,9 @@ def get_postulacion(postulacion_id: int, db: Session = Depends(get_db)):
 
             return "Sin subregistros"
 
-        ddjj_titular = db.query(DDJJ).filter(DDJJ.login == postulacion.dni).first()
-        ddjj_conyuge = None
-        if postulacion.conyuge_dni:
-            ddjj_conyuge = db.query(DDJJ).filter(DDJJ.login == postulacion.conyuge_dni).first()
+        ddjjs = cargar_ddjjs(db, [postulacion.dni, postulacion.conyuge_dni], "subregistros")
+        ddjj_titular = ddjjs.get(postulacion.dni)
+        ddjj_conyuge = ddjjs.get(postulacion.conyuge_dni) if postulacion.conyuge_dni else None
 
         ddjj_subregistros = {
             "titular": construir_subregistros_ddjj(ddjj_titular),
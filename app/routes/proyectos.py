@@ -26,18 +26,27 @@ from bs4 import BeautifulSoup
 # from models.carpeta import DetalleProyectosEnCarpeta
 from models.users import User, Group, UserGroup 
 from database.config import get_db
-from helpers.utils import get_user_name_by_login, construir_subregistro_string, parse_date, generar_codigo_para_link, \
+from helpers.zip_stream import respuesta_zip
+from helpers.ddjj_columnas import cargar_ddjj
+from helpers.subregistros import condicion_subregistros, subregistro_strings
+from helpers.busqueda import buscar
+from helpers.paginacion import paginar_por_cursor, contar_cacheado, respuesta_cursor, DESCRIPCION_CURSOR, DESCRIPCION_CON_TOTAL
+from helpers.utils import get_user_name_by_login, get_user_names_by_logins, construir_subregistro_string, parse_date, generar_codigo_para_link, \
     enviar_mail, enviar_mail_multiples, get_setting_value, edad_como_texto, check_consecutive_numbers, \
     get_notificacion_settings
-from helpers.config_whatsapp import get_whatsapp_settings
+from helpers.whatsapp_cliente import obtener_whatsapp_settings
+from helpers.whatsapp_helper import enviar_templates_whatsapp, envio_rua_notificacion
 from helpers.mensajeria_utils import registrar_mensaje
 
 from models.eventos_y_configs import RuaEvento, UsuarioNotificadoRatificacion
 from services.proyecto_unificacion import unify_on_enter_vinculacion, get_unificacion_info
+from services.uploads import guardar_upload, UploadRechazado
+from services.dossiers import spec_pdf, responder_dossier, estado_dossier, descargar_job_dossier, VARIANTE_A4, VARIANTE_IMAGEN
 
 from security.security import get_current_user, verify_api_key, require_roles
 from dotenv import load_dotenv
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 
 import fitz  # PyMuPDF
 from PIL import Image
@@ -189,17 +198,15 @@ def _save_historial_upload(
     ext = os.path.splitext(file.filename.lower())[1]
     if ext not in {".pdf", ".doc", ".docx", ".jpg", ".jpeg", ".png"}:
         return {"success": False, "tipo_mensaje": "rojo", "mensaje": f"Extensión no permitida: {ext}", "tiempo_mensaje": 6, "next_page": "actual"}
-    file.file.seek(0, os.SEEK_END)
-    if file.file.tell() > 5 * 1024 * 1024:
-        return {"success": False, "tipo_mensaje": "rojo", "mensaje": "Máximo 5MB", "tiempo_mensaje": 6, "next_page": "actual"}
-    file.file.seek(0)
     proyecto_dir = os.path.join(UPLOAD_DIR_DOC_PROYECTOS, str(proyecto.proyecto_id))
     os.makedirs(proyecto_dir, exist_ok=True)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     fn = f"{campo}_{ts}{ext}"
     path = os.path.join(proyecto_dir, fn)
-    with open(path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    try:
+        guardar_upload(file, path, max_mb=5)
+    except UploadRechazado as e:
+        return {"success": False, "tipo_mensaje": "rojo", "mensaje": e.mensaje, "tiempo_mensaje": 6, "next_page": "actual"}
 
     # construir histórico
     raw = getattr(proyecto, campo) or ""
@@ -226,13 +233,7 @@ def _download_all(raw:str, zipname:str, proyecto_id:int):
         r=arr[0]["ruta"]
         if not os.path.exists(r): raise HTTPException(404,"No existe")
         return FileResponse(r, filename=os.path.basename(r))
-    tmp = tempfile.NamedTemporaryFile(delete=False,suffix=".zip")
-    with zipfile.ZipFile(tmp.name,"w",zipfile.ZIP_DEFLATED) as z:
-        for e in arr:
-            ruta=e.get("ruta")
-            if ruta and os.path.exists(ruta):
-                z.write(ruta, arcname=os.path.basename(ruta))
-    return FileResponse(tmp.name, filename=f"{zipname}_{proyecto_id}.zip", media_type="application/zip")
+    return respuesta_zip([(e.get("ruta"), None) for e in arr], f"{zipname}_{proyecto_id}.zip")
 
 
 def _get_proyecto_baja_caducidad_para_login(db: Session, login: Optional[str]):
@@ -568,6 +569,82 @@ def eliminar_proyecto(
 
 
 
+ESTADOS_CON_ENTREVISTAS = ("calendarizando", "entrevistando")
+ESTADOS_CON_NNA = ("vinculacion", "guarda_provisoria", "guarda_confirmada", "adopcion_definitiva")
+
+ESTADO_CARPETA_LEGIBLE = {
+    "vacia": "Vacía",
+    "preparando_carpeta": "Preparando",
+    "enviada_a_juzgado": "Enviada a juzgado",
+    "proyecto_seleccionado": "Proyecto seleccionado"
+}
+
+
+def _datos_pagina_proyectos(db: Session, proyectos: List[Proyecto], con_entrevistas: bool) -> dict:
+    """
+    Resuelve los datos accesorios de una página de GET /proyectos con una consulta IN por tipo de
+    dato (nombres de adoptantes, evaluaciones, NNA vinculados, última carpeta, cantidad de
+    entrevistas y texto de subregistros), sin importar cuántos proyectos tenga la página.
+    """
+    def ids_con_estado(estados) -> List[int]:
+        return [p.proyecto_id for p in proyectos if p.estado_general in estados]
+
+    datos = {
+        "nombres": get_user_names_by_logins(db, [l for p in proyectos for l in (p.login_1, p.login_2)]),
+        "evaluaciones": {},
+        "nna": {},
+        "carpeta": {},
+        "cant_entrevistas": {},
+        "subregistros": subregistro_strings(db, proyectos),
+    }
+
+    ids_entrevistas = ids_con_estado(ESTADOS_CON_ENTREVISTAS)
+    if ids_entrevistas:
+        evaluaciones = db.query(AgendaEntrevistas.proyecto_id, AgendaEntrevistas.evaluacion_comentarios).filter(
+            AgendaEntrevistas.proyecto_id.in_(ids_entrevistas),
+            AgendaEntrevistas.evaluacion_comentarios != None,
+            AgendaEntrevistas.evaluacion_comentarios != ""
+        ).all()
+        for proyecto_id, comentario in evaluaciones:
+            datos["evaluaciones"].setdefault(proyecto_id, []).append(comentario)
+
+    ids_nna = ids_con_estado(ESTADOS_CON_NNA)
+    if ids_nna:
+        nna_relacionados = (
+            db.query(DetalleProyectosEnCarpeta.proyecto_id, Nna.nna_nombre, Nna.nna_apellido)
+            .join(DetalleNNAEnCarpeta, DetalleNNAEnCarpeta.carpeta_id == DetalleProyectosEnCarpeta.carpeta_id)
+            .join(Nna, Nna.nna_id == DetalleNNAEnCarpeta.nna_id)
+            .filter(DetalleProyectosEnCarpeta.proyecto_id.in_(ids_nna))
+            .all()
+        )
+        for n in nna_relacionados:
+            datos["nna"].setdefault(n.proyecto_id, set()).add(f"{n.nna_nombre} {n.nna_apellido}")
+
+    ids_carpeta = ids_con_estado(("en_carpeta",))
+    if ids_carpeta:
+        carpetas = (
+            db.query(DetalleProyectosEnCarpeta.proyecto_id, Carpeta.estado_carpeta)
+            .join(Carpeta, Carpeta.carpeta_id == DetalleProyectosEnCarpeta.carpeta_id)
+            .filter(DetalleProyectosEnCarpeta.proyecto_id.in_(ids_carpeta))
+            .order_by(DetalleProyectosEnCarpeta.proyecto_id, Carpeta.fecha_creacion.desc())
+            .all()
+        )
+        for proyecto_id, estado_carpeta in carpetas:
+            # La primera de cada proyecto es la más reciente
+            datos["carpeta"].setdefault(proyecto_id, estado_carpeta)
+
+    if con_entrevistas and proyectos:
+        datos["cant_entrevistas"] = dict(
+            db.query(AgendaEntrevistas.proyecto_id, func.count())
+            .filter(AgendaEntrevistas.proyecto_id.in_([p.proyecto_id for p in proyectos]))
+            .group_by(AgendaEntrevistas.proyecto_id)
+            .all()
+        )
+
+    return datos
+
+
+
 @proyectos_router.get("/", response_model=dict, 
                   dependencies=[Depends( verify_api_key ), 
                                 Depends(require_roles(["administrador", "supervision", "supervisora", "profesional", "coordinadora"]))])
@@ -599,11 +676,16 @@ def get_proyectos(
         None, description="Filtrar por rua, oficio o convocatoria"
     ),
 
-    subregistros: Optional[List[str]] = Query(None, alias="subregistro_portada")  ):
+    subregistros: Optional[List[str]] = Query(None, alias="subregistro_portada"),
+
+    cursor: Optional[str] = Query(None, description=DESCRIPCION_CURSOR),
+    con_total: bool = Query(False, description=DESCRIPCION_CON_TOTAL),  ):
 
     """
     📋 Devuelve un listado paginado de proyectos adoptivos, permitiendo aplicar múltiples filtros combinados.
 
+    Con `cursor` pagina por clave (orden_es_valido, nro_orden, fecha de nro. de orden, proyecto_id)
+    y devuelve `next_cursor` en lugar de page/total_pages.
     """
 
     try:
@@ -663,130 +745,37 @@ def get_proyectos(
 
             query = query.filter(Proyecto.proyecto_id.in_(subq_proyectos))
 
-        subregistro_field_map = {
-            "1": Proyecto.subreg_1,
-            "2": Proyecto.subreg_2,
-            "3": Proyecto.subreg_3,
-            "4": Proyecto.subreg_4,
-            "FE1": Proyecto.subreg_FE1,
-            "FE2": Proyecto.subreg_FE2,
-            "FE3": Proyecto.subreg_FE3,
-            "FE4": Proyecto.subreg_FE4,
-            "FET": Proyecto.subreg_FET,
-            "5A1E1": Proyecto.subreg_5A1E1,
-            "5A1E2": Proyecto.subreg_5A1E2,
-            "5A1E3": Proyecto.subreg_5A1E3,
-            "5A1E4": Proyecto.subreg_5A1E4,
-            "5A1ET": Proyecto.subreg_5A1ET,
-            "5A2E1": Proyecto.subreg_5A2E1,
-            "5A2E2": Proyecto.subreg_5A2E2,
-            "5A2E3": Proyecto.subreg_5A2E3,
-            "5A2E4": Proyecto.subreg_5A2E4,
-            "5A2ET": Proyecto.subreg_5A2ET,
-            "5B1E1": Proyecto.subreg_5B1E1,
-            "5B1E2": Proyecto.subreg_5B1E2,
-            "5B1E3": Proyecto.subreg_5B1E3,
-            "5B1E4": Proyecto.subreg_5B1E4,
-            "5B1ET": Proyecto.subreg_5B1ET,
-            "5B2E1": Proyecto.subreg_5B2E1,
-            "5B2E2": Proyecto.subreg_5B2E2,
-            "5B2E3": Proyecto.subreg_5B2E3,
-            "5B2E4": Proyecto.subreg_5B2E4,
-            "5B2ET": Proyecto.subreg_5B2ET,
-            "5B3E1": Proyecto.subreg_5B3E1,
-            "5B3E2": Proyecto.subreg_5B3E2,
-            "5B3E3": Proyecto.subreg_5B3E3,
-            "5B3E4": Proyecto.subreg_5B3E4,
-            "5B3ET": Proyecto.subreg_5B3ET,
-            "F5S": Proyecto.subreg_F5S, 
-            "F5E1": Proyecto.subreg_F5E1,
-            "F5E2": Proyecto.subreg_F5E2,
-            "F5E3": Proyecto.subreg_F5E3,
-            "F5E4": Proyecto.subreg_F5E4,
-            "F5ET": Proyecto.subreg_F5ET,
-            "61E1": Proyecto.subreg_61E1,
-            "61E2": Proyecto.subreg_61E2,
-            "61E3": Proyecto.subreg_61E3,
-            "61ET": Proyecto.subreg_61ET,
-            "62E1": Proyecto.subreg_62E1,
-            "62E2": Proyecto.subreg_62E2,
-            "62E3": Proyecto.subreg_62E3,
-            "62ET": Proyecto.subreg_62ET,
-            "63E1": Proyecto.subreg_63E1,
-            "63E2": Proyecto.subreg_63E2,
-            "63E3": Proyecto.subreg_63E3,
-            "63ET": Proyecto.subreg_63ET,
-            "FQ1": Proyecto.subreg_FQ1,
-            "FQ2": Proyecto.subreg_FQ2,
-            "FQ3": Proyecto.subreg_FQ3,
-            "F6E1": Proyecto.subreg_F6E1,
-            "F6E2": Proyecto.subreg_F6E2,
-            "F6E3": Proyecto.subreg_F6E3,
-            "F6ET": Proyecto.subreg_F6ET,
-        }
-
-
-
-        # Suponiendo que ya tenés `query` definido como tu query base
+        # Subregistros: prueba de bits sobre la máscara indexada (ver helpers/subregistros.py)
         if subregistros:
-            subregistros = list(set(subregistros))  # evitar duplicados
-
-            tags_padres = {
-                "FE": ["FE1", "FE2", "FE3", "FE4", "FET"],
-                "5A": ["5A1E1", "5A1E2", "5A1E3", "5A1E4", "5A1ET", "5A2E1", "5A2E2", "5A2E3", "5A2E4", "5A2ET"],
-                "5B": ["5B1E1", "5B1E2", "5B1E3", "5B1E4", "5B1ET", "5B2E1", "5B2E2", "5B2E3", "5B2E4", "5B2ET", "5B3E1", "5B3E2", "5B3E3", "5B3E4", "5B3ET"],
-                "F5": ["F5S", "F5E1", "F5E2", "F5E3", "F5E4", "F5ET"],
-                "6": ["61E1", "61E2", "61E3", "61ET", "62E1", "62E2", "62E3", "62ET", "63E1", "63E2", "63E3", "63ET"],
-                "F6": ["F6E1", "F6E2", "F6E3", "F6ET"],
-            }
-
-            # Excluir padres si ya se mandó algún hijo
-            tags_excluidos = set()
-            for padre, hijos in tags_padres.items():
-                if padre in subregistros and any(hijo in subregistros for hijo in hijos):
-                    tags_excluidos.add(padre)
-
-            subregistros_filtrados = [sr for sr in subregistros if sr not in tags_excluidos]
-
-            condiciones = []
-            for sr in subregistros_filtrados:
-                if sr in tags_padres:
-                    grupo_or = [
-                        subregistro_field_map[subtag] == "Y"
-                        for subtag in tags_padres[sr]
-                        if subtag in subregistro_field_map
-                    ]
-                    if grupo_or:
-                        condiciones.append(or_(*grupo_or))
-                else:
-                    field = subregistro_field_map.get(sr)
-                    if field:
-                        condiciones.append(field == "Y")
-
-            if condiciones:
-                query = query.filter(and_(*condiciones))
+            condicion = condicion_subregistros(Proyecto, subregistros)
+            if condicion is not None:
+                query = query.filter(condicion)
 
 
         if search and len(search) >= 3:
-            palabras = search.lower().split()
-            condiciones_por_palabra = []
-
-            for palabra in palabras:
-                condiciones_por_palabra.append(
-                    or_(
-                        func.lower(func.concat(User1.nombre, " ", User1.apellido)).ilike(f"%{palabra}%"),
-                        func.lower(func.concat(User2.nombre, " ", User2.apellido)).ilike(f"%{palabra}%"),
-                        Proyecto.login_1.ilike(f"%{palabra}%"),
-                        Proyecto.login_2.ilike(f"%{palabra}%"),
-                        Proyecto.nro_orden_rua.ilike(f"%{palabra}%"),
-                        Proyecto.proyecto_calle_y_nro.ilike(f"%{palabra}%"),
-                        Proyecto.proyecto_barrio.ilike(f"%{palabra}%"),
-                        Proyecto.proyecto_localidad.ilike(f"%{palabra}%"),
-                        Proyecto.proyecto_provincia.ilike(f"%{palabra}%")
+            encontrados = buscar("proyectos", search)
+            if encontrados is not None:
+                query = query.filter(Proyecto.proyecto_id.in_(encontrados))
+            else:
+                palabras = search.lower().split()
+                condiciones_por_palabra = []
+
+                for palabra in palabras:
+                    condiciones_por_palabra.append(
+                        or_(
+                            func.lower(func.concat(User1.nombre, " ", User1.apellido)).ilike(f"%{palabra}%"),
+                            func.lower(func.concat(User2.nombre, " ", User2.apellido)).ilike(f"%{palabra}%"),
+                            Proyecto.login_1.ilike(f"%{palabra}%"),
+                            Proyecto.login_2.ilike(f"%{palabra}%"),
+                            Proyecto.nro_orden_rua.ilike(f"%{palabra}%"),
+                            Proyecto.proyecto_calle_y_nro.ilike(f"%{palabra}%"),
+                            Proyecto.proyecto_barrio.ilike(f"%{palabra}%"),
+                            Proyecto.proyecto_localidad.ilike(f"%{palabra}%"),
+                            Proyecto.proyecto_provincia.ilike(f"%{palabra}%")
+                        )
                     )
-                )
-            # Todas las palabras deben coincidir en algún campo (AND entre ORs)
-            query = query.filter(and_(*condiciones_por_palabra))
+                # Todas las palabras deben coincidir en algún campo (AND entre ORs)
+                query = query.filter(and_(*condiciones_por_palabra))
 
 
         # Determina si nro_orden_rua es válido (4 o 5 dígitos numéricos)
@@ -810,16 +799,30 @@ def get_proyectos(
             Proyecto.fecha_asignacion_nro_orden.desc()  # 3. fecha más antigua primero
         )
 
-        # Paginación
-        total_records = query.count()
-        total_pages = max((total_records // limit) + (1 if total_records % limit > 0 else 0), 1)
-        if page > total_pages:
-            return {"page": page, "limit": limit, "total_pages": total_pages, "total_records": total_records, "proyectos": []}
+        if cursor is not None:
+            # Paginación por cursor: mismo orden, con proyecto_id como desempate
+            proyectos, next_cursor = paginar_por_cursor(query, [
+                (orden_es_valido, False),
+                (func.coalesce(nro_orden_valido, 0), False),
+                (func.coalesce(Proyecto.fecha_asignacion_nro_orden, date(1000, 1, 1)), True),
+                (Proyecto.proyecto_id, False),
+            ], cursor, limit)
+            total_records = contar_cacheado(query, "proyectos") if con_total else None
+
+        else:
+            # Paginación
+            total_records = query.count()
+            total_pages = max((total_records // limit) + (1 if total_records % limit > 0 else 0), 1)
+            if page > total_pages:
+                return {"page": page, "limit": limit, "total_pages": total_pages, "total_records": total_records, "proyectos": []}
 
-        skip = (page - 1) * limit
-        proyectos = query.offset(skip).limit(limit).all()
+            skip = (page - 1) * limit
+            proyectos = query.offset(skip).limit(limit).all()
 
 
+        # Datos accesorios de toda la página (cantidad fija de consultas)
+        datos_pagina = _datos_pagina_proyectos(db, proyectos, con_entrevistas = bool(login_profesional))
+
         # Crear la lista de proyectos
         proyectos_list = []
         
@@ -839,53 +842,28 @@ def get_proyectos(
             comentarios_sobre_estado = None
 
             # 1. Casos entrevistando o calendarizando
-            if proyecto.estado_general in ["calendarizando", "entrevistando"]:
-                evaluaciones = db.query(AgendaEntrevistas.evaluacion_comentarios).filter(
-                    AgendaEntrevistas.proyecto_id == proyecto.proyecto_id,
-                    AgendaEntrevistas.evaluacion_comentarios != None,
-                    AgendaEntrevistas.evaluacion_comentarios != ""
-                ).all()
+            if proyecto.estado_general in ESTADOS_CON_ENTREVISTAS:
+                evaluaciones = datos_pagina["evaluaciones"].get(proyecto.proyecto_id)
 
                 if evaluaciones:
                     comentarios_sobre_estado = "Entrevistas realizadas:\n" + "\n".join(
-                        f"- {e.evaluacion_comentarios}" for e in evaluaciones
+                        f"- {e}" for e in evaluaciones
                     )
                 else:
                     comentarios_sobre_estado = "Aún no se registraron evaluaciones en las entrevistas."
 
-            # 2. Casos vinculacion o guarda
-            # Casos vinculacion o guarda → obtener NNA de la carpeta asociada
-            elif proyecto.estado_general in ["vinculacion", "guarda_provisoria", "guarda_confirmada", "adopcion_definitiva"]:
-
-                subquery_carpeta = db.query(DetalleProyectosEnCarpeta.carpeta_id).filter(
-                    DetalleProyectosEnCarpeta.proyecto_id == proyecto.proyecto_id
-                ).subquery()
+            # 2. Casos vinculacion o guarda → NNA de la carpeta asociada
+            elif proyecto.estado_general in ESTADOS_CON_NNA:
+                nombres_nna = datos_pagina["nna"].get(proyecto.proyecto_id)
 
-                nna_relacionados = (
-                    db.query(Nna.nna_nombre, Nna.nna_apellido)
-                    .join(DetalleNNAEnCarpeta, DetalleNNAEnCarpeta.nna_id == Nna.nna_id)
-                    .filter(DetalleNNAEnCarpeta.carpeta_id.in_(subquery_carpeta))
-                    .all()
-                )
-
-                if nna_relacionados:
-                    nombres_nna = list({f"{n.nna_nombre} {n.nna_apellido}" for n in nna_relacionados})
+                if nombres_nna:
                     comentarios_sobre_estado = "NNA relacionado/s:\n" + "\n".join(nombres_nna)
 
             # 3. Caso en_carpeta
             elif proyecto.estado_general == "en_carpeta":
-                carpeta = db.query(Carpeta).join(DetalleProyectosEnCarpeta).filter(
-                    DetalleProyectosEnCarpeta.proyecto_id == proyecto.proyecto_id
-                ).order_by(Carpeta.fecha_creacion.desc()).first()
-
-                if carpeta:
-                    estado_carpeta_map = {
-                        "vacia": "Vacía",
-                        "preparando_carpeta": "Preparando",
-                        "enviada_a_juzgado": "Enviada a juzgado",
-                        "proyecto_seleccionado": "Proyecto seleccionado"
-                    }
-                    estado_legible = estado_carpeta_map.get(carpeta.estado_carpeta, carpeta.estado_carpeta)
+                if proyecto.proyecto_id in datos_pagina["carpeta"]:
+                    estado_carpeta = datos_pagina["carpeta"][proyecto.proyecto_id]
+                    estado_legible = ESTADO_CARPETA_LEGIBLE.get(estado_carpeta, estado_carpeta)
                     comentarios_sobre_estado = f"Estado de carpeta: '{estado_legible}'"
 
 
@@ -895,7 +873,7 @@ def get_proyectos(
                 "proyecto_tipo": proyecto.proyecto_tipo,
                 "nro_orden_rua": proyecto.nro_orden_rua,
 
-                "subregistro_string": construir_subregistro_string(proyecto),  
+                "subregistro_string": datos_pagina["subregistros"].get(proyecto.proyecto_id, ""),
 
                 "proyecto_calle_y_nro": proyecto.proyecto_calle_y_nro,
                 "proyecto_depto_etc": proyecto.proyecto_depto_etc,
@@ -903,9 +881,9 @@ def get_proyectos(
                 "proyecto_localidad": proyecto.proyecto_localidad,
                 "proyecto_provincia": proyecto.proyecto_provincia,
 
-                "login_1_name": get_user_name_by_login(db, proyecto.login_1),
+                "login_1_name": datos_pagina["nombres"].get(proyecto.login_1, ""),
                 "login_1_dni": proyecto.login_1,
-                "login_2_name": get_user_name_by_login(db, proyecto.login_2),
+                "login_2_name": datos_pagina["nombres"].get(proyecto.login_2, ""),
                 "login_2_dni": proyecto.login_2,
 
                 "fecha_asignacion_nro_orden": parse_date(proyecto.fecha_asignacion_nro_orden),
@@ -946,13 +924,11 @@ def get_proyectos(
 
             
             if login_profesional:
-                # Obtener profesionales del proyecto
-                profesionales_proyecto = db.query(User).join(DetalleEquipoEnProyecto).filter(
-                    DetalleEquipoEnProyecto.proyecto_id == proyecto.proyecto_id
-                ).all()
-
-                # Filtrar al profesional actual y determinar el resto
-                otros = [p for p in profesionales_proyecto if p.login != login_profesional]
+                # Profesionales del proyecto (ya cargadas con el equipo), sin el profesional actual
+                otros = [
+                    d.user for d in proyecto.detalle_equipo_proyecto
+                    if d.user and d.user.login != login_profesional
+                ]
 
                 if not otros:
                     junto_a = "Ninguna"
@@ -962,9 +938,7 @@ def get_proyectos(
                     junto_a = " y ".join([p.nombre for p in otros[:2]])
 
 
-                cant_entrevistas = db.query(func.count()).select_from(AgendaEntrevistas).filter(
-                    AgendaEntrevistas.proyecto_id == proyecto.proyecto_id
-                ).scalar()
+                cant_entrevistas = datos_pagina["cant_entrevistas"].get(proyecto.proyecto_id, 0)
 
                 if proyecto.estado_general == "para_valorar":
                     etapa = "Para valorar"
@@ -983,6 +957,9 @@ def get_proyectos(
 
             proyectos_list.append(proyecto_dict)
 
+        if cursor is not None:
+            return respuesta_cursor("proyectos", proyectos_list, limit, next_cursor, total_records)
+
         return {
             "page": page,
             "limit": limit,
@@ -1744,7 +1721,7 @@ def crear_proyecto_preliminar(
 
             aceptado_code = generar_codigo_para_link(16)
 
-        ddjj = db.query(DDJJ).filter(DDJJ.login == usuario_actual_login).first()
+        ddjj = cargar_ddjj(db, usuario_actual_login, "subregistros", "domicilio")
 
         def subreg(key):
             val = getattr(ddjj, f"ddjj_{key}", None)
@@ -2562,16 +2539,6 @@ def subir_documento_proyecto(
     if ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail=f"Extensión de archivo no permitida: {ext}")
 
-    # ——— Validación de tamaño (5 MB) ———
-    file.file.seek(0, os.SEEK_END)
-    size = file.file.tell()
-    if size > 5 * 1024 * 1024:
-        raise HTTPException(
-            status_code=400,
-            detail="El archivo excede el tamaño máximo permitido (5 MB)."
-        )
-    file.file.seek(0)
-    
     proyecto = db.query(Proyecto).filter(Proyecto.proyecto_id == proyecto_id).first()
     if not proyecto:
         raise HTTPException(status_code=404, detail="Proyecto no encontrado")
@@ -2592,10 +2559,10 @@ def subir_documento_proyecto(
     final_filename = f"{nombre_archivo}_{timestamp}{ext}"
     filepath = os.path.join(proyecto_dir, final_filename)
 
-    try:
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+    # Máximo 5 MB; si no cumple sale con 400
+    guardar_upload(file, filepath, max_mb=5)
 
+    try:
         # Actualizar ruta del archivo en la base
         setattr(proyecto, campo, filepath)
         db.commit()
@@ -3416,29 +3383,25 @@ def subir_informe_profesionales(
     proyecto_dir = os.path.join(UPLOAD_DIR_DOC_PROYECTOS, str(proyecto_id))
     os.makedirs(proyecto_dir, exist_ok=True)
 
-    # 3️⃣ Validar tamaño (máx. 5 MB)
-    file.file.seek(0, os.SEEK_END)
-    size = file.file.tell()
-    file.file.seek(0)
-    if size > 5 * 1024 * 1024:
+    # 3️⃣ Preparar nombre y ruta
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    final_name = f"informe_profesionales_{timestamp}{ext}"
+    filepath = os.path.join(proyecto_dir, final_name)
+
+    # 4️⃣ Guardar en disco (máx. 5 MB)
+    try:
+        guardar_upload(file, filepath, max_mb=5)
+    except UploadRechazado as e:
         return {
             "success": False,
             "tipo_mensaje": "rojo",
-            "mensaje": "El archivo excede el tamaño máximo de 5 MB.",
+            "mensaje": e.mensaje,
             "tiempo_mensaje": 6,
             "next_page": "actual"
         }
 
-    # 4️⃣ Preparar nombre y ruta
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    final_name = f"informe_profesionales_{timestamp}{ext}"
-    filepath = os.path.join(proyecto_dir, final_name)
-
 
     try:
-        # 5️⃣ Guardar en disco
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
 
         # 6️⃣ Construir nuevo objeto de historial
         nuevo_archivo = {
@@ -3530,8 +3493,7 @@ def subir_documento_proyecto(
     filepath = os.path.join(proyecto_dir, final_filename)
 
     try:
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        guardar_upload(file, filepath)
 
         # Asignar al campo correspondiente
         setattr(proyecto, tipo_documento, filepath)
@@ -4831,21 +4793,8 @@ def descargar_todos_informes_valoracion(
             media_type="application/octet-stream"
         )
 
-    # 4️⃣ Si hay más, crear ZIP
-    try:
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-        with zipfile.ZipFile(tmp.name, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for entry in archivos:
-                ruta = entry.get("ruta")
-                if ruta and os.path.exists(ruta):
-                    zipf.write(ruta, arcname=os.path.basename(ruta))
-        return FileResponse(
-            path=tmp.name,
-            filename=f"informes_valoracion_{proyecto_id}.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al generar ZIP: {e}")    
+    # 4️⃣ Si hay más, ZIP generado al vuelo
+    return respuesta_zip([(entry.get("ruta"), None) for entry in archivos], f"informes_valoracion_{proyecto_id}.zip")
 
 
 
@@ -4928,8 +4877,7 @@ def subir_dictamen(
     filepath = os.path.join(proyecto_dir, final_filename)
 
     try:
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        guardar_upload(file, filepath)
 
         login_actual = current_user["user"]["login"]
         estado_anterior = proyecto.estado_general  # 🟡 Guardamos antes de cambiarlo
@@ -5293,8 +5241,7 @@ def subir_sentencia_guarda(
     filepath = os.path.join(proyecto_dir, final_filename)
 
     try:
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        guardar_upload(file, filepath)
 
         proyecto.doc_sentencia_guarda = filepath
         db.commit()
@@ -6224,8 +6171,7 @@ def subir_sentencia_adopcion(
     filepath = os.path.join(proyecto_dir, final_filename)
 
     try:
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        guardar_upload(file, filepath)
 
         proyecto.doc_sentencia_adopcion = filepath
         db.commit()
@@ -7001,7 +6947,7 @@ def notificar_proyecto_mensaje(
         canales = get_notificacion_settings(db, base_setting)
         enviar_email_flag = canales.get("email", False)
         enviar_whatsapp_flag = canales.get("whatsapp", False)
-        whatsapp_settings = get_whatsapp_settings(db) if enviar_whatsapp_flag else None
+        whatsapp_settings = obtener_whatsapp_settings(db) if enviar_whatsapp_flag else None
 
         # ------------- ESTADO DEL PROYECTO -------------
         nuevo_estado = None
@@ -7024,6 +6970,8 @@ def notificar_proyecto_mensaje(
         # ===========================================================
         #            📩 ENVIAR A CADA PRETENSO DEL PROYECTO
         # ===========================================================
+        whatsapp_pendientes = []
+
         for login in logins_destinatarios:
             user = db.query(User).filter(User.login == login).first()
             if not user:
@@ -7133,8 +7081,6 @@ def notificar_proyecto_mensaje(
             # ---------------------------------------------------------
             # 📲 WHATSAPP
             # ---------------------------------------------------------
-            whatsapp_enviado = False
-
             if enviar_whatsapp_flag:
 
                 if not user.celular:
@@ -7149,47 +7095,44 @@ def notificar_proyecto_mensaje(
                         data_json="No hay número de celular"
                     )
                 else:
-                    try:
-                        numero = user.celular.replace("+","").replace(" ","").replace("-","")
-                        if not numero.startswith("54"):
-                            numero = "54" + numero
-
-                        respuesta = enviar_whatsapp_rua_notificacion(
-                            db=db,
-                            destinatario=numero,
-                            nombre=user.nombre,
-                            mensaje=mensaje_texto_plano,
-                            whatsapp_settings=whatsapp_settings
-                        )
+                    numero = user.celular.replace("+","").replace(" ","").replace("-","")
+                    if not numero.startswith("54"):
+                        numero = "54" + numero
 
-                        whatsapp_enviado = "messages" in respuesta
-                        mensaje_externo_id = (
-                            respuesta["messages"][0].get("id") if whatsapp_enviado else None
-                        )
+                    # Se envían todos juntos después del loop
+                    whatsapp_pendientes.append((login, user, envio_rua_notificacion(numero, user.nombre, mensaje_texto_plano)))
 
-                        registrar_mensaje(
-                            db=db,
-                            tipo="whatsapp",
-                            login_emisor=login_que_observa,
-                            login_destinatario=login,
-                            destinatario_texto=f"{user.nombre} {user.apellido}",
-                            contenido=mensaje_texto_plano,
-                            estado="enviado" if whatsapp_enviado else "error",
-                            mensaje_externo_id=mensaje_externo_id,
-                            data_json=respuesta
-                        )
 
-                    except Exception as e:
-                        registrar_mensaje(
-                            db=db,
-                            tipo="whatsapp",
-                            login_emisor=login_que_observa,
-                            login_destinatario=login,
-                            destinatario_texto=f"{user.nombre} {user.apellido}",
-                            contenido=mensaje_texto_plano,
-                            estado="error",
-                            data_json=str(e)
-                        )
+        # ---------------------------------------------------------
+        # 📲 WHATSAPP: envío en paralelo y registro de cada respuesta
+        # ---------------------------------------------------------
+        if whatsapp_pendientes:
+            try:
+                respuestas = enviar_templates_whatsapp(
+                    db=db,
+                    envios=[envio for _, _, envio in whatsapp_pendientes],
+                    whatsapp_settings=whatsapp_settings
+                )
+            except Exception as e:
+                respuestas = [{"error": str(e)} for _ in whatsapp_pendientes]
+
+            for (login, user, _), respuesta in zip(whatsapp_pendientes, respuestas):
+                whatsapp_enviado = "messages" in respuesta
+                mensaje_externo_id = (
+                    respuesta["messages"][0].get("id") if whatsapp_enviado else None
+                )
+
+                registrar_mensaje(
+                    db=db,
+                    tipo="whatsapp",
+                    login_emisor=login_que_observa,
+                    login_destinatario=login,
+                    destinatario_texto=f"{user.nombre} {user.apellido}",
+                    contenido=mensaje_texto_plano,
+                    estado="enviado" if whatsapp_enviado else "error",
+                    mensaje_externo_id=mensaje_externo_id,
+                    data_json=respuesta
+                )
 
 
         # -------- CAMBIO DE ESTADO DEL PROYECTO -------
@@ -7944,112 +7887,40 @@ def aprobar_proyecto(
 
 
 
-@proyectos_router.get("/proyectos/{proyecto_id}/descargar-pdf", response_class=FileResponse,
-    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador", "supervision", "supervisora", "profesional"]))])
-def descargar_pdf_proyecto(
-    proyecto_id: int,
-    db: Session = Depends(get_db)
-    ):
-
-    proyecto = db.query(Proyecto).filter(Proyecto.proyecto_id == proyecto_id).first()
-    if not proyecto:
-        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
-
-    output_path = os.path.join(DIR_PDF_GENERADOS, f"proyecto_{proyecto_id}.pdf")
-    pdf_paths: List[Tuple[str, str]] = []
-
-    documentos_a_incluir = {
-        "Informe del equipo técnico": proyecto.informe_profesionales,
-        "Dictamen profesional": proyecto.doc_dictamen,
-        "Sentencia de guarda": proyecto.doc_sentencia_guarda,
-        "Sentencia de adopción": proyecto.doc_sentencia_adopcion,
-        "Convivencia o estado civil": proyecto.doc_proyecto_convivencia_o_estado_civil,
-        "Informe de interrución": proyecto.doc_interrupcion
-    }
-
-    def convertir_a_pdf_y_agregar(nombre, ruta_original):
-        if not ruta_original or not os.path.exists(ruta_original):
-            return
-        ext = os.path.splitext(ruta_original)[1].lower()
-        out_pdf = os.path.join(DIR_PDF_GENERADOS, f"{nombre}_{os.path.basename(ruta_original)}.pdf")
-
-        if ext == ".pdf":
-            shutil.copy(ruta_original, out_pdf)
-        # elif ext in [".jpg", ".jpeg", ".png"]:
-        #     Image.open(ruta_original).convert("RGB").save(out_pdf)
-        elif ext in [".jpg", ".jpeg", ".png"]:
-          img = Image.open(ruta_original).convert("RGB")
-
-          # Tamaño A4 en puntos (1 punto = 1/72 pulgadas)
-          a4_width, a4_height = 595, 842
-
-          # Crear nuevo lienzo blanco A4
-          new_img = Image.new("RGB", (a4_width, a4_height), (255, 255, 255))
-
-          # Redimensionar imagen manteniendo proporción para que quepa en A4
-          img.thumbnail((a4_width, a4_height))
-
-          # Calcular posición para centrarla
-          x = (a4_width - img.width) // 2
-          y = (a4_height - img.height) // 2
+DOCUMENTOS_PERSONALES_PDF = [
+    "doc_adoptante_salud", "doc_adoptante_dni_frente", "doc_adoptante_dni_dorso", "doc_adoptante_domicilio",
+    "doc_adoptante_deudores_alimentarios", "doc_adoptante_antecedentes", "doc_adoptante_migraciones"
+]
 
-          new_img.paste(img, (x, y))
 
-          # Guardar como PDF en tamaño A4
-          new_img.save(out_pdf, "PDF", resolution=100.0)
+def _nombre_legajo_proyecto(proyecto_id: int) -> str:
+    return f"proyecto_{proyecto_id}"
 
-        elif ext in [".doc", ".docx"]:
-            subprocess.run([
-                "libreoffice", "--headless", "--convert-to", "pdf", "--outdir", DIR_PDF_GENERADOS, ruta_original
-            ], check=True)
-            out_pdf = os.path.join(DIR_PDF_GENERADOS, os.path.splitext(os.path.basename(ruta_original))[0] + ".pdf")
-        else:
-            return
 
-        if os.path.exists(out_pdf):
-            pdf_paths.append((nombre, out_pdf))
-
-    def agregar_documentos_personales(user, destino: List[Tuple[str, str]]):
-        campos = [
-            "doc_adoptante_salud", "doc_adoptante_dni_frente", "doc_adoptante_dni_dorso", "doc_adoptante_domicilio",
-            "doc_adoptante_deudores_alimentarios", "doc_adoptante_antecedentes", "doc_adoptante_migraciones"
-        ]
-        for campo in campos:
-            ruta = getattr(user, campo, None)
-            if ruta and os.path.exists(ruta):
-                ext = os.path.splitext(ruta)[1].lower()
-                out_pdf = os.path.join(DIR_PDF_GENERADOS, f"{campo}_{user.login}.pdf")
-                if ext == ".pdf":
-                    shutil.copy(ruta, out_pdf)
-                elif ext in [".jpg", ".jpeg", ".png"]:
-                    Image.open(ruta).convert("RGB").save(out_pdf)
-                elif ext in [".doc", ".docx"]:
-                    subprocess.run([
-                        "libreoffice", "--headless", "--convert-to", "pdf", "--outdir", DIR_PDF_GENERADOS, ruta
-                    ], check=True)
-                    out_pdf = os.path.join(DIR_PDF_GENERADOS, os.path.splitext(os.path.basename(ruta))[0] + ".pdf")
-                else:
-                    continue
-                if os.path.exists(out_pdf):
-                    destino.append((f"{campo.replace('doc_adoptante_', '').replace('_', ' ').capitalize()} de {user.nombre} {user.apellido}", out_pdf))
+def _spec_pdf_proyecto(db: Session, proyecto_id: int):
+    """Spec del legajo PDF del proyecto (ver services/dossiers.py) y el nombre de descarga."""
+    proyecto = db.query(Proyecto).filter(Proyecto.proyecto_id == proyecto_id).first()
+    if not proyecto:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
 
-    for nombre, ruta in documentos_a_incluir.items():
-        convertir_a_pdf_y_agregar(nombre, ruta)
+    documentos = [
+        ("Informe del equipo técnico", proyecto.informe_profesionales, VARIANTE_A4),
+        ("Dictamen profesional", proyecto.doc_dictamen, VARIANTE_A4),
+        ("Sentencia de guarda", proyecto.doc_sentencia_guarda, VARIANTE_A4),
+        ("Sentencia de adopción", proyecto.doc_sentencia_adopcion, VARIANTE_A4),
+        ("Convivencia o estado civil", proyecto.doc_proyecto_convivencia_o_estado_civil, VARIANTE_A4),
+        ("Informe de interrución", proyecto.doc_interrupcion, VARIANTE_A4),
+    ]
 
     pretenso_1 = proyecto.usuario_1
     pretenso_2 = proyecto.usuario_2 if proyecto.login_2 else None
 
-    if pretenso_1:
-        agregar_documentos_personales(pretenso_1, pdf_paths)
-    if pretenso_2:
-        agregar_documentos_personales(pretenso_2, pdf_paths)
-
-    merged = fitz.open()
-
-    portada = merged.new_page(width=595, height=842)
-    portada.insert_textbox(fitz.Rect(0, 50, 595, 100), "SERVICIO DE GUARDA Y ADOPCIÓN", fontname="helv", fontsize=16, align=1, color=(0.1, 0.1, 0.3))
-    portada.insert_textbox(fitz.Rect(0, 75, 595, 120), "REGISTRO ÚNICO DE ADOPCIONES Y EQUIPO TÉCNICO", fontname="helv", fontsize=13, align=1, color=(0.2, 0.2, 0.4))
-    portada.insert_textbox(fitz.Rect(0, 105, 595, 135), "DOCUMENTACIÓN DEL PROYECTO ADOPTIVO", fontname="helv", fontsize=11, align=1, color=(0.4, 0.4, 0.4))
+    for user in (pretenso_1, pretenso_2):
+        if not user:
+            continue
+        for campo in DOCUMENTOS_PERSONALES_PDF:
+            titulo = f"{campo.replace('doc_adoptante_', '').replace('_', ' ').capitalize()} de {user.nombre} {user.apellido}"
+            documentos.append((titulo, getattr(user, campo, None), VARIANTE_IMAGEN))
 
     domicilio = proyecto.proyecto_calle_y_nro or ""
     if proyecto.proyecto_depto_etc:
@@ -8075,37 +7946,55 @@ def descargar_pdf_proyecto(
     if proyecto.estado_general:
         datos.append(f"Estado actual: {proyecto.estado_general}")
 
-    
-    fondo = fitz.Rect(50, 160, 545, 380)
-    portada.draw_rect(fondo, fill=(0.88, 0.93, 0.98))
-    y = 170
-    for linea in datos:
-        portada.insert_textbox(fitz.Rect(60, y, 530, y + 25), linea, fontsize=13, fontname="helv", align=0, color=(0.1, 0.1, 0.1))
-        y += 28
+    nombre_archivo = f"{pretenso_1.nombre}_{pretenso_1.apellido}".replace(" ", "_")
+    if pretenso_2:
+        nombre_archivo += f"_{pretenso_2.nombre}_{pretenso_2.apellido}".replace(" ", "_")
 
-    portada.draw_line(p1=(60, y + 10), p2=(portada.rect.width - 60, y + 10), color=(0.5, 0.5, 0.5), width=0.6)
+    spec = spec_pdf(_nombre_legajo_proyecto(proyecto_id), datos, documentos, separadores = True)
+    return spec, f"proyecto_{nombre_archivo}.pdf"
 
-    for titulo, path in pdf_paths:
-        page = merged.new_page(width=595, height=842)
-        page.insert_textbox(fitz.Rect(0, 280, 595, 320), titulo, fontsize=20, fontname="helv", align=1)
-        icono = "/app/recursos/imagenes/flecha_hacia_abajo.png"
-        if os.path.exists(icono):
-            page.insert_image(fitz.Rect(250, 340, 345, 440), filename=icono)
 
-        with fitz.open(path) as doc:
-            merged.insert_pdf(doc)
 
-    merged.save(output_path)
+@proyectos_router.get("/proyectos/{proyecto_id}/descargar-pdf", response_class=FileResponse,
+    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador", "supervision", "supervisora", "profesional"]))])
+async def descargar_pdf_proyecto(
+    proyecto_id: int,
+    request: Request,
+    db: Session = Depends(get_db)
+    ):
 
-    nombre_archivo = f"{pretenso_1.nombre}_{pretenso_1.apellido}".replace(" ", "_")
-    if pretenso_2:
-        nombre_archivo += f"_{pretenso_2.nombre}_{pretenso_2.apellido}".replace(" ", "_")
+    """
+    📄 Descarga el legajo PDF del proyecto (portada + documentos).
+
+    Si no cambió ningún documento desde el último armado se devuelve el PDF en caché (con ETag).
+    Si hay que armarlo y no termina en unos segundos, responde 202 con el `job_id`: el avance se
+    consulta en `/proyectos/{proyecto_id}/descargar-pdf/jobs/{job_id}` y el archivo en `.../{job_id}/download`.
+    """
+    spec, filename = await run_in_threadpool(_spec_pdf_proyecto, db, proyecto_id)
+    return await responder_dossier(spec, request, filename)
+
+
+
+@proyectos_router.get("/proyectos/{proyecto_id}/descargar-pdf/jobs/{job_id}", response_model=dict,
+    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador", "supervision", "supervisora", "profesional"]))])
+def estado_pdf_proyecto(proyecto_id: int, job_id: str):
+    """
+    ⏳ Avance del armado del legajo PDF del proyecto.
+    """
+    estado = estado_dossier(job_id, _nombre_legajo_proyecto(proyecto_id))
+    if estado is None:
+        raise HTTPException(status_code=404, detail="job no encontrado")
+    return estado
 
-    return FileResponse(
-        path=output_path,
-        filename=f"proyecto_{nombre_archivo}.pdf",
-        media_type="application/pdf"
-    )
+
+
+@proyectos_router.get("/proyectos/{proyecto_id}/descargar-pdf/jobs/{job_id}/download",
+    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador", "supervision", "supervisora", "profesional"]))])
+def descargar_job_pdf_proyecto(proyecto_id: int, job_id: str, request: Request):
+    """
+    📄 Descarga el legajo PDF del proyecto armado por un job.
+    """
+    return descargar_job_dossier(job_id, _nombre_legajo_proyecto(proyecto_id), request)
 
 
 
@@ -8140,8 +8029,7 @@ def subir_informe_vinculacion(
     filepath = os.path.join(proyecto_dir, final_filename)
 
     try:
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        guardar_upload(file, filepath)
 
         proyecto.doc_informe_vinculacion = filepath
 
@@ -8235,8 +8123,7 @@ def subir_informe_seguimiento_guarda(
     filepath = os.path.join(proyecto_dir, final_filename)
 
     try:
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        guardar_upload(file, filepath)
 
         proyecto.doc_informe_seguimiento_guarda = filepath
 
@@ -8733,7 +8620,7 @@ def update_domicilio_de_proyecto(
                     setattr(user, campo_user, data[campo_proy])
 
         # Update DDJJ
-        ddjj = db.query(DDJJ).filter(DDJJ.login == login).first()
+        ddjj = cargar_ddjj(db, login, "domicilio")
         if ddjj:
             if "proyecto_calle_y_nro" in data:
                 ddjj.ddjj_calle = data["proyecto_calle_y_nro"]
@@ -9285,17 +9172,6 @@ def subir_documento_proyecto(
             "tiempo_mensaje": 6, "next_page": "actual"
         }
 
-    # tamaño
-    file.file.seek(0, os.SEEK_END)
-    size = file.file.tell()
-    file.file.seek(0)
-    if size > MAX_FILE_MB * 1024 * 1024:
-        return {
-            "success": False, "tipo_mensaje": "rojo",
-            "mensaje": f"El archivo excede el tamaño máximo permitido de {MAX_FILE_MB}MB.",
-            "tiempo_mensaje": 6, "next_page": "actual"
-        }
-
     carpeta = os.path.join(UPLOAD_DIR_DOC_PROYECTOS, str(proyecto_id))
     _ensure_dir(carpeta)
 
@@ -9305,8 +9181,15 @@ def subir_documento_proyecto(
     destino = os.path.join(carpeta, final_filename)
 
     try:
-        with open(destino, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        guardar_upload(file, destino, max_mb=MAX_FILE_MB)
+    except UploadRechazado as e:
+        return {
+            "success": False, "tipo_mensaje": "rojo",
+            "mensaje": e.mensaje,
+            "tiempo_mensaje": 6, "next_page": "actual"
+        }
+
+    try:
 
         # ---- migrar si es legacy (string) y luego agregar el nuevo ----
         valor_actual = getattr(proyecto, real_field, None)
@@ -9368,21 +9251,8 @@ def descargar_todos_documentos_proyecto(
             raise HTTPException(status_code=404, detail="Archivo no encontrado en disco")
         return FileResponse(path=ruta, filename=os.path.basename(ruta), media_type="application/octet-stream")
 
-    # varios → zip
-    try:
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-        with zipfile.ZipFile(tmp.name, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for a in archivos:
-                ruta = a.get("ruta")
-                if ruta and os.path.exists(ruta):
-                    zipf.write(ruta, arcname=os.path.basename(ruta))
-        return FileResponse(
-            path=tmp.name,
-            filename=f"{real_field}_{proyecto_id}.zip",
-            media_type="application/zip"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al generar el ZIP: {str(e)}")
+    # varios → zip generado al vuelo
+    return respuesta_zip([(a.get("ruta"), None) for a in archivos], f"{real_field}_{proyecto_id}.zip")
 
 
 
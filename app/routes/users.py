@@ -3,11 +3,12 @@ from fastapi import APIRouter, HTTPException, Depends, Query, Request, Body, Upl
 from typing import List, Dict, Optional, Literal, Tuple
 from math import ceil
 from database.config import SessionLocal
-from helpers.utils import check_consecutive_numbers, get_user_name_by_login, \
+from helpers.utils import check_consecutive_numbers, get_user_name_by_login, get_user_names_by_logins, \
     build_subregistro_string, parse_date, calculate_age, validar_correo, generar_codigo_para_link, \
     normalizar_y_validar_dni, capitalizar_nombre, normalizar_celular, verificar_recaptcha, \
     get_notificacion_settings
-from helpers.config_whatsapp import get_whatsapp_settings
+from helpers.whatsapp_cliente import obtener_whatsapp_settings
+from helpers.whatsapp_helper import enviar_whatsapp_rua_notificacion
 
 from helpers.moodle import existe_mail_en_moodle, existe_dni_en_moodle, crear_usuario_en_moodle, get_idcurso, \
     enrolar_usuario, get_idusuario_by_mail, eliminar_usuario_en_moodle, actualizar_usuario_en_moodle, \
@@ -59,16 +60,19 @@ import shutil
 from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 
 from helpers.utils import enviar_mail, get_setting_value, detect_hash_and_verify
+from helpers.mail_queue import PRIORIDAD_MASIVA
+from helpers.jobstore import JOBSTORE_EXPORT_DIR, jobstore_list_jobs
+from services.uploads import guardar_upload, jpeg_de_heic
+from helpers.contadores import obtener_contadores
+from helpers.ddjj_columnas import cargar_ddjj, existe_ddjj
+from helpers.busqueda import buscar
+from services.campanias import CAMPANIA_KIND, lanzar_campania, registrar_tipo_campania, estado_campania
 
 import fitz  # PyMuPDF
 from PIL import Image
-try:
-    import pillow_heif
-    pillow_heif.register_heif_opener()
-    HEIF_ENABLED = True
-except Exception:
-    HEIF_ENABLED = False
 import subprocess
+import uuid
+from itertools import islice
 from pathlib import Path
 
 
@@ -115,22 +119,6 @@ os.makedirs(DIR_PDF_GENERADOS, exist_ok=True)
 users_router = APIRouter()
 
 
-def convert_heic_to_jpg(src_path: str, output_dir: str) -> Optional[str]:
-    if not HEIF_ENABLED:
-        return None
-    try:
-        base = Path(src_path).stem
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        out_path = os.path.join(output_dir, f"{base}_{timestamp}.jpg")
-        img = Image.open(src_path).convert("RGB")
-        img.save(out_path, "JPEG", quality=95)
-        return out_path
-    except Exception:
-        return None
-
-
-
-
 def generar_csv_response(rows: List[Dict], filename: str):
     buffer = StringIO()
     writer = csv.DictWriter(buffer, fieldnames = rows[0].keys())
@@ -150,6 +138,95 @@ def generar_csv_response(rows: List[Dict], filename: str):
 
 
 
+# Prioridad por estado dentro de cada origen (ranking de proyectos de un adoptante)
+ESTADOS_ORDENADOS_RANKING = [
+    'aprobado',
+    'calendarizando',
+    'entrevistando',
+    'para_valorar',
+    'viable',
+    'viable_no_disponible',
+    'en_suspenso',
+    'no_viable',
+    'en_carpeta',
+    'vinculacion',
+    'guarda_provisoria',
+    'guarda_confirmada',
+    'adopcion_definitiva',
+]
+
+
+def _ranking_proyectos_por_login(db: Session, logins: List[str]) -> Dict[str, List[Proyecto]]:
+    """
+    Devuelve { login: [Proyecto, ...] } con los proyectos de cada login ordenados por prioridad:
+      1) origen: rua > oficio > convocatoria
+      2) estado, según ESTADOS_ORDENADOS_RANKING
+      3) SOLO convocatoria: último historial más reciente primero
+      4) proyecto_id como desempate estable
+    Resuelve todos los logins con una única consulta (en lugar de una por usuario) y
+    reparte las filas en Python, conservando el orden global.
+    """
+    logins = [l for l in dict.fromkeys(logins) if l]
+    if not logins:
+        return {}
+
+    orden_origen = case(
+        (Proyecto.ingreso_por == "rua", 0),
+        (Proyecto.ingreso_por == "oficio", 1),
+        (Proyecto.ingreso_por == "convocatoria", 2),
+        else_=3
+    )
+
+    orden_estado = case(
+        *[(Proyecto.estado_general == e, i) for i, e in enumerate(ESTADOS_ORDENADOS_RANKING)],
+        else_=len(ESTADOS_ORDENADOS_RANKING)
+    )
+
+    # Última fecha de historial, solo para los proyectos involucrados
+    hist_max_sq = (
+        db.query(
+            ProyectoHistorialEstado.proyecto_id.label("pid"),
+            func.max(ProyectoHistorialEstado.fecha_hora).label("last_hist")
+        )
+        .join(Proyecto, Proyecto.proyecto_id == ProyectoHistorialEstado.proyecto_id)
+        .filter(
+            Proyecto.ingreso_por == "convocatoria",
+            or_(Proyecto.login_1.in_(logins), Proyecto.login_2.in_(logins))
+        )
+        .group_by(ProyectoHistorialEstado.proyecto_id)
+        .subquery()
+    )
+
+    # Usamos la fecha de historial SOLO para 'convocatoria'; para otros orígenes no influye
+    last_hist_cond = case(
+        (Proyecto.ingreso_por == "convocatoria", hist_max_sq.c.last_hist),
+        else_=None
+    )
+
+    proyectos = (
+        db.query(Proyecto)
+          .outerjoin(hist_max_sq, hist_max_sq.c.pid == Proyecto.proyecto_id)
+          .filter(or_(Proyecto.login_1.in_(logins), Proyecto.login_2.in_(logins)))
+          .order_by(
+              orden_origen.asc(),
+              orden_estado.asc(),
+              last_hist_cond.desc(),
+              Proyecto.proyecto_id.asc()
+          )
+          .all()
+    )
+
+    logins_set = set(logins)
+    proyectos_por_login = {login: [] for login in logins}
+    for proyecto in proyectos:
+        for login in {proyecto.login_1, proyecto.login_2}:
+            if login in logins_set:
+                proyectos_por_login[login].append(proyecto)
+
+    return proyectos_por_login
+
+
+
 @users_router.get("/", response_model=dict, dependencies=[Depends( verify_api_key ), 
                   Depends(require_roles(["administrador", "supervision", "supervisora", "profesional", "coordinadora"]))])
 def get_users(
@@ -528,23 +605,27 @@ def get_users(
 
     
         if search and len(search.strip()) >= 3:
-            palabras = search.lower().split()  # divide en palabras
-            condiciones_por_palabra = []
+            encontrados = buscar("usuarios", search)
+            if encontrados is not None:
+                query = query.filter(User.login.in_(encontrados))
+            else:
+                palabras = search.lower().split()  # divide en palabras
+                condiciones_por_palabra = []
 
-            for palabra in palabras:
-                condiciones_por_palabra.append(
-                    or_(
-                        func.lower(func.concat(User.nombre, " ", User.apellido)).ilike(f"%{palabra}%"),
-                        User.login.ilike(f"%{palabra}%"),
-                        User.mail.ilike(f"%{palabra}%"),
-                        User.calle_y_nro.ilike(f"%{palabra}%"),
-                        User.barrio.ilike(f"%{palabra}%"),
-                        User.localidad.ilike(f"%{palabra}%")
+                for palabra in palabras:
+                    condiciones_por_palabra.append(
+                        or_(
+                            func.lower(func.concat(User.nombre, " ", User.apellido)).ilike(f"%{palabra}%"),
+                            User.login.ilike(f"%{palabra}%"),
+                            User.mail.ilike(f"%{palabra}%"),
+                            User.calle_y_nro.ilike(f"%{palabra}%"),
+                            User.barrio.ilike(f"%{palabra}%"),
+                            User.localidad.ilike(f"%{palabra}%")
+                        )
                     )
-                )
 
-            # Todas las palabras deben coincidir en algún campo (AND entre ORs)
-            query = query.filter(and_(*condiciones_por_palabra))
+                # Todas las palabras deben coincidir en algún campo (AND entre ORs)
+                query = query.filter(and_(*condiciones_por_palabra))
 
         # Para evitar duplicados, para que un usuario que tiene varios proyectos, aparezca una sola vez
         query = query.distinct(User.login)
@@ -642,6 +723,37 @@ def get_users(
         }
 
 
+        # ----- Etapa de ranking de proyectos por lotes (solo Adoptantes) -----
+        # Una única consulta trae, ya ordenados, todos los proyectos de los adoptantes de la página.
+        # Luego se arman las listas por login en Python, conservando el orden global.
+        logins_adoptantes = [u.login for u in users if (u.group or "").lower() == "adoptante"]
+        proyectos_por_login = _ranking_proyectos_por_login(db, logins_adoptantes)
+
+        # Fecha de solicitud de revisión para los usuarios en pedido_revision (una sola consulta agrupada)
+        logins_pedido_revision = [u.login for u in users if u.doc_adoptante_estado == "pedido_revision"]
+        fechas_pedido_revision = {}
+        if logins_pedido_revision:
+            fechas_pedido_revision = dict(
+                db.query(RuaEvento.login, func.max(RuaEvento.evento_fecha))
+                .filter(
+                    RuaEvento.login.in_(logins_pedido_revision),
+                    or_(
+                        RuaEvento.evento_detalle.ilike("%solicitó la revisión de su documentación perso%"),
+                        RuaEvento.evento_detalle.ilike("%Solicitud para la revisión de documentación personal%")
+                    )
+                )
+                .group_by(RuaEvento.login)
+                .all()
+            )
+
+        # Nombres de los integrantes de los proyectos (una sola consulta IN)
+        logins_integrantes = set()
+        for proyectos_login in proyectos_por_login.values():
+            for proyecto in proyectos_login:
+                logins_integrantes.update([proyecto.login_1, proyecto.login_2])
+        nombres_por_login = get_user_names_by_logins(db, logins_integrantes)
+
+
         users_list = []
 
         for user in users:
@@ -652,65 +764,7 @@ def get_users(
             es_adoptante = (user.group or "").lower() == "adoptante"
 
             if es_adoptante:
-                # Prioridad por origen
-                orden_origen = case(
-                    (Proyecto.ingreso_por == "rua", 0),
-                    (Proyecto.ingreso_por == "oficio", 1),
-                    (Proyecto.ingreso_por == "convocatoria", 2),
-                    else_=3
-                )
-    
-                # Prioridad por estado dentro de cada origen
-                estados_ordenados = [
-                    'aprobado',
-                    'calendarizando',
-                    'entrevistando',
-                    'para_valorar',
-                    'viable',
-                    'viable_no_disponible',
-                    'en_suspenso',
-                    'no_viable',
-                    'en_carpeta',
-                    'vinculacion',
-                    'guarda_provisoria',
-                    'guarda_confirmada',
-                    'adopcion_definitiva',
-                ]
-
-                # CASE para ranking de estado
-                orden_estado = case(
-                    *[(Proyecto.estado_general == e, i) for i, e in enumerate(estados_ordenados)],
-                    else_=len(estados_ordenados)
-                )
-
-                # Subquery: última fecha de historial por proyecto
-                hist_max_sq = (
-                    db.query(
-                        ProyectoHistorialEstado.proyecto_id.label("pid"),
-                        func.max(ProyectoHistorialEstado.fecha_hora).label("last_hist")
-                    )
-                    .group_by(ProyectoHistorialEstado.proyecto_id)
-                    .subquery()
-                )
-
-                # Usamos la fecha de historial SOLO para 'convocatoria'; para otros orígenes no influye
-                last_hist_cond = case(
-                    (Proyecto.ingreso_por == "convocatoria", hist_max_sq.c.last_hist),
-                    else_=None
-                )
-
-                proyectos_rows = (
-                    db.query(Proyecto.proyecto_id, Proyecto.ingreso_por, Proyecto.estado_general)
-                      .outerjoin(hist_max_sq, hist_max_sq.c.pid == Proyecto.proyecto_id)
-                      .filter(or_(Proyecto.login_1 == user.login, Proyecto.login_2 == user.login))
-                      .order_by(
-                          orden_origen.asc(),          # 1) origen: rua > oficio > convocatoria
-                          orden_estado.asc(),          # 2) estado, según el orden pedido
-                          last_hist_cond.desc(),       # 3) SOLO convocatoria: último historial más reciente primero
-                          Proyecto.proyecto_id.asc()   # 4) desempate estable
-                      )
-                      .all()
-                )
+                proyectos_rows = proyectos_por_login.get(user.login, [])
                 if doc_ddjj_firmada == "Y":
                     proyectos_rows = [
                         row for row in proyectos_rows
@@ -779,12 +833,8 @@ def get_users(
 
 
             if proyecto_id_primario is not None:
-                # Traer el proyecto primario
-                proyecto_prim = (
-                    db.query(Proyecto)
-                      .filter(Proyecto.proyecto_id == proyecto_id_primario)
-                      .first()
-                )
+                # El proyecto primario es el primero del ranking (ya viene hidratado)
+                proyecto_prim = proyectos_rows[0]
 
                 if proyecto_prim:
                     prim_tipo = proyecto_prim.proyecto_tipo if proyecto_prim.proyecto_tipo in valid_proyecto_tipos else ""
@@ -811,22 +861,9 @@ def get_users(
             # ----------------------------------------------------------
             fecha_doc_adoptante_estado = None
 
-            if user.doc_adoptante_estado == "pedido_revision":
-                evento_match = (
-                    db.query(RuaEvento.evento_fecha)
-                    .filter(
-                        RuaEvento.login == user.login,
-                        or_(
-                            RuaEvento.evento_detalle.ilike("%solicitó la revisión de su documentación perso%"),
-                            RuaEvento.evento_detalle.ilike("%Solicitud para la revisión de documentación personal%")
-                        )
-                    )
-                    .order_by(RuaEvento.evento_fecha.desc())  # por si hay más de una revisión
-                    .first()
-                )
-
-                if evento_match and evento_match.evento_fecha:
-                    fecha_doc_adoptante_estado = evento_match.evento_fecha.strftime("%Y-%m-%d")
+            fecha_pedido_revision = fechas_pedido_revision.get(user.login)
+            if fecha_pedido_revision:
+                fecha_doc_adoptante_estado = fecha_pedido_revision.strftime("%Y-%m-%d")
 
 
 
@@ -888,8 +925,8 @@ def get_users(
                 "nro_orden_rua": prim_nro_orden,
                 "ingreso_por": prim_ingreso_por,
                 "proyecto_operativo": prim_operativo,
-                "login_1_info": get_user_name_by_login(db, prim_login_1) if prim_login_1 else "",
-                "login_2_info": get_user_name_by_login(db, prim_login_2) if prim_login_2 else "",
+                "login_1_info": nombres_por_login.get(prim_login_1, "") if prim_login_1 else "",
+                "login_2_info": nombres_por_login.get(prim_login_2, "") if prim_login_2 else "",
                 "fecha_asignacion_nro_orden": prim_fecha_asign_nro_orden,
                 "ultimo_cambio_de_estado": prim_ultimo_cambio,
                 "subregistro_string": prim_subregistro_string,
@@ -925,6 +962,21 @@ def get_users(
 
 
 
+@users_router.get("/contadores", response_model=dict,
+    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador", "supervision", "supervisora", "profesional", "coordinadora"]))])
+def get_contadores_pendientes(db: Session = Depends(get_db)):
+    """
+    🔢 Contadores de trabajo pendiente del backoffice (documentación en revisión, proyectos en
+    revisión, en entrevistas y en valoración).
+
+    Salen de una caché que se invalida con cada cambio de estado, así que se puede consultar
+    seguido (polling) sin costo.
+    """
+    return {"success": True, "contadores": obtener_contadores(db)}
+
+
+
+
 @users_router.get("/{login}", response_model=dict, dependencies=[Depends(verify_api_key)])
 def get_user_by_login(
     login: str,
@@ -1103,18 +1155,21 @@ def get_user_by_login(
 
         doc_ddjj_firmada = (user.doc_adoptante_ddjj_firmada or "N").strip().upper()
 
-        # Instancia DDJJ (para checks)
-        ddjj = db.query(DDJJ).filter(DDJJ.login == user.login).first()
+        # Instancia DDJJ (para checks): solo las columnas que miran los checks
+        ddjj = cargar_ddjj(db, user.login, "identidad", campos = [
+            *[f"ddjj_hijo{i}_nombre_completo" for i in range(1, 6)],
+            *[f"ddjj_otro{i}_nombre_completo" for i in range(1, 6)],
+            *[f"ddjj_apoyo{i}_nombre_completo" for i in range(1, 3)],
+            "ddjj_ocupacion", "ddjj_horas_semanales", "ddjj_ingreso_mensual",
+            "ddjj_causa_penal", "ddjj_juicios_filiacion", "ddjj_denunciado_violencia_familiar",
+            "ddjj_guardo_1", "ddjj_guardo_2",
+            *SUBREG_CAMPOS,
+        ])
 
         # Métricas/pendientes para supervisión
         pendientes = {}
         if user.group in ['supervisora', 'supervision']:
-            pendientes = {
-                "doc_adoptante": db.query(User).filter(User.doc_adoptante_estado == "pedido_revision").count(),
-                "doc_proyecto": db.query(Proyecto).filter(Proyecto.estado_general == "en_revision").count(),
-                "proyectos_en_entrevistas": db.query(Proyecto).filter(Proyecto.estado_general.in_(["calendarizando", "entrevistando"])).count(),
-                "proyectos_en_valoracion": db.query(Proyecto).filter(Proyecto.estado_general == "en_valoracion").count(),
-            }
+            pendientes = obtener_contadores(db)
 
         # Checks de secciones DDJJ
         ddjj_checks = {
@@ -1866,7 +1921,7 @@ def delete_user(login: str, db: Session = Depends(get_db)):
 
     try:
         # 🔹 Intentar eliminar DDJJ
-        ddjj = db.query(DDJJ).filter(DDJJ.login == login).first()
+        ddjj = cargar_ddjj(db, login)
         if ddjj:
             db.delete(ddjj)
             resumen["ddjj_eliminada"] = True
@@ -2066,17 +2121,6 @@ def update_user_document_by_login(
     if ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail=f"Extensión de archivo no permitida: {ext}")
 
-    # ——— Validación de tamaño (5 MB) ———
-    file.file.seek(0, os.SEEK_END)   # Ir al final del archivo
-    size = file.file.tell()          # Obtener posición (bytes)
-    if size > 5 * 1024 * 1024:
-        raise HTTPException(
-            status_code=400,
-            detail="El archivo excede el tamaño máximo permitido (5 MB)."
-        )
-    file.file.seek(0)  # Volver al inicio para la lectura
-    
-
     usuario = db.query(User).filter(User.login == login).first()
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -2103,10 +2147,10 @@ def update_user_document_by_login(
     final_filename = f"{nombre_archivo}_{timestamp}{ext}"
     filepath = os.path.join(user_dir, final_filename)
 
-    try:
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+    # Máximo 5 MB; si no cumple sale con 400
+    guardar_upload(file, filepath, max_mb=5)
 
+    try:
         # Actualizar ruta en la base de datos
         setattr(usuario, campo, filepath)
         db.commit()
@@ -2333,11 +2377,11 @@ def descargar_documento_usuario(
 
     ext = os.path.splitext(filepath)[1].lower()
     if ext in [".heic", ".heif"]:
-        converted = convert_heic_to_jpg(filepath, DIR_PDF_GENERADOS)
+        converted = jpeg_de_heic(filepath)
         if converted:
             return FileResponse(
                 path=converted,
-                filename=os.path.basename(converted),
+                filename=os.path.splitext(os.path.basename(filepath))[0] + ".jpg",
                 media_type="image/jpeg"
             )
 
@@ -3742,7 +3786,7 @@ def get_estado_usuario(
     )
     group_name = group[0] if group else "Sin grupo asignado"
 
-    ddjj = db.query(DDJJ).filter(DDJJ.login == login).first()
+    ddjj = existe_ddjj(db, login)
 
 
     # proyecto = db.query(Proyecto).filter(
@@ -4461,7 +4505,7 @@ def notificar_pretenso_mensaje(
         canales = get_notificacion_settings(db, base_setting)
         enviar_email_flag = canales.get("email", False)
         enviar_whatsapp_flag = canales.get("whatsapp", False)
-        whatsapp_settings = get_whatsapp_settings(db) if enviar_whatsapp_flag else None
+        whatsapp_settings = obtener_whatsapp_settings(db) if enviar_whatsapp_flag else None
 
 
         # Extraer texto plano del mensaje HTML para guardar en base
@@ -5247,7 +5291,7 @@ def descargar_documentos_usuario(
                 if ruta and os.path.exists(ruta):
                     ext = os.path.splitext(ruta)[1].lower()
                     if ext in [".heic", ".heif"]:
-                        converted = convert_heic_to_jpg(ruta, DIR_PDF_GENERADOS)
+                        converted = jpeg_de_heic(ruta)
                         if converted:
                             ruta = converted
                             ext = ".jpg"
@@ -5449,127 +5493,182 @@ def descargar_documentos_usuario(
 
 
 
-def procesar_envio_masivo(lineas: List[str]):
-    # Procesa el envío masivo de mails para reconfirmar flexibilidad adoptiva
-    # Se usa en el endpoint /usuarios/notificar-desde-txt
-    db = SessionLocal()
-    try:
-        resultados = {"total": 0, "mails_enviados": 0, "errores": []}
+def armar_link_base(db: Session, endpoint: str) -> str:
+    """URL pública del front (protocolo, host y puerto de la configuración) seguida de `endpoint`."""
+    protocolo = get_setting_value(db, "protocolo") or "https"
+    host = get_setting_value(db, "donde_esta_alojado") or "osmvision.com.ar"
+    puerto = get_setting_value(db, "puerto_tcp")
+
+    puerto_predeterminado = (protocolo == "http" and puerto == "80") or (protocolo == "https" and puerto == "443")
+    host_con_puerto = f"{host}:{puerto}" if puerto and not puerto_predeterminado else host
+
+    return f"{protocolo}://{host_con_puerto}{endpoint}"
+
+
+def guardar_archivo_campania(contenido: str, extension: str) -> str:
+    """Guarda el archivo de entrada de una campaña en EXPORT_DIR (se purga junto con su job)."""
+    path = os.path.join(JOBSTORE_EXPORT_DIR, f"campania_{uuid.uuid4().hex}.{extension}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    return path
+
+
+def registrar_envios_en_log(log_name: str, envios: List[Tuple[str, str]]) -> None:
+    if not envios:
+        return
+    os.makedirs(UPLOAD_DIR_DOC_PRETENSOS, exist_ok=True)
+    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with open(os.path.join(UPLOAD_DIR_DOC_PRETENSOS, log_name), "a", encoding="utf-8") as log_file:
+        for login, mail in envios:
+            log_file.write(f"[{ahora}] Enviado a {login} ({mail})\n")
+
+
+
+ASUNTO_FLEXIBILIDAD_ADOPTIVA = "Confirmación sobre flexibilidad adoptiva - RUA"
+
+
+def plantilla_flexibilidad_adoptiva() -> str:
+    """Cuerpo HTML del pedido de reconfirmación de flexibilidad adoptiva, con el marcador {link}."""
+    return f"""
+    <html>
+      <body style="margin: 0; padding: 0; background-color: #f8f9fa;">
+        <table cellpadding="0" cellspacing="0" width="100%" style="background-color: #f8f9fa; padding: 20px;">
+          <tr>
+            <td align="center">
+              <table cellpadding="0" cellspacing="0" width="600" style="background-color: #ffffff; border-radius: 10px; padding: 30px; font-family: Arial, sans-serif; color: #333333; box-shadow: 0 0 10px rgba(0,0,0,0.05);">
+                <tr>
+                  <td style="font-size: 18px; padding-bottom: 20px;">
+                    ¡Hola! nos comunicamos desde el <strong>Registro Único de Adopciones de Córdoba</strong>.
+                  </td>
+                </tr>
+                <tr>
+                  <td style="font-size: 16px; padding-bottom: 10px; line-height: 1.6;">
+                    Te contactamos porque tenemos registrado que al momento de completar el formulario de inscripción señalaste, además de tu preferencia en las condiciones de niñas, niños y adolescentes que consideraste que podrías adoptar, la opción de <strong>“flexibilidad adoptiva”</strong> en relación a otras condiciones de niñas, niños y adolescentes que están esperando una familia.
+                  </td>
+                </tr>
+                <tr>
+                  <td style="font-size: 16px; padding: 10px 0;">
+                    Es por eso que en esta oportunidad te pedimos que nos especifiques tu elección de flexibilidad haciendo clic en el siguiente botón:
+                  </td>
+                </tr>
+                <tr>
+                  <td align="center" style="padding: 20px 0;">
+                    <a href="{{link}}"
+                        style="display: inline-block; padding: 12px 24px; font-size: 16px;
+                              color: #ffffff; background-color: #0d6efd; text-decoration: none;
+                              border-radius: 6px; font-weight: bold;"
+                        target="_blank">
+                      Ir al formulario
+                    </a>
+                  </td>
+                </tr>
+                <tr>
+                  <td style="font-size: 16px; padding-top: 10px;">
+                    ¡Muchas gracias por continuar formando parte del Registro Único de Adopciones de Córdoba!
+                  </td>
+                </tr>
+              </table>
+            </td>
+          </tr>
+        </table>
+      </body>
+    </html>
+    """
 
-        try:
-            protocolo = get_setting_value(db, "protocolo") or "https"
-            host = get_setting_value(db, "donde_esta_alojado") or "osmvision.com.ar"
-            puerto = get_setting_value(db, "puerto_tcp")
-            endpoint = "/reconfirmar-subregistros"
 
-            puerto_predeterminado = (protocolo == "http" and puerto == "80") or (protocolo == "https" and puerto == "443")
-            host_con_puerto = f"{host}:{puerto}" if puerto and not puerto_predeterminado else host
+def procesar_tramo_envio_txt(job: dict, cantidad: int) -> dict:
+    # Procesa un tramo del envío masivo de mails para reconfirmar flexibilidad adoptiva
+    # Se usa en el endpoint /usuarios/notificar-desde-txt
+    # Cada tramo retoma el archivo desde el offset en que terminó el anterior (sin releerlo)
+    cursor = job.get("cursor") or 0
+    with open(job["file_path"], "r", encoding="utf-8") as f:
+        if job.get("offset") is not None:
+            f.seek(job["offset"])
+        else:
+            for _ in range(cursor):
+                f.readline()
+        tramo = []
+        while len(tramo) < cantidad:
+            linea = f.readline()
+            if not linea:
+                break
+            tramo.append(linea.rstrip("\n"))
+        offset = f.tell()
+        fin = not f.readline()
+
+    resultado = {
+        "procesados": len(tramo),
+        "enviados": 0,
+        "errores": [],
+        "cursor": cursor + len(tramo),
+        "offset": offset,
+        "fin": fin,
+    }
 
-            os.makedirs(UPLOAD_DIR_DOC_PRETENSOS, exist_ok=True)
-            log_path = os.path.join(UPLOAD_DIR_DOC_PRETENSOS, "envios_exitosos.txt")
-        except Exception as e:
-            print(f"[ERROR GLOBAL] Fallo en configuración inicial: {e}")
-            return  # cortás aquí si no podés ni siquiera armar el entorno
+    validas = []
+    for idx, linea in enumerate(tramo, start=cursor + 1):
+        partes = linea.split("::")
 
-        for idx, linea in enumerate(lineas, start=1):
-            resultados["total"] += 1
-            partes = linea.split("::")
+        if len(partes) != 4:
+            resultado["errores"].append(f"Línea {idx}: formato inválido")
+            continue
 
-            if len(partes) != 4:
-                resultados["errores"].append(f"Línea {idx}: formato inválido")
-                continue
+        login, nombre, apellido, mail = [p.strip() for p in partes]
 
-            login, nombre, apellido, mail = [p.strip() for p in partes]
+        if not (login and nombre and apellido and mail):
+            resultado["errores"].append(f"Línea {idx}: campos vacíos")
+            continue
 
-            if not (login and nombre and apellido and mail):
-                resultados["errores"].append(f"Línea {idx}: campos vacíos")
-                continue
+        validas.append((login, mail))
 
-            ddjj = db.query(DDJJ).filter(DDJJ.login == login).first()
-            if not ddjj:
-                resultados["errores"].append(f"{login}: no tiene DDJJ registrada")
-                continue
+    if not validas:
+        return resultado
 
-            try:
-                login_base64 = base64.b64encode(login.encode()).decode()
-                link_final = f"{protocolo}://{host_con_puerto}{endpoint}?user={login_base64}"
+    db = SessionLocal()
+    try:
+        con_ddjj = {
+            login for (login,) in
+            db.query(DDJJ.login).filter(DDJJ.login.in_({login for login, _ in validas})).all()
+        }
+    finally:
+        db.close()
 
-                asunto = "Confirmación sobre flexibilidad adoptiva - RUA"
-                cuerpo_html = f"""
-                <html>
-                  <body style="margin: 0; padding: 0; background-color: #f8f9fa;">
-                    <table cellpadding="0" cellspacing="0" width="100%" style="background-color: #f8f9fa; padding: 20px;">
-                      <tr>
-                        <td align="center">
-                          <table cellpadding="0" cellspacing="0" width="600" style="background-color: #ffffff; border-radius: 10px; padding: 30px; font-family: Arial, sans-serif; color: #333333; box-shadow: 0 0 10px rgba(0,0,0,0.05);">
-                            <tr>
-                              <td style="font-size: 18px; padding-bottom: 20px;">
-                                ¡Hola! nos comunicamos desde el <strong>Registro Único de Adopciones de Córdoba</strong>.
-                              </td>
-                            </tr>
-                            <tr>
-                              <td style="font-size: 16px; padding-bottom: 10px; line-height: 1.6;">
-                                Te contactamos porque tenemos registrado que al momento de completar el formulario de inscripción señalaste, además de tu preferencia en las condiciones de niñas, niños y adolescentes que consideraste que podrías adoptar, la opción de <strong>“flexibilidad adoptiva”</strong> en relación a otras condiciones de niñas, niños y adolescentes que están esperando una familia.
-                              </td>
-                            </tr>
-                            <tr>
-                              <td style="font-size: 16px; padding: 10px 0;">
-                                Es por eso que en esta oportunidad te pedimos que nos especifiques tu elección de flexibilidad haciendo clic en el siguiente botón:
-                              </td>
-                            </tr>
-                            <tr>
-                              <td align="center" style="padding: 20px 0;">
-                                <a href="{link_final}"
-                                    style="display: inline-block; padding: 12px 24px; font-size: 16px;
-                                          color: #ffffff; background-color: #0d6efd; text-decoration: none;
-                                          border-radius: 6px; font-weight: bold;"
-                                    target="_blank">
-                                  Ir al formulario
-                                </a>
-                              </td>
-                            </tr>
-                            <tr>
-                              <td style="font-size: 16px; padding-top: 10px;">
-                                ¡Muchas gracias por continuar formando parte del Registro Único de Adopciones de Córdoba!
-                              </td>
-                            </tr>
-                          </table>
-                        </td>
-                      </tr>
-                    </table>
-                  </body>
-                </html>
-                """
+    link_base = job["meta"]["link_base"]
+    enviados = []
 
+    for login, mail in validas:
+        if login not in con_ddjj:
+            resultado["errores"].append(f"{login}: no tiene DDJJ registrada")
+            continue
 
-                enviar_mail(destinatario=mail, asunto=asunto, cuerpo=cuerpo_html)
-                resultados["mails_enviados"] += 1
+        try:
+            login_base64 = base64.b64encode(login.encode()).decode()
+            cuerpo_html = plantilla_flexibilidad_adoptiva().replace("{link}", f"{link_base}?user={login_base64}")
 
-                with open(log_path, "a", encoding="utf-8") as log_file:
-                    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    log_file.write(f"[{ahora}] Enviado a {login} ({mail})\n")
+            enviar_mail(destinatario=mail, asunto=ASUNTO_FLEXIBILIDAD_ADOPTIVA, cuerpo=cuerpo_html,
+                        origen=job["id"], prioridad=PRIORIDAD_MASIVA)
+            resultado["enviados"] += 1
+            enviados.append((login, mail))
 
-                time.sleep(5)
+        except Exception as e:
+            resultado["errores"].append(f"{login} ({mail}): {e}")
 
-            except Exception as e:
-                resultados["errores"].append(f"{login} ({mail}): {e}")
+    registrar_envios_en_log("envios_exitosos.txt", enviados)
+    return resultado
 
-    except Exception as fatal:
-        print(f"[ERROR FATAL] {fatal}")
 
-    finally:
-        db.close()
+registrar_tipo_campania("flexibilidad_txt", procesar_tramo_envio_txt)
 
 
 
 @users_router.post( "/usuarios/notificar-desde-txt", response_model=dict, 
                    dependencies=[ Depends(verify_api_key), Depends(require_roles(["administrador"])) ], )
 async def notificar_desde_txt(
-    background_tasks: BackgroundTasks,  # 👈 primero los que no tienen valor por defecto
     archivo: UploadFile = File(...),
+    db: Session = Depends(get_db),
     ):
     # Endpoint para notificar usuarios desde un archivo .txt para 
-    # la flexibilidad adoptiva. Usa la función procesar_envio_masivo en segundo plano.
+    # la flexibilidad adoptiva. Lanza una campaña (services/campanias.py) que avanza en segundo plano.
 
     if not archivo.filename.lower().endswith(".txt"):
         raise HTTPException(status_code=400, detail="El archivo debe tener extensión .txt")
@@ -5580,21 +5679,84 @@ async def notificar_desde_txt(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al leer el archivo: {e}")
 
-    # Agregamos la tarea en segundo plano
-    background_tasks.add_task(procesar_envio_masivo, lineas)
+    try:
+        job = lanzar_campania(
+            "flexibilidad_txt",
+            archivo = guardar_archivo_campania("\n".join(lineas), "txt"),
+            link_base = armar_link_base(db, "/reconfirmar-subregistros"),
+            total = len(lineas),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al iniciar el envío: {e}")
 
     return {
         "tipo_mensaje": "verde",
         "mensaje": f"Se está procesando el envío de {len(lineas)} correos en segundo plano.",
-        "errores": []
+        "errores": [],
+        "job_id": job["id"],
     }
 
 
 
-def procesar_envio_masivo_postulantes_desde_csv(contenido_csv: str):
-    print("[TAREA] Comenzando procesamiento del CSV...")
+ASUNTO_DISPONIBILIDAD_POSTULANTES = "Consulta por disponibilidad adoptiva"
+
+
+def plantilla_disponibilidad_postulantes() -> str:
+    """Cuerpo HTML de la consulta de disponibilidad a postulantes de convocatorias, con el marcador {link}."""
+    return f"""
+    <html>
+      <body style="margin: 0; padding: 0; background-color: #f8f9fa;">
+        <table cellpadding="0" cellspacing="0" width="100%" style="background-color: #f8f9fa; padding: 20px;">
+          <tr>
+            <td align="center">
+              <table cellpadding="0" cellspacing="0" width="600" style="background-color: #ffffff; border-radius: 10px; padding: 30px; font-family: Arial, sans-serif; color: #333333; box-shadow: 0 0 10px rgba(0,0,0,0.05);">
+                <tr>
+                  <td style="font-size: 18px; padding-bottom: 20px;">
+                    ¡Hola! Nos comunicamos desde el <strong>Registro Único de Adopciones de Córdoba</strong>.
+                  </td>
+                </tr>
+                <tr>
+                  <td style="font-size: 16px; padding-bottom: 10px; line-height: 1.6;">
+                    Como ya te anotaste en una convocatoria pública de adopción, nos interesa saber si querés que te contactemos
+                    para informarte de las próximas búsquedas de familias para niñas, niños y adolescentes que esperan ser adoptados.
+                    <br /><br />
+                    Si estás de acuerdo, nos gustaría que nos especifiques en qué tipo de futuros llamados estarías interesada/o.
+                  </td>
+                </tr>
+                <tr>
+                  <td style="font-size: 16px; padding: 10px 0;">
+                    Te invitamos a completar el siguiente formulario:
+                  </td>
+                </tr>
+                <tr>
+                  <td align="center" style="padding: 20px 0;">
+                    <a href="{{link}}"
+                        style="display: inline-block; padding: 12px 24px; font-size: 16px;
+                              color: #ffffff; background-color: #0d6efd; text-decoration: none;
+                              border-radius: 6px; font-weight: bold;"
+                        target="_blank">
+                      Ir al formulario
+                    </a>
+                  </td>
+                </tr>
+                <tr>
+                  <td style="font-size: 16px; padding-top: 10px;">
+                    ¡Muchas gracias!
+                  </td>
+                </tr>
+              </table>
+            </td>
+          </tr>
+        </table>
+      </body>
+    </html>
+    """
+
+
+def procesar_tramo_postulantes_csv(job: dict, cantidad: int) -> dict:
+    # Procesa un tramo del CSV de postulantes: da de alta usuario y DDJJ si faltan y
+    # envía la consulta por disponibilidad adoptiva. Se usa en /usuarios/notificar-desde-csv-postulantes
 
-    
     def maybe_none(val: Optional[str]) -> Optional[str]:
         v = (val or "").strip()
         return None if v == "" or v.upper() == "NULL" else v
@@ -5610,27 +5772,45 @@ def procesar_envio_masivo_postulantes_desde_csv(contenido_csv: str):
                 pass
         return None
 
-    lector_csv = csv.DictReader(io.StringIO(contenido_csv), delimiter=';', quoting=csv.QUOTE_MINIMAL)
+    # Cada tramo retoma el archivo desde el offset en que terminó el anterior (sin releerlo); el
+    # lector pide las líneas con readline para que tell() siga valiendo
+    cursor = job.get("cursor") or 0
+    with open(job["file_path"], "r", encoding="utf-8", newline="") as f:
+        lineas = iter(f.readline, "")
+        if job.get("offset") is not None:
+            f.seek(job["offset"])
+            lector_csv = csv.DictReader(lineas, fieldnames=job["columnas"], delimiter=';', quoting=csv.QUOTE_MINIMAL)
+        else:
+            lector_csv = csv.DictReader(lineas, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+            for _ in islice(lector_csv, cursor):
+                pass
+        filas = list(islice(lector_csv, cantidad))
+        offset = f.tell()
+
+    resultado = {
+        "procesados": len(filas),
+        "enviados": 0,
+        "errores": [],
+        "cursor": cursor + len(filas),
+        "offset": offset,
+        "columnas": lector_csv.fieldnames,
+        "fin": len(filas) < cantidad,
+    }
+    if not filas:
+        return resultado
+
+    link_base = job["meta"]["link_base"]
+    enviados = []
 
     db: Session = SessionLocal()
     try:
-        resultados = {"total": 0, "mails_enviados": 0, "errores": []}
-
-        protocolo = get_setting_value(db, "protocolo") or "https"
-        host = get_setting_value(db, "donde_esta_alojado") or "osmvision.com.ar"
-        puerto = get_setting_value(db, "puerto_tcp")
-        endpoint = "/reconfirmar-subregistros-postulantes"
-        puerto_predeterminado = (protocolo == "http" and puerto == "80") or (protocolo == "https" and puerto == "443")
-        host_con_puerto = f"{host}:{puerto}" if puerto and not puerto_predeterminado else host
-
-        os.makedirs(UPLOAD_DIR_DOC_PRETENSOS, exist_ok=True)
-        log_path = os.path.join(UPLOAD_DIR_DOC_PRETENSOS, "envios_exitosos_postulantes.txt")
-        print(f"[TAREA] UPLOAD_DIR_DOC_PRETENSOS = {UPLOAD_DIR_DOC_PRETENSOS}")
-
-        for idx, fila in enumerate(lector_csv, start=2):  # línea 2 = primera data
-            print(f"[TAREA] Procesando línea {idx}...")
-            resultados["total"] += 1
+        # Existencias del tramo completo en dos consultas (en lugar de dos por fila)
+        logins = {maybe_none(fila.get("login")) for fila in filas} - {None}
+        users_existentes = {l for (l,) in db.query(User.login).filter(User.login.in_(logins)).all()} if logins else set()
+        ddjj_existentes = {l for (l,) in db.query(DDJJ.login).filter(DDJJ.login.in_(logins)).all()} if logins else set()
+        grupo = db.query(Group).filter(Group.description.ilike("%adoptante%")).first()
 
+        for idx, fila in enumerate(filas, start=cursor + 2):  # línea 2 = primera data
             try:
                 # === lecturas, normalización y NULLs ===
                 login   = maybe_none(fila.get("login"))
@@ -5653,18 +5833,22 @@ def procesar_envio_masivo_postulantes_desde_csv(contenido_csv: str):
 
                 # Validación mínima
                 if not (login and nombre and apellido and mail):
-                    resultados["errores"].append(f"Línea {idx}: campos obligatorios vacíos (login/nombre/apellido/mail)")
+                    resultado["errores"].append(f"Línea {idx}: campos obligatorios vacíos (login/nombre/apellido/mail)")
                     continue
 
-                user_existente = db.query(User).filter(User.login == login).first()
-                ddjj_existente = db.query(DDJJ).filter(DDJJ.login == login).first()
+                user_existente = login in users_existentes
+                ddjj_existente = login in ddjj_existentes
 
                 if user_existente and ddjj_existente:
                     print(f"[TAREA] Usuario y DDJJ ya existen para {login}.")
                     continue
 
                 if not user_existente:
-                    user = User(
+                    if not grupo:
+                        resultado["errores"].append(f"Línea {idx}: No se encontró el grupo 'Adoptante'")
+                        continue
+
+                    db.add(User(
                         login=login,
                         nombre=nombre,
                         apellido=apellido,
@@ -5679,19 +5863,11 @@ def procesar_envio_masivo_postulantes_desde_csv(contenido_csv: str):
                         profesion=ocupacion,
                         fecha_alta=datetime.now().date(),
                         active="Y",
-                    )
-                    db.add(user)
-
-                    grupo = db.query(Group).filter(Group.description.ilike("%adoptante%")).first()
-                    if grupo:
-                        db.add(UserGroup(login=login, group_id=grupo.group_id))
-                    else:
-                        resultados["errores"].append(f"Línea {idx}: No se encontró el grupo 'Adoptante'")
-                        db.rollback()
-                        continue
+                    ))
+                    db.add(UserGroup(login=login, group_id=grupo.group_id))
 
                 if not ddjj_existente:
-                    ddjj = DDJJ(
+                    db.add(DDJJ(
                         login=login,
                         ddjj_nombre=nombre,
                         ddjj_apellido=apellido,
@@ -5709,98 +5885,44 @@ def procesar_envio_masivo_postulantes_desde_csv(contenido_csv: str):
                         ddjj_sexo=sexo,
                         ddjj_ocupacion=ocupacion,
                         ddjj_fecha_ultimo_cambio=datetime.now().strftime("%Y-%m-%d"),
-                    )
-                    db.add(ddjj)
+                    ))
 
                 db.commit()
+                users_existentes.add(login)
+                ddjj_existentes.add(login)
 
                 if not ddjj_existente:
                     login_base64 = base64.b64encode(login.encode()).decode()
-                    link_final = f"{protocolo}://{host_con_puerto}{endpoint}?user={login_base64}"
-                    asunto = "Consulta por disponibilidad adoptiva"
-
-                    cuerpo_html = f"""
-                    <html>
-                      <body style="margin: 0; padding: 0; background-color: #f8f9fa;">
-                        <table cellpadding="0" cellspacing="0" width="100%" style="background-color: #f8f9fa; padding: 20px;">
-                          <tr>
-                            <td align="center">
-                              <table cellpadding="0" cellspacing="0" width="600" style="background-color: #ffffff; border-radius: 10px; padding: 30px; font-family: Arial, sans-serif; color: #333333; box-shadow: 0 0 10px rgba(0,0,0,0.05);">
-                                <tr>
-                                  <td style="font-size: 18px; padding-bottom: 20px;">
-                                    ¡Hola! Nos comunicamos desde el <strong>Registro Único de Adopciones de Córdoba</strong>.
-                                  </td>
-                                </tr>
-                                <tr>
-                                  <td style="font-size: 16px; padding-bottom: 10px; line-height: 1.6;">
-                                    Como ya te anotaste en una convocatoria pública de adopción, nos interesa saber si querés que te contactemos
-                                    para informarte de las próximas búsquedas de familias para niñas, niños y adolescentes que esperan ser adoptados.
-                                    <br /><br />
-                                    Si estás de acuerdo, nos gustaría que nos especifiques en qué tipo de futuros llamados estarías interesada/o.
-                                  </td>
-                                </tr>
-                                <tr>
-                                  <td style="font-size: 16px; padding: 10px 0;">
-                                    Te invitamos a completar el siguiente formulario:
-                                  </td>
-                                </tr>
-                                <tr>
-                                  <td align="center" style="padding: 20px 0;">
-                                    <a href="{link_final}"
-                                        style="display: inline-block; padding: 12px 24px; font-size: 16px;
-                                              color: #ffffff; background-color: #0d6efd; text-decoration: none;
-                                              border-radius: 6px; font-weight: bold;"
-                                        target="_blank">
-                                      Ir al formulario
-                                    </a>
-                                  </td>
-                                </tr>
-                                <tr>
-                                  <td style="font-size: 16px; padding-top: 10px;">
-                                    ¡Muchas gracias!
-                                  </td>
-                                </tr>
-                              </table>
-                            </td>
-                          </tr>
-                        </table>
-                      </body>
-                    </html>
-                    """
-
+                    cuerpo_html = plantilla_disponibilidad_postulantes().replace("{link}", f"{link_base}?user={login_base64}")
 
                     try:
-                        enviar_mail(destinatario=mail, asunto=asunto, cuerpo=cuerpo_html)
-                        print(f"[TAREA] Mail enviado a {mail}")
+                        enviar_mail(destinatario=mail, asunto=ASUNTO_DISPONIBILIDAD_POSTULANTES, cuerpo=cuerpo_html,
+                                    origen=job["id"], prioridad=PRIORIDAD_MASIVA)
+                        resultado["enviados"] += 1
+                        enviados.append((login, mail))
                     except Exception as mail_error:
-                        resultados["errores"].append(f"Línea {idx} ({login}): error al enviar mail: {mail_error}")
-
-                    with open(log_path, "a", encoding="utf-8") as log_file:
-                        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        log_file.write(f"[{ahora}] Enviado a {login} ({mail})\n")
-
-                    resultados["mails_enviados"] += 1
-                    time.sleep(5)
+                        resultado["errores"].append(f"Línea {idx} ({login}): error al enviar mail: {mail_error}")
 
             except Exception as e:
                 db.rollback()
-                resultados["errores"].append(f"Línea {idx} ({fila.get('login','?')}): {e}")
+                resultado["errores"].append(f"Línea {idx} ({fila.get('login','?')}): {e}")
 
-    except Exception as fatal:
-        print(f"[ERROR FATAL] {fatal}")
     finally:
         db.close()
 
-    print(f"[TAREA] Proceso finalizado. Mails enviados: {resultados['mails_enviados']}, Total: {resultados['total']}")
-    return resultados
+    registrar_envios_en_log("envios_exitosos_postulantes.txt", enviados)
+    return resultado
+
+
+registrar_tipo_campania("postulantes_csv", procesar_tramo_postulantes_csv)
 
 
 
 @users_router.post("/usuarios/notificar-desde-csv-postulantes", response_model=dict,
     dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))], )
 async def notificar_desde_csv_postulantes(
-    background_tasks: BackgroundTasks,
     archivo: UploadFile = File(...),
+    db: Session = Depends(get_db),
     ):
 
     if not archivo.filename.lower().endswith(".csv"):
@@ -5822,19 +5944,58 @@ async def notificar_desde_csv_postulantes(
         contenido, encoding_usado = decode_csv_bytes(raw)
         print(f"[CSV] Decodificado con: {encoding_usado}")
 
-        background_tasks.add_task(procesar_envio_masivo_postulantes_desde_csv, contenido)
+        job = lanzar_campania(
+            "postulantes_csv",
+            archivo = guardar_archivo_campania(contenido, "csv"),
+            link_base = armar_link_base(db, "/reconfirmar-subregistros-postulantes"),
+        )
 
 
         return {
             "tipo_mensaje": "verde",
             "mensaje": "Se está procesando el archivo CSV en segundo plano.",
-            "errores": []
+            "errores": [],
+            "job_id": job["id"],
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al iniciar el procesamiento: {e}")
 
 
 
+@users_router.get("/usuarios/campanias", response_model=dict,
+    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))], )
+def listar_campanias(limit: int = 20):
+    # Últimas campañas de notificación masiva con su avance
+    jobs = jobstore_list_jobs(kind=CAMPANIA_KIND, limit=min(max(limit, 1), 100))
+    return {"campanias": [_resumen_campania(job) for job in jobs]}
+
+
+@users_router.get("/usuarios/campanias/{job_id}", response_model=dict,
+    dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))], )
+def get_estado_campania(job_id: str):
+    job = estado_campania(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Campaña no encontrada")
+    return {**_resumen_campania(job), "errores": job.get("errores") or [], "cola_mail": job["cola_mail"]}
+
+
+def _resumen_campania(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "tipo": job["meta"].get("tipo"),
+        "status": job["status"],
+        "limite": job["meta"].get("limite"),
+        "procesados": job.get("procesados") or 0,
+        "enviados": job.get("enviados") or 0,
+        "bajas": job.get("bajas") or 0,
+        "cantidad_errores": len(job.get("errores") or []),
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+
 
 
 
@@ -6069,170 +6230,222 @@ def obtener_query_candidatos_inactivos(db: Session):
     return base, preview_query
 
 
-def enviar_notificacion_inactividad_individual(db: Session, usuario: User) -> dict:
-    hoy = datetime.now()
+ASUNTO_AVISO_INACTIVIDAD = "Aviso por inactividad - Sistema RUA"
 
-    try:
-        notificacion = (
-            db.query(UsuarioNotificadoInactivo)
-            .filter(UsuarioNotificadoInactivo.login == usuario.login)
-            .first()
-        )
 
-        if not notificacion:
-            notificacion = UsuarioNotificadoInactivo(login=usuario.login, mail_enviado_1=hoy)
-            db.add(notificacion)
-            nro_envio = 1
-        elif notificacion.mail_enviado_2 is None:
-            notificacion.mail_enviado_2 = hoy
-            nro_envio = 2
-        elif notificacion.mail_enviado_3 is None:
-            notificacion.mail_enviado_3 = hoy
-            nro_envio = 3
-        elif notificacion.mail_enviado_4 is None:
-            notificacion.mail_enviado_4 = hoy
-            nro_envio = 4
-        else:
-            usuario.operativo = 'N'
-            notificacion.dado_de_baja = hoy
-            db.add(RuaEvento(
-                login=usuario.login,
-                evento_detalle="Usuario dado de baja por inactividad prolongada.",
-                evento_fecha=hoy
-            ))
-            db.commit()
-            return {"success": True, "accion": "baja"}
+def plantilla_aviso_inactividad(nro_envio: int) -> str:
+    """Cuerpo HTML del aviso por inactividad #nro_envio, con el marcador {nombre} sin completar."""
 
-        mensaje_adicional = ""
+    mensaje_adicional = ""
 
-        if nro_envio in (2, 3):
-            mensaje_adicional = """
-            <p style="font-size: 15px; color: #6c757d; margin-top: 25px;">
-              Luego del cuarto aviso semanal tendremos que desactivar tu cuenta.
-            </p>
-            """
-        elif nro_envio == 4:
-            mensaje_adicional = """
-            <p style="font-size: 15px; color: #dc3545; margin-top: 25px;">
-              Necesitamos que en las próximas <strong>24 horas</strong> te comuniques con
-              nosotros por los medios indicados o ingreses a tu cuenta desde la plataforma;
-              de lo contrario, tendremos que desactivar tu cuenta.
-            </p>
-            """
+    if nro_envio in (2, 3):
+        mensaje_adicional = """
+        <p style="font-size: 15px; color: #6c757d; margin-top: 25px;">
+          Luego del cuarto aviso semanal tendremos que desactivar tu cuenta.
+        </p>
+        """
+    elif nro_envio == 4:
+        mensaje_adicional = """
+        <p style="font-size: 15px; color: #dc3545; margin-top: 25px;">
+          Necesitamos que en las próximas <strong>24 horas</strong> te comuniques con
+          nosotros por los medios indicados o ingreses a tu cuenta desde la plataforma;
+          de lo contrario, tendremos que desactivar tu cuenta.
+        </p>
+        """
 
-        enviar_mail(
-            destinatario=usuario.mail,
-            asunto="Aviso por inactividad - Sistema RUA",
-            cuerpo = f"""
-            <html>
-              <body style="margin: 0; padding: 0; background-color: #f8f9fa;">
-                <table cellpadding="0" cellspacing="0" width="100%" style="background-color: #f8f9fa; padding: 20px;">
-                  <tr>
-                    <td align="center">
-                      <table cellpadding="0" cellspacing="0" width="600"
-                        style="background-color: #ffffff; border-radius: 10px; padding: 30px;
-                              font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; color: #343a40;
-                              box-shadow: 0 0 10px rgba(0,0,0,0.1);">
-
-                        <tr>
-                          <td style="padding-top: 20px; font-size: 17px;">
-                            <p>¡Hola, <strong>{usuario.nombre}</strong>! 
-                            <br>Nos comunicamos desde el <strong>Registro Único de Adopciones de Córdoba</strong>.</p>
-                            <p>Te contactamos porque hace más de 6 meses que no hay actividad en tu cuenta. ¿Necesitás 
-                            ayuda con los pasos para continuar con tu inscripción? Comunicate con nosotros al 
-                            siguiente correo: <br>
-                            <a href="mailto:registroadopcion@justiciacordoba.gob.ar">registroadopcion@justiciacordoba.gob.ar</a> <br>
-                            o al teléfono: (0351) 44 81 000 - interno: 13181.</p>
-
-                            <p><strong>¡Te invitamos a que ingreses al sistema para conservar tu cuenta y continuar con el proceso 
-                            de inscripción!</strong></p>
-
-                          </td>
-                        </tr>
-
-                        <tr>
-                          <td align="center" style="padding: 30px 0;">
-                            <a href="https://rua.justiciacordoba.gob.ar/login/" target="_blank"
-                              style="display: inline-block; padding: 12px 24px; background-color: #007bff;
-                                      color: #ffffff; border-radius: 8px; text-decoration: none;
-                                      font-weight: bold; font-size: 16px;">
-                              Ir al sistema RUA
-                            </a>
-
-                            {mensaje_adicional}
-                          </td>
-                        </tr>
-              
-                        <tr>
-                          <td style="font-size: 15px; padding-top: 10px;">
-                            ¡Muchas gracias por querer formar parte del Registro Único de Adopciones de Córdoba!
-                          </td>
-                        </tr>
-                      </table>
-                    </td>
-                  </tr>
-                </table>
-              </body>
-            </html>
-            """
-        )
+    return f"""
+        <html>
+          <body style="margin: 0; padding: 0; background-color: #f8f9fa;">
+            <table cellpadding="0" cellspacing="0" width="100%" style="background-color: #f8f9fa; padding: 20px;">
+              <tr>
+                <td align="center">
+                  <table cellpadding="0" cellspacing="0" width="600"
+                    style="background-color: #ffffff; border-radius: 10px; padding: 30px;
+                          font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; color: #343a40;
+                          box-shadow: 0 0 10px rgba(0,0,0,0.1);">
 
-        registrar_mensaje(
-            db=db,
-            tipo="email",
-            login_emisor=None,
-            login_destinatario=usuario.login,
-            destinatario_texto=f"{usuario.nombre} {usuario.apellido} <{usuario.mail}>",
-            asunto="Aviso por inactividad - Sistema RUA",
-            contenido="Aviso automático por inactividad",
-            estado="enviado",
-            data_json={"tipo_aviso": "inactividad", "nro_envio": nro_envio}
-        )
+                    <tr>
+                      <td style="padding-top: 20px; font-size: 17px;">
+                        <p>¡Hola, <strong>{{nombre}}</strong>! 
+                        <br>Nos comunicamos desde el <strong>Registro Único de Adopciones de Córdoba</strong>.</p>
+                        <p>Te contactamos porque hace más de 6 meses que no hay actividad en tu cuenta. ¿Necesitás 
+                        ayuda con los pasos para continuar con tu inscripción? Comunicate con nosotros al 
+                        siguiente correo: <br>
+                        <a href="mailto:registroadopcion@justiciacordoba.gob.ar">registroadopcion@justiciacordoba.gob.ar</a> <br>
+                        o al teléfono: (0351) 44 81 000 - interno: 13181.</p>
+
+                        <p><strong>¡Te invitamos a que ingreses al sistema para conservar tu cuenta y continuar con el proceso 
+                        de inscripción!</strong></p>
+
+                      </td>
+                    </tr>
+
+                    <tr>
+                      <td align="center" style="padding: 30px 0;">
+                        <a href="https://rua.justiciacordoba.gob.ar/login/" target="_blank"
+                          style="display: inline-block; padding: 12px 24px; background-color: #007bff;
+                                  color: #ffffff; border-radius: 8px; text-decoration: none;
+                                  font-weight: bold; font-size: 16px;">
+                          Ir al sistema RUA
+                        </a>
+
+                        {mensaje_adicional}
+                      </td>
+                    </tr>
+          
+                    <tr>
+                      <td style="font-size: 15px; padding-top: 10px;">
+                        ¡Muchas gracias por querer formar parte del Registro Único de Adopciones de Córdoba!
+                      </td>
+                    </tr>
+                  </table>
+                </td>
+              </tr>
+            </table>
+          </body>
+        </html>
+        """
 
+
+def registrar_aviso_inactividad(db: Session, usuario: User, hoy: datetime) -> dict:
+    """
+    Registra (sin commit) el próximo aviso por inactividad del usuario, o su baja si ya recibió
+    los cuatro. Si corresponde mandar mail, devuelve también el asunto y el cuerpo.
+    """
+    notificacion = (
+        db.query(UsuarioNotificadoInactivo)
+        .filter(UsuarioNotificadoInactivo.login == usuario.login)
+        .first()
+    )
+
+    if not notificacion:
+        notificacion = UsuarioNotificadoInactivo(login=usuario.login, mail_enviado_1=hoy)
+        db.add(notificacion)
+        nro_envio = 1
+    elif notificacion.mail_enviado_2 is None:
+        notificacion.mail_enviado_2 = hoy
+        nro_envio = 2
+    elif notificacion.mail_enviado_3 is None:
+        notificacion.mail_enviado_3 = hoy
+        nro_envio = 3
+    elif notificacion.mail_enviado_4 is None:
+        notificacion.mail_enviado_4 = hoy
+        nro_envio = 4
+    else:
+        usuario.operativo = 'N'
+        notificacion.dado_de_baja = hoy
         db.add(RuaEvento(
             login=usuario.login,
-            evento_detalle=f"Envío aviso inactividad #{nro_envio}",
+            evento_detalle="Usuario dado de baja por inactividad prolongada.",
             evento_fecha=hoy
         ))
+        return {"accion": "baja"}
+
+    registrar_mensaje(
+        db=db,
+        tipo="email",
+        login_emisor=None,
+        login_destinatario=usuario.login,
+        destinatario_texto=f"{usuario.nombre} {usuario.apellido} <{usuario.mail}>",
+        asunto=ASUNTO_AVISO_INACTIVIDAD,
+        contenido="Aviso automático por inactividad",
+        estado="enviado",
+        data_json={"tipo_aviso": "inactividad", "nro_envio": nro_envio}
+    )
 
-        db.commit()
-        return {"success": True, "accion": "mail", "nro_envio": nro_envio}
+    db.add(RuaEvento(
+        login=usuario.login,
+        evento_detalle=f"Envío aviso inactividad #{nro_envio}",
+        evento_fecha=hoy
+    ))
 
-    except Exception as e:
-        db.rollback()
-        return {"success": False, "error": str(e)}
+    return {
+        "accion": "mail",
+        "nro_envio": nro_envio,
+        "asunto": ASUNTO_AVISO_INACTIVIDAD,
+        "cuerpo": plantilla_aviso_inactividad(nro_envio).replace("{nombre}", usuario.nombre or ""),
+    }
+
+
+def procesar_tramo_avisos(db: Session, job: dict, usuarios: List[User], registrar_aviso) -> dict:
+    """
+    Registra los avisos de un tramo de una campaña (services/campanias.py) en una sola transacción
+    y después encola los mails. Un usuario que falla se excluye de los tramos siguientes.
+    """
+    hoy = datetime.now()
+    excluidos = list(job.get("excluidos") or [])
+    resultado = {"procesados": len(usuarios), "enviados": 0, "bajas": 0, "errores": []}
+    mails = []
+
+    for usuario in usuarios:
+        try:
+            with db.begin_nested():
+                aviso = registrar_aviso(db, usuario, hoy)
+        except Exception as e:
+            excluidos.append(usuario.login)
+            resultado["errores"].append(f"{usuario.login}: {e}")
+            continue
+
+        if aviso["accion"] == "baja":
+            resultado["bajas"] += 1
+        else:
+            mails.append((usuario.login, usuario.mail, aviso["asunto"], aviso["cuerpo"]))
+
+    db.commit()
+
+    for login, mail, asunto, cuerpo in mails:
+        try:
+            enviar_mail(destinatario=mail, asunto=asunto, cuerpo=cuerpo, origen=job["id"], prioridad=PRIORIDAD_MASIVA)
+            resultado["enviados"] += 1
+        except Exception as e:
+            resultado["errores"].append(f"{login} ({mail}): error al encolar el mail: {e}")
+
+    resultado["excluidos"] = excluidos
+    return resultado
 
 
-def procesar_notificacion_inactivos_masiva(limite_envios: int):
+def procesar_tramo_inactivos(job: dict, cantidad: int) -> dict:
     db = SessionLocal()
 
     try:
         base, _ = obtener_query_candidatos_inactivos(db)
 
-        usuarios = (
+        query = (
             db.query(User)
             .join(
                 base,
                 User.login.collate("utf8mb4_0900_ai_ci") == base.c.login,
             )
+        )
+        if job.get("excluidos"):
+            query = query.filter(User.login.notin_(job["excluidos"]))
+
+        usuarios = (
+            query
             .order_by(base.c.fecha_alta.asc(), base.c.login.asc())
-            .limit(limite_envios)
-            .with_for_update()
+            .limit(cantidad)
+            .with_for_update(skip_locked=True, of=User)
             .all()
         )
 
-        for usuario in usuarios:
-            enviar_notificacion_inactividad_individual(db, usuario)
-            time.sleep(2)
+        resultado = procesar_tramo_avisos(db, job, usuarios, registrar_aviso_inactividad)
+        resultado["fin"] = len(usuarios) < cantidad
+        return resultado
+
+    except Exception:
+        db.rollback()
+        raise
 
     finally:
         db.close()
 
 
+registrar_tipo_campania("inactividad", procesar_tramo_inactivos)
+
+
 @users_router.post("/notificar-inactivos-masivo",
     dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))], )
 def notificar_usuarios_inactivos_masivo(
-    background_tasks: BackgroundTasks,
     limite_envios: int = 100,   # 👈 default seguro
     ):
 
@@ -6245,15 +6458,13 @@ def notificar_usuarios_inactivos_masivo(
             detail="El límite máximo permitido por ejecución es 1000 envíos"
         )
 
-    background_tasks.add_task(
-        procesar_notificacion_inactivos_masiva,
-        limite_envios
-    )
+    job = lanzar_campania("inactividad", limite=limite_envios)
 
     return {
         "tipo_mensaje": "verde",
         "mensaje": f"Se inició el procesamiento de hasta {limite_envios} notificaciones por inactividad.",
-        "limite_envios": limite_envios
+        "limite_envios": limite_envios,
+        "job_id": job["id"],
     }
 
 
@@ -6607,198 +6818,206 @@ def obtener_query_demora_docs_filtrada(db: Session):
     return base_query, fecha_base_inactividad, ultima_notificacion
 
 
-def enviar_notificacion_demora_docs_individual(db: Session, usuario: User) -> dict:
-    hoy = datetime.now()
+ASUNTO_AVISO_DEMORA_DOCS = "Aviso por demora en el proceso de inscripción - Sistema RUA"
 
-    try:
-        notificacion = (
-            db.query(UsuarioNotificadoDemoraDocs)
-            .filter(UsuarioNotificadoDemoraDocs.login == usuario.login)
-            .first()
-        )
 
-        if not notificacion:
-            notificacion = UsuarioNotificadoDemoraDocs(
-                login = usuario.login,
-                mail_enviado_1 = hoy
-            )
-            nro_envio = 1
-            db.add(notificacion)
+def plantilla_aviso_demora_docs() -> str:
+    """Cuerpo HTML del aviso por demora en documentación, con el marcador {nombre} sin completar."""
+    return f"""
+        <html>
+          <body style="margin: 0; padding: 0; background-color: #f8f9fa;">
+            <table cellpadding="0" cellspacing="0" width="100%"
+                  style="background-color: #f8f9fa; padding: 20px;">
+              <tr>
+                <td align="center">
+                  <table cellpadding="0" cellspacing="0" width="600"
+                    style="background-color: #ffffff; border-radius: 10px; padding: 30px;
+                          font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+                          color: #343a40;
+                          box-shadow: 0 0 10px rgba(0,0,0,0.1);">
 
-        elif notificacion.mail_enviado_2 is None:
-            notificacion.mail_enviado_2 = hoy
-            nro_envio = 2
+                    <!-- Cuerpo -->
+                    <tr>
+                      <td style="padding-top: 20px; font-size: 17px;">
+                        <p>
+                          ¡Hola, <strong>{{nombre}}</strong>!
+                          <br>Nos comunicamos desde el
+                          <strong>Registro Único de Adopciones de Córdoba</strong>.
+                        </p>
+
+                        <p>
+                          Te contactamos porque registramos que no avanzaste con la carga
+                          de tu documentación personal. ¿Necesitás ayuda con los pasos para continuar con tu inscripción?
+                          Comunicate con nosotros al siguiente correo:
+                          <br>
+                          <a href="mailto:registroadopcion@justiciacordoba.gob.ar">
+                            registroadopcion@justiciacordoba.gob.ar
+                          </a>
+                          <br>
+                          o al teléfono: (0351) 44 81 000 – interno: 13181.
+                        </p>
+
+                        <p>
+                          <strong>
+                            ¡Te invitamos a que ingreses al sistema para continuar
+                            con tu proceso de inscripción!
+                          </strong>
+                        </p>
 
-        elif notificacion.mail_enviado_3 is None:
-            notificacion.mail_enviado_3 = hoy
-            nro_envio = 3
+                      </td>
+                    </tr>
 
-        else:
-            usuario.operativo = "N"
-            notificacion.dado_de_baja = hoy
-            db.add(RuaEvento(
-                login = usuario.login,
-                evento_detalle = "Usuario dado de baja por demora en documentación.",
-                evento_fecha = hoy
-            ))
-            db.commit()
-            return {"success": True, "accion": "baja"}
-
-
-        enviar_mail(
-            destinatario = usuario.mail,
-            asunto = "Aviso por demora en el proceso de inscripción - Sistema RUA",
-            cuerpo = f"""
-            <html>
-              <body style="margin: 0; padding: 0; background-color: #f8f9fa;">
-                <table cellpadding="0" cellspacing="0" width="100%"
-                      style="background-color: #f8f9fa; padding: 20px;">
-                  <tr>
-                    <td align="center">
-                      <table cellpadding="0" cellspacing="0" width="600"
-                        style="background-color: #ffffff; border-radius: 10px; padding: 30px;
-                              font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                              color: #343a40;
-                              box-shadow: 0 0 10px rgba(0,0,0,0.1);">
-
-                        <!-- Cuerpo -->
-                        <tr>
-                          <td style="padding-top: 20px; font-size: 17px;">
-                            <p>
-                              ¡Hola, <strong>{usuario.nombre}</strong>!
-                              <br>Nos comunicamos desde el
-                              <strong>Registro Único de Adopciones de Córdoba</strong>.
-                            </p>
-
-                            <p>
-                              Te contactamos porque registramos que no avanzaste con la carga
-                              de tu documentación personal. ¿Necesitás ayuda con los pasos para continuar con tu inscripción?
-                              Comunicate con nosotros al siguiente correo:
-                              <br>
-                              <a href="mailto:registroadopcion@justiciacordoba.gob.ar">
-                                registroadopcion@justiciacordoba.gob.ar
-                              </a>
-                              <br>
-                              o al teléfono: (0351) 44 81 000 – interno: 13181.
-                            </p>
-
-                            <p>
-                              <strong>
-                                ¡Te invitamos a que ingreses al sistema para continuar
-                                con tu proceso de inscripción!
-                              </strong>
-                            </p>
-
-                          </td>
-                        </tr>
-
-                        <!-- Botón -->
-                        <tr>
-                          <td align="center" style="padding: 30px 0;">
-                            <a href="https://rua.justiciacordoba.gob.ar/login/"
-                              target="_blank"
-                              style="display: inline-block;
-                                      padding: 12px 24px;
-                                      background-color: #007bff;
-                                      color: #ffffff;
-                                      border-radius: 8px;
-                                      text-decoration: none;
-                                      font-weight: bold;
-                                      font-size: 16px;">
-                              Ir al sistema RUA
-                            </a>
-                          </td>
-                        </tr>
-
-                        <!-- Cierre -->
-                        <tr>
-                          <td style="font-size: 15px; padding-top: 10px;">
-                            ¡Muchas gracias por querer formar parte del Registro Único de Adopciones de Córdoba!
-                          </td>
-                        </tr>
-
-                      </table>
-                    </td>
-                  </tr>
-                </table>
-              </body>
-            </html>
-            """
-        )
+                    <!-- Botón -->
+                    <tr>
+                      <td align="center" style="padding: 30px 0;">
+                        <a href="https://rua.justiciacordoba.gob.ar/login/"
+                          target="_blank"
+                          style="display: inline-block;
+                                  padding: 12px 24px;
+                                  background-color: #007bff;
+                                  color: #ffffff;
+                                  border-radius: 8px;
+                                  text-decoration: none;
+                                  font-weight: bold;
+                                  font-size: 16px;">
+                          Ir al sistema RUA
+                        </a>
+                      </td>
+                    </tr>
 
-        # 🧾 Registro del mensaje (MISMO PATRÓN que inactividad)
-        registrar_mensaje(
-            db = db,
-            tipo = "email",
-            login_emisor = None,
-            login_destinatario = usuario.login,
-            destinatario_texto = f"{usuario.nombre} {usuario.apellido} <{usuario.mail}>",
-            asunto = "Aviso por demora en el proceso de inscripción - Sistema RUA",
-            contenido = "Aviso automático por demora en la carga de documentación",
-            estado = "enviado",
-            data_json = {
-                "tipo_aviso": "demora_documentacion",
-                "nro_envio": nro_envio
-            }
+                    <!-- Cierre -->
+                    <tr>
+                      <td style="font-size: 15px; padding-top: 10px;">
+                        ¡Muchas gracias por querer formar parte del Registro Único de Adopciones de Córdoba!
+                      </td>
+                    </tr>
+
+                  </table>
+                </td>
+              </tr>
+            </table>
+          </body>
+        </html>
+        """
+
+
+def registrar_aviso_demora_docs(db: Session, usuario: User, hoy: datetime) -> dict:
+    """
+    Registra (sin commit) el próximo aviso por demora en documentación, o la baja si ya recibió
+    los tres. Si corresponde mandar mail, devuelve también el asunto y el cuerpo.
+    """
+    notificacion = (
+        db.query(UsuarioNotificadoDemoraDocs)
+        .filter(UsuarioNotificadoDemoraDocs.login == usuario.login)
+        .first()
+    )
+
+    if not notificacion:
+        notificacion = UsuarioNotificadoDemoraDocs(
+            login = usuario.login,
+            mail_enviado_1 = hoy
         )
+        nro_envio = 1
+        db.add(notificacion)
 
-        # 📌 Evento de auditoría
+    elif notificacion.mail_enviado_2 is None:
+        notificacion.mail_enviado_2 = hoy
+        nro_envio = 2
+
+    elif notificacion.mail_enviado_3 is None:
+        notificacion.mail_enviado_3 = hoy
+        nro_envio = 3
+
+    else:
+        usuario.operativo = "N"
+        notificacion.dado_de_baja = hoy
         db.add(RuaEvento(
             login = usuario.login,
-            evento_detalle = f"Envío aviso demora documentación #{nro_envio}",
+            evento_detalle = "Usuario dado de baja por demora en documentación.",
             evento_fecha = hoy
         ))
+        return {"accion": "baja"}
+
+    # 🧾 Registro del mensaje (MISMO PATRÓN que inactividad)
+    registrar_mensaje(
+        db = db,
+        tipo = "email",
+        login_emisor = None,
+        login_destinatario = usuario.login,
+        destinatario_texto = f"{usuario.nombre} {usuario.apellido} <{usuario.mail}>",
+        asunto = ASUNTO_AVISO_DEMORA_DOCS,
+        contenido = "Aviso automático por demora en la carga de documentación",
+        estado = "enviado",
+        data_json = {
+            "tipo_aviso": "demora_documentacion",
+            "nro_envio": nro_envio
+        }
+    )
 
-        db.commit()
-        return {"success": True, "accion": "mail", "nro_envio": nro_envio}
+    # 📌 Evento de auditoría
+    db.add(RuaEvento(
+        login = usuario.login,
+        evento_detalle = f"Envío aviso demora documentación #{nro_envio}",
+        evento_fecha = hoy
+    ))
 
-    except Exception as e:
-        db.rollback()
-        return {"success": False, "error": str(e)}
+    return {
+        "accion": "mail",
+        "nro_envio": nro_envio,
+        "asunto": ASUNTO_AVISO_DEMORA_DOCS,
+        "cuerpo": plantilla_aviso_demora_docs().replace("{nombre}", usuario.nombre or ""),
+    }
 
 
 
-def procesar_notificacion_demora_docs_masiva(limite_envios: int):
+def procesar_tramo_demora_docs(job: dict, cantidad: int) -> dict:
     db = SessionLocal()
 
     try:
         base_query, _, _ = obtener_query_demora_docs_filtrada(db)
 
+        if job.get("excluidos"):
+            base_query = base_query.filter(User.login.notin_(job["excluidos"]))
+
         usuarios = (
             base_query
             .with_entities(User)
-            .limit(limite_envios)
-            .with_for_update()
+            .limit(cantidad)
+            .with_for_update(skip_locked=True, of=User)
             .all()
         )
 
-        for usuario in usuarios:
-            enviar_notificacion_demora_docs_individual(db, usuario)
-            time.sleep(2)
+        resultado = procesar_tramo_avisos(db, job, usuarios, registrar_aviso_demora_docs)
+        resultado["fin"] = len(usuarios) < cantidad
+        return resultado
+
+    except Exception:
+        db.rollback()
+        raise
 
     finally:
         db.close()
 
 
+registrar_tipo_campania("demora_docs", procesar_tramo_demora_docs)
+
+
 
 @users_router.post("/notificar-demora-documentacion-masivo",
     dependencies=[Depends(verify_api_key), Depends(require_roles(["administrador"]))], )
 def notificar_demora_documentacion_masivo(
-    background_tasks: BackgroundTasks,
     limite_envios: int = 100,
     ):
 
     if limite_envios <= 0 or limite_envios > 1000:
         raise HTTPException(status_code=400, detail="Límite inválido")
 
-    background_tasks.add_task(
-        procesar_notificacion_demora_docs_masiva,
-        limite_envios
-    )
+    job = lanzar_campania("demora_docs", limite=limite_envios)
 
     return {
         "tipo_mensaje": "verde",
-        "mensaje": f"Se inició el envío de avisos por demora en documentación (máx {limite_envios})."
+        "mensaje": f"Se inició el envío de avisos por demora en documentación (máx {limite_envios}).",
+        "job_id": job["id"],
     }
 
 
@@ -0,0 +1,49 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from database.config import SessionLocal
+from helpers.utils import detect_hash_and_verify
+from models.users import User
+from security.security import get_password_hash
+
+
+# Verificación de contraseñas en un pool acotado.
+#
+# bcrypt.checkpw cuesta del orden de 100 ms de CPU por llamada (libera el GIL mientras calcula).
+# Las verificaciones de login pasan por un pool de LOGIN_HASH_WORKERS hilos: en un pico de logins
+# el hashing usa a lo sumo esa cantidad de núcleos y el resto de los requests sigue atendiéndose.
+# La migración de claves MD5 heredadas a bcrypt se encola en el mismo pool, después de responder.
+
+
+LOGIN_HASH_WORKERS = int(os.getenv("LOGIN_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool = ThreadPoolExecutor(max_workers=LOGIN_HASH_WORKERS, thread_name_prefix="credenciales")
+
+
+
+def verificar_clave(password: str, stored_hash: str) -> bool:
+    """detect_hash_and_verify ejecutado en el pool de credenciales (bloquea al hilo que llama)."""
+    return _pool.submit(detect_hash_and_verify, password, stored_hash).result()
+
+
+def es_hash_md5(stored_hash: str) -> bool:
+    return len(stored_hash) == 32 and all(c in "0123456789abcdefABCDEF" for c in stored_hash)
+
+
+def migrar_clave_md5(login: str, password: str, hash_md5: str) -> None:
+    """Encola el rehash a bcrypt de una clave MD5 recién verificada (no espera el resultado)."""
+    _pool.submit(_migrar_clave_md5, login, password, hash_md5)
+
+
+def _migrar_clave_md5(login: str, password: str, hash_md5: str) -> None:
+    db = SessionLocal()
+    try:
+        # Solo si la clave no cambió mientras tanto
+        db.query(User).filter(User.login == login, User.clave == hash_md5) \
+            .update({User.clave: get_password_hash(password)}, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ No se pudo migrar a bcrypt la clave de {login}: {e}")
+    finally:
+        db.close()
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from helpers.cache import get_redis, redis_key
+from models.users import User, UserGroup
+
+
+# Caché de identidad para get_current_user.
+#
+# Guarda, por (login, exp del token), el dict del usuario y su rol durante IDENTIDAD_TTL_SEGS
+# segundos, así los requests autenticados no consultan sec_users y sec_groups cada vez. Sin redis
+# es un LRU en memoria por worker (hasta IDENTIDAD_MAX_ENTRADAS); con REDIS_URL se comparte entre
+# workers en un hash por login (un campo por token).
+#
+# Se invalida sola al confirmar (commit) cambios hechos por el ORM sobre un User o su UserGroup
+# (rol, operativo, active o cualquier dato del perfil). Los cambios por SQL directo o por
+# query(...).update() no pasan por el flush: ahí hay que llamar a invalidar_identidad(login).
+
+
+IDENTIDAD_TTL_SEGS = int(os.getenv("IDENTIDAD_TTL_SEGS", "30"))
+
+IDENTIDAD_MAX_ENTRADAS = int(os.getenv("IDENTIDAD_MAX_ENTRADAS", "2048"))
+
+# Campos del dict de usuario que son fechas (en redis viajan como ISO)
+_CAMPOS_FECHA = ("fecha_nacimiento", "fecha_alta")
+
+
+_identidades: "OrderedDict[tuple, tuple]" = OrderedDict()
+_identidades_lock = threading.Lock()
+
+
+
+def _a_redis(identidad: Dict[str, Any]) -> str:
+    usuario = dict(identidad["user"])
+    for campo in _CAMPOS_FECHA:
+        if isinstance(usuario.get(campo), date):
+            usuario[campo] = usuario[campo].isoformat()
+    return json.dumps({"user": usuario, "role": identidad["role"]})
+
+
+def _desde_redis(crudo: str) -> Dict[str, Any]:
+    identidad = json.loads(crudo)
+    for campo in _CAMPOS_FECHA:
+        if identidad["user"].get(campo):
+            identidad["user"][campo] = date.fromisoformat(identidad["user"][campo])
+    return identidad
+
+
+def _copia(identidad: Dict[str, Any]) -> Dict[str, Any]:
+    # Los endpoints reciben su propia copia: si modifican el dict no alteran la caché
+    return {"user": dict(identidad["user"]), "role": identidad["role"]}
+
+
+
+def leer_identidad(login: str, exp: Any) -> Optional[Dict[str, Any]]:
+    """La identidad cacheada para ese login y token, o None si no está (o venció)."""
+    r = get_redis()
+    if r is not None:
+        try:
+            crudo = r.hget(redis_key("identidad", login), str(exp))
+            return _desde_redis(crudo) if crudo else None
+        except Exception as e:
+            print(f"⚠️ No se pudo leer la identidad cacheada en redis: {e}")
+
+    ahora = time.time()
+    with _identidades_lock:
+        guardado = _identidades.get((login, exp))
+        if guardado is None:
+            return None
+        if guardado[0] <= ahora:
+            del _identidades[(login, exp)]
+            return None
+        _identidades.move_to_end((login, exp))
+        return _copia(guardado[1])
+
+
+def guardar_identidad(login: str, exp: Any, identidad: Dict[str, Any]) -> None:
+    r = get_redis()
+    if r is not None:
+        try:
+            clave = redis_key("identidad", login)
+            pipe = r.pipeline()
+            pipe.hset(clave, str(exp), _a_redis(identidad))
+            pipe.expire(clave, IDENTIDAD_TTL_SEGS)
+            pipe.execute()
+            return
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar la identidad en redis: {e}")
+
+    with _identidades_lock:
+        _identidades[(login, exp)] = (time.time() + IDENTIDAD_TTL_SEGS, _copia(identidad))
+        _identidades.move_to_end((login, exp))
+        while len(_identidades) > IDENTIDAD_MAX_ENTRADAS:
+            _identidades.popitem(last = False)
+
+
+def invalidar_identidad(login: str) -> None:
+    """Descarta la identidad cacheada de `login` (todos sus tokens)."""
+    with _identidades_lock:
+        for clave in [c for c in _identidades if c[0] == login]:
+            del _identidades[clave]
+
+    r = get_redis()
+    if r is not None:
+        try:
+            r.delete(redis_key("identidad", login))
+        except Exception as e:
+            print(f"⚠️ No se pudo invalidar la identidad en redis: {e}")
+
+
+
+# ── Invalidación automática por cambios del ORM ─────────────────────────────────
+# Los logins tocados en el flush se juntan en session.info y se invalidan recién en el commit,
+# para que otro request no vuelva a cachear los datos viejos mientras la transacción sigue abierta.
+# Si la transacción se revierte no se limpian: invalidar de más solo cuesta una consulta.
+
+def _logins_pendientes(session: Session) -> Set[str]:
+    return session.info.setdefault("identidades_a_invalidar", set())
+
+
+@event.listens_for(Session, "after_flush")
+def _marcar_identidades(session: Session, flush_context) -> None:
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, UserGroup) or (isinstance(obj, User) and obj not in session.new):
+            if obj.login:
+                _logins_pendientes(session).add(obj.login)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_identidades(session: Session) -> None:
+    logins = session.info.pop("identidades_a_invalidar", None)
+    for login in logins or ():
+        invalidar_identidad(login)
+
@@ -8,6 +8,7 @@ from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 from database.config import get_db  # Importamos el acceso a la DB
 from models.users import User, Group, UserGroup
+from security.identidad import leer_identidad, guardar_identidad
 
 # Cargar API_KEY desde el entorno
 API_KEY = os.getenv("API_KEY")
@@ -71,26 +72,30 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
                 detail="Token inválido"
             )
 
-        # Buscar al usuario en la base de datos
-        user = db.query(User).filter(User.login == user_login).first()
-        if user is None:
+        # Identidad cacheada para este token (ver security/identidad.py)
+        identidad = leer_identidad(user_login, payload.get("exp"))
+        if identidad is not None:
+            return identidad
+
+        # Usuario y grupo (solo uno) en una sola consulta
+        fila = (
+            db.query(User, Group.description)
+            .outerjoin(UserGroup, UserGroup.login == User.login)
+            .outerjoin(Group, Group.group_id == UserGroup.group_id)
+            .filter(User.login == user_login)
+            .first()
+        )
+        if fila is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Usuario no encontrado"
             )
-
-        # Obtener el grupo del usuario (solo uno)
-        user_group = (
-            db.query(Group.description)
-            .join(UserGroup, Group.group_id == UserGroup.group_id)
-            .filter(UserGroup.login == user.login)
-            .first()  # ⚡ Obtiene solo un grupo en lugar de una lista
-        )
+        user, group_description = fila
 
         # Si el usuario no tiene grupo, asignar "Sin grupo asignado"
-        role = user_group.description if user_group else "Sin grupo asignado"
+        role = group_description if group_description else "Sin grupo asignado"
 
-        return {
+        identidad = {
             "user": {
                 "login": user.login,
                 "nombre": user.nombre,
@@ -108,6 +113,9 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             },
             "role": role  # ✅ Devuelve un único grupo como rol
         }
+        guardar_identidad(user_login, payload.get("exp"), identidad)
+
+        return identidad
 
     except JWTError:
         raise HTTPException(
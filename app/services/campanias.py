@@ -0,0 +1,163 @@
+import os
+import time
+import uuid
+import socket
+import threading
+from typing import Callable, Dict, Any, Optional
+
+from helpers.jobstore import (
+    jobstore_create_job,
+    jobstore_update_job,
+    jobstore_read_job,
+    jobstore_take_job,
+    jobstore_list_jobs,
+)
+from helpers.mail_queue import estado_cola_mail
+
+
+# Campañas de notificación masiva (avisos por inactividad, por demora en documentación y los
+# envíos desde TXT/CSV).
+#
+# Cada campaña es un job del jobstore (kind "campania_mail"). Un hilo la procesa de a tramos de
+# CAMPANIA_TRAMO destinatarios: el tipo de campaña reclama, registra y confirma cada tramo en una
+# transacción corta y encola los mails en helpers/mail_queue.py, que los entrega en paralelo dentro
+# del límite de envíos del canal (helpers/rate_limit.py). El avance queda en el job después de
+# cada tramo, así que si el proceso se reinicia la campaña se retoma desde donde quedó.
+
+
+CAMPANIA_KIND = "campania_mail"
+
+# Destinatarios por tramo (una transacción por tramo)
+CAMPANIA_TRAMO = int(os.getenv("CAMPANIA_TRAMO", "50"))
+
+# Vigencia del lease de una campaña; se renueva en cada tramo
+CAMPANIA_LEASE_SEGS = 120
+
+# Errores que se guardan en el job (los primeros)
+CAMPANIA_MAX_ERRORES = 200
+
+_CONTADORES = ("procesados", "enviados", "bajas")
+
+
+# tipo -> función que procesa un tramo: procesar_tramo(job, cantidad) -> resultado
+#
+# El resultado trae los contadores del tramo ("procesados", "enviados", "bajas"), la lista
+# "errores" y "fin" = True cuando no quedan destinatarios. Cualquier otra clave (un cursor, logins
+# a excluir, etc.) se guarda tal cual en el job para el tramo siguiente.
+_tipos: Dict[str, Callable[[Dict[str, Any], int], Dict[str, Any]]] = {}
+
+_hilos: Dict[str, threading.Thread] = {}
+_hilos_lock = threading.Lock()
+_token_proceso = uuid.uuid4().hex[:8]
+
+
+
+def registrar_tipo_campania(tipo: str, procesar_tramo: Callable[[Dict[str, Any], int], Dict[str, Any]]) -> None:
+    _tipos[tipo] = procesar_tramo
+
+
+def _duenio() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{_token_proceso}"
+
+
+
+def lanzar_campania(tipo: str, limite: Optional[int] = None, archivo: Optional[str] = None, **meta) -> Dict[str, Any]:
+    """
+    Crea el job de la campaña y arranca su hilo. `limite` corta la campaña tras esa cantidad de
+    destinatarios; `archivo` es la entrada de la campaña (TXT/CSV) y se purga junto con el job.
+    """
+    if tipo not in _tipos:
+        raise ValueError(f"Tipo de campaña desconocido: {tipo}")
+    job = jobstore_create_job(kind = CAMPANIA_KIND, meta = {"tipo": tipo, "limite": limite, **meta})
+    jobstore_update_job(job["id"], file_path = archivo, procesados = 0, enviados = 0, bajas = 0, errores = [])
+    _iniciar_hilo(job["id"])
+    return job
+
+
+def reanudar_campanias() -> int:
+    """Retoma las campañas que quedaron sin terminar (al arrancar la app). Devuelve cuántas."""
+    jobs = jobstore_list_jobs(kind = CAMPANIA_KIND, status = "pending") + \
+        jobstore_list_jobs(kind = CAMPANIA_KIND, status = "running")
+    for job in jobs:
+        _iniciar_hilo(job["id"])
+    return len(jobs)
+
+
+def estado_campania(job_id: str) -> Optional[Dict[str, Any]]:
+    """El job de la campaña con el estado de sus mails en la cola de salida."""
+    job = jobstore_read_job(job_id)
+    if job is None or job.get("kind") != CAMPANIA_KIND:
+        return None
+    job["cola_mail"] = estado_cola_mail(origen = job_id)
+    return job
+
+
+
+def _iniciar_hilo(job_id: str) -> None:
+    with _hilos_lock:
+        hilo = _hilos.get(job_id)
+        if hilo is not None and hilo.is_alive():
+            return
+        hilo = threading.Thread(target=_loop_campania, args=(job_id,), name=f"campania-{job_id[:8]}", daemon=True)
+        _hilos[job_id] = hilo
+        hilo.start()
+
+
+def _loop_campania(job_id: str) -> None:
+    """Espera a tener el lease (otro proceso puede estar corriéndola) y procesa la campaña."""
+    try:
+        while True:
+            job = jobstore_read_job(job_id)
+            if job is None or job["status"] not in ("pending", "running"):
+                return
+            if jobstore_take_job(job_id, _duenio(), CAMPANIA_LEASE_SEGS):
+                _ejecutar_campania(job_id)
+                return
+            time.sleep(max((job.get("lease_until") or 0) - time.time(), 1) + 1)
+    except Exception as e:
+        print(f"❌ Error en la campaña {job_id}: {e}")
+    finally:
+        with _hilos_lock:
+            _hilos.pop(job_id, None)
+
+
+def _ejecutar_campania(job_id: str) -> None:
+    job = jobstore_read_job(job_id)
+    tipo = job["meta"].get("tipo")
+    procesar_tramo = _tipos.get(tipo)
+    if procesar_tramo is None:
+        jobstore_update_job(job_id, status = "error", error = f"Tipo de campaña desconocido: {tipo}")
+        return
+
+    limite = job["meta"].get("limite")
+    jobstore_update_job(job_id, status = "running")
+    inicio = time.monotonic()
+
+    try:
+        while True:
+            cantidad = CAMPANIA_TRAMO
+            if limite:
+                cantidad = min(cantidad, limite - (job.get("procesados") or 0))
+                if cantidad <= 0:
+                    break
+
+            resultado = procesar_tramo(job, cantidad)
+
+            campos = {k: v for k, v in resultado.items() if k not in _CONTADORES + ("errores", "fin")}
+            for contador in _CONTADORES:
+                campos[contador] = (job.get(contador) or 0) + (resultado.get(contador) or 0)
+            campos["errores"] = ((job.get("errores") or []) + (resultado.get("errores") or []))[:CAMPANIA_MAX_ERRORES]
+            job = jobstore_update_job(job_id, **campos)
+
+            if resultado.get("fin") or not resultado.get("procesados"):
+                break
+            if not jobstore_take_job(job_id, _duenio(), CAMPANIA_LEASE_SEGS):
+                # Otro proceso se quedó con la campaña
+                return
+
+        jobstore_update_job(job_id, status = "done", duracion_segs = round(time.monotonic() - inicio, 1))
+        print(f"✅ Campaña {tipo} ({job_id}) terminada: {job.get('procesados')} procesados, {job.get('enviados')} mails.")
+
+    except Exception as e:
+        jobstore_update_job(job_id, status = "error", error = str(e))
+        print(f"❌ Error en la campaña {tipo} ({job_id}): {e}")
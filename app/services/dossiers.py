@@ -0,0 +1,441 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from zipfile import ZipFile
+
+import fitz
+from fastapi import Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from helpers.conversion_pdf import imagen_a_pdf, office_a_pdf, EXTENSIONES_IMAGEN, EXTENSIONES_OFFICE
+from helpers.jobstore import JOBSTORE_EXPORT_DIR, jobstore_create_job, jobstore_update_job, jobstore_read_job
+
+
+# Armado de legajos en PDF (proyecto adoptivo y carpeta completa).
+#
+# Un legajo se describe con un "spec": las líneas de la portada y la lista de documentos
+# (título, ruta, variante). Su huella es un hash del spec con la fecha de modificación y el tamaño
+# de cada archivo, así que mientras no cambie ningún documento se sirve el PDF ya armado.
+#
+# Cada documento se convierte a PDF una sola vez y queda en caché con la misma clave (ruta +
+# mtime + tamaño + variante): las imágenes en un pool de procesos y los Word en un único
+# LibreOffice por lote. El armado corre en un hilo como job del jobstore (kind "dossier_pdf"), con
+# su avance; el endpoint espera unos segundos y, si no terminó, responde 202 con el job_id.
+#
+# Si algún documento no se pudo convertir, el legajo se arma igual sin él pero no se guarda con su
+# huella: queda con un nombre de un solo uso (el job lo informa en `faltantes`) y el próximo pedido
+# vuelve a intentar la conversión.
+
+
+DOSSIER_KIND = "dossier_pdf"
+
+DOSSIER_CACHE_DIR = os.path.join(os.getenv("DIR_PDF_GENERADOS") or JOBSTORE_EXPORT_DIR, "_dossiers")
+_DIR_CONVERSIONES = os.path.join(DOSSIER_CACHE_DIR, "conversiones")
+_DIR_ARMADOS = os.path.join(DOSSIER_CACHE_DIR, "armados")
+
+# Procesos para convertir imágenes
+DOSSIER_PROCESOS = int(os.getenv("DOSSIER_PROCESOS", "2"))
+
+# Segundos que el endpoint de descarga espera el armado antes de responder 202
+DOSSIER_ESPERA_SEGS = float(os.getenv("DOSSIER_ESPERA_SEGS", "15"))
+
+# Tamaño máximo de la caché; al superarlo se borran los archivos usados hace más tiempo
+DOSSIER_CACHE_MAX_MB = int(os.getenv("DOSSIER_CACHE_MAX_MB", "2048"))
+
+# Cambiar si cambia el formato de los PDF armados (invalida la caché)
+_VERSION = 1
+
+ICONO_SEPARADOR = "/app/recursos/imagenes/flecha_hacia_abajo.png"
+
+# Variantes de conversión de imágenes
+VARIANTE_A4 = "a4"            # centrada en una hoja A4
+VARIANTE_IMAGEN = "imagen"    # PDF del tamaño de la imagen
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Un solo LibreOffice a la vez por proceso (comparten el perfil)
+_office_lock = threading.Lock()
+
+# huella -> job_id de los armados en curso en este proceso
+_en_curso: Dict[str, str] = {}
+_en_curso_lock = threading.Lock()
+
+
+
+def spec_pdf(nombre: str, portada: List[str], documentos: List[tuple], separadores: bool = True) -> Dict[str, Any]:
+    """
+    Spec de un legajo PDF. `documentos` es [(título, ruta, variante)]: con `separadores` cada uno va
+    precedido de una hoja con su título. Los documentos sin ruta o inexistentes se omiten.
+    """
+    return {
+        "tipo": "pdf",
+        "nombre": nombre,
+        "portada": portada,
+        "separadores": separadores,
+        "documentos": [list(d) for d in documentos if d[1] and os.path.exists(d[1])],
+    }
+
+
+def spec_zip(nombre: str, partes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Spec de un ZIP con un PDF por parte (cada parte es un spec_pdf)."""
+    return {"tipo": "zip", "nombre": nombre, "partes": partes}
+
+
+
+# ── Huellas y caché ────────────────────────────────────────────────────────────
+
+def _firma_archivo(ruta: str) -> List[Any]:
+    st = os.stat(ruta)
+    return [ruta, st.st_mtime_ns, st.st_size]
+
+
+def huella(spec: Dict[str, Any]) -> str:
+    if spec["tipo"] == "zip":
+        base = [_VERSION, "zip", spec["nombre"], [huella(p) for p in spec["partes"]]]
+    else:
+        base = [
+            _VERSION, "pdf", spec["portada"], spec["separadores"],
+            [[titulo, variante] + _firma_archivo(ruta) for titulo, ruta, variante in spec["documentos"]],
+        ]
+    return hashlib.sha1(json.dumps(base, ensure_ascii=False).encode()).hexdigest()
+
+
+def ruta_armado(spec: Dict[str, Any], huella_spec: str) -> str:
+    extension = ".zip" if spec["tipo"] == "zip" else ".pdf"
+    return os.path.join(_DIR_ARMADOS, f"{spec['nombre']}_{huella_spec[:16]}{extension}")
+
+
+def ruta_derivado(ruta: str, variante: str, extension: str = ".pdf") -> str:
+    """Ruta en caché de un derivado del archivo (conversión a PDF, JPEG, miniatura...)."""
+    clave = hashlib.sha1(json.dumps(_firma_archivo(ruta) + [variante]).encode()).hexdigest()
+    return os.path.join(_DIR_CONVERSIONES, clave + extension)
+
+
+def _pdf_de(ruta: str, variante: str) -> str:
+    """PDF de un documento: el propio archivo si ya es PDF, si no su conversión en caché."""
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext == ".pdf":
+        return ruta
+    # La variante solo cambia el resultado de las imágenes
+    return ruta_derivado(ruta, variante if ext in EXTENSIONES_IMAGEN else "")
+
+
+def _podar_cache() -> None:
+    limite = DOSSIER_CACHE_MAX_MB * 1024 * 1024
+    archivos = []
+    for carpeta in (_DIR_CONVERSIONES, _DIR_ARMADOS):
+        for entrada in os.scandir(carpeta):
+            if entrada.is_file():
+                st = entrada.stat()
+                archivos.append((max(st.st_atime, st.st_mtime), st.st_size, entrada.path))
+    total = sum(a[1] for a in archivos)
+    for _, tamanio, ruta in sorted(archivos):
+        if total <= limite:
+            break
+        try:
+            os.remove(ruta)
+            total -= tamanio
+        except OSError:
+            pass
+
+
+
+# ── Conversión ─────────────────────────────────────────────────────────────────
+
+def pool_conversiones() -> ProcessPoolExecutor:
+    """Pool de procesos para el trabajo de CPU sobre imágenes (también lo usa services/uploads.py)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=DOSSIER_PROCESOS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _convertir_pendientes(documentos: List[tuple], avance) -> None:
+    """Convierte (y deja en caché) los documentos que todavía no tienen su PDF."""
+    imagenes, office = {}, {}
+    for _, ruta, variante in documentos:
+        destino = _pdf_de(ruta, variante)
+        if destino == ruta or os.path.exists(destino):
+            continue
+        ext = os.path.splitext(ruta)[1].lower()
+        if ext in EXTENSIONES_IMAGEN:
+            imagenes[(ruta, variante)] = destino
+        elif ext in EXTENSIONES_OFFICE:
+            office[ruta] = destino
+
+    futuros = [
+        pool_conversiones().submit(imagen_a_pdf, ruta, destino, variante == VARIANTE_A4)
+        for (ruta, variante), destino in imagenes.items()
+    ]
+
+    if office:
+        with _office_lock:
+            perfil = os.path.join(DOSSIER_CACHE_DIR, f"libreoffice_{os.getpid()}")
+            try:
+                office_a_pdf(office, perfil)
+            except Exception as e:
+                print(f"❌ Error convirtiendo documentos de Office: {e}")
+
+            # Un documento roto hace fallar (o cortar) el lote entero: los que quedaron sin PDF se
+            # reintentan de a uno
+            faltan = {origen: destino for origen, destino in office.items() if not os.path.exists(destino)}
+            if faltan and len(office) > 1:
+                print(f"⚠️ Reintentando de a uno {len(faltan)} documento/s de Office")
+                for origen, destino in faltan.items():
+                    try:
+                        office_a_pdf({origen: destino}, perfil)
+                    except Exception as e:
+                        print(f"❌ Error convirtiendo '{origen}' a PDF: {e}")
+        avance(len(office))
+
+    for futuro in futuros:
+        try:
+            futuro.result()
+        except Exception as e:
+            print(f"❌ Error convirtiendo imagen a PDF: {e}")
+        avance(1)
+
+
+
+def precalentar(ruta: str) -> None:
+    """Deja en caché las conversiones a PDF de un documento recién subido (en todas sus variantes)."""
+    os.makedirs(_DIR_CONVERSIONES, exist_ok=True)
+    _convertir_pendientes([(None, ruta, VARIANTE_A4), (None, ruta, VARIANTE_IMAGEN)], lambda n: None)
+
+
+
+# ── Armado ─────────────────────────────────────────────────────────────────────
+
+def _agregar_portada(merged, lineas: List[str]) -> None:
+    portada = merged.new_page(width=595, height=842)
+    portada.insert_textbox(fitz.Rect(0, 50, 595, 100), "SERVICIO DE GUARDA Y ADOPCIÓN", fontname="helv", fontsize=16, align=1, color=(0.1, 0.1, 0.3))
+    portada.insert_textbox(fitz.Rect(0, 75, 595, 120), "REGISTRO ÚNICO DE ADOPCIONES Y EQUIPO TÉCNICO", fontname="helv", fontsize=13, align=1, color=(0.2, 0.2, 0.4))
+    portada.insert_textbox(fitz.Rect(0, 105, 595, 135), "DOCUMENTACIÓN DEL PROYECTO ADOPTIVO", fontname="helv", fontsize=11, align=1, color=(0.4, 0.4, 0.4))
+
+    fondo = fitz.Rect(50, 160, 545, 380)
+    portada.draw_rect(fondo, fill=(0.88, 0.93, 0.98))
+    y = 170
+    for linea in lineas:
+        portada.insert_textbox(fitz.Rect(60, y, 530, y + 25), linea, fontsize=13, fontname="helv", align=0, color=(0.1, 0.1, 0.1))
+        y += 28
+
+    portada.draw_line(p1=(60, y + 10), p2=(portada.rect.width - 60, y + 10), color=(0.5, 0.5, 0.5), width=0.6)
+
+
+def _ruta_incompleta(spec: Dict[str, Any]) -> str:
+    """Ruta de un solo uso para un armado al que le faltan documentos (no se sirve desde la caché)."""
+    extension = ".zip" if spec["tipo"] == "zip" else ".pdf"
+    return os.path.join(_DIR_ARMADOS, f"{spec['nombre']}_incompleto_{uuid.uuid4().hex[:16]}{extension}")
+
+
+def _armar_pdf(spec: Dict[str, Any], destino: str) -> List[str]:
+    """Arma el PDF en `destino`. Devuelve las rutas de los documentos que no se pudieron incluir."""
+    merged = fitz.open()
+    _agregar_portada(merged, spec["portada"])
+    faltantes = []
+
+    for titulo, ruta, variante in spec["documentos"]:
+        pdf = _pdf_de(ruta, variante)
+        if not os.path.exists(pdf):
+            print(f"⚠️ No se generó el PDF para: {ruta}")
+            faltantes.append(ruta)
+            continue
+        try:
+            with fitz.open(pdf) as doc:
+                if spec["separadores"]:
+                    page = merged.new_page(width=595, height=842)
+                    page.insert_textbox(fitz.Rect(0, 280, 595, 320), titulo, fontsize=20, fontname="helv", align=1)
+                    if os.path.exists(ICONO_SEPARADOR):
+                        page.insert_image(fitz.Rect(250, 340, 345, 440), filename=ICONO_SEPARADOR)
+                merged.insert_pdf(doc)
+        except Exception as e:
+            print(f"❌ Error agregando '{ruta}' al legajo: {e}")
+            faltantes.append(ruta)
+
+    temporal = destino + f".{os.getpid()}.tmp"
+    merged.save(temporal)
+    merged.close()
+    os.replace(temporal, destino)
+    return faltantes
+
+
+def _armar_parte(spec: Dict[str, Any]) -> Tuple[str, List[str]]:
+    """PDF de un spec desde la caché o recién armado; (ruta, documentos faltantes)."""
+    destino = ruta_armado(spec, huella(spec))
+    if os.path.exists(destino):
+        return destino, []
+    provisorio = _ruta_incompleta(spec)
+    faltantes = _armar_pdf(spec, provisorio)
+    if faltantes:
+        return provisorio, faltantes
+    os.replace(provisorio, destino)
+    return destino, []
+
+
+def construir(spec: Dict[str, Any], job_id: Optional[str] = None) -> str:
+    """Arma el legajo (o lo toma de la caché) y devuelve la ruta del archivo."""
+    os.makedirs(_DIR_CONVERSIONES, exist_ok=True)
+    os.makedirs(_DIR_ARMADOS, exist_ok=True)
+
+    huella_spec = huella(spec)
+    destino = ruta_armado(spec, huella_spec)
+    if os.path.exists(destino):
+        return destino
+
+    partes = spec["partes"] if spec["tipo"] == "zip" else [spec]
+    documentos = [d for parte in partes for d in parte["documentos"]]
+
+    progreso = {"convertidos": 0}
+
+    def avance(n):
+        progreso["convertidos"] += n
+        if job_id:
+            jobstore_update_job(job_id, convertidos = progreso["convertidos"])
+
+    if job_id:
+        jobstore_update_job(job_id, status = "running", fase = "convirtiendo", total = len(documentos), convertidos = 0)
+    _convertir_pendientes(documentos, avance)
+
+    if job_id:
+        jobstore_update_job(job_id, fase = "armando")
+
+    if spec["tipo"] == "zip":
+        pdfs, faltantes = [], []
+        for parte in partes:
+            ruta_parte, faltan = _armar_parte(parte)
+            pdfs.append((parte["nombre"] + ".pdf", ruta_parte))
+            faltantes += faltan
+        if faltantes:
+            destino = _ruta_incompleta(spec)
+        temporal = destino + f".{os.getpid()}.tmp"
+        with ZipFile(temporal, "w") as zipf:
+            for nombre, ruta in pdfs:
+                zipf.write(ruta, nombre)
+        os.replace(temporal, destino)
+    else:
+        destino, faltantes = _armar_parte(spec)
+
+    if faltantes:
+        print(f"⚠️ Legajo {spec['nombre']} armado sin {len(faltantes)} documento/s: no queda en caché")
+        if job_id:
+            jobstore_update_job(job_id, faltantes = faltantes)
+
+    _podar_cache()
+    return destino
+
+
+
+# ── Jobs ───────────────────────────────────────────────────────────────────────
+
+def lanzar_dossier(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Arranca el armado en segundo plano (o devuelve el job que ya lo está armando)."""
+    huella_spec = huella(spec)
+    with _en_curso_lock:
+        job_id = _en_curso.get(huella_spec)
+        if job_id:
+            job = jobstore_read_job(job_id)
+            if job and job["status"] in ("pending", "running"):
+                return job
+
+        job = jobstore_create_job(kind = DOSSIER_KIND, meta = {"nombre": spec["nombre"], "huella": huella_spec})
+        _en_curso[huella_spec] = job["id"]
+
+    def _runner():
+        try:
+            ruta = construir(spec, job["id"])
+            # Un armado incompleto no comparte el ETag del completo (el cliente no lo tiene que conservar)
+            etag = huella_spec if ruta == ruta_armado(spec, huella_spec) else os.path.splitext(os.path.basename(ruta))[0]
+            jobstore_update_job(job["id"], status = "done", archivo = ruta, etag = etag)
+        except Exception as e:
+            print(f"❌ Error armando el legajo {spec['nombre']}: {e}")
+            jobstore_update_job(job["id"], status = "error", error = str(e))
+        finally:
+            with _en_curso_lock:
+                _en_curso.pop(huella_spec, None)
+
+    threading.Thread(target=_runner, name=f"dossier-{job['id'][:8]}", daemon=True).start()
+    return job
+
+
+def _job_de(job_id: str, nombre: str) -> Optional[Dict[str, Any]]:
+    """El job de armado si existe y es del legajo `nombre` (el spec del proyecto / carpeta pedido)."""
+    job = jobstore_read_job(job_id)
+    if job is None or job.get("kind") != DOSSIER_KIND or (job.get("meta") or {}).get("nombre") != nombre:
+        return None
+    return job
+
+
+def estado_dossier(job_id: str, nombre: str) -> Optional[Dict[str, Any]]:
+    job = _job_de(job_id, nombre)
+    if job is None:
+        return None
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "fase": job.get("fase"),
+        "total": job.get("total"),
+        "convertidos": job.get("convertidos"),
+        "error": job.get("error"),
+        "faltantes": job.get("faltantes") or [],
+        "file_ready": bool(job["status"] == "done" and job.get("archivo") and os.path.exists(job["archivo"])),
+    }
+
+
+def _media_type(ruta: str) -> str:
+    return "application/zip" if ruta.endswith(".zip") else "application/pdf"
+
+
+def respuesta_archivo(ruta: str, etag: str, request: Request, filename: str) -> Response:
+    """El archivo con ETag; 304 si el cliente ya tiene esa versión."""
+    etag_header = f'"{etag}"'
+    if etag_header in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers={"ETag": etag_header})
+    return FileResponse(path=ruta, filename=filename, media_type=_media_type(ruta), headers={"ETag": etag_header})
+
+
+def descargar_job_dossier(job_id: str, nombre: str, request: Request, filename: Optional[str] = None) -> Response:
+    job = _job_de(job_id, nombre)
+    if job is None:
+        return JSONResponse(status_code=404, content={"detail": "job no encontrado"})
+    if job["status"] != "done" or not job.get("archivo") or not os.path.exists(job["archivo"]):
+        return JSONResponse(status_code=409, content={"detail": "el archivo todavía no está listo"})
+    ruta = job["archivo"]
+    return respuesta_archivo(ruta, job.get("etag") or "", request, filename or job["meta"].get("nombre") + os.path.splitext(ruta)[1])
+
+
+async def responder_dossier(spec: Dict[str, Any], request: Request, filename: str) -> Response:
+    """
+    Descarga del legajo: si está en caché lo devuelve enseguida; si no, lanza el armado y espera
+    hasta DOSSIER_ESPERA_SEGS. Si no terminó, responde 202 con el job para seguir el avance.
+    """
+    huella_spec = await run_in_threadpool(huella, spec)
+    ruta = ruta_armado(spec, huella_spec)
+    if os.path.exists(ruta):
+        return respuesta_archivo(ruta, huella_spec, request, filename)
+
+    job = await run_in_threadpool(lanzar_dossier, spec)
+    limite = time.monotonic() + DOSSIER_ESPERA_SEGS
+    while time.monotonic() < limite:
+        await asyncio.sleep(0.25)
+        if os.path.exists(ruta):
+            return respuesta_archivo(ruta, huella_spec, request, filename)
+        # Un legajo incompleto no aparece en `ruta`: se sirve el archivo que dejó el job
+        actual = await run_in_threadpool(jobstore_read_job, job["id"])
+        if actual and actual["status"] == "done" and actual.get("archivo") and os.path.exists(actual["archivo"]):
+            return respuesta_archivo(actual["archivo"], actual.get("etag") or "", request, filename)
+        if actual and actual["status"] == "error":
+            break
+
+    estado = await run_in_threadpool(estado_dossier, job["id"], spec["nombre"])
+    return JSONResponse(status_code=202, content=estado)
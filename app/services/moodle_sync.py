@@ -0,0 +1,237 @@
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import update, func
+from starlette.concurrency import run_in_threadpool
+
+from database.config import SessionLocal
+from helpers.jobstore import jobstore_create_job, jobstore_update_job
+from helpers.moodle import moodle_client
+from models.users import User
+
+
+load_dotenv()
+
+
+# Sincronización de cursos aprobados en Moodle (la ejecuta task_scheduler.py, en el mismo proceso).
+#
+# Recorre los usuarios con doc_adoptante_curso_aprobado = 'N' en lotes por login. Por lote:
+# resuelve los ids de Moodle de todos los mails con core_user_get_users_by_field (de a
+# MOODLE_SYNC_MAILS_POR_REQUEST), consulta la finalización del curso usuario por usuario (Moodle no
+# tiene un endpoint masivo para eso) con concurrencia acotada y marca los aprobados con un único
+# UPDATE. Todos los requests a Moodle pasan por un limitador de tasa.
+
+
+# Usuarios por lote (un UPDATE y un commit por lote)
+MOODLE_SYNC_BATCH_SIZE = int(os.getenv("MOODLE_SYNC_BATCH_SIZE", "500"))
+
+# Requests de finalización de curso en vuelo al mismo tiempo
+MOODLE_SYNC_CONCURRENCIA = int(os.getenv("MOODLE_SYNC_CONCURRENCIA", "8"))
+
+# Tope de requests por segundo hacia Moodle (0 = sin límite)
+MOODLE_SYNC_RPS = float(os.getenv("MOODLE_SYNC_RPS", "10"))
+
+# Mails resueltos por cada request de core_user_get_users_by_field
+MOODLE_SYNC_MAILS_POR_REQUEST = int(os.getenv("MOODLE_SYNC_MAILS_POR_REQUEST", "50"))
+
+
+
+class LimitadorTasa:
+    """Espacia los requests para no superar `rps` por segundo (compartido entre tareas del mismo loop)."""
+
+    def __init__(self, rps: float):
+        self.intervalo = 1.0 / rps if rps and rps > 0 else 0.0
+        self._proximo = 0.0
+        self._lock = asyncio.Lock()
+        self.requests = 0
+
+    async def esperar(self) -> None:
+        self.requests += 1
+        if not self.intervalo:
+            return
+        async with self._lock:
+            ahora = time.monotonic()
+            espera = self._proximo - ahora
+            self._proximo = max(ahora, self._proximo) + self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+
+def _leer_lote(ultimo_login: Optional[str], batch_size: int) -> List[Tuple[str, str]]:
+    db = SessionLocal()
+    try:
+        query = db.query(User.login, User.mail).filter(
+            User.doc_adoptante_curso_aprobado == "N",
+            User.mail.isnot(None),
+            User.mail != "",
+        )
+        if ultimo_login is not None:
+            query = query.filter(User.login > ultimo_login)
+        return [(login, mail) for login, mail in query.order_by(User.login).limit(batch_size).all()]
+    finally:
+        db.close()
+
+
+def _contar_pendientes() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.count(User.login)).filter(User.doc_adoptante_curso_aprobado == "N").scalar() or 0
+    finally:
+        db.close()
+
+
+def _marcar_aprobados(logins: List[str]) -> int:
+    if not logins:
+        return 0
+    db = SessionLocal()
+    try:
+        resultado = db.execute(
+            update(User)
+            .where(User.login.in_(logins), User.doc_adoptante_curso_aprobado == "N")
+            .values(doc_adoptante_curso_aprobado = "Y")
+            .execution_options(synchronize_session = False)
+        )
+        db.commit()
+        return resultado.rowcount or 0
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+
+async def _resolver_ids(mails: List[str], limitador: LimitadorTasa, metricas: Dict) -> Dict[str, int]:
+    """Ids de Moodle por mail: primero la caché del cliente y el resto con requests masivos."""
+    ids, faltantes = {}, []
+    for mail in dict.fromkeys(mails):
+        id_usuario = moodle_client.id_usuario_cacheado(mail)
+        if id_usuario is None:
+            faltantes.append(mail)
+        else:
+            ids[mail] = id_usuario
+
+    for i in range(0, len(faltantes), MOODLE_SYNC_MAILS_POR_REQUEST):
+        tramo = faltantes[i:i + MOODLE_SYNC_MAILS_POR_REQUEST]
+        await limitador.esperar()
+        try:
+            ids.update(await moodle_client.aids_usuarios_por_mails(tramo))
+        except HTTPException as e:
+            metricas["errores"] += len(tramo)
+            print(f"⚠️ No se pudieron resolver {len(tramo)} mails en Moodle: {e.detail}")
+    return ids
+
+
+async def _sincronizar_lote(
+    lote: List[Tuple[str, str]],
+    id_curso: int,
+    limitador: LimitadorTasa,
+    semaforo: asyncio.Semaphore,
+    metricas: Dict,
+) -> List[str]:
+    """Devuelve los logins del lote con el curso aprobado."""
+    ids = await _resolver_ids([mail for _, mail in lote], limitador, metricas)
+
+    async def _verificar(login: str, id_usuario: int) -> Optional[str]:
+        async with semaforo:
+            await limitador.esperar()
+            try:
+                aprobado = await moodle_client.aestado_completitud(id_curso, id_usuario)
+            except HTTPException as e:
+                metricas["errores"] += 1
+                print(f"⚠️ Error consultando el curso de {login} en Moodle: {e.detail}")
+                return None
+        return login if aprobado else None
+
+    tareas = []
+    for login, mail in lote:
+        id_usuario = ids.get(mail)
+        if id_usuario is None:
+            continue                                  # error al resolver (ya contado)
+        if id_usuario == -1:
+            metricas["no_encontrados"] += 1
+            continue
+        tareas.append(_verificar(login, id_usuario))
+
+    metricas["consultados"] += len(tareas)
+    return [login for login in await asyncio.gather(*tareas) if login]
+
+
+
+async def sincronizar_cursos_aprobados(
+    batch_size: int = MOODLE_SYNC_BATCH_SIZE,
+    concurrencia: int = MOODLE_SYNC_CONCURRENCIA,
+    rps: float = MOODLE_SYNC_RPS,
+) -> Dict:
+    """
+    Un ciclo completo de sincronización. Devuelve las métricas del ciclo, que también quedan
+    registradas en el jobstore (kind 'moodle_sync').
+    """
+    t0 = time.perf_counter()
+    job = jobstore_create_job("moodle_sync", meta = {"batch_size": batch_size, "concurrencia": concurrencia, "rps": rps})
+    metricas = {
+        "pendientes": await run_in_threadpool(_contar_pendientes),
+        "lotes": 0,
+        "leidos": 0,
+        "consultados": 0,
+        "aprobados": 0,
+        "no_encontrados": 0,
+        "errores": 0,
+        "requests_moodle": 0,
+        "duracion_segs": 0.0,
+    }
+    jobstore_update_job(job["id"], status = "running", metricas = metricas)
+
+    limitador = LimitadorTasa(rps)
+    semaforo = asyncio.Semaphore(max(1, concurrencia))
+
+    try:
+        await limitador.esperar()
+        id_curso = await moodle_client.aid_curso()
+        if id_curso == -1:
+            raise HTTPException(status_code = 404, detail = "Curso no encontrado en Moodle.")
+
+        ultimo_login = None
+        while True:
+            lote = await run_in_threadpool(_leer_lote, ultimo_login, batch_size)
+            if not lote:
+                break
+            ultimo_login = lote[-1][0]
+
+            aprobados = await _sincronizar_lote(lote, id_curso, limitador, semaforo, metricas)
+            metricas["aprobados"] += await run_in_threadpool(_marcar_aprobados, aprobados)
+            metricas["lotes"] += 1
+            metricas["leidos"] += len(lote)
+            metricas["requests_moodle"] = limitador.requests
+            metricas["duracion_segs"] = round(time.perf_counter() - t0, 2)
+            jobstore_update_job(job["id"], metricas = metricas)
+
+            print(f"📚 Lote {metricas['lotes']}: {len(lote)} usuarios, {len(aprobados)} con curso aprobado")
+
+    except Exception as e:
+        metricas["requests_moodle"] = limitador.requests
+        metricas["duracion_segs"] = round(time.perf_counter() - t0, 2)
+        detalle = e.detail if isinstance(e, HTTPException) else str(e)
+        jobstore_update_job(job["id"], status = "error", error = detalle, metricas = metricas)
+        print(f"❌ Sincronización con Moodle interrumpida: {detalle}")
+        return metricas
+
+    finally:
+        await moodle_client.aclose()
+
+    metricas["requests_moodle"] = limitador.requests
+    metricas["duracion_segs"] = round(time.perf_counter() - t0, 2)
+    metricas["requests_por_seg"] = round(limitador.requests / metricas["duracion_segs"], 2) if metricas["duracion_segs"] else None
+    jobstore_update_job(job["id"], status = "done", metricas = metricas)
+
+    print(
+        f"✅ Sincronización con Moodle: {metricas['leidos']} usuarios en {metricas['lotes']} lotes, "
+        f"{metricas['aprobados']} aprobados, {metricas['no_encontrados']} sin cuenta, {metricas['errores']} errores, "
+        f"{metricas['requests_moodle']} requests en {metricas['duracion_segs']} segundos"
+    )
+    return metricas
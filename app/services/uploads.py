@@ -0,0 +1,160 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+from helpers.conversion_pdf import heic_a_jpeg, miniatura, HEIF_ENABLED, EXTENSIONES_IMAGEN
+from services.dossiers import pool_conversiones, precalentar, ruta_derivado
+
+
+# Subida de documentos (pretensos, proyectos, NNA).
+#
+# guardar_upload() copia el archivo en bloques contando los bytes (corta apenas se pasa del
+# máximo), valida por los primeros bytes que el contenido sea del tipo que dice la extensión y lo
+# escribe en un temporal de la misma carpeta que después se renombra, así nunca queda un documento
+# a medio escribir en la ruta final. Apenas está en disco (fsync) el request sigue.
+#
+# Lo que cuesta CPU queda para un hilo de fondo que lo manda al pool de procesos de
+# services/dossiers.py: HEIC -> JPEG, miniatura y las conversiones a PDF que usa el armado de
+# legajos. Todo queda en la caché de dossiers, indexado por ruta + fecha de modificación + tamaño.
+
+
+# Máximo por defecto de los endpoints que no tenían uno propio
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "25"))
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+HEIC_CALIDAD_JPEG = int(os.getenv("HEIC_CALIDAD_JPEG", "85"))
+MINIATURA_LADO = 320
+
+# Tipos reales (detectados por contenido) aceptados para cada extensión
+TIPOS_POR_EXTENSION = {
+    ".pdf": {"pdf"},
+    ".jpg": {"jpeg"},
+    ".jpeg": {"jpeg"},
+    ".png": {"png"},
+    ".doc": {"ole", "zip", "rtf"},
+    ".docx": {"zip", "ole"},
+    ".heic": {"heif"},
+    ".heif": {"heif"},
+}
+
+EXTENSIONES_HEIC = (".heic", ".heif")
+
+
+_derivados = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-derivados")
+
+
+
+class UploadRechazado(HTTPException):
+    """El archivo subido no se guardó (tamaño o contenido). Es un 400 con el motivo en `mensaje`."""
+
+    def __init__(self, mensaje: str):
+        super().__init__(status_code=400, detail=mensaje)
+        self.mensaje = mensaje
+
+
+
+def detectar_tipo(cabecera: bytes) -> Optional[str]:
+    """Tipo real del archivo según sus primeros bytes (None si no se reconoce)."""
+    if cabecera.startswith(b"%PDF-"):
+        return "pdf"
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if cabecera.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "ole"        # .doc de Word 97-2003
+    if cabecera.startswith(b"PK\x03\x04"):
+        return "zip"        # .docx
+    if cabecera.startswith(b"{\\rtf"):
+        return "rtf"
+    if cabecera[4:8] == b"ftyp" and cabecera[8:12] in (b"heic", b"heix", b"hevc", b"heim", b"heis", b"mif1", b"msf1"):
+        return "heif"
+    return None
+
+
+def guardar_upload(file: UploadFile, destino: str, max_mb: int = UPLOAD_MAX_MB) -> str:
+    """
+    Guarda el archivo subido en `destino` (la extensión de destino define el tipo esperado).
+    Lanza UploadRechazado si supera `max_mb` o si el contenido no corresponde a la extensión.
+    Después programa sus derivados en segundo plano.
+    """
+    ext = os.path.splitext(destino)[1].lower()
+    max_bytes = max_mb * 1024 * 1024
+    temporal = os.path.join(os.path.dirname(destino), f".{os.path.basename(destino)}.{os.getpid()}.part")
+
+    file.file.seek(0)
+    primero = file.file.read(UPLOAD_CHUNK_SIZE)
+    if detectar_tipo(primero[:16]) not in TIPOS_POR_EXTENSION.get(ext, ()):
+        raise UploadRechazado(f"El contenido del archivo no corresponde a un {ext}.")
+
+    total = 0
+    try:
+        with open(temporal, "wb") as f:
+            bloque = primero
+            while bloque:
+                total += len(bloque)
+                if total > max_bytes:
+                    raise UploadRechazado(f"El archivo excede el tamaño máximo permitido ({max_mb} MB).")
+                f.write(bloque)
+                bloque = file.file.read(UPLOAD_CHUNK_SIZE)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    programar_derivados(destino)
+    return destino
+
+
+
+def ruta_jpeg_heic(ruta: str) -> str:
+    return ruta_derivado(ruta, "jpeg", ".jpg")
+
+
+def ruta_miniatura(ruta: str) -> str:
+    return ruta_derivado(ruta, "miniatura", ".jpg")
+
+
+def jpeg_de_heic(ruta: str) -> Optional[str]:
+    """
+    JPEG de una foto HEIC/HEIF. Si todavía no está en caché se convierte en el pool de procesos
+    (el hilo que llama solo espera). None si no se puede convertir.
+    """
+    if not HEIF_ENABLED:
+        return None
+    destino = ruta_jpeg_heic(ruta)
+    if os.path.exists(destino):
+        return destino
+    try:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        return pool_conversiones().submit(heic_a_jpeg, ruta, destino, HEIC_CALIDAD_JPEG).result()
+    except Exception as e:
+        print(f"⚠️ No se pudo convertir HEIC a JPEG ({ruta}): {e}")
+        return None
+
+
+def _generar_derivados(ruta: str) -> None:
+    try:
+        ext = os.path.splitext(ruta)[1].lower()
+        imagen = ruta
+        if ext in EXTENSIONES_HEIC:
+            imagen = jpeg_de_heic(ruta)
+        if imagen and (ext in EXTENSIONES_IMAGEN or ext in EXTENSIONES_HEIC):
+            destino = ruta_miniatura(ruta)
+            if not os.path.exists(destino):
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                pool_conversiones().submit(miniatura, imagen, destino, MINIATURA_LADO).result()
+        if ext not in EXTENSIONES_HEIC:
+            precalentar(ruta)
+    except Exception as e:
+        print(f"⚠️ Error generando derivados de {ruta}: {e}")
+
+
+def programar_derivados(ruta: str) -> None:
+    """Encola la conversión HEIC, la miniatura y el PDF pre-renderizado del archivo."""
+    _derivados.submit(_generar_derivados, ruta)
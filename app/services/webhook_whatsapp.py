@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, update
+
+from database.config import SessionLocal
+from helpers.celulares import usuarios_por_celular
+from helpers.webhook_inbox import guardar_webhook, tomar_webhooks, marcar_webhooks_procesados, \
+    marcar_webhooks_fallidos, purgar_webhooks_viejos
+from models.notif_y_observaciones import Mensajeria, WebhookEvent
+
+
+logger = logging.getLogger(__name__)
+
+
+# Procesamiento de los webhooks de WhatsApp Cloud API.
+#
+# POST /notificaciones/webhook/whatsapp guarda el cuerpo en la bandeja durable
+# (helpers/webhook_inbox.py) y responde enseguida. Un hilo por proceso toma los webhooks pendientes
+# de a WEBHOOK_LOTE y los aplica en una sola transacción: los remitentes de todo el lote se
+# resuelven con una consulta por el índice de celulares (helpers/celulares.py), los últimos eventos
+# y registros de Mensajeria también, y los cambios de estado terminan en un UPDATE por estado.
+# Si el lote falla se vuelve a aplicar cada webhook por separado: solo los que fallan solos se
+# reintentan con backoff.
+
+
+CANAL_WHATSAPP = "whatsapp"
+
+# Webhooks que se procesan juntos (una transacción por lote)
+WEBHOOK_LOTE = int(os.getenv("WEBHOOK_LOTE", "100"))
+
+# Cada cuánto revisa la bandeja el worker si nadie lo despierta
+WEBHOOK_INTERVALO_SEGS = 2
+
+# Estados de WhatsApp -> Mensajeria.estado
+ESTADOS_WHATSAPP = {
+    "sent": "enviado",
+    "delivered": "entregado",
+    "read": "leido",
+    "failed": "error",
+}
+
+
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_evento_worker = threading.Event()
+
+
+
+def recibir_webhook_whatsapp(cuerpo: str) -> int:
+    """Guarda el webhook en la bandeja y despierta al worker. Devuelve el id en la bandeja."""
+    webhook_id = guardar_webhook(CANAL_WHATSAPP, cuerpo)
+    iniciar_worker_webhooks()
+    _evento_worker.set()
+    return webhook_id
+
+
+
+def _extraer_eventos(cuerpos: List[Dict[str, Any]]):
+    """Mensajes entrantes y estados de todos los webhooks del lote, en orden de llegada."""
+    mensajes, estados = [], []
+    for body in cuerpos:
+        for e in body.get("entry", []):
+            for change in e.get("changes", []):
+                value = change.get("value", {})
+                mensajes.extend(value.get("messages", []))
+                estados.extend(value.get("statuses", []))
+    return mensajes, estados
+
+
+def _aplicar_mensajes(db, mensajes: List[Dict[str, Any]]) -> None:
+    if not mensajes:
+        return
+
+    # Remitentes del lote: una sola consulta por el índice de celulares
+    usuarios = usuarios_por_celular(db, [m["from"] for m in mensajes])
+
+    # Primer registro de Mensajeria de cada remitente (una consulta, sin traer el historial)
+    logins = {u.login for u in usuarios.values()}
+    ultimo_por_login = {}
+    if logins:
+        primeros_ids = (
+            db.query(func.min(Mensajeria.mensaje_id))
+            .filter(Mensajeria.login_destinatario.in_(logins))
+            .group_by(Mensajeria.login_destinatario)
+        )
+        for m in db.query(Mensajeria).filter(Mensajeria.mensaje_id.in_(primeros_ids.scalar_subquery())):
+            ultimo_por_login[m.login_destinatario] = m
+
+    for message in mensajes:
+        sender = message["from"]
+        meta_id = message["id"]
+        user = usuarios.get(sender)
+
+        login_user = user.login if user else None
+        user_texto = f"{user.nombre} {user.apellido}" if user else sender
+
+        content = ""
+        if message["type"] == "text":
+            content = message["text"]["body"]
+            logger.info(f"Mensaje recibido de {sender}: {content}")
+
+        # 1. Historial (webhooks)
+        db.add(WebhookEvent(
+            mensaje_externo_id=meta_id,
+            content=content,
+            status="respondido",
+            login_usuario=login_user
+        ))
+
+        # 2. Último evento en Mensajeria
+        last_msg = ultimo_por_login.get(login_user) if login_user else None
+        if last_msg:
+            last_msg.mensaje_externo_id = meta_id
+            last_msg.contenido = content
+            last_msg.estado = "respondido"
+            last_msg.destinatario_texto = user_texto
+        else:
+            last_msg = Mensajeria(
+                mensaje_externo_id=meta_id,
+                tipo="whatsapp",
+                contenido=content,
+                estado="respondido",
+                login_destinatario=login_user,
+                destinatario_texto=user_texto
+            )
+            db.add(last_msg)
+            if login_user:
+                ultimo_por_login[login_user] = last_msg
+
+
+def _aplicar_estados(db, estados: List[Dict[str, Any]]) -> None:
+    if not estados:
+        return
+
+    ids = {s["id"] for s in estados}
+
+    # Último evento de cada mensaje del lote (una consulta)
+    ultimos_ids = (
+        db.query(func.max(WebhookEvent.id))
+        .filter(WebhookEvent.mensaje_externo_id.in_(ids))
+        .group_by(WebhookEvent.mensaje_externo_id)
+    )
+    ultimo_evento = {
+        ev.mensaje_externo_id: ev
+        for ev in db.query(WebhookEvent).filter(WebhookEvent.id.in_(ultimos_ids.scalar_subquery()))
+    }
+
+    estado_final = {}
+    for status in estados:
+        message_id = status["id"]
+        estado_mapeado = ESTADOS_WHATSAPP.get(status["status"], status["status"])
+
+        last_event = ultimo_evento.get(message_id)
+        if last_event is None:
+            logger.warning(f"Mensaje original {message_id} no encontrado en historial para registrar estado {estado_mapeado}")
+            continue
+        if last_event.status == estado_mapeado:
+            logger.info(f"Estado {estado_mapeado} ya registrado para {message_id}, ignorando duplicado.")
+            continue
+
+        nuevo = WebhookEvent(
+            mensaje_externo_id=message_id,
+            asunto=last_event.asunto,
+            content=last_event.content,
+            status=estado_mapeado,
+            login_usuario=last_event.login_usuario
+        )
+        db.add(nuevo)
+        ultimo_evento[message_id] = nuevo
+        estado_final[message_id] = estado_mapeado
+
+    # Mensajeria: un UPDATE por estado con todos los mensajes que terminaron en él
+    por_estado: Dict[str, List[str]] = {}
+    for message_id, estado in estado_final.items():
+        por_estado.setdefault(estado, []).append(message_id)
+    for estado, message_ids in por_estado.items():
+        db.execute(
+            update(Mensajeria)
+            .where(Mensajeria.mensaje_externo_id.in_(message_ids))
+            .values(estado=estado)
+            .execution_options(synchronize_session=False)
+        )
+    if estado_final:
+        logger.info(f"Estados registrados: {len(estado_final)} mensajes")
+
+
+def _aplicar_webhooks(cuerpos: List[Dict[str, Any]]) -> None:
+    """Aplica los webhooks en una transacción (todo o nada)."""
+    db = SessionLocal()
+    try:
+        mensajes, estados = _extraer_eventos(cuerpos)
+        _aplicar_mensajes(db, mensajes)
+        db.flush()
+        _aplicar_estados(db, estados)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def procesar_webhooks_whatsapp(limite: int = WEBHOOK_LOTE) -> int:
+    """Procesa un lote de la bandeja en una transacción. Devuelve cuántos webhooks tomó."""
+    filas = tomar_webhooks(CANAL_WHATSAPP, limite)
+    if not filas:
+        return 0
+
+    validas, descartados = [], []
+    for fila in filas:
+        try:
+            cuerpo = json.loads(fila["cuerpo"])
+        except ValueError:
+            cuerpo = None
+        if isinstance(cuerpo, dict):
+            validas.append((fila, cuerpo))
+        else:
+            logger.error(f"Webhook {fila['id']} con JSON inválido, se descarta")
+            descartados.append(fila["id"])
+
+    try:
+        _aplicar_webhooks([cuerpo for _, cuerpo in validas])
+    except Exception as e:
+        # Uno malo no frena al resto: se aplican de a uno y se reintentan solo los que fallan
+        logger.warning(f"Error procesando {len(validas)} webhooks de WhatsApp juntos ({e}), se aplican de a uno")
+        for fila, cuerpo in validas:
+            try:
+                _aplicar_webhooks([cuerpo])
+            except Exception as e_fila:
+                logger.error(f"Error procesando el webhook {fila['id']} de WhatsApp: {e_fila}")
+                marcar_webhooks_fallidos([fila], str(e_fila))
+            else:
+                marcar_webhooks_procesados([fila["id"]])
+        marcar_webhooks_procesados(descartados)
+        return len(filas)
+
+    marcar_webhooks_procesados([f["id"] for f in filas])
+    return len(filas)
+
+
+
+def _loop_worker() -> None:
+    ultima_purga = 0.0
+    while True:
+        try:
+            while procesar_webhooks_whatsapp():
+                pass
+            if time.monotonic() - ultima_purga > 3600:
+                purgar_webhooks_viejos()
+                ultima_purga = time.monotonic()
+        except Exception as e:
+            print(f"❌ Error en el worker de webhooks: {e}")
+
+        _evento_worker.wait(timeout=WEBHOOK_INTERVALO_SEGS)
+        _evento_worker.clear()
+
+
+def iniciar_worker_webhooks() -> None:
+    """Arranca (una vez por proceso) el hilo que vacía la bandeja de webhooks."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_loop_worker, name="webhook-inbox", daemon=True)
+            _worker.start()
@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+
+# La app se importa con el directorio app/ como raíz (igual que uvicorn y task_scheduler.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Variables que los módulos validan al importarse (las rutas se crean dentro de un directorio
+# temporal). Jobstore, cola de mails y límites de envío guardan sus bases SQLite en EXPORT_DIR.
+_BASE = tempfile.mkdtemp(prefix="rua_tests_")
+
+os.environ.setdefault("SECRET_KEY", "clave-de-los-tests")
+os.environ.setdefault("EXPORT_DIR", os.path.join(_BASE, "exportaciones"))
+os.environ.setdefault("DIR_PDF_GENERADOS", os.path.join(_BASE, "pdf_generados"))
+for _carpeta in ("PRETENSOS", "PROYECTOS", "INFORMES", "NNAS"):
+    os.environ.setdefault(f"UPLOAD_DIR_DOC_{_carpeta}", os.path.join(_BASE, "documentos", _carpeta.lower()))
+
+for _variable in ("EXPORT_DIR", "DIR_PDF_GENERADOS"):
+    os.makedirs(os.environ[_variable], exist_ok=True)
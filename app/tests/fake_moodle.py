@@ -0,0 +1,88 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+
+# Servidor HTTP local que imita el web service REST de Moodle (solo las funciones que usa
+# helpers/moodle.py en la sincronización de cursos aprobados). Cuenta los requests por wsfunction.
+
+
+class FakeMoodle:
+
+    def __init__(self, id_curso: int = 7, shortname: str = "curso_rua"):
+        self.id_curso = id_curso
+        self.shortname = shortname
+        self.usuarios: Dict[str, Tuple[int, bool]] = {}        # mail -> (id, curso aprobado)
+        self.ids_con_error: Set[int] = set()                   # ids cuya consulta de finalización falla
+        self.requests = Counter()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._lock = threading.Lock()
+
+
+    def agregar_usuario(self, mail: str, id_usuario: int, aprobado: bool) -> None:
+        self.usuarios[mail.lower()] = (id_usuario, aprobado)
+
+
+    @property
+    def endpoint(self) -> str:
+        host, puerto = self._server.server_address[:2]
+        return f"http://{host}:{puerto}/webservice/rest/server.php"
+
+
+    def responder(self, params: Dict[str, str]) -> Tuple[int, object]:
+        funcion = params.get("wsfunction")
+        with self._lock:
+            self.requests[funcion] += 1
+
+        if funcion == "core_course_get_courses_by_field":
+            if params.get("value") != self.shortname:
+                return 200, {"courses": []}
+            return 200, {"courses": [{"id": self.id_curso, "shortname": self.shortname}]}
+
+        if funcion == "core_user_get_users_by_field":
+            mails = [v for k, v in params.items() if k.startswith("values[")]
+            return 200, [
+                {"id": self.usuarios[m.lower()][0], "email": m}
+                for m in mails if m.lower() in self.usuarios
+            ]
+
+        if funcion == "core_completion_get_course_completion_status":
+            id_usuario = int(params["userid"])
+            if id_usuario in self.ids_con_error:
+                return 500, {"exception": "moodle_exception"}
+            aprobado = any(i == id_usuario and ok for i, ok in self.usuarios.values())
+            return 200, {"completionstatus": {"completed": aprobado}}
+
+        return 400, {"exception": "invalid_parameter_exception", "wsfunction": funcion}
+
+
+    def __enter__(self) -> "FakeMoodle":
+        moodle = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                largo = int(self.headers.get("Content-Length") or 0)
+                cuerpo = self.rfile.read(largo).decode()
+                params = {k: v[0] for k, v in parse_qs(cuerpo).items()}
+                status, data = moodle.responder(params)
+                salida = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(salida)))
+                self.end_headers()
+                self.wfile.write(salida)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
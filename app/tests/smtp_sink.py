@@ -0,0 +1,96 @@
+import socketserver
+import threading
+import time
+from typing import List, Optional
+
+
+# Servidor SMTP local que acepta todo y guarda los mensajes en memoria (sin TLS; AUTH se acepta
+# sin verificar). Cuenta conexiones y logins para medir cuánto se reutiliza cada conexión.
+# `demora_saludo` simula el costo de abrir una conexión real (handshake TLS, login).
+
+
+class _Servidor(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+
+class SMTPSink:
+
+    def __init__(self, demora_saludo: float = 0.0):
+        self.demora_saludo = demora_saludo
+        self.mensajes: List[dict] = []
+        self.conexiones = 0
+        self.logins = 0
+        self._server: Optional[_Servidor] = None
+        self._lock = threading.Lock()
+
+
+    @property
+    def puerto(self) -> int:
+        return self._server.server_address[1]
+
+
+    def _handler(self):
+        sink = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def responder(self, linea: str) -> None:
+                self.wfile.write((linea + "\r\n").encode())
+                self.wfile.flush()
+
+            def handle(self):
+                with sink._lock:
+                    sink.conexiones += 1
+                time.sleep(sink.demora_saludo)
+                self.responder("220 sink ESMTP")
+                remitente, destinatarios = None, []
+                while True:
+                    linea = self.rfile.readline().decode(errors="replace").rstrip("\r\n")
+                    if not linea:
+                        return
+                    comando = linea.split(" ", 1)[0].upper()
+                    if comando in ("EHLO", "HELO"):
+                        self.wfile.write(b"250-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                        self.wfile.flush()
+                    elif comando == "AUTH":
+                        with sink._lock:
+                            sink.logins += 1
+                        self.responder("235 Authentication successful")
+                    elif comando == "MAIL":
+                        remitente, destinatarios = linea.split(":", 1)[1].strip(), []
+                        self.responder("250 OK")
+                    elif comando == "RCPT":
+                        destinatarios.append(linea.split(":", 1)[1].strip().strip("<>"))
+                        self.responder("250 OK")
+                    elif comando == "DATA":
+                        self.responder("354 End data with <CR><LF>.<CR><LF>")
+                        lineas = []
+                        while True:
+                            dato = self.rfile.readline().decode(errors="replace")
+                            if dato in (".\r\n", ".\n", ""):
+                                break
+                            lineas.append(dato)
+                        with sink._lock:
+                            sink.mensajes.append({"remitente": remitente, "destinatarios": destinatarios, "datos": "".join(lineas)})
+                        self.responder("250 OK queued")
+                    elif comando in ("RSET", "NOOP"):
+                        self.responder("250 OK")
+                    elif comando == "QUIT":
+                        self.responder("221 Bye")
+                        return
+                    else:
+                        self.responder("502 Command not implemented")
+
+        return _Handler
+
+
+    def __enter__(self) -> "SMTPSink":
+        self._server = _Servidor(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql.expression import Alias, Label
+
+from helpers.busqueda import FUENTES, _documentos
+from models.base import Base
+from models.convocatorias import Postulacion
+from models.ddjj import DDJJ
+from models.nna import Nna
+from models.proyecto import Proyecto
+from models.users import User
+
+
+# El índice de búsqueda reemplaza al filtro ILIKE de cada listado: el documento de cada tipo tiene
+# que contener los mismos campos que ese ILIKE (si falta uno, buscar por ese campo no encuentra
+# nada mientras el índice esté armado). Los campos de cada ILIKE se copian de su ruta.
+
+
+def _campos(*columnas):
+    return {(c.table.name, c.key) for c in (col.__clause_element__() for col in columnas)}
+
+
+FALLBACKS = {
+    # routes/users.py (get_users)
+    "usuarios": _campos(User.nombre, User.apellido, User.login, User.mail, User.calle_y_nro, User.barrio,
+                        User.localidad),
+    # routes/proyectos.py (get_proyectos); User1/User2 son los adoptantes
+    "proyectos": _campos(User.nombre, User.apellido, Proyecto.login_1, Proyecto.login_2, Proyecto.nro_orden_rua,
+                         Proyecto.proyecto_calle_y_nro, Proyecto.proyecto_barrio, Proyecto.proyecto_localidad,
+                         Proyecto.proyecto_provincia),
+    # routes/nna.py (get_nnas)
+    "nna": _campos(Nna.nna_nombre, Nna.nna_apellido, Nna.nna_dni, Nna.nna_localidad),
+    # routes/ddjj.py
+    "ddjj": _campos(DDJJ.ddjj_nombre, DDJJ.ddjj_apellido, DDJJ.login, DDJJ.ddjj_localidad, DDJJ.ddjj_provincia,
+                    DDJJ.ddjj_correo_electronico, DDJJ.ddjj_telefono),
+    # routes/carpeta.py (búsqueda rápida)
+    "carpetas": _campos(Nna.nna_nombre, Nna.nna_apellido, Nna.nna_dni, Proyecto.nro_orden_rua, Proyecto.login_1,
+                        Proyecto.login_2, User.nombre, User.apellido, User.login),
+    # routes/postulaciones.py
+    "postulaciones": _campos(Postulacion.nombre, Postulacion.apellido, Postulacion.dni, Postulacion.calle_y_nro,
+                             Postulacion.barrio, Postulacion.localidad, Postulacion.provincia, Postulacion.mail,
+                             Postulacion.ocupacion, Postulacion.conyuge_nombre, Postulacion.conyuge_apellido,
+                             Postulacion.conyuge_dni, Postulacion.conyuge_otros_datos),
+}
+
+
+def _campos_del_documento(tipo):
+    """(tabla, columna) de las columnas de valor de la fuente (todas menos la clave)."""
+    _, _, fuente = FUENTES[tipo]
+    campos = set()
+    for columna in list(fuente(Session()).statement.selected_columns)[1:]:
+        if isinstance(columna, Label):
+            columna = columna.element
+        tabla = columna.table.element if isinstance(columna.table, Alias) else columna.table
+        campos.add((tabla.name, columna.key))
+    return campos
+
+
+def test_hay_un_fallback_por_fuente():
+    assert set(FALLBACKS) == set(FUENTES)
+
+
+@pytest.mark.parametrize("tipo", sorted(FALLBACKS))
+def test_el_documento_tiene_los_campos_del_ilike(tipo):
+    assert _campos_del_documento(tipo) == FALLBACKS[tipo]
+
+
+def test_el_documento_de_un_usuario_incluye_su_login():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(User(login="27123456", clave="x", nombre="Ana", apellido="Pérez"))
+    db.commit()
+
+    documentos = _documentos(db, "usuarios", ["27123456", "30000000"])
+    db.close()
+
+    assert "27123456" in documentos["27123456"].split()
+    assert "perez" in documentos["27123456"].split()
+    assert documentos["30000000"] is None
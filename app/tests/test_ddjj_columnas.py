@@ -0,0 +1,111 @@
+import gc
+import time
+import tracemalloc
+from datetime import date
+
+import pytest
+from sqlalchemy import Date, Integer, BigInteger, String, Text, create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from helpers.ddjj_columnas import DDJJ_GRUPOS, cargar_ddjjs
+from models.base import Base
+from models.ddjj import DDJJ
+
+
+# Memoria y tiempo de traer 10.000 DDJJ completas (query(DDJJ), ~280 columnas) contra traer solo
+# el grupo "subregistros" con cargar_ddjjs. SQLite en memoria con todas las columnas cargadas.
+# Con `pytest -s` se ven las mediciones.
+
+
+CANTIDAD = 10_000
+
+# Logins por consulta (SQLite viejo admite hasta 999 parámetros)
+TRAMO = 500
+
+
+def _valor(columna, i):
+    if isinstance(columna.type, (Integer, BigInteger)):
+        return i
+    if isinstance(columna.type, Date):
+        return date(1980, 1, 1 + i % 28)
+    if isinstance(columna.type, String) and columna.type.length:
+        return f"{columna.key}_{i}"[:columna.type.length]
+    if isinstance(columna.type, (String, Text)):
+        return f"{columna.key}_{i}"
+    return None
+
+
+@pytest.fixture(scope="module")
+def sesiones():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[DDJJ.__table__])
+
+    columnas = [c for c in DDJJ.__table__.columns if c.key not in ("ddjj_id", "login")]
+    filas = [
+        {"login": f"2{i:07d}", **{c.key: _valor(c, i) for c in columnas}}
+        for i in range(CANTIDAD)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(DDJJ), filas)
+
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _logins():
+    return [f"2{i:07d}" for i in range(CANTIDAD)]
+
+
+def _completas(db):
+    resultado = {}
+    logins = _logins()
+    for inicio in range(0, len(logins), TRAMO):
+        for d in db.query(DDJJ).filter(DDJJ.login.in_(logins[inicio:inicio + TRAMO])).order_by(DDJJ.ddjj_id).all():
+            resultado.setdefault(d.login, d)
+    return resultado
+
+
+def _subregistros(db):
+    resultado = {}
+    logins = _logins()
+    for inicio in range(0, len(logins), TRAMO):
+        resultado.update(cargar_ddjjs(db, logins[inicio:inicio + TRAMO], "subregistros"))
+    return resultado
+
+
+def _medir(sesiones, cargar):
+    """(pico de memoria en MB, mejor tiempo en segundos de 3) de cargar las DDJJ en una sesión nueva."""
+    tiempos = []
+    for _ in range(3):
+        db = sesiones()
+        gc.collect()
+        t0 = time.perf_counter()
+        ddjjs = cargar(db)
+        tiempos.append(time.perf_counter() - t0)
+        assert len(ddjjs) == CANTIDAD
+        db.close()
+
+    db = sesiones()
+    gc.collect()
+    tracemalloc.start()
+    ddjjs = cargar(db)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    campo = DDJJ_GRUPOS["subregistros"][0]
+    assert all(getattr(d, campo) is not None for d in ddjjs.values())
+    db.close()
+    return pico / 1024 / 1024, min(tiempos)
+
+
+def test_el_grupo_subregistros_usa_menos_memoria_y_tiempo_que_la_ddjj_completa(sesiones):
+    memoria_completa, tiempo_completa = _medir(sesiones, _completas)
+    memoria_grupo, tiempo_grupo = _medir(sesiones, _subregistros)
+
+    print(f"\n{CANTIDAD} DDJJ completas: {memoria_completa:.1f} MB pico, {tiempo_completa * 1000:.0f} ms"
+          f"\n{CANTIDAD} DDJJ, grupo subregistros ({len(DDJJ_GRUPOS['subregistros'])} columnas): "
+          f"{memoria_grupo:.1f} MB pico, {tiempo_grupo * 1000:.0f} ms")
+
+    # El grupo tiene ~40% de las columnas
+    assert memoria_grupo < memoria_completa * 0.7
+    assert tiempo_grupo < tiempo_completa
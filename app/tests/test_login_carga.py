@@ -0,0 +1,110 @@
+import asyncio
+import statistics
+import time
+
+import bcrypt
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import routes.login as login_module
+from database.config import get_db
+from models.base import Base
+from models.users import User
+from routes.login import login_router
+
+
+# Carga de logins concurrentes contra POST /login (la ruta real, con una base SQLite sembrada)
+# junto a otro tráfico: requests livianos que solo necesitan el event loop, cuya latencia no tiene
+# que crecer con los logins. Se compara con el mismo login ejecutado en el event loop (como era
+# antes de pasar procesar_login al threadpool). Con `pytest -s` se ven los p50/p99.
+
+
+LOGINS = 32
+OTROS_REQUESTS = 200
+CLAVE = "clave-de-prueba-123"
+HASH = bcrypt.hashpw(CLAVE.encode(), bcrypt.gensalt(rounds=10)).decode()
+
+
+@pytest.fixture
+def app(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'login.sqlite3'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(engine)
+    sesiones = sessionmaker(bind=engine)
+
+    sesion = sesiones()
+    for i in range(LOGINS):
+        sesion.add(User(login=f"3000000{i:02d}", clave=HASH, nombre=f"Nombre{i}", apellido=f"Apellido{i}",
+                        active="Y", operativo="Y"))
+    sesion.commit()
+    sesion.close()
+
+    def _db():
+        db = sesiones()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    aplicacion = FastAPI()
+    aplicacion.include_router(login_router)
+    aplicacion.dependency_overrides[get_db] = _db
+
+    @aplicacion.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    yield aplicacion
+    engine.dispose()
+
+
+def _percentiles(latencias):
+    ordenadas = sorted(latencias)
+    p99 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.99))]
+    return statistics.median(ordenadas) * 1000, p99 * 1000
+
+
+async def _carga(app):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://rua.test") as cliente:
+
+        async def _login(i):
+            t0 = time.perf_counter()
+            respuesta = await cliente.post("/login", data={"username": f"3000000{i:02d}", "password": CLAVE,
+                                                            "bypass_recaptcha": "Y"})
+            assert respuesta.json()["success"] is True
+            return time.perf_counter() - t0
+
+        async def _otro_request(llegada):
+            # Latencia desde que "llega" el request hasta que se responde
+            await asyncio.sleep(max(0.0, llegada - time.perf_counter()))
+            assert (await cliente.get("/ping")).status_code == 200
+            return time.perf_counter() - llegada
+
+        inicio = time.perf_counter()
+        otros = [_otro_request(inicio + i * 0.005) for i in range(OTROS_REQUESTS)]
+        logins = [_login(i) for i in range(LOGINS)]
+        resultados = await asyncio.gather(*logins, *otros)
+        return resultados[:LOGINS], resultados[LOGINS:]
+
+
+async def _en_el_loop(funcion, *args, **kwargs):
+    return funcion(*args, **kwargs)
+
+
+def test_logins_concurrentes_no_frenan_al_resto(app, monkeypatch):
+    logins_pool, otros_pool = asyncio.run(_carga(app))
+
+    # Mismo camino, pero procesar_login corre en el event loop
+    monkeypatch.setattr(login_module, "run_in_threadpool", _en_el_loop)
+    logins_loop, otros_loop = asyncio.run(_carga(app))
+
+    for nombre, logins, otros in (("threadpool", logins_pool, otros_pool), ("event loop", logins_loop, otros_loop)):
+        p50_l, p99_l = _percentiles(logins)
+        p50_o, p99_o = _percentiles(otros)
+        print(f"\n{nombre}: logins p50 {p50_l:.1f} ms / p99 {p99_l:.1f} ms, "
+              f"otros requests p50 {p50_o:.2f} ms / p99 {p99_o:.2f} ms")
+
+    # Con el threadpool, el resto del tráfico no espera a bcrypt
+    assert _percentiles(otros_pool)[1] < _percentiles(otros_loop)[1]
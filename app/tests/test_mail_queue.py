@@ -0,0 +1,127 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from helpers import mail_queue, rate_limit
+from smtp_sink import SMTPSink
+
+
+# Cola de mails contra un servidor SMTP local (tests/smtp_sink.py): entrega, reutilización de
+# conexiones, backoff y costo por mensaje con y sin conexión persistente (`pytest -s` los muestra).
+
+
+@pytest.fixture
+def sink(monkeypatch, tmp_path):
+    with SMTPSink(demora_saludo=0.02) as servidor:
+        monkeypatch.setenv("MAIL_SERVER", "127.0.0.1")
+        monkeypatch.setenv("MAIL_PORT", str(servidor.puerto))
+        monkeypatch.setenv("MAIL_REMITENTE", "rua@rua.test")
+        monkeypatch.setenv("MAIL_PASSWORD", "clave")
+        monkeypatch.setattr(mail_queue, "MAIL_SMTP_STARTTLS", False)
+        monkeypatch.setitem(rate_limit.ENVIOS_POR_MINUTO, "smtp", 0)
+
+        # Cola nueva por test y sin el worker en segundo plano: los lotes se procesan a mano
+        monkeypatch.setattr(mail_queue, "MAIL_QUEUE_DB_PATH", str(tmp_path / "mail_queue.sqlite3"))
+        monkeypatch.setattr(mail_queue, "_initialized", False)
+        monkeypatch.setattr(mail_queue, "_local", threading.local())
+        monkeypatch.setattr(mail_queue, "_conexiones", threading.local())
+        monkeypatch.setattr(mail_queue, "_todas_las_conexiones", [])
+        monkeypatch.setattr(mail_queue, "iniciar_worker_mail", lambda: None)
+        yield servidor
+        for conexion in mail_queue._todas_las_conexiones:
+            conexion.cerrar()
+
+
+def _vaciar_cola() -> None:
+    while mail_queue.procesar_cola_mail():
+        pass
+
+
+def test_la_cola_entrega_todo_con_conexiones_persistentes(sink):
+    for i in range(30):
+        mail_queue.encolar_mail([f"persona{i}@rua.test"], f"Asunto {i}", "<p>Hola</p>", origen="prueba")
+
+    _vaciar_cola()
+
+    assert mail_queue.estado_cola_mail("prueba")["enviado"] == 30
+    assert len(sink.mensajes) == 30
+    assert sink.conexiones <= mail_queue.MAIL_SMTP_CONEXIONES
+    assert sink.logins == sink.conexiones
+
+
+def test_los_transaccionales_salen_antes_que_los_masivos(sink, monkeypatch):
+    monkeypatch.setattr(mail_queue, "MAIL_SMTP_CONEXIONES", 1)
+    mail_queue.encolar_mail(["masivo@rua.test"], "Campaña", "x", prioridad=mail_queue.PRIORIDAD_MASIVA)
+    mail_queue.encolar_mail(["usuario@rua.test"], "Activación", "x")
+
+    _vaciar_cola()
+
+    assert [m["destinatarios"] for m in sink.mensajes] == [["usuario@rua.test"], ["masivo@rua.test"]]
+
+
+def test_un_servidor_caido_reprograma_con_backoff(sink, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto_cerrado = s.getsockname()[1]
+    monkeypatch.setenv("MAIL_PORT", str(puerto_cerrado))
+
+    mail_id = mail_queue.encolar_mail(["persona@rua.test"], "Asunto", "x", origen="caido")
+    _vaciar_cola()
+
+    fila = mail_queue._get_conn().execute("SELECT * FROM mails WHERE id = ?", (mail_id,)).fetchone()
+    assert fila["estado"] == "pendiente"
+    assert fila["intentos"] == 1
+    assert fila["proximo_intento"] >= time.time() + mail_queue.MAIL_QUEUE_BACKOFF_BASE_SEGS - 5
+
+
+def test_el_lote_que_espera_turno_no_lo_retoma_otro_worker(sink, monkeypatch):
+    # Un envío cada 0,1 s: el lote tarda más que el lease, que se extiende con cada envío
+    monkeypatch.setattr(mail_queue, "MAIL_SMTP_CONEXIONES", 1)
+    monkeypatch.setattr(mail_queue, "MAIL_QUEUE_LEASE_SEGS", 0.3)
+    monkeypatch.setitem(rate_limit.ENVIOS_POR_MINUTO, "smtp", 600)
+    for i in range(8):
+        mail_queue.encolar_mail([f"persona{i}@rua.test"], f"Asunto {i}", "x")
+
+    primero = threading.Thread(target=mail_queue.procesar_cola_mail)
+    primero.start()
+    while mail_queue.estado_cola_mail()["enviando"] == 0:
+        time.sleep(0.01)
+
+    # Otro worker revisa la cola mientras el primero espera sus turnos
+    while primero.is_alive():
+        mail_queue.procesar_cola_mail()
+        time.sleep(0.05)
+    primero.join()
+
+    assert mail_queue.estado_cola_mail()["enviado"] == 8
+    assert len(sink.mensajes) == 8
+
+
+def test_costo_por_mensaje_con_y_sin_reutilizar_la_conexion(sink):
+    n = 40
+    mensaje = mail_queue.armar_mensaje(["persona@rua.test"], "Asunto", "<p>Hola</p>")
+
+    t0 = time.perf_counter()
+    conexion = mail_queue.ConexionSMTP()
+    for _ in range(n):
+        conexion.enviar(mensaje, "rua@rua.test", ["persona@rua.test"])
+    conexion.cerrar()
+    con_reuso = (time.perf_counter() - t0) / n
+    conexiones_con_reuso = sink.conexiones
+
+    t0 = time.perf_counter()
+    for _ in range(n):
+        conexion = mail_queue.ConexionSMTP()
+        conexion.enviar(mensaje, "rua@rua.test", ["persona@rua.test"])
+        conexion.cerrar()
+    sin_reuso = (time.perf_counter() - t0) / n
+
+    print(f"\nSMTP: {con_reuso * 1000:.2f} ms por mensaje reutilizando la conexión, "
+          f"{sin_reuso * 1000:.2f} ms abriendo una por mensaje")
+
+    assert conexiones_con_reuso == 1
+    assert sink.conexiones == 1 + n
+    assert len(sink.mensajes) == 2 * n
+    assert con_reuso < sin_reuso
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from fake_moodle import FakeMoodle
+from helpers.moodle import MoodleConfig, moodle_client
+from services import moodle_sync
+
+
+# Sincronización de cursos aprobados contra un Moodle falso: la base (lotes, conteo y UPDATE) y el
+# jobstore se reemplazan por listas en memoria; el cliente HTTP, el limitador y la concurrencia son
+# los reales.
+
+
+PENDIENTES = [
+    ("ana", "ana@rua.test"),
+    ("beto", "beto@rua.test"),
+    ("carla", "carla@rua.test"),
+    ("dario", "dario@rua.test"),
+    ("eva", "eva@rua.test"),
+]
+
+
+@pytest.fixture
+def moodle(monkeypatch):
+    with FakeMoodle() as fake:
+        fake.agregar_usuario("ana@rua.test", 11, aprobado=True)
+        fake.agregar_usuario("beto@rua.test", 12, aprobado=False)
+        fake.agregar_usuario("carla@rua.test", 13, aprobado=True)
+        fake.agregar_usuario("dario@rua.test", 14, aprobado=True)      # eva no existe en Moodle
+
+        moodle_client._cursos.clear()
+        moodle_client._usuarios.clear()
+        moodle_client._config = MoodleConfig("token", fake.endpoint, 5, fake.shortname)
+        monkeypatch.setattr(moodle_client, "_config_ts", time.monotonic() + 3600)
+        yield fake
+        moodle_client.invalidar_configuracion()
+
+
+@pytest.fixture
+def base(monkeypatch):
+    marcados = []
+
+    def _leer_lote(ultimo_login, batch_size):
+        return [p for p in PENDIENTES if ultimo_login is None or p[0] > ultimo_login][:batch_size]
+
+    def _marcar_aprobados(logins):
+        marcados.extend(logins)
+        return len(logins)
+
+    monkeypatch.setattr(moodle_sync, "_leer_lote", _leer_lote)
+    monkeypatch.setattr(moodle_sync, "_contar_pendientes", lambda: len(PENDIENTES))
+    monkeypatch.setattr(moodle_sync, "_marcar_aprobados", _marcar_aprobados)
+    monkeypatch.setattr(moodle_sync, "jobstore_create_job", lambda kind, meta=None: {"id": "job"})
+    monkeypatch.setattr(moodle_sync, "jobstore_update_job", lambda job_id, **campos: None)
+    return marcados
+
+
+def test_marca_los_aprobados_con_pocos_requests(moodle, base):
+    metricas = asyncio.run(moodle_sync.sincronizar_cursos_aprobados(batch_size=2, concurrencia=4, rps=0))
+
+    assert sorted(base) == ["ana", "carla", "dario"]
+    assert metricas["lotes"] == 3
+    assert metricas["leidos"] == 5
+    assert metricas["aprobados"] == 3
+    assert metricas["no_encontrados"] == 1
+    assert metricas["errores"] == 0
+
+    # Un request por el curso, uno por lote para resolver los mails y uno por usuario existente
+    assert moodle.requests["core_course_get_courses_by_field"] == 1
+    assert moodle.requests["core_user_get_users_by_field"] == 3
+    assert moodle.requests["core_completion_get_course_completion_status"] == 4
+
+
+def test_un_error_de_moodle_no_corta_el_ciclo(moodle, base):
+    moodle.ids_con_error.add(11)
+
+    metricas = asyncio.run(moodle_sync.sincronizar_cursos_aprobados(batch_size=10, concurrencia=2, rps=0))
+
+    assert sorted(base) == ["carla", "dario"]
+    assert metricas["errores"] == 1
+    assert metricas["consultados"] == 4
+
+
+def test_curso_inexistente_corta_el_ciclo(moodle, base):
+    moodle.shortname = "otro_curso"
+
+    metricas = asyncio.run(moodle_sync.sincronizar_cursos_aprobados())
+
+    assert base == []
+    assert metricas["lotes"] == 0
+
+
+def test_limitador_respeta_la_tasa():
+    async def _correr():
+        limitador = moodle_sync.LimitadorTasa(20)
+        t0 = time.monotonic()
+        await asyncio.gather(*(limitador.esperar() for _ in range(5)))
+        return limitador.requests, time.monotonic() - t0
+
+    requests, duracion = asyncio.run(_correr())
+
+    assert requests == 5
+    assert duracion >= 0.19
@@ -0,0 +1,160 @@
+import re
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.config import contar_sentencias_sql
+from helpers import paginacion
+from models.base import Base
+from models.carpeta import Carpeta, DetalleNNAEnCarpeta, DetalleProyectosEnCarpeta
+from models.nna import Nna
+from models.proyecto import Proyecto, DetalleEquipoEnProyecto, AgendaEntrevistas
+from models.users import User
+from routes.proyectos import get_proyectos
+
+
+# GET /proyectos resuelve los datos accesorios de la página con una consulta por tipo de dato:
+# la cantidad de sentencias no puede depender de cuántos proyectos trae la página, y cada proyecto
+# tiene que recibir sus datos (evaluaciones, NNA, estado de carpeta, etapa de entrevistas).
+# Base SQLite en memoria con el esquema de los modelos (REGEXP se registra como función).
+
+
+ESTADOS = ("entrevistando", "vinculacion", "en_carpeta", "aprobado")
+CANTIDAD = 12
+
+# Evaluaciones de las entrevistas de los proyectos "entrevistando" (proyecto_id -> comentarios)
+EVALUACIONES = {1: ["Buena predisposición"], 5: ["Primera charla", "Visita al hogar"], 9: [None, "", None]}
+
+# NNA de la carpeta de los proyectos en "vinculacion" (proyecto_id -> nombres)
+NNA_VINCULADOS = {2: ["Luz Gómez", "Tomás Gómez"], 6: ["Ana Ruiz"], 10: ["Juan Paz"]}
+
+# Carpetas de los proyectos "en_carpeta": una vieja y la vigente (proyecto_id -> estado vigente)
+CARPETA_VIGENTE = {3: "enviada_a_juzgado", 7: "preparando_carpeta", 11: "proyecto_seleccionado"}
+
+
+def _sembrar_carpetas_y_entrevistas(sesion):
+    carpeta_id, nna_id = 0, 0
+
+    for proyecto_id, comentarios in EVALUACIONES.items():
+        for n, comentario in enumerate(comentarios):
+            sesion.add(AgendaEntrevistas(proyecto_id=proyecto_id, login_que_agenda="prof",
+                                         fecha_hora=datetime(2024, 3, 1 + n, 10), evaluacion_comentarios=comentario))
+
+    for proyecto_id, nombres in NNA_VINCULADOS.items():
+        carpeta_id += 1
+        sesion.add(Carpeta(carpeta_id=carpeta_id, estado_carpeta="proyecto_seleccionado", fecha_creacion=date(2024, 1, 1)))
+        sesion.add(DetalleProyectosEnCarpeta(carpeta_id=carpeta_id, proyecto_id=proyecto_id))
+        for nombre_completo in nombres:
+            nna_id += 1
+            nombre, apellido = nombre_completo.split()
+            sesion.add(Nna(nna_id=nna_id, nna_nombre=nombre, nna_apellido=apellido))
+            sesion.add(DetalleNNAEnCarpeta(carpeta_id=carpeta_id, nna_id=nna_id))
+
+    for proyecto_id, estado in CARPETA_VIGENTE.items():
+        for estado_carpeta, creada in (("vacia", date(2023, 5, 1)), (estado, date(2024, 2, 1))):
+            carpeta_id += 1
+            sesion.add(Carpeta(carpeta_id=carpeta_id, estado_carpeta=estado_carpeta, fecha_creacion=creada))
+            sesion.add(DetalleProyectosEnCarpeta(carpeta_id=carpeta_id, proyecto_id=proyecto_id))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def _regexp(conn, _):
+        conn.create_function("regexp", 2, lambda patron, valor: valor is not None and re.search(patron, str(valor)) is not None)
+
+    Base.metadata.create_all(engine)
+    sesion = sessionmaker(bind=engine)()
+
+    sesion.add(User(login="prof", clave="x", nombre="Paula", apellido="Profesional"))
+    for i in range(CANTIDAD):
+        login = f"2000000{i:02d}"
+        sesion.add(User(login=login, clave="x", nombre=f"Nombre{i}", apellido=f"Apellido{i}"))
+        sesion.add(Proyecto(proyecto_id=i + 1, login_1=login, nro_orden_rua=str(1000 + i),
+                            estado_general=ESTADOS[i % len(ESTADOS)], proyecto_tipo="Monoparental"))
+        sesion.add(DetalleEquipoEnProyecto(proyecto_id=i + 1, login="prof"))
+    sesion.flush()
+    _sembrar_carpetas_y_entrevistas(sesion)
+    sesion.commit()
+
+    monkeypatch.setattr(paginacion, "get_redis", lambda: None)
+    paginacion._conteos.clear()
+    yield sesion
+    sesion.close()
+
+
+def _listar(db, **params):
+    argumentos = dict(
+        request=None, db=db, page=1, limit=10, search=None, proyecto_tipo=None, nro_orden_rua=None,
+        fecha_nro_orden_inicio=None, fecha_nro_orden_fin=None, fecha_cambio_estado_inicio=None,
+        fecha_cambio_estado_fin=None, proyecto_estado_general=None, login_profesional=None,
+        ingreso_por=None, subregistros=None, cursor=None, con_total=False,
+    )
+    argumentos.update(params)
+    db.expunge_all()
+    with contar_sentencias_sql(db) as contador:
+        respuesta = get_proyectos(**argumentos)
+    return respuesta, contador["sentencias"]
+
+
+def test_sentencias_fijas_por_pagina(db):
+    chica, sentencias_chica = _listar(db, limit=len(ESTADOS))
+    grande, sentencias_grande = _listar(db, limit=CANTIDAD)
+
+    assert len(chica["proyectos"]) == len(ESTADOS)
+    assert len(grande["proyectos"]) == CANTIDAD
+    assert sentencias_chica == sentencias_grande
+
+
+def test_sentencias_fijas_por_pagina_con_cursor(db):
+    chica, sentencias_chica = _listar(db, limit=len(ESTADOS), cursor="")
+    grande, sentencias_grande = _listar(db, limit=CANTIDAD, cursor="")
+
+    assert chica["next_cursor"] is not None
+    assert len(grande["proyectos"]) == CANTIDAD
+    assert sentencias_chica == sentencias_grande
+
+
+def test_sentencias_fijas_por_pagina_de_profesional(db):
+    _, sentencias_chica = _listar(db, limit=len(ESTADOS), login_profesional="prof")
+    _, sentencias_grande = _listar(db, limit=CANTIDAD, login_profesional="prof")
+
+    assert sentencias_chica == sentencias_grande
+
+
+def test_datos_accesorios_de_cada_proyecto(db):
+    respuesta, _ = _listar(db, limit=CANTIDAD, login_profesional="prof")
+    por_id = {p["proyecto_id"]: p for p in respuesta["proyectos"]}
+    assert len(por_id) == CANTIDAD
+
+    # Entrevistando: evaluaciones cargadas y etapa según la cantidad de entrevistas
+    assert por_id[1]["comentarios_sobre_estado"] == "Entrevistas realizadas:\n- Buena predisposición"
+    assert por_id[1]["etapa"] == "1era. entrevista"
+    lineas = por_id[5]["comentarios_sobre_estado"].split("\n")
+    assert lineas[0] == "Entrevistas realizadas:"
+    assert sorted(lineas[1:]) == ["- Primera charla", "- Visita al hogar"]
+    assert por_id[5]["etapa"] == "2da. entrevista"
+    assert por_id[9]["comentarios_sobre_estado"] == "Aún no se registraron evaluaciones en las entrevistas."
+    assert por_id[9]["etapa"] == "3era. entrevista"
+
+    # Vinculación: NNA de la carpeta del proyecto
+    for proyecto_id, nombres in NNA_VINCULADOS.items():
+        lineas = por_id[proyecto_id]["comentarios_sobre_estado"].split("\n")
+        assert lineas[0] == "NNA relacionado/s:"
+        assert sorted(lineas[1:]) == sorted(nombres)
+
+    # En carpeta: estado legible de la carpeta más reciente
+    assert por_id[3]["comentarios_sobre_estado"] == "Estado de carpeta: 'Enviada a juzgado'"
+    assert por_id[7]["comentarios_sobre_estado"] == "Estado de carpeta: 'Preparando'"
+    assert por_id[11]["comentarios_sobre_estado"] == "Estado de carpeta: 'Proyecto seleccionado'"
+
+    # Sin entrevistas: calendarizando; sin otras profesionales en el equipo
+    for proyecto_id in (2, 3, 4, 8, 12):
+        assert por_id[proyecto_id]["etapa"] == "Calendarizando"
+    assert por_id[4]["comentarios_sobre_estado"] == ""
+    assert all(p["junto_a"] == "Ninguna" for p in por_id.values())
@@ -0,0 +1,78 @@
+import re
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.config import contar_sentencias_sql
+from models.base import Base
+from models.eventos_y_configs import RuaEvento
+from models.proyecto import Proyecto
+from models.users import User, Group, UserGroup
+from routes.users import get_users
+
+
+# GET /users arma el ranking de proyectos, los nombres de los integrantes y las fechas de pedido
+# de revisión de toda la página con una consulta cada uno: la cantidad de sentencias no puede
+# depender de cuántos usuarios trae la página. Base SQLite en memoria con el esquema de los modelos.
+
+
+CANTIDAD = 10
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def _regexp(conn, _):
+        conn.create_function("regexp", 2, lambda patron, valor: valor is not None and re.search(patron, str(valor)) is not None)
+
+    Base.metadata.create_all(engine)
+    sesion = sessionmaker(bind=engine)()
+
+    sesion.add(Group(group_id=1, description="adoptante"))
+    for i in range(CANTIDAD):
+        login = f"2500000{i:02d}"
+        pareja = f"2600000{i:02d}"
+        for dni, nombre in ((login, f"Nombre{i}"), (pareja, f"Pareja{i}")):
+            sesion.add(User(login=dni, clave="x", nombre=nombre, apellido=f"Apellido{i}", active="Y", operativo="Y",
+                            doc_adoptante_estado="pedido_revision", doc_adoptante_curso_aprobado="Y"))
+            sesion.add(UserGroup(login=dni, group_id=1))
+            sesion.add(RuaEvento(login=dni, evento_fecha=datetime(2024, 1, 1 + i),
+                                 evento_detalle="El usuario solicitó la revisión de su documentación personal."))
+        sesion.add(Proyecto(proyecto_id=i + 1, login_1=login, login_2=pareja, nro_orden_rua=str(2000 + i),
+                            ingreso_por="rua", operativo="Y", estado_general="viable", proyecto_tipo="Matrimonio"))
+    sesion.commit()
+
+    yield sesion
+    sesion.close()
+
+
+def _listar(db, limit):
+    argumentos = dict(
+        request=None, db=db, page=1, limit=limit, count_only=False, operativo=None, include_inoperativos=False,
+        group_description="adoptante", search=None, proyecto_tipo=None, curso_aprobado=None,
+        doc_adoptante_estado=None, nro_orden_rua=None, fecha_alta_inicio=None, fecha_alta_fin=None,
+        edad_min=None, edad_max=None, fecha_nro_orden_inicio=None, fecha_nro_orden_fin=None, ingreso_por="rua",
+    )
+    db.expunge_all()
+    with contar_sentencias_sql(db) as contador:
+        respuesta = get_users(**argumentos)
+    return respuesta, contador["sentencias"]
+
+
+def test_sentencias_fijas_por_pagina(db):
+    uno, sentencias_uno = _listar(db, limit=1)
+    todos, sentencias_todos = _listar(db, limit=2 * CANTIDAD)
+
+    assert len(uno["users"]) == 1
+    assert len(todos["users"]) == 2 * CANTIDAD
+    assert sentencias_uno == sentencias_todos
+
+    for usuario in todos["users"]:
+        assert usuario["proyectos_ids"]
+        assert usuario["login_1_info"] and usuario["login_2_info"]
+        assert usuario["fecha_doc_adoptante_estado"].startswith("2024-01-")